@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модуль asyncio-движка проверки (CHECK_ENGINE=async).
+Одна корутина на ключ вместо потока: запуск xray, ожидание порта, запросы через SOCKS5
+и паузы не занимают потоков, поэтому одновременно проверяются сотни ключей.
+Логика вердикта общая с потоковым движком (checker._probe_steps).
+"""
+
+import asyncio
+import logging
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional
+
+from .config import (
+    ASYNC_CONCURRENCY,
+    GEOLOCATION_SERVICE,
+    PROBE_KEEP_ALIVE,
+    XRAY_STARTUP_WAIT,
+)
+from .checker import _hysteria_result, _hysteria_timeout, _prepare_key, _probe_steps
+from .deadline import Deadline
+from .dns_cache import cached_address
+from .key_feed import KeyFeed
+from .logger_config import should_debug as should_debug_func
+from .parsing import is_hysteria
+from .port_pool import capacity, take_port_async
+from .probe import AsyncProbeSession, probe_request_async
+from .process_registry import register, release_async
+from .utils import geolocation_from_response, raise_nofile_limit
+from .xray_manager import (
+    run_xray_async,
+    wait_for_xray_ready_async,
+)
+from .xray_resources import record_usage
+from .xray_templates import render_xray_config
+
+logger = logging.getLogger(__name__)
+
+# Как часто свободная корутина перепроверяет пустой источник ключей
+_FEED_POLL = 0.05
+
+
+async def _check_hysteria_reachable_async(address: str, port: int, timeout: float) -> tuple[bool, float]:
+    """Асинхронный аналог checker._check_hysteria_reachable."""
+    start_time = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(cached_address(address), port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return (False, timeout)
+    elapsed = time.perf_counter() - start_time
+    writer.close()
+    return (True, elapsed)
+
+
+async def _run_probe_steps_async(steps, port: int, session: Optional[AsyncProbeSession] = None):
+    """Асинхронно исполняет операции _probe_steps через SOCKS-порт xray (session - keep-alive сессия ключа)."""
+    result = None
+    try:
+        while True:
+            op = steps.send(result)
+            kind = op[0]
+            if kind == "request":
+                _, url, timeout, method, post_data = op
+                if session is not None:
+                    result = await session.request(url, timeout, method=method, post_data=post_data)
+                else:
+                    result = await probe_request_async(url, port, timeout, method=method, post_data=post_data)
+            elif kind == "sleep":
+                await asyncio.sleep(op[1])
+                result = None
+            elif kind == "parallel":
+                result = await _run_parallel_steps_async(op[1], op[2], port, session)
+            elif kind == "geolocation":
+                response, _, _ = await probe_request_async(GEOLOCATION_SERVICE, port, op[1])
+                result = geolocation_from_response(response) if response is not None else None
+            else:
+                raise ValueError(f"Неизвестная операция проверки: {kind}")
+    except StopIteration as stop:
+        return stop.value
+
+
+async def _run_parallel_steps_async(generators: list, stop, port: int, session: Optional[AsyncProbeSession] = None) -> list:
+    """Операция "parallel": генераторы одновременно, незавершённые отменяются по stop() и дожидаются отмены."""
+    tasks = {asyncio.ensure_future(_run_probe_steps_async(gen, port, session)): i for i, gen in enumerate(generators)}
+    outcomes: dict[int, object] = {}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                outcomes[tasks[task]] = task.result()
+            if stop(outcomes):
+                break
+    finally:
+        for task in pending:
+            task.cancel()
+        # Отменённые запросы закрывают свои соединения до того, как вызывающий закроет сессию
+        await asyncio.gather(*pending, return_exceptions=True)
+    return [outcomes.get(i) for i in range(len(generators))]
+
+
+async def check_key_e2e_async(vless_line: str, debug: bool = False, cache: Optional[dict] = None) -> tuple[str, bool, Optional[dict]]:
+    """Асинхронная версия check_key_e2e. Возвращает (строка_ключа, доступен, метрики)."""
+    should_debug_flag = should_debug_func(debug)
+    deadline = Deadline()
+
+    early_result, parsed, metrics = _prepare_key(vless_line, should_debug_flag, cache, check_hysteria=False)
+    if early_result is not None:
+        return early_result
+
+    if is_hysteria(parsed):
+        ok, latency = await _check_hysteria_reachable_async(parsed["address"], parsed["port"], _hysteria_timeout(deadline))
+        return _hysteria_result(vless_line, ok, latency, metrics, cache)
+
+    port = await take_port_async()
+    if port is None:
+        if should_debug_flag:
+            logger.debug("Нет свободного порта в пуле.")
+        return (vless_line, False, metrics)
+
+    proc = None
+    try:
+        proc = await run_xray_async(render_xray_config(parsed, port), stderr_pipe=should_debug_flag)
+        register(proc, [port])
+        ready, err = await wait_for_xray_ready_async(proc, [port], timeout=min(XRAY_STARTUP_WAIT, deadline.remaining()))
+        if not ready:
+            if should_debug_flag:
+                logger.debug(f"xray не готов: {err}")
+            return (vless_line, False, metrics)
+        session = AsyncProbeSession(port) if PROBE_KEEP_ALIVE else None
+        try:
+            return await _run_probe_steps_async(_probe_steps(vless_line, metrics, should_debug_flag, cache, deadline), port, session)
+        finally:
+            if session is not None:
+                session.close()
+    except FileNotFoundError:
+        if should_debug_flag:
+            from . import config as config_module
+            logger.debug(f"Xray не найден (команда: {config_module.XRAY_CMD}). Установите Xray и добавьте в PATH или задайте XRAY_PATH.")
+        return (vless_line, False, metrics)
+    except (OSError, ValueError) as e:
+        if should_debug_flag:
+            logger.debug(f"Исключение: {e}")
+        return (vless_line, False, metrics)
+    finally:
+        record_usage(proc, [metrics])
+        # Без ожидания выхода xray: слот параллельности свободен сразу, порт вернётся после выхода
+        release_async(proc, [port])
+
+
+def run_checks_async(
+    links: Iterable[str] | KeyFeed,
+    on_result: Callable[[str, bool, Optional[dict]], None],
+    on_error: Callable[[list[str], Exception], None],
+    cache: Optional[dict] = None,
+    concurrency: int = ASYNC_CONCURRENCY,
+) -> None:
+    """
+    Проверяет ключи в asyncio: одновременно не более concurrency ключей (и не больше числа адресов inbound, см. port_pool.capacity).
+    links - список или KeyFeed (ключи берутся по мере освобождения места, пока источник не исчерпан).
+    on_result(ключ, доступен, метрики) вызывается по мере готовности; on_error([ключ], исключение) - при сбое проверки.
+    Источник ключей (пополнение из очереди SQLite) и обработчики результатов (журнал с fsync, поток
+    результатов) блокируют - они выполняются в отдельных потоках, по одному на каждый: цикл событий
+    не останавливается, а on_result/on_error по-прежнему вызываются последовательно.
+    """
+    limit = max(1, min(concurrency, capacity()))
+    raise_nofile_limit(limit * 8 + 256)
+    feed = links if isinstance(links, KeyFeed) else KeyFeed(links)
+    feed_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="async-feed")
+    result_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="async-results")
+
+    async def worker() -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                # Без ожидания: поток источника не занят, пока источник пуст
+                link = await loop.run_in_executor(feed_executor, feed.get, 0)
+            except queue.Empty:
+                await asyncio.sleep(_FEED_POLL)
+                continue
+            if link is None:
+                return
+            try:
+                link_result, ok, metrics = await check_key_e2e_async(link, cache=cache)
+            except Exception as e:
+                await loop.run_in_executor(result_executor, on_error, [link], e)
+            else:
+                await loop.run_in_executor(result_executor, on_result, link_result, ok, metrics)
+
+    async def main() -> None:
+        await asyncio.gather(*(worker() for _ in range(limit)))
+
+    try:
+        asyncio.run(main())
+    finally:
+        feed_executor.shutdown()
+        result_executor.shutdown()
@@ -18,8 +18,8 @@ def get_key_hash(vless_line: str) -> str:
     return hashlib.sha256(vless_line.encode()).hexdigest()[:16]
 
 
-def load_cache() -> dict:
-    """Загружает кэш из файла."""
+def load_cache(ttl: Optional[int] = CACHE_TTL) -> dict:
+    """Загружает кэш из файла. ttl=None - вместе с устаревшими записями (история для PRIORITY_SCHEDULING)."""
     if not ENABLE_CACHE or not CACHE_FILE:
         return {}
     cache_path = Path(CACHE_FILE)
@@ -31,7 +31,7 @@ def load_cache() -> dict:
         current_time = time.time()
         return {
             k: v for k, v in cache.items()
-            if current_time - v.get('timestamp', 0) < CACHE_TTL
+            if ttl is None or current_time - v.get('timestamp', 0) < ttl
         }
     except Exception as e:
         import logging
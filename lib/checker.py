@@ -5,27 +5,33 @@
 Поддерживает протоколы: VLESS, VMess, Trojan, Shadowsocks, Hysteria, Hysteria2.
 """
 
-import json
 import logging
-import os
 import socket
-import tempfile
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import Optional
 
 from .cache import check_cache, get_key_hash
+from .deadline import Deadline
+from .dns_cache import cached_address, pinned_address
 from .config import (
+    ADAPTIVE_CONCURRENCY,
+    ADAPTIVE_MAX_WORKERS,
     ALLOWED_COUNTRIES,
     CHECK_GEOLOCATION,
     CONNECT_TIMEOUT,
     CONNECT_TIMEOUT_SLOW,
     ENABLE_CACHE,
+    KEY_DEADLINE,
     MAX_RESPONSE_TIME,
     MAX_RETRIES,
+    MAX_WORKERS,
     MIN_AVG_RESPONSE_TIME,
     MIN_RESPONSE_SIZE,
     MIN_SUCCESSFUL_REQUESTS,
     MIN_SUCCESSFUL_URLS,
+    PROBE_CLIENT,
     REQUEST_DELAY,
     REQUESTS_PER_URL,
     REQUIRE_HTTPS,
@@ -43,8 +49,9 @@ from .config import (
     TEST_URL,
     TEST_URLS,
     TEST_URLS_HTTPS,
+    URL_PROBE_MODE,
     USE_ADAPTIVE_TIMEOUT,
-    XRAY_STARTUP_POLL_INTERVAL,
+    XRAY_DAEMON_MODE,
     XRAY_STARTUP_WAIT,
     _CLIENT_TEST_HTTPS,
 )
@@ -52,8 +59,11 @@ import logging
 from .logger_config import should_debug as should_debug_func
 
 logger = logging.getLogger(__name__)
-from .parsing import parse_proxy_url, parse_vless_url
-from .port_pool import return_port, take_port
+from .metrics import new_key_metrics
+from .parsing import is_hysteria, parse_proxy_url, parse_vless_url
+from .port_pool import take_port, take_ports
+from .probe import ProbeSession
+from .process_registry import register, release
 
 
 def _check_hysteria_reachable(address: str, port: int, timeout: float) -> tuple[bool, float]:
@@ -64,33 +74,55 @@ def _check_hysteria_reachable(address: str, port: int, timeout: float) -> tuple[
     """
     try:
         start_time = time.perf_counter()
-        with socket.create_connection((address, port), timeout=timeout):
+        with socket.create_connection((cached_address(address), port), timeout=timeout):
             elapsed = time.perf_counter() - start_time
             return (True, elapsed)
     except (socket.error, socket.gaierror, OSError):
         return (False, timeout)  # При ошибке возвращаем таймаут как задержку
-from .signals import active_processes
 from .utils import (
     check_geolocation_allowed,
     check_response_valid,
-    get_geolocation,
+    get_geolocation_via_socks,
     is_connection_error,
-    make_request,
+    is_timeout_error,
+    make_socks_request,
+    socks_session,
 )
-from .xray_manager import build_xray_config, kill_xray_process, run_xray
+from .xray_daemon import XrayDaemonPool, get_daemon_pool
+from .xray_manager import run_xray, wait_for_xray_ready
+from .xray_resources import record_usage
+from .xray_templates import render_xray_batch_config, render_xray_config
 
 logger = logging.getLogger(__name__)
 
 
-def check_key_e2e(vless_line: str, debug: bool = False, cache: Optional[dict] = None) -> tuple[str, bool, Optional[dict]]:
+def _hysteria_result(vless_line: str, ok: bool, latency: float, metrics: dict, cache: Optional[dict]) -> tuple[str, bool, dict]:
+    """Итог проверки Hysteria/Hysteria2 по результату TCP-проверки доступности."""
+    # Сохраняем задержку в метрики для сортировки
+    if ok:
+        metrics["response_times"] = [latency]
+    if cache is not None and ENABLE_CACHE:
+        key_hash = get_key_hash(vless_line)
+        cache[key_hash] = {"result": ok, "timestamp": time.time()}
+    metrics["successful_urls"] = 1 if ok else 0
+    metrics["failed_urls"] = 0 if ok else 1
+    return (vless_line, ok, metrics)
+
+
+def _hysteria_timeout(deadline: Optional[Deadline]) -> float:
+    """Таймаут TCP-проверки Hysteria с учётом бюджета ключа (KEY_DEADLINE)."""
+    timeout = float(CONNECT_TIMEOUT_SLOW if USE_ADAPTIVE_TIMEOUT else CONNECT_TIMEOUT)
+    return deadline.clamp(timeout) if deadline is not None else timeout
+
+
+def _prepare_key(vless_line: str, should_debug_flag: bool, cache: Optional[dict], check_hysteria: bool = True, deadline: Optional[Deadline] = None) -> tuple[Optional[tuple[str, bool, dict]], Optional[dict], dict]:
     """
-    End-to-end проверка с расширенными возможностями.
-    Возвращает (строка_ключа, доступен, метрики).
-    Метрики содержат информацию о проверке (время ответа, геолокация и т.д.).
+    Общая часть проверки до запуска xray: кэш, разбор ссылки, Hysteria/Hysteria2.
+    Возвращает (готовый_результат или None, parsed, метрики); адрес в parsed - IP из DNS-кэша, если он есть.
+    Если готовый результат не None - xray для ключа не нужен.
+    check_hysteria=False: Hysteria не проверяется здесь (вызывающий проверит сам, например асинхронно).
+    deadline: таймаут проверки Hysteria укорачивается до остатка бюджета ключа.
     """
-    # debug параметр используется только для первого ключа и только если уровень логирования DEBUG
-    should_debug_flag = should_debug_func(debug)
-    
     # Проверка кэша
     if cache is not None and ENABLE_CACHE:
         key_hash = get_key_hash(vless_line)
@@ -98,386 +130,593 @@ def check_key_e2e(vless_line: str, debug: bool = False, cache: Optional[dict] =
         if cached_result is not None:
             if should_debug_flag:
                 logger.debug(f"Результат из кэша для ключа: {key_hash[:8]}...")
-            metrics = {
-                "response_times": [],
-                "geolocation": None,
-                "successful_urls": 0,
-                "failed_urls": 0,
-                "total_requests": 0,
-                "successful_requests": 0,
-                "cached": True
-            }
-            return (vless_line, cached_result, metrics)
-    
-    metrics = {
-        "response_times": [],
-        "geolocation": None,
-        "successful_urls": 0,
-        "failed_urls": 0,
-        "total_requests": 0,
-        "successful_requests": 0,
-        "cached": False
-    }
-    
+            metrics = new_key_metrics(cached=True)
+            return ((vless_line, cached_result, metrics), None, metrics)
+
+    metrics = new_key_metrics()
+
     parsed = parse_proxy_url(vless_line)
     if not parsed:
         if should_debug_flag:
             logger.debug("Не удалось разобрать прокси-ссылку.")
-        return (vless_line, False, metrics)
+        return ((vless_line, False, metrics), None, metrics)
 
     # Hysteria/Hysteria2: Xray не поддерживает; проверяем только доступность хоста по TCP
-    if parsed.get("protocol") in ("hysteria", "hysteria2"):
-        timeout = CONNECT_TIMEOUT_SLOW if USE_ADAPTIVE_TIMEOUT else CONNECT_TIMEOUT
-        ok, latency = _check_hysteria_reachable(parsed["address"], parsed["port"], float(timeout))
-        # Сохраняем задержку в метрики для сортировки
-        if ok:
-            metrics["response_times"] = [latency]
-        if cache is not None and ENABLE_CACHE:
-            key_hash = get_key_hash(vless_line)
-            cache[key_hash] = {"result": ok, "timestamp": time.time()}
-        metrics["successful_urls"] = 1 if ok else 0
-        metrics["failed_urls"] = 0 if ok else 1
-        return (vless_line, ok, metrics)
+    if is_hysteria(parsed):
+        if not check_hysteria:
+            return (None, parsed, metrics)
+        timeout = _hysteria_timeout(deadline)
+        ok, latency = _check_hysteria_reachable(parsed["address"], parsed["port"], timeout)
+        return (_hysteria_result(vless_line, ok, latency, metrics, cache), parsed, metrics)
 
-    port = take_port()
-    if port is None:
-        if should_debug_flag:
-            logger.debug("Нет свободного порта в пуле.")
-        return (vless_line, False, metrics)
-    
-    # Добавляем процесс в список активных для обработки сигналов
-    proc = None
+    return (None, pinned_address(parsed), metrics)
 
-    config = build_xray_config(parsed, port)
-    fd, config_path = tempfile.mkstemp(suffix=".json", prefix="xray_")
-    try:
-        with os.fdopen(fd, "w", encoding="utf-8") as f:
-            json.dump(config, f, ensure_ascii=False)
-    except Exception as e:
-        try:
-            os.close(fd)
-        except OSError:
-            pass
-        return_port(port)
-        if should_debug_flag:
-            logger.debug(f"Ошибка записи конфига: {e}")
-        return (vless_line, False, metrics)
 
-    try:
-        proc = run_xray(config_path, stderr_pipe=should_debug_flag)
-        active_processes.append((proc, port))
-        waited = 0.0
-        while waited < XRAY_STARTUP_WAIT:
-            if proc.poll() is not None:
-                break
-            time.sleep(XRAY_STARTUP_POLL_INTERVAL)
-            waited += XRAY_STARTUP_POLL_INTERVAL
-        if proc.poll() is not None:
-            if should_debug_flag and proc.stderr:
-                err = proc.stderr.read().decode("utf-8", errors="replace")
-                logger.debug(f"xray завершился сразу. stderr:\n{err}")
-            active_processes.remove((proc, port))
-            return (vless_line, False, metrics)
-        
-        proxies = {
-            "http": f"socks5h://127.0.0.1:{port}",
-            "https": f"socks5h://127.0.0.1:{port}",
-        }
+def _record_phase_timings(metrics: dict, response) -> None:
+    """Сохраняет время фаз успешного запроса (только встроенный клиент, см. PROBE_CLIENT)."""
+    timings = getattr(response, "timings", None)
+    if timings:
+        metrics.setdefault("phase_timings", []).append(timings)
+
+
+def _record_response(metrics: dict, response, elapsed_time: float) -> None:
+    """Учитывает успешный запрос: время ответа, фазы, холодный (новое соединение) или тёплый (keep-alive)."""
+    metrics.setdefault("response_times", []).append(elapsed_time)
+    _record_phase_timings(metrics, response)
+    kind = "warm_response_times" if getattr(response, "reused", False) else "cold_response_times"
+    metrics.setdefault(kind, []).append(elapsed_time)
+
+
+def _count_timeout(metrics: dict, error: Optional[Exception]) -> None:
+    """Считает запросы, завершившиеся таймаутом (сигнал перегрузки для ADAPTIVE_CONCURRENCY)."""
+    if is_timeout_error(error):
+        metrics["timeouts"] = metrics.get("timeouts", 0) + 1
+
+
+def _deadline_exceeded(vless_line: str, metrics: dict, should_debug_flag: bool) -> tuple[str, bool, dict]:
+    """Итог проверки, не уложившейся в бюджет времени KEY_DEADLINE."""
+    metrics["deadline_exceeded"] = True
+    if should_debug_flag:
+        logger.debug(f"Превышен бюджет времени на ключ ({KEY_DEADLINE} с)")
+    return (vless_line, False, metrics)
+
+
+def _enough_urls(successful: list[tuple[str, str]]) -> bool:
+    """
+    Достаточно ли успешных URL (url, тип), чтобы не проверять остальные.
+    В строгом режиме проверяются все URL; при REQUIRE_HTTPS нужен хотя бы один успешный HTTPS.
+    """
+    if STRICT_MODE or len(successful) < MIN_SUCCESSFUL_URLS:
+        return False
+    return not REQUIRE_HTTPS or any(url_type == "https" for _, url_type in successful)
+
+
+def _pass_impossible(all_urls: list[tuple[str, str]], outcomes: dict[int, dict]) -> bool:
+    """
+    Проход проверки уже не может быть успешным по итогам части URL (outcomes: индекс -> итог URL):
+    в строгом режиме "все URL" - первый неуспешный URL; иначе успешных даже с учётом ещё не
+    завершённых меньше MIN_SUCCESSFUL_URLS или при REQUIRE_HTTPS не осталось ни одного HTTPS.
+    """
+    if any(not o["ok"] for o in outcomes.values()) and STRICT_MODE and STRICT_MODE_REQUIRE_ALL:
+        return True
+    possible = [url for i, url in enumerate(all_urls) if i not in outcomes or outcomes[i]["ok"]]
+    if len(possible) < MIN_SUCCESSFUL_URLS:
+        return True
+    return REQUIRE_HTTPS and not any(url_type == "https" for _, url_type in possible)
+
+
+def _probe_url_steps(url: str, timeout: float, deadline: Deadline, should_debug_flag: bool):
+    """
+    Запросы к одному URL: REQUESTS_PER_URL запросов с повторами при обрыве соединения.
+    Генератор операций, как _probe_steps. Итог - результаты URL в виде частичных метрик
+    (ok, response_times, phase_timings, счётчики), их сливает _merge_url_outcome.
+    """
+    outcome = {
+        "ok": False,
+        "response_times": [],
+        "phase_timings": [],
+        "cold_response_times": [],
+        "warm_response_times": [],
+        "total_requests": 0,
+        "successful_requests": 0,
+        "timeouts": 0,
+        "deadline_exceeded": False,
+    }
+    request_results = []
+    
+    # Множественные запросы к одному URL
+    for request_num in range(REQUESTS_PER_URL):
+        if request_num > 0:
+            yield ("sleep", deadline.sleep_time(REQUEST_DELAY))
         
-        # Определяем таймаут
-        timeout = CONNECT_TIMEOUT_SLOW if USE_ADAPTIVE_TIMEOUT else CONNECT_TIMEOUT
+        # Повторные попытки с экспоненциальной задержкой
+        request_successful = False
         
-        # Строгий режим: N запросов к gstatic/generate_204 подряд, без повторов; таймаут как в мобильном клиенте
-        if STRONG_STYLE_TEST:
-            test_url = _CLIENT_TEST_HTTPS
-            max_ok_time = STRONG_MAX_RESPONSE_TIME if STRONG_MAX_RESPONSE_TIME > 0 else MAX_RESPONSE_TIME
-            # Таймаут одного запроса: STRONG_STYLE_TIMEOUT - общее время (connect + read), без завышения
-            connect_t = max(3, min(10, int(STRONG_STYLE_TIMEOUT * 0.4)))
-            read_t = max(5, STRONG_STYLE_TIMEOUT - connect_t)
-            timeout_strong = (connect_t, read_t)
-            attempts_needed = max(1, STRONG_ATTEMPTS)
-            last_elapsed = 0.0
-            for attempt in range(attempts_needed):
-                if attempt > 0:
-                    time.sleep(0.5)
-                response, elapsed_time, error = make_request(test_url, proxies, timeout_strong)
-                metrics["total_requests"] = metrics.get("total_requests", 0) + 1
-                if response and not error and check_response_valid(response, 0, test_url):
-                    if max_ok_time > 0 and elapsed_time > max_ok_time:
+        for retry_attempt in range(MAX_RETRIES + 1):
+            if retry_attempt > 0:
+                delay = RETRY_DELAY_BASE * (RETRY_DELAY_MULTIPLIER ** (retry_attempt - 1))
+                yield ("sleep", deadline.sleep_time(delay))
+            if deadline.expired():
+                outcome["deadline_exceeded"] = True
+                return outcome
+            
+            response, elapsed_time, error = yield ("request", url, deadline.clamp(timeout), "GET", None)
+            outcome["total_requests"] += 1
+            _count_timeout(outcome, error)
+            
+            if response and not error:
+                if check_response_valid(response, MIN_RESPONSE_SIZE, url):
+                    # Проверка времени ответа
+                    if MAX_RESPONSE_TIME > 0 and elapsed_time > MAX_RESPONSE_TIME:
                         if should_debug_flag:
-                            logger.debug(f"Строгий режим: превышено время ответа {elapsed_time:.2f}с > {max_ok_time}с")
-                        active_processes.remove((proc, port))
-                        return (vless_line, False, metrics)
-                    last_elapsed = elapsed_time
-                    if metrics.get("response_times") is None:
-                        metrics["response_times"] = []
-                    metrics["response_times"].append(elapsed_time)
-                    continue
-                if should_debug_flag:
-                    logger.debug(f"Строгий режим: запрос не удался (попытка {attempt + 1}, error={error}, status={getattr(response, 'status_code', None)})")
-                active_processes.remove((proc, port))
-                return (vless_line, False, metrics)
-            metrics["successful_requests"] = attempts_needed
-            metrics["successful_urls"] = 1
-            metrics["failed_urls"] = 0
-            active_processes.remove((proc, port))
-            return (vless_line, True, metrics)
-
-        # Собираем все URL для проверки
-        all_urls = []
-        if TEST_URLS:
-            all_urls.extend([(url, "http") for url in TEST_URLS])
-        if TEST_URLS_HTTPS:
-            all_urls.extend([(url, "https") for url in TEST_URLS_HTTPS])
+                            logger.debug(f"Превышено время ответа: {elapsed_time:.2f}с > {MAX_RESPONSE_TIME}с")
+                        continue
+                    
+                    _record_response(outcome, response, elapsed_time)
+                    request_results.append(True)
+                    outcome["successful_requests"] += 1
+                    request_successful = True
+                    break
+                else:
+                    if should_debug_flag:
+                        logger.debug(f"Невалидный ответ: статус={response.status_code}, размер={len(response.content)}")
+            elif error:
+                if should_debug_flag and retry_attempt == MAX_RETRIES:
+                    if is_connection_error(error):
+                        logger.debug(f"Ошибка соединения после {MAX_RETRIES + 1} попыток: {error}")
+                    else:
+                        logger.debug(f"Ошибка запроса: {error}")
+            
+            # Если это connection error и есть еще попытки, продолжаем
+            if error and is_connection_error(error) and retry_attempt < MAX_RETRIES:
+                continue
+            elif error:
+                break
         
-        if not all_urls:
-            if TEST_URL:
-                all_urls = [(TEST_URL, "http")]
-            else:
-                if should_debug_flag:
-                    logger.debug("Нет URL для проверки. Задайте TEST_URL или TEST_URLS.")
-                active_processes.remove((proc, port))
-                return (vless_line, False, metrics)
+        request_results.append(request_successful)
+    
+    # Проверяем, достаточно ли успешных запросов к этому URL
+    outcome["ok"] = sum(request_results) >= MIN_SUCCESSFUL_REQUESTS
+    return outcome
+
+
+def _merge_url_outcome(metrics: dict, outcome: dict) -> None:
+    """Добавляет результаты одного URL (_probe_url_steps) в метрики ключа."""
+    for name in ("response_times", "phase_timings", "cold_response_times", "warm_response_times"):
+        metrics.setdefault(name, []).extend(outcome.get(name, []))
+    for name in ("total_requests", "successful_requests", "timeouts"):
+        metrics[name] = metrics.get(name, 0) + outcome[name]
+
+
+def _probe_steps(vless_line: str, metrics: dict, should_debug_flag: bool, cache: Optional[dict], deadline: Optional[Deadline] = None):
+    """
+    Логика проверки ключа через поднятый туннель, не зависящая от способа ввода-вывода.
+    Генератор отдаёт операции и получает их результаты через send():
+      ("request", url, timeout, method, post_data) -> (response, время_ответа, ошибка)
+      ("sleep", секунды) -> None
+      ("geolocation", timeout) -> dict или None
+      ("parallel", [генераторы], stop) -> список итогов генераторов (None - отменён); генераторы
+        исполняются одновременно, оставшиеся отменяются, как только stop({индекс: итог}) вернёт True
+    Итог (строка_ключа, доступен, метрики) - значение StopIteration.
+    Исполняется синхронно (_run_probe_steps) или в asyncio (lib.async_checker).
+    Таймауты и паузы укорачиваются до остатка deadline; по его исчерпании ключ не прошёл.
+    """
+    if deadline is None:
+        deadline = Deadline(None)
+    # Определяем таймаут
+    timeout = CONNECT_TIMEOUT_SLOW if USE_ADAPTIVE_TIMEOUT else CONNECT_TIMEOUT
+    
+    # Строгий режим: N запросов к gstatic/generate_204 подряд, без повторов; таймаут как в мобильном клиенте
+    if STRONG_STYLE_TEST:
+        test_url = _CLIENT_TEST_HTTPS
+        max_ok_time = STRONG_MAX_RESPONSE_TIME if STRONG_MAX_RESPONSE_TIME > 0 else MAX_RESPONSE_TIME
+        # Таймаут одного запроса: STRONG_STYLE_TIMEOUT - общее время (connect + read), без завышения
+        connect_t = max(3, min(10, int(STRONG_STYLE_TIMEOUT * 0.4)))
+        read_t = max(5, STRONG_STYLE_TIMEOUT - connect_t)
+        timeout_strong = (connect_t, read_t)
+        attempts_needed = max(1, STRONG_ATTEMPTS)
+        last_elapsed = 0.0
+        for attempt in range(attempts_needed):
+            if attempt > 0:
+                yield ("sleep", deadline.sleep_time(0.5))
+            if deadline.expired():
+                return _deadline_exceeded(vless_line, metrics, should_debug_flag)
+            response, elapsed_time, error = yield ("request", test_url, deadline.clamp(timeout_strong), "GET", None)
+            metrics["total_requests"] = metrics.get("total_requests", 0) + 1
+            _count_timeout(metrics, error)
+            if response and not error and check_response_valid(response, 0, test_url):
+                if max_ok_time > 0 and elapsed_time > max_ok_time:
+                    if should_debug_flag:
+                        logger.debug(f"Строгий режим: превышено время ответа {elapsed_time:.2f}с > {max_ok_time}с")
+                    return (vless_line, False, metrics)
+                last_elapsed = elapsed_time
+                _record_response(metrics, response, elapsed_time)
+                continue
+            if should_debug_flag:
+                logger.debug(f"Строгий режим: запрос не удался (попытка {attempt + 1}, error={error}, status={getattr(response, 'status_code', None)})")
+            return (vless_line, False, metrics)
+        metrics["successful_requests"] = attempts_needed
+        metrics["successful_urls"] = 1
+        metrics["failed_urls"] = 0
+        return (vless_line, True, metrics)
+
+    # Собираем все URL для проверки
+    all_urls = []
+    if TEST_URLS:
+        all_urls.extend([(url, "http") for url in TEST_URLS])
+    if TEST_URLS_HTTPS:
+        all_urls.extend([(url, "https") for url in TEST_URLS_HTTPS])
+    
+    if not all_urls:
+        if TEST_URL:
+            all_urls = [(TEST_URL, "http")]
+        else:
+            if should_debug_flag:
+                logger.debug("Нет URL для проверки. Задайте TEST_URL или TEST_URLS.")
+            return (vless_line, False, metrics)
+    
+    # Проверка стабильности: несколько проходов
+    stability_results = []
+    all_url_results = {}  # Сохраняем результаты всех проверок стабильности
+    for stability_check in range(STABILITY_CHECKS):
+        if stability_check > 0:
+            yield ("sleep", deadline.sleep_time(STABILITY_CHECK_DELAY))
         
-        # Проверка стабильности: несколько проходов
-        stability_results = []
-        all_url_results = {}  # Сохраняем результаты всех проверок стабильности
-        for stability_check in range(STABILITY_CHECKS):
-            if stability_check > 0:
-                time.sleep(STABILITY_CHECK_DELAY)
-            
-            url_results = {}
-            successful_urls_count = 0
-            
+        url_results = {}
+        successful_urls_count = 0
+        
+        if URL_PROBE_MODE == "parallel" and len(all_urls) > 1:
+            # Все URL одновременно через один SOCKS-порт; "гонка" - как только хватает успешных URL
+            # (условие короткого замыкания ниже), остальные запросы отменяются; в строгом режиме ждём все
+            def enough(outcomes: dict[int, dict]) -> bool:
+                return _enough_urls([all_urls[i] for i, o in outcomes.items() if o["ok"]])
+
+            def decided(outcomes: dict[int, dict]) -> bool:
+                # Хватает успешных URL или проход уже не может пройти - остальные запросы не нужны
+                return enough(outcomes) or _pass_impossible(all_urls, outcomes)
+
+            outcomes = yield ("parallel", [_probe_url_steps(url, timeout, deadline, should_debug_flag) for url, _ in all_urls], decided)
+            finished = {i: o for i, o in enumerate(outcomes) if o is not None}
+            for i, outcome in finished.items():
+                _merge_url_outcome(metrics, outcome)
+                url_results[all_urls[i][0]] = outcome["ok"]
+                successful_urls_count += 1 if outcome["ok"] else 0
+            if not enough(finished) and any(o["deadline_exceeded"] for o in finished.values()):
+                return _deadline_exceeded(vless_line, metrics, should_debug_flag)
+        else:
             # Проверка каждого URL
-            for url, url_type in all_urls:
-                url_successful = False
-                request_results = []
-                
-                # Множественные запросы к одному URL
-                for request_num in range(REQUESTS_PER_URL):
-                    if request_num > 0:
-                        time.sleep(REQUEST_DELAY)
-                    
-                    # Повторные попытки с экспоненциальной задержкой
-                    last_error = None
-                    request_successful = False
-                    
-                    for retry_attempt in range(MAX_RETRIES + 1):
-                        if retry_attempt > 0:
-                            delay = RETRY_DELAY_BASE * (RETRY_DELAY_MULTIPLIER ** (retry_attempt - 1))
-                            time.sleep(delay)
-                        
-                        response, elapsed_time, error = make_request(url, proxies, timeout)
-                        metrics["total_requests"] += 1
-                        
-                        if response and not error:
-                            if check_response_valid(response, MIN_RESPONSE_SIZE, url):
-                                # Проверка времени ответа
-                                if MAX_RESPONSE_TIME > 0 and elapsed_time > MAX_RESPONSE_TIME:
-                                    if should_debug_flag:
-                                        logger.debug(f"Превышено время ответа: {elapsed_time:.2f}с > {MAX_RESPONSE_TIME}с")
-                                    continue
-                                
-                                metrics["response_times"].append(elapsed_time)
-                                request_results.append(True)
-                                metrics["successful_requests"] += 1
-                                request_successful = True
-                                break
-                            else:
-                                if should_debug_flag:
-                                    logger.debug(f"Невалидный ответ: статус={response.status_code}, размер={len(response.content)}")
-                        elif error:
-                            last_error = error
-                            if should_debug_flag and retry_attempt == MAX_RETRIES:
-                                if is_connection_error(error):
-                                    logger.debug(f"Ошибка соединения после {MAX_RETRIES + 1} попыток: {error}")
-                                else:
-                                    logger.debug(f"Ошибка запроса: {error}")
-                        
-                        # Если это connection error и есть еще попытки, продолжаем
-                        if error and is_connection_error(error) and retry_attempt < MAX_RETRIES:
-                            continue
-                        elif error:
-                            break
-                    
-                    request_results.append(request_successful)
-                
-                # Проверяем, достаточно ли успешных запросов к этому URL
-                successful_requests = sum(request_results)
-                if successful_requests >= MIN_SUCCESSFUL_REQUESTS:
-                    url_successful = True
+            finished = {}
+            for i, (url, url_type) in enumerate(all_urls):
+                outcome = yield from _probe_url_steps(url, timeout, deadline, should_debug_flag)
+                finished[i] = outcome
+                _merge_url_outcome(metrics, outcome)
+                if outcome["deadline_exceeded"]:
+                    return _deadline_exceeded(vless_line, metrics, should_debug_flag)
+                url_results[url] = outcome["ok"]
+                if outcome["ok"]:
                     successful_urls_count += 1
                 
-                url_results[url] = url_successful
-                
                 # Короткое замыкание: если уже достаточно успешных URL - не проверяем остальные
                 # (сохраняем качество: MIN_SUCCESSFUL_URLS по-прежнему требуется)
-                # В строгом режиме проверяем все URL
-                if not STRICT_MODE and successful_urls_count >= MIN_SUCCESSFUL_URLS:
-                    if not REQUIRE_HTTPS:
-                        break
-                    # Если нужен HTTPS - выходим только когда есть хотя бы один успешный HTTPS
-                    if any(url_results.get(u, False) for u, t in all_urls if t == "https"):
-                        break
-            
-            # Проверка POST запросов (если включено)
-            if TEST_POST_REQUESTS:
-                post_url = all_urls[0][0] if all_urls else TEST_URL
-                post_response, post_elapsed, post_error = make_request(
-                    post_url, proxies, timeout, method="POST", post_data={"test": "data"}
-                )
-                metrics["total_requests"] += 1
-                if post_response and not post_error and check_response_valid(post_response, MIN_RESPONSE_SIZE, post_url):
-                    metrics["successful_requests"] += 1
-                    metrics["response_times"].append(post_elapsed)
-                elif should_debug_flag:
-                    logger.debug(f"POST запрос не удался: {post_error}")
-            
-            # Проверка геолокации
-            if CHECK_GEOLOCATION:
-                geolocation = get_geolocation(proxies)
-                if geolocation:
-                    metrics["geolocation"] = geolocation
-                    if not check_geolocation_allowed(geolocation, ALLOWED_COUNTRIES):
-                        if should_debug_flag:
-                            logger.debug(f"Геолокация не разрешена: {geolocation}")
-                        active_processes.remove((proc, port))
-                        return (vless_line, False, metrics)
-            
-            # Сохраняем результаты для этого прохода проверки стабильности
-            for url, success in url_results.items():
-                if url not in all_url_results:
-                    all_url_results[url] = []
-                all_url_results[url].append(success)
-            
-            # Проверка HTTPS для этой проверки стабильности
-            https_check_passed = True
-            if REQUIRE_HTTPS:
-                https_urls = [url for url, url_type in all_urls if url_type == "https"]
-                if https_urls:
-                    https_successful = sum(1 for url in https_urls if url_results.get(url, False))
-                    if https_successful == 0:
-                        https_check_passed = False
-                        if should_debug_flag:
-                            logger.debug(f"Проверка стабильности {stability_check + 1}: нет успешных HTTPS URL")
-            
-            # Проверяем, достаточно ли успешных URL
-            # В строгом режиме требуем успешного прохождения всех URL
-            if STRICT_MODE and STRICT_MODE_REQUIRE_ALL:
-                all_urls_passed = successful_urls_count == len(all_urls)
-                stability_results.append(all_urls_passed and https_check_passed)
-                if not all_urls_passed:
+                if _enough_urls([(u, t) for u, t in all_urls if url_results.get(u, False)]):
+                    break
+                # И наоборот: проход уже не может пройти (например, в строгом режиме не прошёл один URL)
+                if _pass_impossible(all_urls, finished):
+                    break
+        
+        # Проверка POST запросов (если включено)
+        if TEST_POST_REQUESTS:
+            if deadline.expired():
+                return _deadline_exceeded(vless_line, metrics, should_debug_flag)
+            post_url = all_urls[0][0] if all_urls else TEST_URL
+            post_response, post_elapsed, post_error = yield (
+                "request", post_url, deadline.clamp(timeout), "POST", {"test": "data"}
+            )
+            metrics["total_requests"] += 1
+            _count_timeout(metrics, post_error)
+            if post_response and not post_error and check_response_valid(post_response, MIN_RESPONSE_SIZE, post_url):
+                metrics["successful_requests"] += 1
+                _record_response(metrics, post_response, post_elapsed)
+            elif should_debug_flag:
+                logger.debug(f"POST запрос не удался: {post_error}")
+        
+        # Проверка геолокации
+        if CHECK_GEOLOCATION:
+            if deadline.expired():
+                return _deadline_exceeded(vless_line, metrics, should_debug_flag)
+            geolocation = yield ("geolocation", deadline.clamp(CONNECT_TIMEOUT))
+            if geolocation:
+                metrics["geolocation"] = geolocation
+                if not check_geolocation_allowed(geolocation, ALLOWED_COUNTRIES):
                     if should_debug_flag:
-                        logger.debug(f"Строгий режим: не все URL успешны ({successful_urls_count}/{len(all_urls)})")
-                    active_processes.remove((proc, port))
+                        logger.debug(f"Геолокация не разрешена: {geolocation}")
                     return (vless_line, False, metrics)
-                if not https_check_passed:
+        
+        # Сохраняем результаты для этого прохода проверки стабильности
+        for url, success in url_results.items():
+            if url not in all_url_results:
+                all_url_results[url] = []
+            all_url_results[url].append(success)
+        
+        # Проверка HTTPS для этой проверки стабильности
+        https_check_passed = True
+        if REQUIRE_HTTPS:
+            https_urls = [url for url, url_type in all_urls if url_type == "https"]
+            if https_urls:
+                https_successful = sum(1 for url in https_urls if url_results.get(url, False))
+                if https_successful == 0:
+                    https_check_passed = False
                     if should_debug_flag:
-                        logger.debug("Строгий режим: нет успешных HTTPS URL")
-                    active_processes.remove((proc, port))
-                    return (vless_line, False, metrics)
-            else:
-                stability_results.append(successful_urls_count >= MIN_SUCCESSFUL_URLS and https_check_passed)
+                        logger.debug(f"Проверка стабильности {stability_check + 1}: нет успешных HTTPS URL")
         
-        # Проверка стабильности: все проверки должны быть успешными
-        if STABILITY_CHECKS > 1:
-            all_stable = all(stability_results)
-            if not all_stable:
+        # Проверяем, достаточно ли успешных URL
+        # В строгом режиме требуем успешного прохождения всех URL
+        if STRICT_MODE and STRICT_MODE_REQUIRE_ALL:
+            all_urls_passed = successful_urls_count == len(all_urls)
+            stability_results.append(all_urls_passed and https_check_passed)
+            if not all_urls_passed:
                 if should_debug_flag:
-                    logger.debug(f"Нестабильное соединение: {sum(stability_results)}/{STABILITY_CHECKS} проверок успешно")
-                active_processes.remove((proc, port))
+                    logger.debug(f"Строгий режим: не все URL успешны ({successful_urls_count}/{len(all_urls)})")
                 return (vless_line, False, metrics)
-        
-        # Проверка среднего времени ответа
-        if metrics["response_times"]:
-            avg_time = sum(metrics["response_times"]) / len(metrics["response_times"])
-            metrics["avg_response_time"] = avg_time
-            if MIN_AVG_RESPONSE_TIME > 0 and avg_time > MIN_AVG_RESPONSE_TIME:
+            if not https_check_passed:
                 if should_debug_flag:
-                    logger.debug(f"Среднее время ответа слишком велико: {avg_time:.2f}с > {MIN_AVG_RESPONSE_TIME}с")
-                active_processes.remove((proc, port))
+                    logger.debug("Строгий режим: нет успешных HTTPS URL")
                 return (vless_line, False, metrics)
-        
-        # Финальная проверка: достаточно ли успешных URL
-        # Используем результаты последней проверки стабильности
+        else:
+            stability_results.append(successful_urls_count >= MIN_SUCCESSFUL_URLS and https_check_passed)
+    
+    # Проверка стабильности: все проверки должны быть успешными
+    if STABILITY_CHECKS > 1:
+        all_stable = all(stability_results)
+        if not all_stable:
+            if should_debug_flag:
+                logger.debug(f"Нестабильное соединение: {sum(stability_results)}/{STABILITY_CHECKS} проверок успешно")
+            return (vless_line, False, metrics)
+    
+    # Проверка среднего времени ответа
+    if metrics["response_times"]:
+        avg_time = sum(metrics["response_times"]) / len(metrics["response_times"])
+        metrics["avg_response_time"] = avg_time
+        if MIN_AVG_RESPONSE_TIME > 0 and avg_time > MIN_AVG_RESPONSE_TIME:
+            if should_debug_flag:
+                logger.debug(f"Среднее время ответа слишком велико: {avg_time:.2f}с > {MIN_AVG_RESPONSE_TIME}с")
+            return (vless_line, False, metrics)
+    
+    # Финальная проверка: достаточно ли успешных URL
+    # Используем результаты последней проверки стабильности
+    final_url_results = {}
+    final_successful_count = 0
+    if all_url_results:
+        # Берем результаты последней проверки стабильности
+        for url in all_urls:
+            url_key = url[0]
+            if url_key in all_url_results:
+                # URL считается успешным, если он успешен в последней проверке
+                final_url_results[url_key] = all_url_results[url_key][-1] if all_url_results[url_key] else False
+                if final_url_results[url_key]:
+                    final_successful_count += 1
+    else:
+        # Fallback: если нет результатов проверки стабильности, используем пустые результаты
         final_url_results = {}
         final_successful_count = 0
-        if all_url_results:
-            # Берем результаты последней проверки стабильности
-            for url in all_urls:
-                url_key = url[0]
-                if url_key in all_url_results:
-                    # URL считается успешным, если он успешен в последней проверке
-                    final_url_results[url_key] = all_url_results[url_key][-1] if all_url_results[url_key] else False
-                    if final_url_results[url_key]:
-                        final_successful_count += 1
+    
+    metrics["successful_urls"] = final_successful_count
+    metrics["failed_urls"] = len(all_urls) - final_successful_count
+    is_available = final_successful_count >= MIN_SUCCESSFUL_URLS
+    
+    # Проверка HTTPS, если требуется
+    if REQUIRE_HTTPS:
+        https_urls = [url for url, url_type in all_urls if url_type == "https"]
+        if https_urls:
+            https_successful = sum(1 for url in https_urls if final_url_results.get(url, False))
+            if https_successful == 0:
+                if should_debug_flag:
+                    checked = [u for u in https_urls if u in final_url_results]
+                    not_checked = [u for u in https_urls if u not in final_url_results]
+                    logger.debug(f"REQUIRE_HTTPS: нет успешных HTTPS URL (проверено: {len(checked)}, успешных: 0)")
+                    if checked:
+                        for u in checked:
+                            logger.debug(f"  HTTPS {u} -> {final_url_results.get(u, False)}")
+                    if not_checked:
+                        logger.debug(f"  Не проверялись (короткое замыкание?): {not_checked}")
+                    from .config import VERIFY_HTTPS_SSL
+                    if VERIFY_HTTPS_SSL:
+                        logger.debug("  Совет: при ошибке SSL через прокси задайте VERIFY_HTTPS_SSL=false в .env")
+                is_available = False
         else:
-            # Fallback: если нет результатов проверки стабильности, используем пустые результаты
-            final_url_results = {}
-            final_successful_count = 0
-        
-        metrics["successful_urls"] = final_successful_count
-        metrics["failed_urls"] = len(all_urls) - final_successful_count
-        is_available = final_successful_count >= MIN_SUCCESSFUL_URLS
-        
-        # Проверка HTTPS, если требуется
+            if should_debug_flag:
+                logger.debug("REQUIRE_HTTPS: нет HTTPS URL для проверки (TEST_URLS_HTTPS пуст?)")
+            is_available = False
+    
+    # В строгом режиме требуем успешного прохождения всех URL
+    if STRICT_MODE and STRICT_MODE_REQUIRE_ALL:
+        is_available = final_successful_count == len(all_urls)
         if REQUIRE_HTTPS:
             https_urls = [url for url, url_type in all_urls if url_type == "https"]
             if https_urls:
                 https_successful = sum(1 for url in https_urls if final_url_results.get(url, False))
-                if https_successful == 0:
-                    if should_debug_flag:
-                        checked = [u for u in https_urls if u in final_url_results]
-                        not_checked = [u for u in https_urls if u not in final_url_results]
-                        logger.debug(f"REQUIRE_HTTPS: нет успешных HTTPS URL (проверено: {len(checked)}, успешных: 0)")
-                        if checked:
-                            for u in checked:
-                                logger.debug(f"  HTTPS {u} -> {final_url_results.get(u, False)}")
-                        if not_checked:
-                            logger.debug(f"  Не проверялись (короткое замыкание?): {not_checked}")
-                        from config import VERIFY_HTTPS_SSL
-                        if VERIFY_HTTPS_SSL:
-                            logger.debug("  Совет: при ошибке SSL через прокси задайте VERIFY_HTTPS_SSL=false в .env")
-                    is_available = False
+                # В строгом режиме требуем успешного прохождения всех HTTPS URL
+                is_available = is_available and (https_successful == len(https_urls))
             else:
-                if should_debug_flag:
-                    logger.debug("REQUIRE_HTTPS: нет HTTPS URL для проверки (TEST_URLS_HTTPS пуст?)")
+                # Если REQUIRE_HTTPS=true, но нет HTTPS URL - это ошибка конфигурации
                 is_available = False
-        
-        # В строгом режиме требуем успешного прохождения всех URL
-        if STRICT_MODE and STRICT_MODE_REQUIRE_ALL:
-            is_available = final_successful_count == len(all_urls)
-            if REQUIRE_HTTPS:
-                https_urls = [url for url, url_type in all_urls if url_type == "https"]
-                if https_urls:
-                    https_successful = sum(1 for url in https_urls if final_url_results.get(url, False))
-                    # В строгом режиме требуем успешного прохождения всех HTTPS URL
-                    is_available = is_available and (https_successful == len(https_urls))
+    
+    # Сохранение в кэш
+    if cache is not None and ENABLE_CACHE:
+        key_hash = get_key_hash(vless_line)
+        cache[key_hash] = {
+            'result': is_available,
+            'timestamp': time.time()
+        }
+    
+    return (vless_line, is_available, metrics)
+
+
+def _run_probe_steps(steps, port: int, cancel: Optional[threading.Event] = None, session=None):
+    """
+    Синхронно исполняет операции _probe_steps через SOCKS-порт xray.
+    cancel: при установке события исполнение прекращается перед следующей операцией (итог None).
+    session: keep-alive сессия ключа (socks_session), общая для всех запросов, в том числе параллельных.
+    """
+    result = None
+    try:
+        while True:
+            if cancel is not None and cancel.is_set():
+                steps.close()
+                return None
+            op = steps.send(result)
+            kind = op[0]
+            if kind == "request":
+                _, url, timeout, method, post_data = op
+                result = make_socks_request(url, port, timeout, method=method, post_data=post_data, session=session)
+            elif kind == "sleep":
+                if cancel is not None:
+                    cancel.wait(op[1])
                 else:
-                    # Если REQUIRE_HTTPS=true, но нет HTTPS URL - это ошибка конфигурации
-                    is_available = False
-        
-        # Сохранение в кэш
-        if cache is not None and ENABLE_CACHE:
-            key_hash = get_key_hash(vless_line)
-            cache[key_hash] = {
-                'result': is_available,
-                'timestamp': time.time()
-            }
-        
-        active_processes.remove((proc, port))
-        return (vless_line, is_available, metrics)
+                    time.sleep(op[1])
+                result = None
+            elif kind == "geolocation":
+                result = get_geolocation_via_socks(port, op[1])
+            elif kind == "parallel":
+                result = _run_parallel_steps(op[1], op[2], port, session)
+            else:
+                raise ValueError(f"Неизвестная операция проверки: {kind}")
+    except StopIteration as stop:
+        return stop.value
+
+
+# Общий пул потоков для операций "parallel": потоки переиспользуются между ключами и проходами стабильности
+_parallel_executor: Optional[ThreadPoolExecutor] = None
+_parallel_executor_lock = threading.Lock()
+
+
+def _get_parallel_executor() -> ThreadPoolExecutor:
+    global _parallel_executor
+    with _parallel_executor_lock:
+        if _parallel_executor is None:
+            # Потоки создаются по мере надобности: предел - все URL всех одновременно проверяемых ключей
+            checks = max(MAX_WORKERS, ADAPTIVE_MAX_WORKERS if ADAPTIVE_CONCURRENCY else 0)
+            urls = max(2, len(TEST_URLS) + len(TEST_URLS_HTTPS))
+            _parallel_executor = ThreadPoolExecutor(max_workers=checks * urls, thread_name_prefix="probe")
+        return _parallel_executor
+
+
+def _run_parallel_steps(generators: list, stop, port: int, session=None) -> list:
+    """
+    Операция "parallel": генераторы в потоках общего пула, незавершённые отменяются по stop().
+    Отмена прерывает идущие запросы (ProbeSession.abort_active), и функция дожидается всех потоков:
+    после возврата никто не пишет в сессию, её можно закрывать. Запросы клиента requests прервать
+    нельзя - их ожидание ограничено таймаутом запроса.
+    """
+    own_session = None
+    if session is None and PROBE_CLIENT != "requests":
+        # Без keep-alive: отдельная сессия нужна только для отмены запросов
+        session = own_session = ProbeSession(port, keep_alive=False)
+    outcomes: dict[int, object] = {}
+    cancel = threading.Event()
+    executor = _get_parallel_executor()
+    futures = {executor.submit(_run_probe_steps, gen, port, cancel, session): i for i, gen in enumerate(generators)}
+    try:
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                outcomes[futures[future]] = future.result()
+            if stop(outcomes):
+                break
+    finally:
+        cancel.set()
+        abort_active = getattr(session, "abort_active", None)
+        if abort_active is not None:
+            abort_active()
+        wait(futures)
+        if own_session is not None:
+            own_session.close()
+    return [outcomes.get(i) for i in range(len(generators))]
+
+
+def _check_through_proxy(vless_line: str, port: int, metrics: dict, should_debug_flag: bool, cache: Optional[dict], deadline: Optional[Deadline] = None) -> tuple[str, bool, dict]:
+    """
+    Проверка ключа через уже поднятый локальный SOCKS-порт xray.
+    Возвращает (строка_ключа, доступен, метрики).
+    """
+    session = socks_session(port)
+    try:
+        return _run_probe_steps(_probe_steps(vless_line, metrics, should_debug_flag, cache, deadline), port, session=session)
+    finally:
+        if session is not None:
+            session.close()
+
+
+def _check_key_via_daemon(pool: XrayDaemonPool, vless_line: str, parsed: dict, metrics: dict, should_debug_flag: bool, cache: Optional[dict], deadline: Deadline) -> tuple[str, bool, dict]:
+    """Проверка ключа через слот долгоживущего xray: outbound добавляется через API и удаляется после проверки."""
+    lease = pool.lease(timeout=min(deadline.remaining(), 60.0))
+    if lease is None:
+        if should_debug_flag:
+            logger.debug("Нет свободного слота xray-демона.")
+        return (vless_line, False, metrics)
+    daemon, slot = lease
+    try:
+        if not daemon.attach(slot, parsed):
+            if should_debug_flag:
+                logger.debug("xray API отклонил outbound ключа.")
+            return (vless_line, False, metrics)
+        try:
+            return _check_through_proxy(vless_line, daemon.socks_ports[slot], metrics, should_debug_flag, cache, deadline)
+        finally:
+            daemon.detach(slot)
+    except ValueError as e:
+        if should_debug_flag:
+            logger.debug(f"Исключение: {e}")
+        return (vless_line, False, metrics)
+    finally:
+        pool.release(daemon, slot)
+
+
+def check_key_e2e(vless_line: str, debug: bool = False, cache: Optional[dict] = None) -> tuple[str, bool, Optional[dict]]:
+    """
+    End-to-end проверка с расширенными возможностями.
+    Возвращает (строка_ключа, доступен, метрики).
+    Метрики содержат информацию о проверке (время ответа, геолокация и т.д.).
+    """
+    # debug параметр используется только для первого ключа и только если уровень логирования DEBUG
+    should_debug_flag = should_debug_func(debug)
+    deadline = Deadline()
+
+    early_result, parsed, metrics = _prepare_key(vless_line, should_debug_flag, cache, deadline=deadline)
+    if early_result is not None:
+        return early_result
+
+    # Режим демонов: без запуска отдельного xray (если демоны не поднялись - обычный путь)
+    if XRAY_DAEMON_MODE:
+        pool = get_daemon_pool()
+        if pool is not None:
+            return _check_key_via_daemon(pool, vless_line, parsed, metrics, should_debug_flag, cache, deadline)
+
+    port = take_port()
+    if port is None:
+        if should_debug_flag:
+            logger.debug("Нет свободного порта в пуле.")
+        return (vless_line, False, metrics)
+    
+    proc = None
+
+    try:
+        proc = run_xray(render_xray_config(parsed, port), stderr_pipe=should_debug_flag)
+        # В реестре - для завершения при прерывании
+        register(proc, [port])
+        ready, err = wait_for_xray_ready(proc, [port], timeout=min(XRAY_STARTUP_WAIT, deadline.remaining()))
+        if not ready:
+            if should_debug_flag:
+                logger.debug(f"xray не готов: {err}")
+            return (vless_line, False, metrics)
+
+        return _check_through_proxy(vless_line, port, metrics, should_debug_flag, cache, deadline)
         
     except FileNotFoundError:
         if should_debug_flag:
-            import config
-            logger.debug(f"Xray не найден (команда: {config.XRAY_CMD}). Установите Xray и добавьте в PATH или задайте XRAY_PATH.")
-        if proc:
-            try:
-                active_processes.remove((proc, port))
-            except ValueError:
-                pass
+            from . import config as config_module
+            logger.debug(f"Xray не найден (команда: {config_module.XRAY_CMD}). Установите Xray и добавьте в PATH или задайте XRAY_PATH.")
         return (vless_line, False, metrics)
     except Exception as e:
         if should_debug_flag:
@@ -489,28 +728,98 @@ def check_key_e2e(vless_line: str, debug: bool = False, cache: Optional[dict] =
                         logger.debug(f"stderr xray:\n{err}")
                 except Exception:
                     pass
-        if proc:
-            try:
-                active_processes.remove((proc, port))
-            except ValueError:
-                pass
         return (vless_line, False, metrics)
     finally:
-        if proc is not None:
+        if proc is not None and should_debug_flag and proc.stderr is not None and proc.poll() is not None:
             try:
-                active_processes.remove((proc, port))
-            except ValueError:
+                err = proc.stderr.read().decode("utf-8", errors="replace")
+                if err.strip():
+                    logger.debug(f"stderr xray после завершения:\n{err}")
+            except Exception:
                 pass
-            if should_debug_flag and proc.stderr is not None and proc.poll() is not None:
-                try:
-                    err = proc.stderr.read().decode("utf-8", errors="replace")
-                    if err.strip():
-                        logger.debug(f"stderr xray после завершения:\n{err}")
-                except Exception:
-                    pass
-            kill_xray_process(proc, drain_stderr=True)
+        record_usage(proc, [metrics])
+        # Без ожидания выхода xray: порт вернёт фоновый сборщик
+        release(proc, [port])
+
+
+def check_keys_batch(vless_lines: list[str], debug: bool = False, cache: Optional[dict] = None) -> list[tuple[str, bool, Optional[dict]]]:
+    """
+    Пакетная проверка: один процесс xray на весь пакет ключей (свой SOCKS-порт на каждый ключ),
+    запросы по ключам идут параллельно. Результаты - как у check_key_e2e, в порядке vless_lines.
+    Если пакетный xray не поднялся (например, один из конфигов невалиден) - ключи
+    проверяются по одному через check_key_e2e.
+    """
+    should_debug_flag = should_debug_func(debug)
+    # Бюджет времени общий для ключей пакета: они проверяются одновременно
+    deadline = Deadline()
+    results: dict[str, tuple[str, bool, Optional[dict]]] = {}
+    pending: list[tuple[str, dict, dict]] = []
+    for line in vless_lines:
+        early_result, parsed, metrics = _prepare_key(line, should_debug_flag, cache, deadline=Deadline())
+        if early_result is not None:
+            results[line] = early_result
+        else:
+            pending.append((line, parsed, metrics))
+
+    def fallback(items: list[tuple[str, dict, dict]]) -> None:
+        for line, _, _ in items:
+            results[line] = check_key_e2e(line, debug=debug, cache=cache)
+
+    if len(pending) <= 1:
+        fallback(pending)
+        return [results[line] for line in vless_lines]
+
+    ports = take_ports(len(pending))
+    if ports is None:
+        if should_debug_flag:
+            logger.debug("Нет свободных портов для пакета, проверка по одному.")
+        fallback(pending)
+        return [results[line] for line in vless_lines]
+
+    proc = None
+    started = False
+    try:
         try:
-            os.unlink(config_path)
-        except FileNotFoundError:
-            pass
-        return_port(port)
+            config = render_xray_batch_config([parsed for _, parsed, _ in pending], ports)
+        except ValueError as e:
+            if should_debug_flag:
+                logger.debug(f"Пакетный конфиг не собран: {e}")
+            config = None
+        if config is not None:
+            proc = run_xray(config, stderr_pipe=should_debug_flag)
+            register(proc, ports)
+            started, err = wait_for_xray_ready(proc, ports, timeout=min(XRAY_STARTUP_WAIT, deadline.remaining()))
+            if not started and should_debug_flag:
+                logger.debug(f"Пакетный xray не готов: {err}")
+        if started:
+            with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+                futures = [
+                    executor.submit(_check_through_proxy, line, port, metrics, should_debug_flag, cache, deadline)
+                    for (line, _, metrics), port in zip(pending, ports)
+                ]
+                for (line, _, metrics), future in zip(pending, futures):
+                    try:
+                        results[line] = future.result()
+                    except Exception as e:
+                        if should_debug_flag:
+                            logger.debug(f"Исключение: {e}")
+                        results[line] = (line, False, metrics)
+    except FileNotFoundError:
+        if should_debug_flag:
+            from . import config as config_module
+            logger.debug(f"Xray не найден (команда: {config_module.XRAY_CMD}). Установите Xray и добавьте в PATH или задайте XRAY_PATH.")
+        for line, _, metrics in pending:
+            results[line] = (line, False, metrics)
+    except Exception as e:
+        # Ключи без результата будут проверены по одному
+        if should_debug_flag:
+            logger.debug(f"Исключение в пакетной проверке: {e}")
+        started = False
+    finally:
+        if started:
+            record_usage(proc, [metrics for _, _, metrics in pending])
+        release(proc, ports)
+
+    if not started:
+        fallback([item for item in pending if item[0] not in results])
+    return [results[line] for line in vless_lines]
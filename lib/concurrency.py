@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модуль адаптивной параллельности (ADAPTIVE_CONCURRENCY).
+AIMD-регулятор числа одновременных проверок: раз в ADAPTIVE_INTERVAL секунд лимит
+растёт на шаг, если пропускная способность заметно выросла (или это первое окно), и умножается на 0.7 при давлении:
+загрузка CPU, мало свободных дескрипторов или памяти, всплеск доли таймаутов.
+Каждое изменение лимита пишется в лог с причиной.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Optional
+
+from .config import (
+    ADAPTIVE_INTERVAL,
+    ADAPTIVE_MAX_WORKERS,
+    ADAPTIVE_MIN_WORKERS,
+    ADAPTIVE_TIMEOUT_SPIKE,
+    XRAY_DAEMON_COUNT,
+    XRAY_DAEMON_MODE,
+    XRAY_DAEMON_SLOTS,
+)
+from .key_feed import KeyFeed
+
+logger = logging.getLogger(__name__)
+
+_DECREASE_FACTOR = 0.7
+# Как часто пул перепроверяет источник ключей, пока ждёт завершения задач
+_FEED_POLL = 0.1
+# Рост лимита - только если пропускная способность выросла хотя бы на столько (на плато лимит не растёт)
+_GROWTH_MIN_GAIN = 1.05
+# Пороги давления на ресурсы
+_CPU_BUSY_LIMIT = 0.95
+_FD_USED_LIMIT = 0.85
+_MEM_AVAILABLE_MIN = 0.10
+
+
+def _read_cpu_times() -> Optional[tuple[int, int]]:
+    """(простой, всего) из /proc/stat или None."""
+    try:
+        with open("/proc/stat", "r", encoding="ascii") as f:
+            fields = [int(x) for x in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+    return (idle, sum(fields))
+
+
+def _fd_usage() -> Optional[float]:
+    """Доля занятых дескрипторов процесса от мягкого лимита."""
+    try:
+        import resource
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft == resource.RLIM_INFINITY or soft <= 0:
+            return None
+        return len(os.listdir("/proc/self/fd")) / soft
+    except (ImportError, OSError, ValueError):
+        return None
+
+
+def _memory_available() -> Optional[float]:
+    """Доля доступной памяти (MemAvailable / MemTotal)."""
+    try:
+        info = {}
+        with open("/proc/meminfo", "r", encoding="ascii") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                info[name] = int(value.split()[0])
+        return info["MemAvailable"] / info["MemTotal"]
+    except (OSError, ValueError, KeyError, ZeroDivisionError):
+        return None
+
+
+def max_workers_cap() -> int:
+    """Верхняя граница лимита: в режиме демонов не больше, чем слотов у демонов."""
+    if XRAY_DAEMON_MODE:
+        return max(1, min(ADAPTIVE_MAX_WORKERS, XRAY_DAEMON_COUNT * XRAY_DAEMON_SLOTS))
+    return ADAPTIVE_MAX_WORKERS
+
+
+class AdaptiveLimiter:
+    """AIMD-регулятор числа одновременных задач. record() вызывается по завершении каждой задачи."""
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int = ADAPTIVE_MIN_WORKERS,
+        maximum: Optional[int] = None,
+        interval: float = ADAPTIVE_INTERVAL,
+    ):
+        self.maximum = max(1, maximum if maximum is not None else max_workers_cap())
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.initial = max(self.minimum, min(initial, self.maximum))
+        self.limit = self.initial
+        self.interval = interval
+        self.step = max(2, self.initial // 10)
+        self.decisions: list[str] = []
+        self.lowest = self.limit
+        self.highest = self.limit
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._completed = 0
+        self._timeouts = 0
+        self._prev_rate: Optional[float] = None
+        self._timeout_baseline: Optional[float] = None
+        self._cpu_prev = _read_cpu_times()
+
+    def record(self, timed_out: bool = False) -> None:
+        with self._lock:
+            self._completed += 1
+            if timed_out:
+                self._timeouts += 1
+            now = time.monotonic()
+            if now - self._window_start >= self.interval:
+                self._adjust(now)
+
+    def _cpu_busy(self) -> Optional[float]:
+        current = _read_cpu_times()
+        if current is None or self._cpu_prev is None:
+            try:
+                return os.getloadavg()[0] / (os.cpu_count() or 1)
+            except (AttributeError, OSError):
+                return None
+        idle_delta = current[0] - self._cpu_prev[0]
+        total_delta = current[1] - self._cpu_prev[1]
+        self._cpu_prev = current
+        if total_delta <= 0:
+            return None
+        return 1.0 - idle_delta / total_delta
+
+    def _pressure(self, timeout_ratio: float) -> Optional[str]:
+        """Причина сократить лимит или None."""
+        cpu = self._cpu_busy()
+        if cpu is not None and cpu > _CPU_BUSY_LIMIT:
+            return f"CPU загружен на {cpu:.0%}"
+        fd = _fd_usage()
+        if fd is not None and fd > _FD_USED_LIMIT:
+            return f"занято {fd:.0%} дескрипторов"
+        mem = _memory_available()
+        if mem is not None and mem < _MEM_AVAILABLE_MIN:
+            return f"свободно {mem:.0%} памяти"
+        baseline = self._timeout_baseline
+        if baseline is not None and timeout_ratio - baseline > ADAPTIVE_TIMEOUT_SPIKE:
+            return f"всплеск таймаутов: {timeout_ratio:.0%} (обычно {baseline:.0%})"
+        return None
+
+    def _adjust(self, now: float) -> None:
+        elapsed = now - self._window_start
+        rate = self._completed / elapsed
+        timeout_ratio = self._timeouts / self._completed if self._completed else 0.0
+        old = self.limit
+        reason = self._pressure(timeout_ratio)
+        if reason:
+            self.limit = max(self.minimum, int(self.limit * _DECREASE_FACTOR))
+        else:
+            # Обычная доля таймаутов (мёртвые ключи дают её всегда) - скользящее среднее без окон перегрузки
+            self._timeout_baseline = timeout_ratio if self._timeout_baseline is None else (
+                0.7 * self._timeout_baseline + 0.3 * timeout_ratio
+            )
+            if self._prev_rate is None or rate >= self._prev_rate * _GROWTH_MIN_GAIN:
+                self.limit = min(self.maximum, self.limit + self.step)
+                reason = f"пропускная способность {rate:.1f}/с"
+        self._prev_rate = rate
+        self._window_start = now
+        self._completed = 0
+        self._timeouts = 0
+        if self.limit != old:
+            self.lowest = min(self.lowest, self.limit)
+            self.highest = max(self.highest, self.limit)
+            message = f"параллельность {old} -> {self.limit}: {reason}"
+            self.decisions.append(message)
+            logger.info(message)
+
+    def summary(self) -> str:
+        return (
+            f"старт {self.initial}, итог {self.limit}, диапазон {self.lowest}-{self.highest}, "
+            f"изменений {len(self.decisions)}"
+        )
+
+
+def run_adaptive(
+    fn: Callable,
+    items: Iterable | KeyFeed,
+    on_done: Callable[[object, Future], bool],
+    limiter: Optional[AdaptiveLimiter] = None,
+    workers: int = 1,
+    batch: int = 1,
+) -> None:
+    """
+    Выполняет fn(item) в пуле потоков, держа в работе не больше limiter.limit задач (без limiter - workers).
+    on_done(item, future) обрабатывает результат и возвращает True, если задача завершилась таймаутом.
+    items - список или KeyFeed: задачи берутся по мере освобождения места, пока источник не исчерпан.
+    batch > 1: элемент задачи - список до batch ключей источника.
+    """
+    feed = items if isinstance(items, KeyFeed) else KeyFeed(items)
+    pending: dict[Future, object] = {}
+    exhausted = False
+    with ThreadPoolExecutor(max_workers=limiter.maximum if limiter is not None else max(1, workers)) as executor:
+        while True:
+            limit = limiter.limit if limiter is not None else max(1, workers)
+            while not exhausted and len(pending) < limit:
+                try:
+                    # Пока задачи в работе - не ждём: источник пополнится по их результатам
+                    links = feed.get_many(batch, timeout=0 if pending else None)
+                except queue.Empty:
+                    break
+                if links is None:
+                    exhausted = True
+                    break
+                item = links if batch > 1 else links[0]
+                pending[executor.submit(fn, item)] = item
+            if not pending:
+                break
+            # Ограниченное ожидание: ключи могут появиться в источнике и без завершения своих задач
+            done, _ = wait(pending, timeout=None if exhausted else _FEED_POLL, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                timed_out = bool(on_done(item, future))
+                if limiter is not None:
+                    limiter.record(timed_out)
@@ -94,11 +94,18 @@ REQUEST_DELAY = _env_float("REQUEST_DELAY", 0.5)
 CONNECT_TIMEOUT = _env_int("CONNECT_TIMEOUT", 8)
 CONNECT_TIMEOUT_SLOW = _env_int("CONNECT_TIMEOUT_SLOW", 15)
 USE_ADAPTIVE_TIMEOUT = _env_bool("USE_ADAPTIVE_TIMEOUT", False)
+# Бюджет времени на один ключ (секунд, 0 = без ограничения): таймауты запросов, повторы и паузы
+# укорачиваются до остатка бюджета, по его исчерпании ключ считается нерабочим. По умолчанию выключен:
+# медленный, но рабочий ключ не должен попадать в notworkers из-за общего лимита
+KEY_DEADLINE = _env_float("KEY_DEADLINE", 0.0)
 
 # Повторные попытки
 MAX_RETRIES = _env_int("MAX_RETRIES", 1)
 RETRY_DELAY_BASE = _env_float("RETRY_DELAY_BASE", 1.0)
 RETRY_DELAY_MULTIPLIER = _env_float("RETRY_DELAY_MULTIPLIER", 2.0)
+# Порядок проверки URL ключа: sequential - по одному (по умолчанию, как раньше); parallel - все URL одновременно
+# через один туннель (как только набралось MIN_SUCCESSFUL_URLS, остальные отменяются; в строгом режиме ждём все)
+URL_PROBE_MODE = _env("URL_PROBE_MODE", "sequential").lower()
 
 # Проверка ответов
 MAX_RESPONSE_TIME = _env_float("MAX_RESPONSE_TIME", 0)
@@ -106,6 +113,16 @@ MIN_RESPONSE_SIZE = _env_int("MIN_RESPONSE_SIZE", 0)
 VERIFY_HTTPS_SSL = _env_bool("VERIFY_HTTPS_SSL", False)
 # Максимальная задержка (мс): серверы с задержкой выше не попадают в available / white-list_available
 MAX_LATENCY_MS = _env_int("MAX_LATENCY_MS", 3000)
+# Клиент проверочных запросов: requests - через requests/PySocks (по умолчанию, как раньше); raw - встроенный
+# SOCKS5/HTTP-клиент с замером фаз (connect, SOCKS, TLS, первый байт)
+PROBE_CLIENT = _env("PROBE_CLIENT", "requests").lower()
+# Keep-alive сессия на ключ: повторные запросы (REQUESTS_PER_URL, проходы стабильности, попытки строгого режима)
+# идут по уже открытому туннелю без SOCKS- и TLS-рукопожатия; первый запрос считается холодным, остальные - тёплыми.
+# По умолчанию выключено: тёплые запросы быстрее холодных, средняя задержка ключа меняется
+PROBE_KEEP_ALIVE = _env_bool("PROBE_KEEP_ALIVE", False)
+# Сортировать рабочие ключи по средней задержке тёплых запросов, если они были (MAX_LATENCY_MS по-прежнему
+# применяется к средней по всем запросам)
+SORT_BY_WARM_LATENCY = _env_bool("SORT_BY_WARM_LATENCY", False)
 
 if not VERIFY_HTTPS_SSL:
     urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -134,13 +151,130 @@ STRONG_ATTEMPTS = _env_int("STRONG_ATTEMPTS", 3)
 
 # Производительность
 MAX_WORKERS = _env_int("MAX_WORKERS", 120)
+# Движок проверки: threads - пул потоков (MAX_WORKERS), async - asyncio (ASYNC_CONCURRENCY ключей одновременно)
+CHECK_ENGINE = _env("CHECK_ENGINE", "threads").lower()
+ASYNC_CONCURRENCY = _env_int("ASYNC_CONCURRENCY", 500)
+# Процессов проверки (0 = по числу ядер): ключи раздаются процессам через общую очередь заданий, у каждого
+# своя часть портов (см. INBOUND_ALLOCATOR) и 1/K от MAX_WORKERS/ASYNC_CONCURRENCY;
+# 1 - всё в одном процессе. Пакетный режим (XRAY_BATCH_SIZE > 1) и адаптивная параллельность - только в одном процессе
+WORKER_PROCESSES = _env_int("WORKER_PROCESSES", 1) or (os.cpu_count() or 1)
+# Адаптивная параллельность (AIMD) для пула потоков проверки и speedtest: MAX_WORKERS - стартовое значение,
+# число одновременных проверок растёт, пока растёт пропускная способность, и сокращается при загрузке CPU,
+# нехватке дескрипторов или памяти и всплеске доли таймаутов
+ADAPTIVE_CONCURRENCY = _env_bool("ADAPTIVE_CONCURRENCY", False)
+ADAPTIVE_MIN_WORKERS = _env_int("ADAPTIVE_MIN_WORKERS", 8)
+ADAPTIVE_MAX_WORKERS = _env_int("ADAPTIVE_MAX_WORKERS", 400)
+ADAPTIVE_INTERVAL = _env_float("ADAPTIVE_INTERVAL", 3.0)  # секунд между решениями
+ADAPTIVE_TIMEOUT_SPIKE = _env_float("ADAPTIVE_TIMEOUT_SPIKE", 0.2)  # рост доли таймаутов над обычной, считающийся всплеском
 BASE_PORT = _env_int("BASE_PORT", 20000)
 
+# DNS: до проверки разрешить имена серверов всех ключей параллельно (кэш в памяти и в DNS_CACHE_FILE);
+# ключи с несуществующим доменом (NXDOMAIN) сразу считаются нерабочими. По умолчанию выключено
+DNS_PRECACHE = _env_bool("DNS_PRECACHE", False)
+DNS_CACHE_FILE = _env("DNS_CACHE_FILE", ".dns_cache.json")
+DNS_CACHE_TTL = _env_int("DNS_CACHE_TTL", 600)  # секунд для успешно разрешённых имён
+DNS_NEGATIVE_TTL = _env_int("DNS_NEGATIVE_TTL", 300)  # секунд для NXDOMAIN
+DNS_TIMEOUT = _env_float("DNS_TIMEOUT", 5.0)
+DNS_CONCURRENCY = _env_int("DNS_CONCURRENCY", 64)
+
+# Потоковая запись: каждый проверенный ключ сразу дописывается в <результат>.jsonl, файл рабочих ключей
+# и (top100) переписываются (атомарно) раз в STREAM_PUBLISH_INTERVAL секунд, а не только в конце прогона.
+# По умолчанию выключено (шарды --shard пишут JSONL всегда: по нему собирается общий результат)
+STREAM_RESULTS = _env_bool("STREAM_RESULTS", False)
+STREAM_PUBLISH_INTERVAL = _env_float("STREAM_PUBLISH_INTERVAL", 30.0)
+# Шард "i/N" (как --shard i/N): проверять только ключи, чей стабильный хеш попадает в шард i из N;
+# результаты шардов собирает vless_checker.py --merge-shards
+SHARD = _env("SHARD", "")
+# Общая очередь ключей (как --queue ПУТЬ): несколько процессов проверки берут пачки ключей из файла SQLite
+# в аренду; аренда продлевается, пока процесс жив, ключи упавшего процесса возвращаются в очередь
+WORK_QUEUE = _env("WORK_QUEUE", "")
+QUEUE_BATCH_SIZE = _env_int("QUEUE_BATCH_SIZE", 50)  # ключей в одной аренде
+QUEUE_LEASE_SECONDS = _env_float("QUEUE_LEASE_SECONDS", 60.0)  # аренда без heartbeat истекает через столько секунд
+QUEUE_MAX_ATTEMPTS = _env_int("QUEUE_MAX_ATTEMPTS", 3)  # истёкших аренд ключа, после которых он считается нерабочим
+# Продолжение после обрыва: проверенные ключи с вердиктом и метриками пишутся в JOURNAL_FILE; при перезапуске
+# с тем же списком они не проверяются заново. После успешного завершения журнал удаляется. По умолчанию выключено
+RESUME = _env_bool("RESUME", False)
+JOURNAL_FILE = _env("JOURNAL_FILE", ".checker_journal.jsonl")
+JOURNAL_FLUSH_EVERY = _env_int("JOURNAL_FLUSH_EVERY", 50)  # записей в пачке
+JOURNAL_FLUSH_INTERVAL = _env_float("JOURNAL_FLUSH_INTERVAL", 5.0)  # не реже, секунд
+# Приоритетный порядок: сначала ключи, которые вероятнее пройдут (по прошлому результату, notworkers, кэшу
+# и признакам ключа) - при обрыве прогона по таймауту рабочие ключи уже проверены. По умолчанию - порядок списка
+PRIORITY_SCHEDULING = _env_bool("PRIORITY_SCHEDULING", False)
+# Группировка по серверу: сначала проверяется один ключ на адрес:порт/транспорт; если он не прошёл и сервер
+# не принимает TCP - остальные ключи этого сервера считаются нерабочими без запуска xray. По умолчанию выключена
+ENDPOINT_GROUPING = _env_bool("ENDPOINT_GROUPING", False)
+
+# TCP-префильтр: до запуска xray проверить, что адрес:порт сервера принимает TCP-соединения;
+# недоступные ключи сразу считаются нерабочими (UDP-транспорты kcp/quic и Hysteria не фильтруются).
+# Отсеянные без запуска xray ключи в notworkers не попадают: сбой соединения мог быть разовым.
+# По умолчанию выключен: меняет вердикты и состав notworkers
+TCP_PREFILTER = _env_bool("TCP_PREFILTER", False)
+# Таймаут соединения префильтра - как у самой проверки, чтобы не отсеивать медленные, но рабочие серверы
+TCP_PREFILTER_TIMEOUT = _env_float("TCP_PREFILTER_TIMEOUT", float(CONNECT_TIMEOUT))
+TCP_PREFILTER_CONCURRENCY = _env_int("TCP_PREFILTER_CONCURRENCY", 2000)
+
 # Настройки Xray
+# Максимальное ожидание запуска xray: проверка идёт, как только SOCKS-порт начал принимать соединения
 XRAY_STARTUP_WAIT = _env_float("XRAY_STARTUP_WAIT", 1.8)
+# Интервал опроса порта xray при запуске (как раньше; меньше - быстрее готовность при большей нагрузке опросом)
 XRAY_STARTUP_POLL_INTERVAL = _env_float("XRAY_STARTUP_POLL_INTERVAL", 0.2)
 XRAY_CMD = _env("XRAY_PATH", "") or "xray"
+# Передача конфига в xray без временных файлов: stdin (-config stdin:) или memfd (анонимный файл в памяти,
+# только Linux; без memfd - stdin). Включено по умолчанию: конфиг тот же, меняется только способ передачи,
+# вердикты и вывод не зависят от него
+XRAY_CONFIG_DELIVERY = _env("XRAY_CONFIG_DELIVERY", "stdin").lower()
+# Защита от осиротевших xray (Linux): PR_SET_PDEATHSIG - spawn-сервер и процессы-исполнители (а с ними их xray)
+# завершаются вместе с процессом проверки даже при SIGKILL; ORPHAN_SWEEP - при старте завершить xray прошлых запусков, чей процесс уже не существует
+XRAY_PDEATHSIG = _env_bool("XRAY_PDEATHSIG", True)
+ORPHAN_SWEEP = _env_bool("ORPHAN_SWEEP", True)
+# Запуск xray через spawn-сервер (POSIX): отдельный маленький процесс запускает xray через posix_spawn,
+# процессу проверки не нужен fork (дорогой при многих потоках и большой куче); xray завершаются вместе с ним.
+# По умолчанию выключен: xray запускается напрямую из процесса проверки, как раньше
+XRAY_SPAWN_SERVER = _env_bool("XRAY_SPAWN_SERVER", False)
+# Профиль ресурсов xray: none - без ограничений; lean - GOMAXPROCS=1, GOGC=50, GOMEMLIMIT=64MiB, nice 10,
+# ionice idle (больше одновременных xray на маленьких машинах). Отдельные настройки ниже переопределяют профиль
+XRAY_RESOURCE_PROFILE = _env("XRAY_RESOURCE_PROFILE", "none").lower()
+XRAY_GOMAXPROCS = _env("XRAY_GOMAXPROCS", "")
+XRAY_GOGC = _env("XRAY_GOGC", "")
+XRAY_GOMEMLIMIT = _env("XRAY_GOMEMLIMIT", "")
+# Привязка xray к CPU: "0-3,6" или несколько наборов через ";" (процессы распределяются по наборам по кругу)
+XRAY_CPU_AFFINITY = _env("XRAY_CPU_AFFINITY", "")
+# Приоритет xray: nice (0-19) и ionice (idle или best-effort[:0-7])
+XRAY_NICE = _env("XRAY_NICE", "")
+XRAY_IONICE = _env("XRAY_IONICE", "").lower()
+# Лимиты xray (0 - без лимита): открытые файлы и адресное пространство в МБ (Go резервирует много виртуальной
+# памяти - для кучи лучше GOMEMLIMIT, лимит адресного пространства - не меньше нескольких ГБ)
+XRAY_RLIMIT_NOFILE = _env_int("XRAY_RLIMIT_NOFILE", 0)
+XRAY_RLIMIT_AS_MB = _env_int("XRAY_RLIMIT_AS_MB", 0)
+# Учёт ресурсов xray по /proc: пиковый RSS и процессорное время процесса в метриках ключа (по умолчанию выключен)
+XRAY_RESOURCE_ACCOUNTING = _env_bool("XRAY_RESOURCE_ACCOUNTING", False)
 XRAY_DIR_NAME = _env("XRAY_DIR_NAME", "xray_dist")
+# Пакетный режим: сколько ключей проверять через один процесс xray (1 = отдельный xray на каждый ключ)
+XRAY_BATCH_SIZE = max(1, _env_int("XRAY_BATCH_SIZE", 1))
+# Режим демонов: постоянные процессы xray с API, outbound ключа подменяется на лету (без перезапуска xray)
+XRAY_DAEMON_MODE = _env_bool("XRAY_DAEMON_MODE", False)
+# Слотов (одновременных ключей) на один демон и число демонов (0 = столько, чтобы хватило на MAX_WORKERS)
+XRAY_DAEMON_SLOTS = max(1, _env_int("XRAY_DAEMON_SLOTS", 20))
+XRAY_DAEMON_COUNT = _env_int("XRAY_DAEMON_COUNT", 0) or -(-MAX_WORKERS // XRAY_DAEMON_SLOTS)
+# asyncio-движок не поддерживает демоны xray и пакетный режим: с ними проверка идёт в пуле потоков
+ASYNC_ENGINE_FALLBACK = CHECK_ENGINE == "async" and (XRAY_DAEMON_MODE or XRAY_BATCH_SIZE > 1)
+if ASYNC_ENGINE_FALLBACK:
+    CHECK_ENGINE = "threads"
+# Порты пула: SOCKS на каждую одновременную проверку + порты xray-демонов
+_MAX_CONCURRENT_CHECKS = (
+    ASYNC_CONCURRENCY if CHECK_ENGINE == "async"
+    else max(MAX_WORKERS, ADAPTIVE_MAX_WORKERS) if ADAPTIVE_CONCURRENCY
+    else MAX_WORKERS
+)
+PORT_POOL_SIZE = _MAX_CONCURRENT_CHECKS + (XRAY_DAEMON_COUNT * (XRAY_DAEMON_SLOTS + 1) if XRAY_DAEMON_MODE else 0)
+# Адреса SOCKS inbound для xray: pool - фиксированный пул PORT_POOL_SIZE портов от BASE_PORT (по умолчанию, как раньше);
+# dynamic - свободные порты BASE_PORT..PORT_RANGE_END с проверкой bind и карантином PORT_QUARANTINE секунд
+# перед повторной выдачей; unix - Unix-сокеты вместо TCP-портов (не занимают порты; при PROBE_CLIENT=requests - как dynamic)
+INBOUND_ALLOCATOR = _env("INBOUND_ALLOCATOR", "pool").lower()
+# Конец диапазона dynamic (не включительно; 0 = BASE_PORT + max(10000, 4 * PORT_POOL_SIZE на каждый процесс проверки)):
+# порты в карантине не выдаются, диапазон должен вмещать все порты, освобождённые за PORT_QUARANTINE секунд
+PORT_RANGE_END = min(65536, _env_int("PORT_RANGE_END", 0) or BASE_PORT + max(10000, 4 * PORT_POOL_SIZE * max(1, WORKER_PROCESSES)))
+PORT_QUARANTINE = _env_float("PORT_QUARANTINE", 5.0)
 
 # Отладка
 DEBUG_FIRST_FAIL = _env_bool("DEBUG_FIRST_FAIL", True)
@@ -4,38 +4,76 @@
 Модуль отображения конфигурации.
 """
 
+import os
+
 from rich.console import Console
 from rich.panel import Panel
 from rich.table import Table
 
 from .config import (
+    ADAPTIVE_CONCURRENCY,
+    ADAPTIVE_MAX_WORKERS,
+    ADAPTIVE_MIN_WORKERS,
+    ASYNC_CONCURRENCY,
+    ASYNC_ENGINE_FALLBACK,
     BASE_PORT,
+    CHECK_ENGINE,
     CHECK_GEOLOCATION,
     CONNECT_TIMEOUT,
     CONNECT_TIMEOUT_SLOW,
+    DNS_CACHE_TTL,
+    DNS_PRECACHE,
     ENABLE_CACHE,
+    ENDPOINT_GROUPING,
+    INBOUND_ALLOCATOR,
+    JOURNAL_FILE,
+    KEY_DEADLINE,
     MAX_LATENCY_MS,
     MAX_RESPONSE_TIME,
     MAX_RETRIES,
     MAX_WORKERS,
     MIN_SUCCESSFUL_URLS,
     MODE,
+    ORPHAN_SWEEP,
+    PORT_POOL_SIZE,
+    PORT_QUARANTINE,
+    PORT_RANGE_END,
+    PROBE_CLIENT,
+    PRIORITY_SCHEDULING,
+    PROBE_KEEP_ALIVE,
     REQUESTS_PER_URL,
+    RESUME,
+    SHARD,
     STABILITY_CHECKS,
     STRICT_MODE,
     STRONG_ATTEMPTS,
     STRONG_MAX_RESPONSE_TIME,
     STRONG_STYLE_TEST,
     STRONG_STYLE_TIMEOUT,
+    STREAM_PUBLISH_INTERVAL,
+    STREAM_RESULTS,
+    TCP_PREFILTER,
+    TCP_PREFILTER_TIMEOUT,
     TEST_URL,
     TEST_URLS,
     TEST_URLS_HTTPS,
+    URL_PROBE_MODE,
     USE_ADAPTIVE_TIMEOUT,
+    WORK_QUEUE,
+    WORKER_PROCESSES,
+    XRAY_BATCH_SIZE,
+    XRAY_CONFIG_DELIVERY,
+    XRAY_DAEMON_COUNT,
+    XRAY_DAEMON_MODE,
+    XRAY_DAEMON_SLOTS,
+    XRAY_PDEATHSIG,
+    XRAY_SPAWN_SERVER,
     XRAY_STARTUP_POLL_INTERVAL,
     XRAY_STARTUP_WAIT,
     _CLIENT_TEST_HTTPS,
 )
 from .parsing import get_output_path
+from .xray_resources import limits_summary
 
 console = Console()
 
@@ -43,7 +81,12 @@ console = Console()
 def print_current_config(list_url: str) -> None:
     """Выводит текущие параметры в понятном формате перед стартом."""
     output_path = get_output_path(list_url)
-    ports_end = BASE_PORT + MAX_WORKERS - 1
+    if INBOUND_ALLOCATOR == "pool":
+        inbounds_display = f"{BASE_PORT}-{BASE_PORT + PORT_POOL_SIZE * max(1, WORKER_PROCESSES) - 1} (фиксированный пул)"
+    else:
+        inbounds_display = f"{BASE_PORT}-{PORT_RANGE_END - 1} (свободные, карантин {PORT_QUARANTINE:g} с)"
+        if INBOUND_ALLOCATOR == "unix" and PROBE_CLIENT != "requests":
+            inbounds_display = "Unix-сокеты; TCP для API демонов: " + inbounds_display
     if STRONG_STYLE_TEST:
         reqs = f"{STRONG_ATTEMPTS} запроса подряд" if STRONG_ATTEMPTS != 1 else "1 запрос"
         test_urls_display = f"Строгий режим: {_CLIENT_TEST_HTTPS} ({reqs})"
@@ -64,9 +107,20 @@ def print_current_config(list_url: str) -> None:
     if TEST_URLS_HTTPS:
         config_table.add_row("[cyan]HTTPS URL[/cyan]", f"{len(TEST_URLS_HTTPS)} URL")
     config_table.add_row("[cyan]Таймаут запроса[/cyan]", f"{CONNECT_TIMEOUT} с" + (f" (медленные: {CONNECT_TIMEOUT_SLOW} с)" if USE_ADAPTIVE_TIMEOUT else ""))
+    config_table.add_row("[cyan]Клиент запросов[/cyan]", "встроенный SOCKS5/HTTP (замер фаз)" if PROBE_CLIENT != "requests" else "requests")
+    if PROBE_KEEP_ALIVE:
+        config_table.add_row("[cyan]Соединения[/cyan]", "keep-alive на ключ (холодный и тёплые запросы раздельно)")
+    if KEY_DEADLINE > 0:
+        config_table.add_row("[cyan]Бюджет на ключ[/cyan]", f"{KEY_DEADLINE:g} с (запросы, повторы и паузы укорачиваются)")
     config_table.add_row("[cyan]Повторных попыток[/cyan]", str(MAX_RETRIES + 1))
     config_table.add_row("[cyan]Запросов на URL[/cyan]", str(REQUESTS_PER_URL))
     config_table.add_row("[cyan]Минимум успешных[/cyan]", f"{MIN_SUCCESSFUL_URLS} URL")
+    if not STRONG_STYLE_TEST:
+        config_table.add_row(
+            "[cyan]Порядок URL[/cyan]",
+            ("параллельно (все сразу)" if STRICT_MODE else "параллельно (до первых успешных)")
+            if URL_PROBE_MODE == "parallel" else "по очереди",
+        )
     if STABILITY_CHECKS > 1:
         config_table.add_row("[cyan]Проверок стабильности[/cyan]", str(STABILITY_CHECKS))
     if MAX_RESPONSE_TIME > 0:
@@ -75,9 +129,50 @@ def print_current_config(list_url: str) -> None:
         config_table.add_row("[cyan]Проверка геолокации[/cyan]", "[green]включена[/green]")
     if STRICT_MODE:
         config_table.add_row("[cyan]Строгий режим[/cyan]", "[green]включен[/green]")
-    config_table.add_row("[cyan]Потоков[/cyan]", str(MAX_WORKERS))
-    config_table.add_row("[cyan]Порты SOCKS[/cyan]", f"{BASE_PORT}-{ports_end}")
-    config_table.add_row("[cyan]Ожидание xray[/cyan]", f"{XRAY_STARTUP_WAIT} с (проверка каждые {XRAY_STARTUP_POLL_INTERVAL} с)")
+    if CHECK_ENGINE == "async":
+        config_table.add_row("[cyan]Движок[/cyan]", f"asyncio (до {ASYNC_CONCURRENCY} ключей одновременно)")
+    else:
+        config_table.add_row("[cyan]Потоков[/cyan]", str(MAX_WORKERS) + (
+            f" (адаптивно {ADAPTIVE_MIN_WORKERS}-{ADAPTIVE_MAX_WORKERS})" if ADAPTIVE_CONCURRENCY else ""
+        ))
+    if ASYNC_ENGINE_FALLBACK:
+        config_table.add_row(
+            "[cyan]Движок[/cyan]",
+            "[yellow]потоки (async несовместим с " + ("XRAY_DAEMON_MODE" if XRAY_DAEMON_MODE else "XRAY_BATCH_SIZE") + ")[/yellow]",
+        )
+    if XRAY_CONFIG_DELIVERY == "memfd":
+        config_table.add_row("[cyan]Конфиг xray[/cyan]", "memfd (без файлов на диске)")
+    if XRAY_SPAWN_SERVER and CHECK_ENGINE != "async" and hasattr(os, "posix_spawnp"):
+        config_table.add_row("[cyan]Запуск xray[/cyan]", "spawn-сервер (posix_spawn)")
+    resource_limits = limits_summary()
+    if resource_limits:
+        config_table.add_row("[cyan]Ресурсы xray[/cyan]", resource_limits)
+    orphan_guards = [name for name, on in (("PDEATHSIG", XRAY_PDEATHSIG), ("очистка при старте", ORPHAN_SWEEP)) if on]
+    config_table.add_row("[cyan]Осиротевшие xray[/cyan]", ", ".join(orphan_guards) or "[dim]без защиты[/dim]")
+    if WORKER_PROCESSES > 1:
+        config_table.add_row("[cyan]Процессов проверки[/cyan]", str(WORKER_PROCESSES))
+    if DNS_PRECACHE:
+        config_table.add_row("[cyan]DNS-кэш[/cyan]", f"[green]включен[/green] (TTL {DNS_CACHE_TTL} с, NXDOMAIN отсеивается)")
+    if STREAM_RESULTS:
+        config_table.add_row("[cyan]Промежуточная публикация[/cyan]", f"каждые {STREAM_PUBLISH_INTERVAL:g} с (+ JSONL по каждому ключу)")
+    if RESUME:
+        config_table.add_row("[cyan]Продолжение после обрыва[/cyan]", f"журнал {JOURNAL_FILE}")
+    if SHARD:
+        config_table.add_row("[cyan]Шард[/cyan]", SHARD)
+    if WORK_QUEUE:
+        config_table.add_row("[cyan]Общая очередь[/cyan]", WORK_QUEUE)
+    if PRIORITY_SCHEDULING:
+        config_table.add_row("[cyan]Порядок проверки[/cyan]", "по приоритету (история и признаки ключей)")
+    if ENDPOINT_GROUPING:
+        config_table.add_row("[cyan]Группировка по серверу[/cyan]", "[green]включена[/green] (сначала один ключ на сервер)")
+    if TCP_PREFILTER:
+        config_table.add_row("[cyan]TCP-префильтр[/cyan]", f"[green]включен[/green] (таймаут {TCP_PREFILTER_TIMEOUT} с)")
+    config_table.add_row("[cyan]Inbound SOCKS[/cyan]", inbounds_display)
+    if XRAY_DAEMON_MODE:
+        config_table.add_row("[cyan]xray-демоны[/cyan]", f"{XRAY_DAEMON_COUNT} × {XRAY_DAEMON_SLOTS} слотов (outbound через API)")
+    elif XRAY_BATCH_SIZE > 1:
+        config_table.add_row("[cyan]Ключей на xray[/cyan]", f"{XRAY_BATCH_SIZE} (пакетный режим)")
+    config_table.add_row("[cyan]Ожидание xray[/cyan]", f"до {XRAY_STARTUP_WAIT} с, до открытия порта (проверка каждые {XRAY_STARTUP_POLL_INTERVAL} с)")
     if ENABLE_CACHE:
         config_table.add_row("[cyan]Кэширование[/cyan]", "[green]включено[/green]")
     config_table.add_row("[cyan]Макс. задержка в файл[/cyan]", f"{MAX_LATENCY_MS} мс (серверы с задержкой выше не записываются)")
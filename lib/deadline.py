@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модуль бюджета времени на проверку одного ключа (KEY_DEADLINE).
+Проверка сверяется с бюджетом перед каждым запросом и паузой: таймауты и паузы
+укорачиваются до остатка, при исчерпании бюджета проверка завершается.
+"""
+
+import time
+from typing import Optional
+
+from .config import KEY_DEADLINE
+
+# Меньше этого остатка запрос не начинаем - он заведомо не успеет
+_MIN_REQUEST_TIME = 0.2
+
+
+class Deadline:
+    """Срок окончания проверки ключа. budget=0 или None - без ограничения."""
+
+    def __init__(self, budget: Optional[float] = KEY_DEADLINE):
+        self.expires = time.monotonic() + budget if budget and budget > 0 else None
+
+    def remaining(self) -> float:
+        if self.expires is None:
+            return float("inf")
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self) -> bool:
+        """True, если на запрос времени уже не осталось."""
+        return self.remaining() < _MIN_REQUEST_TIME
+
+    def clamp(self, timeout: float | tuple[float, float]) -> float | tuple[float, float]:
+        """Таймаут запроса (число или (connect, read)), укороченный до остатка бюджета."""
+        remaining = self.remaining()
+        if isinstance(timeout, (tuple, list)):
+            return (min(timeout[0], remaining), min(timeout[1], remaining))
+        return min(timeout, remaining)
+
+    def sleep_time(self, seconds: float) -> float:
+        """Пауза, укороченная до остатка бюджета."""
+        return min(seconds, self.remaining())
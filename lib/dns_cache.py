@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модуль массового разрешения имён серверов ключей.
+Уникальные хосты разрешаются параллельно один раз за прогон; результат хранится в памяти
+и в DNS_CACHE_FILE (с TTL), NXDOMAIN кэшируется отдельно с DNS_NEGATIVE_TTL.
+getaddrinfo не сообщает TTL записей, поэтому срок жизни задаётся настройками.
+pinned_address подставляет разрешённый IP в адрес outbound xray (имя остаётся в SNI и Host),
+чтобы xray не разрешал имя каждого ключа заново.
+"""
+
+import asyncio
+import ipaddress
+import json
+import logging
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Optional
+
+from .config import (
+    DNS_CACHE_FILE,
+    DNS_CACHE_TTL,
+    DNS_CONCURRENCY,
+    DNS_NEGATIVE_TTL,
+    DNS_TIMEOUT,
+)
+from .result_stream import atomic_write_text
+
+logger = logging.getLogger(__name__)
+
+# Коды getaddrinfo, означающие, что имени нет (а не временный сбой резолвера)
+_NXDOMAIN_ERRORS = {
+    code for code in (getattr(socket, "EAI_NONAME", None), getattr(socket, "EAI_NODATA", None)) if code is not None
+}
+
+# host -> {"ips": [...], "timestamp": t} или {"nxdomain": True, "timestamp": t}
+_entries: dict[str, dict] = {}
+
+# Протоколы outbound xray, адрес которых можно заменить на IP
+_PINNED_PROTOCOLS = {"vless", "vmess", "trojan", "shadowsocks"}
+# Транспорт -> поле ключа с заголовком Host (None - заголовка нет). Для остальных транспортов (grpc, xhttp, ...)
+# сервер может видеть адрес подключения в :authority/Host - их адрес не меняется
+_PINNED_NETWORKS = {"tcp": None, "ws": "wsHost", "h2": "wsHost"}
+
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+def _entry_valid(entry: dict, now: float) -> bool:
+    ttl = DNS_NEGATIVE_TTL if entry.get("nxdomain") else DNS_CACHE_TTL
+    return now - entry.get("timestamp", 0) < ttl
+
+
+def _load_dns_cache() -> None:
+    """Загружает дисковый кэш в память (только не устаревшие записи)."""
+    if not DNS_CACHE_FILE:
+        return
+    cache_path = Path(DNS_CACHE_FILE)
+    if not cache_path.exists():
+        return
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        now = time.time()
+        for host, entry in data.items():
+            if host not in _entries and _entry_valid(entry, now):
+                _entries[host] = entry
+    except Exception as e:
+        logger.warning(f"Ошибка загрузки DNS-кэша: {e}")
+
+
+def _save_dns_cache() -> None:
+    if not DNS_CACHE_FILE:
+        return
+    try:
+        now = time.time()
+        # Атомарно: параллельный прогон или обрыв не оставят наполовину записанный файл
+        atomic_write_text(DNS_CACHE_FILE, json.dumps({h: e for h, e in _entries.items() if _entry_valid(e, now)}, ensure_ascii=False))
+    except Exception as e:
+        logger.warning(f"Ошибка сохранения DNS-кэша: {e}")
+
+
+async def _resolve_all(hosts: list[str]) -> dict[str, dict]:
+    loop = asyncio.get_running_loop()
+    # getaddrinfo блокирующий - выполняется в отдельном пуле потоков нужного размера
+    concurrency = max(1, min(DNS_CONCURRENCY, len(hosts)))
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    loop.set_default_executor(executor)
+    # DNS_TIMEOUT отсчитывается с начала запроса, а не с постановки в очередь пула
+    slots = asyncio.Semaphore(concurrency)
+
+    async def resolve(host: str) -> Optional[dict]:
+        try:
+            async with slots:
+                infos = await asyncio.wait_for(loop.getaddrinfo(host, None, type=socket.SOCK_STREAM), DNS_TIMEOUT)
+        except socket.gaierror as e:
+            if e.errno in _NXDOMAIN_ERRORS:
+                return {"nxdomain": True, "timestamp": time.time()}
+            return None
+        except (OSError, UnicodeError, asyncio.TimeoutError):
+            return None
+        ips = list(dict.fromkeys(info[4][0] for info in infos))
+        return {"ips": ips, "timestamp": time.time()} if ips else None
+
+    try:
+        results = await asyncio.gather(*(resolve(host) for host in hosts))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return {host: entry for host, entry in zip(hosts, results) if entry is not None}
+
+
+def resolve_hosts(hosts: Iterable[str]) -> None:
+    """
+    Разрешает имена (IP-адреса пропускаются) и заполняет кэш.
+    Имена с временной ошибкой резолвера в кэш не попадают - их разрешит xray как обычно.
+    """
+    if not _entries:
+        _load_dns_cache()
+    now = time.time()
+    pending = sorted({
+        h for h in hosts
+        if h and not _is_ip(h) and not (h in _entries and _entry_valid(_entries[h], now))
+    })
+    if pending:
+        _entries.update(asyncio.run(_resolve_all(pending)))
+        _save_dns_cache()
+    logger.debug(f"DNS: разрешено {len(pending)} новых имён, в кэше {len(_entries)}")
+
+
+def is_nxdomain(host: str) -> bool:
+    """True, если имя точно не существует (по данным кэша)."""
+    entry = _entries.get(host)
+    return bool(entry and entry.get("nxdomain"))
+
+
+def cached_address(host: str) -> str:
+    """Первый IP-адрес имени из кэша или само имя, если оно не разрешалось."""
+    entry = _entries.get(host)
+    if entry and entry.get("ips"):
+        return entry["ips"][0]
+    return host
+
+
+def pinned_address(parsed: dict) -> dict:
+    """
+    Ключ с IP сервера из кэша вместо имени: xray подключается без повторного разрешения.
+    Имя остаётся там, где его видит сервер: SNI (serverName, если не задан) и Host ws/h2.
+    Без записи в кэше или для транспортов без явного Host - ключ без изменений.
+    """
+    host = str(parsed.get("address", ""))
+    entry = _entries.get(host)
+    network = parsed.get("network", "tcp")
+    if not entry or not entry.get("ips") or parsed.get("protocol") not in _PINNED_PROTOCOLS or network not in _PINNED_NETWORKS:
+        return parsed
+    pinned = dict(parsed, address=entry["ips"][0])
+    # У VMess "security" - шифр, транспортное шифрование в "tls"
+    security = parsed.get("tls") if parsed.get("protocol") == "vmess" and parsed.get("tls") else parsed.get("security")
+    if security in ("tls", "reality") and not parsed.get("serverName"):
+        pinned["serverName"] = host
+    header = _PINNED_NETWORKS[network]
+    if header and not parsed.get(header):
+        pinned[header] = host
+    return pinned
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модуль группировки ключей по серверу (ENDPOINT_GROUPING).
+Ключи, отличающиеся только UUID/паролем, примечанием или flow, но указывающие на один
+адрес:порт с тем же транспортом и шифрованием, образуют группу. Сначала проверяется
+по одному представителю группы; если представитель не прошёл и сервер не принимает
+TCP-соединения - остальные ключи группы считаются нерабочими без запуска xray.
+Если сервер жив, остальные ключи проверяются как обычно (учётные данные у них свои).
+SiblingDispatcher делает это потоково: ключи сервера уходят в общий источник проверки (KeyFeed)
+сразу по вердикту его представителя, не дожидаясь остальных представителей.
+"""
+
+import logging
+import threading
+from typing import Callable, Optional
+
+from .key_feed import KeyFeed
+from .parsing import parse_proxy_url
+from .prefilter import dead_key_metrics, probe_tcp_endpoints, tcp_endpoint
+
+logger = logging.getLogger(__name__)
+
+
+def endpoint_key(parsed: dict) -> tuple:
+    """Ключ группы: протокол, адрес, порт, транспорт, шифрование транспорта."""
+    # У VMess "security" - шифр, транспортное шифрование в "tls"
+    security = parsed.get("tls", "") if parsed.get("protocol") == "vmess" else parsed.get("security", "")
+    return (
+        parsed.get("protocol"),
+        str(parsed.get("address", "")).lower(),
+        parsed.get("port"),
+        parsed.get("network", "tcp"),
+        security,
+    )
+
+
+def group_by_endpoint(links: list[str]) -> tuple[list[str], dict[str, list[str]]]:
+    """
+    Возвращает (представители в исходном порядке, {представитель: остальные ключи группы}).
+    Неразобранные ключи - каждый сам себе представитель.
+    """
+    groups: dict[tuple, str] = {}
+    representatives: list[str] = []
+    siblings: dict[str, list[str]] = {}
+    for link in links:
+        parsed = parse_proxy_url(link)
+        key: Optional[tuple] = endpoint_key(parsed) if parsed else None
+        representative = groups.get(key) if key is not None else None
+        if representative is None:
+            if key is not None:
+                groups[key] = link
+            representatives.append(link)
+        else:
+            siblings.setdefault(representative, []).append(link)
+    return (representatives, siblings)
+
+
+def split_siblings(
+    verdicts: dict[str, bool],
+    siblings: dict[str, list[str]],
+) -> tuple[list[str], dict[str, dict]]:
+    """
+    По итогам проверки представителей делит остальные ключи групп.
+    verdicts: {представитель: доступен}; представитель без вердикта (ошибка проверки) считается непрошедшим.
+    Возвращает (ключи_для_проверки, {ключ_мёртвого_сервера: метрики}).
+    """
+    to_check: list[str] = []
+    suspects: dict[str, Optional[tuple[str, int]]] = {}
+    for representative, others in siblings.items():
+        if verdicts.get(representative):
+            to_check.extend(others)
+        else:
+            suspects[representative] = tcp_endpoint(representative)
+
+    # Представитель не прошёл: повторно проверяем, жив ли сам сервер (UDP-транспорты не проверяются)
+    reachable = probe_tcp_endpoints(sorted({e for e in suspects.values() if e is not None}))
+    dead: dict[str, dict] = {}
+    for representative, endpoint in suspects.items():
+        if endpoint is not None and not reachable.get(endpoint, True):
+            for link in siblings[representative]:
+                dead[link] = dead_key_metrics()
+        else:
+            to_check.extend(siblings[representative])
+    logger.debug(f"Группировка: {len(dead)} ключей отсеяно по мёртвым серверам, {len(to_check)} на проверку")
+    return (to_check, dead)
+
+
+class SiblingDispatcher:
+    """
+    Группировка по серверу поверх KeyFeed: в источник кладутся представители, а остальные ключи
+    группы - по вердикту представителя (verdict). Прошёл - ключи сразу в начало источника; не прошёл -
+    сервер перепроверяется по TCP в фоновом потоке (накопившиеся серверы - одним проходом), ключи
+    мёртвого сервера передаются в on_dead({ключ: метрики}), живого - в начало источника.
+    Пока группа ждёт вердикта, источник держится открытым (KeyFeed.hold).
+    """
+
+    def __init__(self, feed: KeyFeed, on_dead: Callable[[dict[str, dict]], None]):
+        self._feed = feed
+        self._on_dead = on_dead
+        self._siblings: dict[str, list[str]] = {}
+        self._suspects: dict[str, list[str]] = {}
+        self._wake = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def add(self, links: list[str]) -> None:
+        """Группирует ключи и кладёт в источник представителей."""
+        representatives, siblings = group_by_endpoint(links)
+        with self._wake:
+            self._siblings.update(siblings)
+        for _ in siblings:
+            self._feed.hold()
+        self._feed.put(representatives)
+
+    def verdict(self, link: str, ok: bool) -> None:
+        """Вердикт ключа (ошибка проверки - ok=False); для представителя - решение по его группе."""
+        with self._wake:
+            others = self._siblings.pop(link, None)
+            if others is None:
+                return
+            if not ok:
+                self._suspects[link] = others
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._probe_loop, name="siblings", daemon=True)
+                    self._thread.start()
+                self._wake.notify()
+                return
+        self._feed.put(others, front=True)
+        self._feed.release()
+
+    def _probe_loop(self) -> None:
+        while True:
+            with self._wake:
+                while not self._suspects and not self._closed:
+                    self._wake.wait()
+                if not self._suspects:
+                    return
+                suspects, self._suspects = self._suspects, {}
+            try:
+                to_check, dead = split_siblings({}, suspects)
+            except Exception as e:
+                logger.warning(f"Группировка: перепроверка серверов не удалась ({e}), ключи проверяются как обычно")
+                to_check, dead = [link for others in suspects.values() for link in others], {}
+            try:
+                if dead:
+                    self._on_dead(dead)
+                self._feed.put(to_check, front=True)
+            finally:
+                for _ in suspects:
+                    self._feed.release()
+
+    def close(self) -> None:
+        """Останавливает фоновый поток (после того как источник исчерпан)."""
+        with self._wake:
+            self._closed = True
+            self._wake.notify()
+        if self._thread is not None:
+            self._thread.join()
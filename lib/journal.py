@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модуль журнала прогона для продолжения после обрыва (RESUME).
+Каждый проверенный ключ с вердиктом и метриками дописывается в JOURNAL_FILE (JSONL);
+записи сбрасываются на диск пачками. Первая строка - отпечаток входного списка:
+при перезапуске с тем же списком уже проверенные ключи не проверяются повторно,
+с другим списком журнал начинается заново. После успешного завершения журнал удаляется.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+from .config import JOURNAL_FILE, JOURNAL_FLUSH_EVERY, JOURNAL_FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+def list_fingerprint(links: Iterable[str]) -> str:
+    """Отпечаток входного списка (не зависит от порядка ключей)."""
+    digest = hashlib.sha256()
+    for link in sorted(set(links)):
+        digest.update(link.encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()[:32]
+
+
+class CheckpointJournal:
+    """Журнал проверенных ключей одного входного списка."""
+
+    def __init__(
+        self,
+        fingerprint: str,
+        path: str = JOURNAL_FILE,
+        flush_every: int = JOURNAL_FLUSH_EVERY,
+        flush_interval: float = JOURNAL_FLUSH_INTERVAL,
+    ):
+        self.path = Path(path)
+        self.fingerprint = fingerprint
+        self.flush_every = max(1, flush_every)
+        self.flush_interval = flush_interval
+        self._pending: list[str] = []
+        self._last_flush = time.monotonic()
+        # RLock: flush() может вызываться из обработчика сигнала посреди add() в том же потоке
+        self._lock = threading.RLock()
+        self._file = None
+
+    def load(self) -> dict[str, tuple[bool, Optional[dict]]]:
+        """
+        Читает журнал: {ключ: (доступен, метрики)}. Журнал другого списка или повреждённый - не используется.
+        Открывает журнал для дописывания (новый - с заголовком).
+        """
+        done: dict[str, tuple[bool, Optional[dict]]] = {}
+        header_ok = False
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for index, line in enumerate(f):
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            # Последняя строка могла быть недописана при обрыве
+                            continue
+                        if index == 0:
+                            header_ok = record.get("fingerprint") == self.fingerprint
+                            if not header_ok:
+                                break
+                            continue
+                        done[record["key"]] = (bool(record.get("ok")), record.get("metrics"))
+            except (OSError, UnicodeDecodeError, KeyError, AttributeError) as e:
+                logger.warning(f"Ошибка чтения журнала {self.path}: {e}")
+                header_ok = False
+                done = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if header_ok:
+            self._file = open(self.path, "a", encoding="utf-8")
+            # Недописанная при обрыве строка завершается, чтобы новые записи не склеились с ней
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+            if torn:
+                self._file.write("\n")
+        else:
+            done = {}
+            self._file = open(self.path, "w", encoding="utf-8")
+            self._file.write(json.dumps({"fingerprint": self.fingerprint, "created": time.time()}) + "\n")
+            self._file.flush()
+        return done
+
+    def add(self, link: str, ok: bool, metrics: Optional[dict]) -> None:
+        """Добавляет ключ; на диск - пачкой из flush_every записей или раз в flush_interval секунд."""
+        line = json.dumps({"key": link, "ok": ok, "metrics": metrics}, ensure_ascii=False, default=str)
+        with self._lock:
+            self._pending.append(line)
+            due = len(self._pending) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if self._file is None or not self._pending:
+                return
+            try:
+                self._file.write("\n".join(self._pending) + "\n")
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except OSError as e:
+                logger.warning(f"Ошибка записи журнала {self.path}: {e}")
+            self._pending.clear()
+
+    def close(self, completed: bool = False) -> None:
+        """Закрывает журнал; completed=True - прогон завершён, журнал больше не нужен и удаляется."""
+        with self._lock:
+            self.flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if completed:
+                try:
+                    self.path.unlink()
+                except FileNotFoundError:
+                    pass
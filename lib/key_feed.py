@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модуль потокового источника ключей для движков проверки (KeyFeed).
+Движок (пул потоков, пакетный режим, asyncio, процессы-исполнители) один на весь прогон и
+берёт ключи по одному, когда освобождается место, - без барьеров между фазами и пачками:
+- ключи серверов по вердикту их представителя докладываются в начало (grouping.SiblingDispatcher);
+- пачки общей очереди арендуются по мере освобождения места (refill).
+Пока кто-то держит hold(), источник не считается исчерпанным: ключи ещё могут появиться.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Iterable, Optional
+
+
+class KeyFeed:
+    """
+    Потокобезопасная очередь ключей.
+    refill() вызывается, когда очередь пуста: кладёт ключи (put) и возвращает True; False - ключей
+    пока нет, повторить через refill_interval секунд; None - источник исчерпан.
+    """
+
+    def __init__(
+        self,
+        links: Iterable[str] = (),
+        refill: Optional[Callable[[], Optional[bool]]] = None,
+        refill_interval: float = 1.0,
+    ):
+        self._items: deque[str] = deque(links)
+        self._cond = threading.Condition()
+        self._holds = 0
+        self._refill = refill
+        self._refill_interval = refill_interval
+        self._refilling = False
+        self._next_refill = 0.0
+
+    def put(self, links: Iterable[str], front: bool = False) -> None:
+        """Добавляет ключи в конец (front=True - в начало, в прежнем порядке)."""
+        links = list(links)
+        if not links:
+            return
+        with self._cond:
+            if front:
+                self._items.extendleft(reversed(links))
+            else:
+                self._items.extend(links)
+            self._cond.notify_all()
+
+    def hold(self) -> None:
+        """Ключи ещё появятся (например, после вердикта представителя) - не завершать источник."""
+        with self._cond:
+            self._holds += 1
+
+    def release(self) -> None:
+        """Снимает hold() (после put ключей, если они есть)."""
+        with self._cond:
+            self._holds -= 1
+            self._cond.notify_all()
+
+    def pending(self) -> int:
+        """Сколько ключей ждёт в очереди."""
+        with self._cond:
+            return len(self._items)
+
+    def drain(self) -> list[str]:
+        """Забирает все ждущие ключи без пополнения (аварийное завершение движка)."""
+        with self._cond:
+            items = list(self._items)
+            self._items.clear()
+            return items
+
+    def get(self, timeout: Optional[float] = None) -> Optional[str]:
+        """Следующий ключ; None - ключей больше не будет; queue.Empty - за timeout секунд ключ не появился."""
+        items = self.get_many(1, timeout)
+        return items[0] if items else None
+
+    def get_many(self, count: int, timeout: Optional[float] = None) -> Optional[list[str]]:
+        """
+        До count ключей: ждёт первый (не дольше timeout), остальные - только уже доступные.
+        None - ключей больше не будет; queue.Empty - за timeout секунд ключ не появился.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._cond:
+                while True:
+                    if self._items:
+                        return [self._items.popleft() for _ in range(min(count, len(self._items)))]
+                    now = time.monotonic()
+                    refill_due = self._refill is not None and not self._refilling and now >= self._next_refill
+                    if refill_due:
+                        self._refilling = True
+                        break
+                    if self._refill is None and not self._refilling and not self._holds:
+                        return None
+                    wait = None if deadline is None else deadline - now
+                    if wait is not None and wait <= 0:
+                        raise queue.Empty
+                    if self._refill is not None and not self._refilling:
+                        wait = self._next_refill - now if wait is None else min(wait, self._next_refill - now)
+                    self._cond.wait(wait)
+            self._run_refill()
+
+    def _run_refill(self) -> None:
+        added = False
+        try:
+            added = self._refill()
+        finally:
+            with self._cond:
+                self._refilling = False
+                if added is None:
+                    self._refill = None
+                elif not added:
+                    self._next_refill = time.monotonic() + self._refill_interval
+                self._cond.notify_all()
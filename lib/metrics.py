@@ -13,6 +13,23 @@ from rich.table import Table
 console = Console()
 
 
+def new_key_metrics(cached: bool = False) -> dict:
+    """Пустые метрики проверки одного ключа."""
+    return {
+        "response_times": [],
+        "geolocation": None,
+        "successful_urls": 0,
+        "failed_urls": 0,
+        "total_requests": 0,
+        "successful_requests": 0,
+        "phase_timings": [],
+        "cold_response_times": [],
+        "warm_response_times": [],
+        "timeouts": 0,
+        "cached": cached
+    }
+
+
 def calculate_performance_metrics(results: list, all_metrics: dict, elapsed_time: float) -> dict:
     """Вычисляет метрики производительности."""
     metrics = {
@@ -59,6 +76,16 @@ def calculate_performance_metrics(results: list, all_metrics: dict, elapsed_time
         except (statistics.StatisticsError, ValueError):
             pass
     
+    # Ресурсы xray по ключам (XRAY_RESOURCE_ACCOUNTING)
+    usage = [m for m in all_metrics.values() if m and "xray_cpu_ms" in m]
+    if usage:
+        rss = [m["xray_rss_kb"] for m in usage if m.get("xray_rss_kb")]
+        cpu = [m["xray_cpu_ms"] for m in usage]
+        metrics['xray_avg_rss_mb'] = statistics.mean(rss) / 1024 if rss else 0.0
+        metrics['xray_max_rss_mb'] = max(rss) / 1024 if rss else 0.0
+        metrics['xray_avg_cpu_ms'] = statistics.mean(cpu)
+        metrics['xray_max_cpu_ms'] = max(cpu)
+
     if elapsed_time > 0:
         metrics['keys_per_second'] = metrics['checked_keys'] / elapsed_time
     
@@ -82,6 +109,9 @@ def print_statistics_table(metrics: dict):
         table.add_row("Мин. время ответа", f"{metrics['min_response_time']:.2f} с")
         table.add_row("Макс. время ответа", f"{metrics['max_response_time']:.2f} с")
         table.add_row("Медианное время", f"{metrics['median_response_time']:.2f} с")
+    if metrics.get('xray_avg_cpu_ms') is not None:
+        table.add_row("RSS xray (сред./макс.)", f"{metrics['xray_avg_rss_mb']:.0f} / {metrics['xray_max_rss_mb']:.0f} МБ")
+        table.add_row("CPU xray на ключ", f"{metrics['xray_avg_cpu_ms']:.0f} / {metrics['xray_max_cpu_ms']:.0f} мс")
     table.add_row("Время проверки", f"{metrics['total_time']:.1f} с")
     table.add_row("Скорость", f"{metrics['keys_per_second']:.2f} ключ/с")
     
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модуль защиты от осиротевших процессов xray (SIGKILL процесса проверки, отменённый CI).
+- Каждый xray получает в окружении метку владельца XRAY_OWNER_ENV=pid:время_старта
+  запустившего процесса (время старта отличает владельца от процесса с тем же pid).
+- На Linux PR_SET_PDEATHSIG (XRAY_PDEATHSIG) ставится один раз на процесс, а не на каждый xray
+  (preexec_fn небезопасен при многих потоках и отключает быстрый запуск через vfork/posix_spawn):
+  spawn-сервер и процессы-исполнители WORKER_PROCESSES получают SIGTERM при гибели родителя
+  (die_with_parent) и завершают свои xray. xray, запущенные напрямую (без spawn-сервера),
+  после SIGKILL процесса проверки завершает sweep_orphans при следующем запуске.
+- При старте sweep_orphans() ищет в /proc процессы с меткой, владельца которых уже нет, и
+  завершает их группой: они держат порты диапазона и CPU. Процессы живых прогонов
+  (очередь или шарды на том же хосте) не трогаются.
+"""
+
+import logging
+import os
+import signal
+from typing import Optional
+
+from .config import XRAY_PDEATHSIG
+from .spawn_server import parent_death_signal
+
+logger = logging.getLogger(__name__)
+
+XRAY_OWNER_ENV = "VLESS_CHECKER_OWNER"
+
+# pid -> окружение xray с меткой этого процесса (процессы-исполнители считают свои)
+_child_env: dict[int, dict[str, str]] = {}
+
+
+def process_start_time(pid: int) -> Optional[str]:
+    """Время старта процесса из /proc/<pid>/stat (в тиках с загрузки) или None, если процесса нет."""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # Имя процесса в скобках может содержать пробелы - поля считаем после ")"
+    fields = stat[stat.rfind(b")") + 2:].split()
+    return fields[19].decode() if len(fields) > 19 else None
+
+
+def owner_token(pid: Optional[int] = None) -> str:
+    """Метка владельца: pid:время_старта (без /proc - только pid)."""
+    pid = os.getpid() if pid is None else pid
+    return f"{pid}:{process_start_time(pid) or ''}"
+
+
+def xray_env() -> dict[str, str]:
+    """Окружение для запуска xray: окружение процесса и метка владельца."""
+    pid = os.getpid()
+    if pid not in _child_env:
+        _child_env[pid] = {**os.environ, XRAY_OWNER_ENV: owner_token(pid)}
+    return _child_env[pid]
+
+
+def die_with_parent(parent: int, sig: int = signal.SIGTERM) -> None:
+    """Текущий процесс получит sig при завершении родителя parent (Linux; процессы-исполнители WORKER_PROCESSES)."""
+    if XRAY_PDEATHSIG:
+        parent_death_signal(parent, sig)
+
+
+def _owner_of(pid: int) -> Optional[str]:
+    """Метка владельца из окружения процесса или None (не xray проверки или нет доступа)."""
+    try:
+        with open(f"/proc/{pid}/environ", "rb") as f:
+            environ = f.read()
+    except OSError:
+        return None
+    prefix = XRAY_OWNER_ENV.encode() + b"="
+    for item in environ.split(b"\0"):
+        if item.startswith(prefix):
+            return item[len(prefix):].decode(errors="replace")
+    return None
+
+
+def _owner_alive(token: str) -> bool:
+    pid, _, start = token.partition(":")
+    if not pid.isdigit():
+        return True
+    current = process_start_time(int(pid))
+    return current is not None and (not start or current == start)
+
+
+def sweep_orphans() -> int:
+    """
+    Завершает (SIGKILL группы) процессы xray, оставшиеся от прогонов, владелец которых уже не
+    существует. Возвращает число завершённых процессов. Без /proc ничего не делает.
+    """
+    if not os.path.isdir("/proc"):
+        return 0
+    own = {os.getpid(), os.getppid()}
+    killed = 0
+    for name in os.listdir("/proc"):
+        if not name.isdigit() or int(name) in own:
+            continue
+        pid = int(name)
+        token = _owner_of(pid)
+        if token is None or _owner_alive(token):
+            continue
+        try:
+            # xray запускается в своей сессии: группа = pid
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                continue
+        killed += 1
+    if killed:
+        logger.warning(f"Завершено осиротевших процессов xray прошлых запусков: {killed}")
+    return killed
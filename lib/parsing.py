@@ -9,6 +9,7 @@ import json
 import os
 import requests
 from datetime import datetime
+from typing import Optional
 from urllib.parse import urlparse, parse_qs, unquote
 
 from .config import OUTPUT_ADD_DATE, OUTPUT_DIR, OUTPUT_FILE
@@ -602,11 +603,17 @@ def parse_proxy_url(proxy_url: str) -> dict | None:
     return None
 
 
-def load_merged_keys(links_file: str) -> tuple[str, list[tuple[str, str]]]:
+def is_hysteria(parsed: Optional[dict]) -> bool:
+    """Ключ Hysteria/Hysteria2: xray их не поддерживает, проверяется только доступность сервера по TCP."""
+    return bool(parsed) and parsed.get("protocol") in ("hysteria", "hysteria2")
+
+
+def load_merged_keys(links_file: str, sources: Optional[dict[str, str]] = None) -> tuple[str, list[tuple[str, str]]]:
     """
     Режим merge: читает ссылки из links_file, загружает списки по каждой,
     объединяет ключи (дедупликация по ссылке, первое вхождение). Возвращает
     (имя_источника_для_вывода, список (vless_ссылка, полная_строка)).
+    sources: если передан, заполняется {нормализованный ключ: имя списка, где ключ встретился первым}.
     """
     urls = load_urls_from_file(links_file)
     if not urls:
@@ -635,6 +642,8 @@ def load_merged_keys(links_file: str) -> tuple[str, list[tuple[str, str]]]:
                 parsed = parse_proxy_lines(text)
                 new_count = 0
                 for link, full in parsed:
+                    if sources is not None:
+                        sources.setdefault(normalize_proxy_link(link), get_source_name(url))
                     if link not in seen_links:
                         seen_links.add(link)
                         result.append((link, full))
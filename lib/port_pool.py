@@ -1,26 +1,317 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-Модуль управления пулом портов для SOCKS прокси.
+Модуль выделения адресов SOCKS inbound для xray (INBOUND_ALLOCATOR).
+Адрес - номер TCP-порта на 127.0.0.1 (int) или Unix-сокет (str: путь или "@имя" -
+абстрактный сокет Linux, без файла).
+- pool: фиксированный пул PORT_POOL_SIZE портов от BASE_PORT (нет свободного - None);
+- dynamic: порты из BASE_PORT..PORT_RANGE_END по кругу; порт выдаётся после проверки bind
+  (не занят другим процессом) и не раньше PORT_QUARANTINE секунд после возврата. Под общей
+  блокировкой порты только резервируются, bind проверяется уже вне её (take_ports);
+- unix: Unix-сокеты без TCP-портов; TCP-порты (API демонов, клиент requests) - как в dynamic.
 """
 
+import asyncio
+import logging
+import os
+import socket
+import sys
+import tempfile
 import threading
+import time
+from collections import deque
+from typing import Optional, Union
 
-from .config import BASE_PORT, MAX_WORKERS
+from .config import BASE_PORT, INBOUND_ALLOCATOR, PORT_POOL_SIZE, PORT_QUARANTINE, PORT_RANGE_END, PROBE_CLIENT
+
+logger = logging.getLogger(__name__)
+
+InboundAddress = Union[int, str]
+
+
+class _FixedPool:
+    """Фиксированный набор портов."""
+
+    def __init__(self, start: int, count: int):
+        self._ports = list(range(start, start + count))
+        self.capacity = count
+
+    def take(self, count: int) -> Optional[list[int]]:
+        if count <= 0 or len(self._ports) < count:
+            return None
+        ports = self._ports[-count:]
+        del self._ports[-count:]
+        return ports
+
+    def give_back(self, ports: list[int]) -> None:
+        self._ports.extend(ports)
+
+    def busy(self, ports: list[int]) -> list[int]:
+        return []
+
+    cancel = give_back
+    set_aside = give_back
+
+
+def _port_free(port: int) -> bool:
+    """Порт можно слушать на 127.0.0.1 (не занят другим процессом)."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        # Как у слушающего сокета xray: соединения в TIME_WAIT после прошлого xray не мешают bind.
+        # На Windows SO_REUSEADDR разрешает занять уже слушаемый порт - там проверка без него
+        if sys.platform != "win32":
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("127.0.0.1", port))
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+# Сколько не предлагать порт, который слушает другой процесс
+_BUSY_BACKOFF = 1.0
+
+
+class _DynamicPorts:
+    """Порты диапазона по кругу с проверкой bind и карантином после возврата."""
+
+    def __init__(self, start: int, end: int, quarantine: float):
+        self.start = start
+        self.end = max(start + 1, end)
+        self.capacity = self.end - self.start
+        self.quarantine = quarantine
+        self._next = start
+        self._used: set[int] = set()
+        self._released: deque[tuple[float, int]] = deque()
+        self._busy: deque[tuple[float, int]] = deque()
+        self._quarantined: set[int] = set()
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for queue in (self._released, self._busy):
+            while queue and queue[0][0] <= now:
+                self._quarantined.discard(queue.popleft()[1])
+
+    def take(self, count: int) -> Optional[list[int]]:
+        """Резервирует count портов без проверки bind (её делает вызывающий вне блокировки - busy)."""
+        if count <= 0:
+            return None
+        self._expire()
+        ports: list[int] = []
+        for _ in range(self.capacity):
+            port = self._next
+            self._next = self.start if port + 1 >= self.end else port + 1
+            if port in self._used or port in self._quarantined:
+                continue
+            ports.append(port)
+            self._used.add(port)
+            if len(ports) == count:
+                return ports
+        # Весь диапазон занят - возвращаем взятое
+        self._used.difference_update(ports)
+        return None
+
+    def busy(self, ports: list[int]) -> list[int]:
+        """Зарезервированные порты, которые слушает другой процесс (без блокировки пула)."""
+        return [port for port in ports if not _port_free(port)]
+
+    def cancel(self, ports: list[int]) -> None:
+        """Снимает резерв с невыданных портов без карантина."""
+        self._used.difference_update(ports)
+
+    def set_aside(self, ports: list[int]) -> None:
+        """Порты, занятые другим процессом: не предлагать их _BUSY_BACKOFF секунд."""
+        until = time.monotonic() + _BUSY_BACKOFF
+        for port in ports:
+            self._used.discard(port)
+            self._quarantined.add(port)
+            self._busy.append((until, port))
+
+    def give_back(self, ports: list[int]) -> None:
+        until = time.monotonic() + self.quarantine
+        for port in ports:
+            if port in self._used:
+                self._used.discard(port)
+                if self.quarantine > 0:
+                    self._quarantined.add(port)
+                    self._released.append((until, port))
+
+
+class _UnixSockets:
+    """Unix-сокеты с уникальными именами: абстрактные на Linux, иначе файлы в личном каталоге."""
+
+    def __init__(self):
+        self.capacity = sys.maxsize
+        self._counter = 0
+        self._dir: Optional[str] = None
+        self._prefix = f"vless-checker-{os.getpid()}"
+
+    def take(self, count: int) -> Optional[list[str]]:
+        if count <= 0:
+            return None
+        if not sys.platform.startswith("linux") and self._dir is None:
+            self._dir = tempfile.mkdtemp(prefix="vless_checker_sock_")
+        addresses = []
+        for _ in range(count):
+            self._counter += 1
+            if self._dir is None:
+                addresses.append(f"@{self._prefix}-{self._counter}")
+            else:
+                addresses.append(os.path.join(self._dir, f"s{self._counter}.sock"))
+        return addresses
+
+    def give_back(self, addresses: list[str]) -> None:
+        for address in addresses:
+            if not address.startswith("@"):
+                try:
+                    os.unlink(address)
+                except OSError:
+                    pass
+
+    def busy(self, addresses: list[str]) -> list[str]:
+        return []
+
+    cancel = give_back
+    set_aside = give_back
+
+
+def _tcp_allocator(start: int, pool_size: int, range_end: int):
+    if INBOUND_ALLOCATOR == "pool":
+        return _FixedPool(start, pool_size)
+    return _DynamicPorts(start, range_end, PORT_QUARANTINE)
+
+
+# Сколько ждать свободного адреса: адреса держат ещё не завершившиеся xray (process_registry) и карантин
+_TAKE_WAIT = 5.0
+_TAKE_RETRY = 0.05
 
 _port_lock = threading.Lock()
-_port_pool = list(range(BASE_PORT, BASE_PORT + MAX_WORKERS))
+_port_returned = threading.Condition(_port_lock)
+_tcp = _tcp_allocator(BASE_PORT, PORT_POOL_SIZE, PORT_RANGE_END)
+_unix = None
+if INBOUND_ALLOCATOR == "unix":
+    if PROBE_CLIENT == "requests" or not hasattr(socket, "AF_UNIX"):
+        # requests/PySocks подключается к прокси только по TCP
+        logger.warning("INBOUND_ALLOCATOR=unix недоступен (PROBE_CLIENT=requests или нет Unix-сокетов) - используются TCP-порты")
+    else:
+        _unix = _UnixSockets()
+
+
+def take_port(tcp: bool = False, wait: float = _TAKE_WAIT) -> InboundAddress | None:
+    """Берет адрес inbound (tcp=True - только TCP-порт: API xray, клиент requests); None, если за wait секунд не освободился."""
+    addresses = take_ports(1, tcp=tcp, wait=wait)
+    return addresses[0] if addresses else None
+
+
+async def take_port_async(wait: float = _TAKE_WAIT) -> InboundAddress | None:
+    """take_port для asyncio-движка: ждёт свободного адреса, не блокируя цикл событий."""
+    deadline = time.monotonic() + wait
+    while True:
+        address = take_port(wait=0)
+        if address is not None or time.monotonic() >= deadline:
+            return address
+        await asyncio.sleep(_TAKE_RETRY)
+
+
+def return_port(port: InboundAddress) -> None:
+    """Возвращает адрес inbound."""
+    return_ports([port])
+
 
+def take_ports(count: int, tcp: bool = False, wait: float = _TAKE_WAIT) -> list | None:
+    """
+    Берет сразу count адресов (всё или ничего), ожидая освобождения не дольше wait секунд.
+    Под блокировкой адреса только резервируются; bind проверяется вне её, занятые другим
+    процессом откладываются, и резерв повторяется.
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        with _port_lock:
+            while True:
+                allocator = _unix if _unix is not None and not tcp else _tcp
+                addresses = allocator.take(count)
+                remaining = deadline - time.monotonic()
+                if addresses is not None:
+                    break
+                if remaining <= 0 or count > allocator.capacity:
+                    return None
+                # Карантин dynamic истекает без возврата адресов - перепроверяем периодически
+                _port_returned.wait(min(remaining, _TAKE_RETRY))
+        busy = allocator.busy(addresses)
+        if not busy:
+            return addresses
+        with _port_lock:
+            allocator.set_aside(busy)
+            allocator.cancel([address for address in addresses if address not in busy])
+            _port_returned.notify_all()
 
-def take_port() -> int | None:
-    """Берет порт из пула."""
+
+def return_ports(ports: list) -> None:
+    """Возвращает несколько адресов."""
     with _port_lock:
-        if not _port_pool:
-            return None
-        return _port_pool.pop()
+        _tcp.give_back([port for port in ports if isinstance(port, int)])
+        if _unix is not None:
+            _unix.give_back([port for port in ports if isinstance(port, str)])
+        _port_returned.notify_all()
+
+
+def unix_inbounds() -> bool:
+    """True - take_port без tcp=True выдаёт Unix-сокеты (клиенты requests к ним подключиться не могут)."""
+    return _unix is not None
 
 
-def return_port(port: int) -> None:
-    """Возвращает порт в пул."""
+def capacity() -> int:
+    """Сколько адресов можно держать одновременно (ограничение параллельности проверок)."""
+    return _unix.capacity if _unix is not None else _tcp.capacity
+
+
+def use_port_slice(index: int, count: int) -> None:
+    """
+    Оставляет этому процессу свою часть портов (процесс index из count, WORKER_PROCESSES):
+    pool - свой пул PORT_POOL_SIZE портов подряд, dynamic - index-я доля диапазона.
+    """
+    global _tcp
     with _port_lock:
-        _port_pool.append(port)
+        if INBOUND_ALLOCATOR == "pool":
+            start = BASE_PORT + index * PORT_POOL_SIZE
+            _tcp = _tcp_allocator(start, PORT_POOL_SIZE, start + PORT_POOL_SIZE)
+        else:
+            size = max(1, (PORT_RANGE_END - BASE_PORT) // max(1, count))
+            start = BASE_PORT + index * size
+            _tcp = _tcp_allocator(start, PORT_POOL_SIZE, start + size)
+
+
+def inbound_listen(address: InboundAddress) -> tuple[str, int]:
+    """(listen, port) для inbound xray: 127.0.0.1 и порт или путь/@имя Unix-сокета с портом 0."""
+    if isinstance(address, str):
+        return (address, 0)
+    return ("127.0.0.1", address)
+
+
+def _unix_path(address: str) -> str:
+    """Адрес сокета для socket.connect: "@имя" - абстрактный (начинается с нулевого байта)."""
+    return "\0" + address[1:] if address.startswith("@") else address
+
+
+def connect_inbound(address: InboundAddress, timeout: float, host: str = "127.0.0.1") -> socket.socket:
+    """Соединение с inbound xray (TCP с TCP_NODELAY или Unix-сокет)."""
+    if isinstance(address, int):
+        sock = socket.create_connection((host, address), timeout=timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(_unix_path(address))
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+async def open_inbound_connection(address: InboundAddress, host: str = "127.0.0.1", **kwargs):
+    """Асинхронный аналог connect_inbound: (reader, writer)."""
+    if isinstance(address, int):
+        return await asyncio.open_connection(host, address, **kwargs)
+    return await asyncio.open_unix_connection(_unix_path(address), **kwargs)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модуль префильтров до запуска xray:
+- DNS: имена серверов всех ключей разрешаются заранее (lib.dns_cache), ключи с NXDOMAIN отсеиваются;
+- TCP: массовая проверка, что сервер ключа принимает TCP-соединения. Тысячи неблокирующих
+  connect из одного потока (asyncio); каждая пара IP:порт проверяется один раз,
+  сколько бы ключей (и имён, разрешающихся в этот IP) на неё ни указывало.
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+from .config import TCP_PREFILTER_CONCURRENCY, TCP_PREFILTER_TIMEOUT
+from .dns_cache import cached_address, is_nxdomain, resolve_hosts
+from .metrics import new_key_metrics
+from .parsing import is_hysteria, parse_proxy_url
+from .utils import raise_nofile_limit
+
+logger = logging.getLogger(__name__)
+
+# Транспорты поверх UDP: TCP-порт сервера может быть закрыт при рабочем ключе
+_UDP_NETWORKS = ("kcp", "mkcp", "quic")
+
+
+def tcp_endpoint(link: str) -> Optional[tuple[str, int]]:
+    """(адрес, порт) для TCP-проверки или None, если ключ не фильтруется (не разобран, UDP-транспорт, Hysteria)."""
+    parsed = parse_proxy_url(link)
+    if not parsed or is_hysteria(parsed):
+        return None
+    if str(parsed.get("network", "tcp")).lower() in _UDP_NETWORKS:
+        return None
+    return (cached_address(parsed["address"]), int(parsed["port"]))
+
+
+def dead_key_metrics() -> dict:
+    """Метрики ключа, отсеянного без запуска xray (префильтр, группировка по серверу)."""
+    metrics = new_key_metrics()
+    metrics["failed_urls"] = 1
+    metrics["prefiltered"] = True
+    return metrics
+
+
+def dns_prefilter(links: list[str]) -> tuple[list[str], dict[str, dict]]:
+    """
+    Разрешает имена серверов всех ключей одним параллельным проходом.
+    Возвращает (ключи_для_дальнейшей_проверки, {ключ_с_NXDOMAIN: метрики}).
+    """
+    hosts: dict[str, Optional[str]] = {}
+    for link in links:
+        parsed = parse_proxy_url(link)
+        hosts[link] = parsed["address"] if parsed else None
+    resolve_hosts(host for host in hosts.values() if host)
+    passed: list[str] = []
+    dead: dict[str, dict] = {}
+    for link in links:
+        host = hosts[link]
+        if host and is_nxdomain(host):
+            dead[link] = dead_key_metrics()
+        else:
+            passed.append(link)
+    return (passed, dead)
+
+
+async def _probe_endpoints(endpoints: list[tuple[str, int]], timeout: float, concurrency: int) -> dict[tuple[str, int], bool]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def probe(endpoint: tuple[str, int]) -> bool:
+        async with semaphore:
+            try:
+                _, writer = await asyncio.wait_for(asyncio.open_connection(*endpoint), timeout)
+            except (OSError, asyncio.TimeoutError, UnicodeError):
+                return False
+            writer.close()
+            return True
+
+    results = await asyncio.gather(*(probe(endpoint) for endpoint in endpoints))
+    return dict(zip(endpoints, results))
+
+
+def probe_tcp_endpoints(
+    endpoints: list[tuple[str, int]],
+    timeout: float = TCP_PREFILTER_TIMEOUT,
+    concurrency: int = TCP_PREFILTER_CONCURRENCY,
+) -> dict[tuple[str, int], bool]:
+    """Параллельно проверяет, принимают ли адреса TCP-соединения: {(адрес, порт): доступен}."""
+    if not endpoints:
+        return {}
+    limit = max(1, min(concurrency, len(endpoints)))
+    raise_nofile_limit(limit * 2 + 256)
+    return asyncio.run(_probe_endpoints(endpoints, timeout, limit))
+
+
+def tcp_prefilter(
+    links: list[str],
+    timeout: float = TCP_PREFILTER_TIMEOUT,
+    concurrency: int = TCP_PREFILTER_CONCURRENCY,
+) -> tuple[list[str], dict[str, dict]]:
+    """
+    Делит ключи на прошедшие префильтр и недоступные по TCP.
+    Возвращает (ключи_для_проверки_через_xray в исходном порядке, {недоступный_ключ: метрики}).
+    """
+    endpoints: dict[str, Optional[tuple[str, int]]] = {link: tcp_endpoint(link) for link in links}
+    unique = sorted({endpoint for endpoint in endpoints.values() if endpoint is not None})
+    if not unique:
+        return (list(links), {})
+
+    reachable = probe_tcp_endpoints(unique, timeout, concurrency)
+    logger.debug(f"TCP-префильтр: доступно {sum(reachable.values())} из {len(unique)} адресов")
+
+    passed: list[str] = []
+    dead: dict[str, dict] = {}
+    for link in links:
+        endpoint = endpoints[link]
+        if endpoint is None or reachable[endpoint]:
+            passed.append(link)
+        else:
+            dead[link] = dead_key_metrics()
+    return (passed, dead)
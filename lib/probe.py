@@ -0,0 +1,666 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модуль лёгкого клиента проверочных запросов через локальный SOCKS5 xray (без requests):
+рукопожатие SOCKS5 (имя хоста резолвит прокси, как socks5h), минимальный HTTP/1.1-запрос,
+TLS через ssl для HTTPS. Фиксирует время каждой фазы запроса.
+Сессии (ProbeSession, AsyncProbeSession) держат keep-alive соединения через туннель ключа,
+чтобы повторные запросы не платили за SOCKS- и TLS-рукопожатие.
+"""
+
+import asyncio
+import ipaddress
+import json
+import socket
+import ssl
+import struct
+import threading
+import time
+from typing import Callable, Optional
+from urllib.parse import urlsplit
+
+from requests.utils import default_user_agent
+
+from .config import VERIFY_HTTPS_SSL
+from .port_pool import InboundAddress, connect_inbound, open_inbound_connection
+
+# Ограничения на размер ответа: проверке не нужны большие тела
+_MAX_HEAD_SIZE = 64 * 1024
+_MAX_BODY_SIZE = 1024 * 1024
+
+_SOCKS5_GREETING = b"\x05\x01\x00"  # версия 5, один метод: без аутентификации
+_SOCKS5_ERRORS = {
+    1: "general SOCKS server failure",
+    2: "connection not allowed by ruleset",
+    3: "network unreachable",
+    4: "host unreachable",
+    5: "connection refused",
+    6: "TTL expired",
+    7: "command not supported",
+    8: "address type not supported",
+}
+
+_USER_AGENT = default_user_agent()
+
+
+class ProbeError(Exception):
+    """Ошибка проверочного запроса (SOCKS, TLS, HTTP)."""
+
+
+class ProbeTimeout(ProbeError):
+    """Таймаут проверочного запроса."""
+
+
+class ProbeResponse:
+    """
+    Ответ проверочного запроса. Для check_response_valid совместим с requests.Response
+    (status_code, content). timings - время фаз от начала запроса в секундах:
+    connect (TCP до SOCKS), socks (туннель установлен), tls (рукопожатие завершено, только HTTPS),
+    first_byte (первый байт ответа), total (ответ прочитан).
+    reused - ответ получен по соединению, открытому предыдущим запросом сессии (фаз до first_byte нет).
+    """
+
+    def __init__(self, status_code: int, headers: dict[str, str], content: bytes, timings: dict[str, float]):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.timings = timings
+        self.reused = False
+
+    def json(self):
+        return json.loads(self.content.decode("utf-8"))
+
+
+def _split_url(url: str) -> tuple[str, str, int, str]:
+    """Разбирает URL на (схема, хост, порт, путь_с_запросом)."""
+    parts = urlsplit(url)
+    scheme = (parts.scheme or "http").lower()
+    if scheme not in ("http", "https"):
+        raise ProbeError(f"Неподдерживаемая схема URL: {scheme}")
+    host = parts.hostname
+    if not host:
+        raise ProbeError(f"В URL нет хоста: {url}")
+    port = parts.port or (443 if scheme == "https" else 80)
+    target = parts.path or "/"
+    if parts.query:
+        target += "?" + parts.query
+    return (scheme, host, port, target)
+
+
+def _split_timeout(timeout: float | tuple[float, float]) -> tuple[float, float]:
+    """Таймаут как в requests: число или (connect, read)."""
+    if isinstance(timeout, (tuple, list)):
+        return (float(timeout[0]), float(timeout[1]))
+    return (float(timeout), float(timeout))
+
+
+def _socks5_connect_request(host: str, port: int) -> bytes:
+    """Запрос CONNECT: IP-адрес как есть, имя хоста - как домен (резолвит прокси)."""
+    try:
+        ip = ipaddress.ip_address(host)
+    except ValueError:
+        name = host.encode("idna")
+        if len(name) > 255:
+            raise ProbeError(f"Слишком длинное имя хоста: {host}")
+        address = b"\x03" + bytes([len(name)]) + name
+    else:
+        address = (b"\x01" if ip.version == 4 else b"\x04") + ip.packed
+    return b"\x05\x01\x00" + address + struct.pack(">H", port)
+
+
+def _check_socks5_method(reply: bytes) -> None:
+    if len(reply) != 2 or reply[0] != 5:
+        raise ProbeError("Некорректный ответ SOCKS5-сервера")
+    if reply[1] != 0:
+        raise ProbeError("SOCKS5-сервер не принял метод без аутентификации")
+
+
+def _check_socks5_reply(head: bytes) -> int:
+    """Проверяет начало ответа на CONNECT. Возвращает число оставшихся байт адреса (без длины домена)."""
+    if len(head) != 4 or head[0] != 5:
+        raise ProbeError("Некорректный ответ SOCKS5-сервера")
+    if head[1] != 0:
+        raise ProbeError(f"SOCKS5: {_SOCKS5_ERRORS.get(head[1], f'ошибка {head[1]}')}")
+    atyp = head[3]
+    if atyp == 1:
+        return 4 + 2
+    if atyp == 4:
+        return 16 + 2
+    if atyp == 3:
+        return -1  # длина домена в следующем байте
+    raise ProbeError(f"SOCKS5: неизвестный тип адреса {atyp}")
+
+
+def _build_http_request(method: str, host: str, port: int, scheme: str, target: str,
+                        post_data: Optional[dict] = None, keep_alive: bool = False) -> bytes:
+    """Минимальный HTTP/1.1-запрос."""
+    default_port = 443 if scheme == "https" else 80
+    host_header = host if port == default_port else f"{host}:{port}"
+    if ":" in host and not host.startswith("["):
+        host_header = f"[{host}]" if port == default_port else f"[{host}]:{port}"
+    body = b""
+    lines = [
+        f"{method} {target} HTTP/1.1",
+        f"Host: {host_header}",
+        f"User-Agent: {_USER_AGENT}",
+        "Accept: */*",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    if method == "POST":
+        body = json.dumps(post_data or {}).encode("utf-8")
+        lines.append("Content-Type: application/json")
+        lines.append(f"Content-Length: {len(body)}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+
+def _parse_head(head: bytes) -> tuple[int, dict[str, str]]:
+    """Разбирает строку статуса и заголовки ответа."""
+    lines = head.decode("latin-1").split("\r\n")
+    status_line = lines[0].split(" ", 2)
+    if len(status_line) < 2 or not status_line[0].startswith("HTTP/"):
+        raise ProbeError(f"Некорректный ответ HTTP: {lines[0][:80]!r}")
+    try:
+        status = int(status_line[1])
+    except ValueError:
+        raise ProbeError(f"Некорректный статус HTTP: {status_line[1][:20]!r}")
+    headers: dict[str, str] = {}
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return (status, headers)
+
+
+def _body_framing(method: str, status: int, headers: dict[str, str]) -> tuple[str, int]:
+    """Как читать тело: ("none", 0), ("chunked", 0), ("length", n) или ("close", 0)."""
+    if method == "HEAD" or 100 <= status < 200 or status in (204, 304):
+        return ("none", 0)
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        return ("chunked", 0)
+    length = headers.get("content-length")
+    if length is not None:
+        try:
+            return ("length", max(0, int(length)))
+        except ValueError:
+            raise ProbeError(f"Некорректный Content-Length: {length[:20]!r}")
+    return ("close", 0)
+
+
+_ssl_contexts: dict[bool, ssl.SSLContext] = {}
+
+
+def _ssl_context(verify: bool) -> ssl.SSLContext:
+    """Общий SSL-контекст (создание контекста дорогое - один на процесс)."""
+    ctx = _ssl_contexts.get(verify)
+    if ctx is None:
+        ctx = ssl.create_default_context()
+        if not verify:
+            ctx.check_hostname = False
+            ctx.verify_mode = ssl.CERT_NONE
+        _ssl_contexts[verify] = ctx
+    return ctx
+
+
+class _ConnectionClosed(ProbeError):
+    """Соединение закрыто раньше, чем получен ожидаемый ответ."""
+
+
+class _SocketReader:
+    """Буферизованное чтение из блокирующего сокета (аналог asyncio.StreamReader)."""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.buffer = bytearray()
+
+    def _fill(self) -> bool:
+        data = self.sock.recv(65536)
+        if not data:
+            return False
+        self.buffer += data
+        return True
+
+    def readexactly(self, n: int) -> bytes:
+        while len(self.buffer) < n:
+            if not self._fill():
+                raise _ConnectionClosed()
+        data = bytes(self.buffer[:n])
+        del self.buffer[:n]
+        return data
+
+    def readuntil(self, separator: bytes, limit: int = _MAX_HEAD_SIZE) -> bytes:
+        start = 0
+        while True:
+            index = self.buffer.find(separator, start)
+            if index >= 0:
+                return self.readexactly(index + len(separator))
+            if len(self.buffer) > limit:
+                raise ProbeError("Слишком большие заголовки ответа")
+            start = max(0, len(self.buffer) - len(separator) + 1)
+            if not self._fill():
+                raise _ConnectionClosed()
+
+    def read(self, limit: int) -> bytes:
+        """Читает до закрытия соединения (не больше limit байт)."""
+        while len(self.buffer) < limit and self._fill():
+            pass
+        return self.readexactly(min(limit, len(self.buffer)))
+
+
+def _read_body(reader: _SocketReader, framing: str, length: int) -> bytes:
+    if framing == "none":
+        return b""
+    if framing == "length":
+        return reader.readexactly(min(length, _MAX_BODY_SIZE))
+    if framing == "chunked":
+        chunks = []
+        total = 0
+        while True:
+            size_line = reader.readuntil(b"\r\n")
+            try:
+                size = int(size_line.split(b";", 1)[0].strip(), 16)
+            except ValueError:
+                raise ProbeError("Некорректный chunked-ответ")
+            if size == 0:
+                return b"".join(chunks)
+            chunk = reader.readexactly(size)
+            reader.readexactly(2)
+            chunks.append(chunk)
+            total += size
+            if total >= _MAX_BODY_SIZE:
+                return b"".join(chunks)
+    return reader.read(_MAX_BODY_SIZE)
+
+
+def _failed_phase(scheme: str, timings: dict[str, float], reused: bool) -> str:
+    """Фаза, на которой оборвался запрос: первая незавершённая (у повторного соединения - только чтение)."""
+    if reused:
+        return "read"
+    for phase in ("connect", "socks", "tls"):
+        if phase not in timings and (phase != "tls" or scheme == "https"):
+            return phase
+    return "read"
+
+
+def _reusable(head: bytes, headers: dict[str, str], framing: str, length: int, content: bytes) -> bool:
+    """Можно ли вернуть соединение в сессию: HTTP/1.1 без Connection: close, тело прочитано целиком."""
+    if not head.startswith(b"HTTP/1.1") or headers.get("connection", "").lower() == "close":
+        return False
+    if framing == "length":
+        return length <= _MAX_BODY_SIZE
+    if framing == "chunked":
+        return len(content) < _MAX_BODY_SIZE
+    return framing == "none"
+
+
+def _open_tunnel(
+    socks_host: str, socks_port: InboundAddress, scheme: str, host: str, port: int,
+    connect_t: float, read_t: float, start: float, timings: dict[str, float],
+    track: Optional[Callable[[Optional[socket.socket], Optional[socket.socket]], None]] = None,
+) -> tuple[socket.socket, _SocketReader]:
+    """
+    Соединение с SOCKS inbound (порт или Unix-сокет), CONNECT к хосту, для HTTPS - TLS. Отмечает завершённые фазы в timings.
+    track(старый, новый): сообщает владельцу сокет, на котором идёт обмен (после TLS - обёрнутый), чтобы его можно было прервать.
+    """
+    sock = connect_inbound(socks_port, connect_t, socks_host)
+    try:
+        if track is not None:
+            track(None, sock)
+        timings["connect"] = time.perf_counter() - start
+
+        reader = _SocketReader(sock)
+        sock.sendall(_SOCKS5_GREETING)
+        _check_socks5_method(reader.readexactly(2))
+        sock.sendall(_socks5_connect_request(host, port))
+        rest = _check_socks5_reply(reader.readexactly(4))
+        if rest < 0:
+            rest = reader.readexactly(1)[0] + 2
+        reader.readexactly(rest)
+        timings["socks"] = time.perf_counter() - start
+
+        sock.settimeout(read_t)
+        if scheme == "https":
+            raw = sock
+            sock = _ssl_context(VERIFY_HTTPS_SSL).wrap_socket(raw, server_hostname=host)
+            if track is not None:
+                track(raw, sock)
+            reader = _SocketReader(sock)
+            timings["tls"] = time.perf_counter() - start
+    except BaseException:
+        if track is not None:
+            track(sock, None)
+        sock.close()
+        raise
+    return (sock, reader)
+
+
+def _exchange(
+    sock: socket.socket, reader: _SocketReader, method: str, host: str, port: int, scheme: str, target: str,
+    post_data: Optional[dict], keep_alive: bool, start: float, timings: dict[str, float],
+) -> tuple[ProbeResponse, bool]:
+    """Отправляет запрос по готовому туннелю и читает ответ. Возвращает (ответ, соединение_можно_переиспользовать)."""
+    sock.sendall(_build_http_request(method, host, port, scheme, target, post_data, keep_alive=keep_alive))
+    head = reader.readuntil(b"\r\n\r\n")
+    timings["first_byte"] = time.perf_counter() - start
+    status, headers = _parse_head(head[:-4])
+    framing, length = _body_framing(method, status, headers)
+    content = _read_body(reader, framing, length)
+    reusable = keep_alive and _reusable(head, headers, framing, length, content)
+    if reusable and framing == "chunked":
+        # Трейлеры и завершающая пустая строка, иначе они останутся в буфере следующего ответа
+        while reader.readuntil(b"\r\n") != b"\r\n":
+            pass
+    reusable = reusable and not reader.buffer
+    timings["total"] = time.perf_counter() - start
+    return (ProbeResponse(status, headers, content, timings), reusable)
+
+
+def _close_quietly(sock: socket.socket) -> None:
+    try:
+        sock.close()
+    except OSError:
+        pass
+
+
+def probe_request(
+    url: str,
+    socks_port: InboundAddress,
+    timeout: float | tuple[float, float],
+    method: str = "GET",
+    post_data: Optional[dict] = None,
+    socks_host: str = "127.0.0.1",
+) -> tuple[Optional[ProbeResponse], float, Optional[Exception]]:
+    """
+    HTTP(S)-запрос через SOCKS5 на блокирующем сокете. Возвращает (ответ, время_ответа, ошибка) как make_request.
+    timeout: число или (connect, read); connect - до установления туннеля, read - на каждое чтение после.
+    """
+    return ProbeSession(socks_port, socks_host, keep_alive=False).request(url, timeout, method, post_data)
+
+
+class ProbeSession:
+    """
+    Сессия запросов через один SOCKS-порт: keep-alive соединения (туннель + TLS) переиспользуются
+    между запросами к тому же хосту. ProbeResponse.reused - ответ получен по уже открытому соединению.
+    Потокобезопасна: параллельные запросы берут разные соединения. abort_active() прерывает
+    идущие запросы (их потоки сразу получают ошибку соединения); после close() соединения не сохраняются.
+    """
+
+    def __init__(self, socks_port: InboundAddress, socks_host: str = "127.0.0.1", keep_alive: bool = True):
+        self.socks_port = socks_port
+        self.socks_host = socks_host
+        self.keep_alive = keep_alive
+        self._idle: dict[tuple[str, str, int], list[tuple[socket.socket, _SocketReader]]] = {}
+        self._active: set[socket.socket] = set()
+        # Номер отмены: запрос, начатый до abort_active(), не открывает новых соединений
+        self._aborts = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def _take(self, origin: tuple[str, str, int]) -> Optional[tuple[socket.socket, _SocketReader]]:
+        with self._lock:
+            idle = self._idle.get(origin)
+            conn = idle.pop() if idle else None
+            if conn is not None:
+                self._active.add(conn[0])
+            return conn
+
+    def _put(self, origin: tuple[str, str, int], conn: tuple[socket.socket, _SocketReader]) -> None:
+        with self._lock:
+            self._active.discard(conn[0])
+            if not self._closed:
+                self._idle.setdefault(origin, []).append(conn)
+                return
+        # Сессия уже закрыта - соединение некуда вернуть
+        _close_quietly(conn[0])
+
+    def _track(self, old: Optional[socket.socket], new: Optional[socket.socket], aborts: Optional[int] = None) -> None:
+        with self._lock:
+            self._active.discard(old)
+            if new is None:
+                return
+            if aborts is not None and aborts != self._aborts:
+                raise ConnectionAbortedError("Запрос отменён")
+            self._active.add(new)
+
+    def abort_active(self) -> None:
+        """Прерывает идущие запросы: shutdown их сокетов будит потоки, заблокированные в чтении."""
+        with self._lock:
+            self._aborts += 1
+            active = list(self._active)
+        for sock in active:
+            try:
+                # Метод базового класса: SSLSocket.shutdown сбросил бы TLS-состояние, которым пользуется другой поток
+                socket.socket.shutdown(sock, socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def request(
+        self,
+        url: str,
+        timeout: float | tuple[float, float],
+        method: str = "GET",
+        post_data: Optional[dict] = None,
+    ) -> tuple[Optional[ProbeResponse], float, Optional[Exception]]:
+        """Запрос как probe_request; открытое соединение к тому же хосту используется повторно."""
+        start = time.perf_counter()
+        timings: dict[str, float] = {}
+        scheme = "http"
+        conn = None
+        reused = False
+        aborts = self._aborts
+        try:
+            scheme, host, port, target = _split_url(url)
+            connect_t, read_t = _split_timeout(timeout)
+            origin = (scheme, host, port)
+            conn = self._take(origin) if self.keep_alive else None
+            if conn is not None:
+                reused = True
+                conn[0].settimeout(read_t)
+                try:
+                    response, reusable = _exchange(*conn, method, host, port, scheme, target, post_data, True, start, timings)
+                except (_ConnectionClosed, ConnectionError, ssl.SSLError):
+                    if "first_byte" in timings:
+                        raise
+                    # Сервер закрыл простаивавшее соединение - повторяем по новому
+                    self._track(conn[0], None)
+                    _close_quietly(conn[0])
+                    conn = None
+                    reused = False
+                    start = time.perf_counter()
+            if conn is None:
+                conn = _open_tunnel(
+                    self.socks_host, self.socks_port, scheme, host, port, connect_t, read_t, start, timings,
+                    lambda old, new: self._track(old, new, aborts),
+                )
+                response, reusable = _exchange(*conn, method, host, port, scheme, target, post_data, self.keep_alive, start, timings)
+            response.reused = reused
+            if reusable:
+                self._put(origin, conn)
+                conn = None
+            return (response, timings["total"], None)
+        except socket.timeout:
+            phase = _failed_phase(scheme, timings, reused)
+            return (None, time.perf_counter() - start, ProbeTimeout(f"Таймаут запроса (фаза {phase})"))
+        except _ConnectionClosed:
+            phase = _failed_phase(scheme, timings, reused)
+            return (None, time.perf_counter() - start, ConnectionAbortedError(f"Соединение закрыто (фаза {phase})"))
+        except (OSError, ssl.SSLError, ProbeError, ValueError) as e:
+            return (None, time.perf_counter() - start, e)
+        finally:
+            if conn is not None:
+                self._track(conn[0], None)
+                _close_quietly(conn[0])
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for sock, _ in conns:
+                _close_quietly(sock)
+
+
+async def _read_body_async(reader: asyncio.StreamReader, framing: str, length: int) -> bytes:
+    if framing == "none":
+        return b""
+    if framing == "length":
+        return await reader.readexactly(min(length, _MAX_BODY_SIZE))
+    if framing == "chunked":
+        chunks = []
+        total = 0
+        while True:
+            size_line = await reader.readline()
+            try:
+                size = int(size_line.split(b";", 1)[0].strip(), 16)
+            except ValueError:
+                raise ProbeError("Некорректный chunked-ответ")
+            if size == 0:
+                return b"".join(chunks)
+            chunk = await reader.readexactly(size)
+            await reader.readexactly(2)
+            chunks.append(chunk)
+            total += size
+            if total >= _MAX_BODY_SIZE:
+                return b"".join(chunks)
+    return await reader.read(_MAX_BODY_SIZE)
+
+
+async def _open_tunnel_async(
+    socks_host: str, socks_port: InboundAddress, scheme: str, host: str, port: int,
+    connect_t: float, read_t: float, start: float, timings: dict[str, float],
+) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """Асинхронный аналог _open_tunnel."""
+    reader, writer = await asyncio.wait_for(open_inbound_connection(socks_port, socks_host, limit=_MAX_HEAD_SIZE), connect_t)
+    try:
+        timings["connect"] = time.perf_counter() - start
+
+        async def socks_handshake() -> None:
+            writer.write(_SOCKS5_GREETING)
+            _check_socks5_method(await reader.readexactly(2))
+            writer.write(_socks5_connect_request(host, port))
+            rest = _check_socks5_reply(await reader.readexactly(4))
+            if rest < 0:
+                rest = (await reader.readexactly(1))[0] + 2
+            await reader.readexactly(rest)
+
+        await asyncio.wait_for(socks_handshake(), connect_t)
+        timings["socks"] = time.perf_counter() - start
+
+        if scheme == "https":
+            await asyncio.wait_for(writer.start_tls(_ssl_context(VERIFY_HTTPS_SSL), server_hostname=host), read_t)
+            timings["tls"] = time.perf_counter() - start
+    except BaseException:
+        writer.close()
+        raise
+    return (reader, writer)
+
+
+async def _exchange_async(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter, method: str, host: str, port: int, scheme: str,
+    target: str, post_data: Optional[dict], keep_alive: bool, read_t: float, start: float, timings: dict[str, float],
+) -> tuple[ProbeResponse, bool]:
+    """Асинхронный аналог _exchange."""
+    writer.write(_build_http_request(method, host, port, scheme, target, post_data, keep_alive=keep_alive))
+    await asyncio.wait_for(writer.drain(), read_t)
+    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), read_t)
+    timings["first_byte"] = time.perf_counter() - start
+    status, headers = _parse_head(head[:-4])
+    framing, length = _body_framing(method, status, headers)
+    content = await asyncio.wait_for(_read_body_async(reader, framing, length), read_t)
+    reusable = keep_alive and _reusable(head, headers, framing, length, content)
+    if reusable and framing == "chunked":
+        while await asyncio.wait_for(reader.readuntil(b"\r\n"), read_t) != b"\r\n":
+            pass
+    reusable = reusable and not reader.at_eof()
+    timings["total"] = time.perf_counter() - start
+    return (ProbeResponse(status, headers, content, timings), reusable)
+
+
+async def probe_request_async(
+    url: str,
+    socks_port: InboundAddress,
+    timeout: float | tuple[float, float],
+    method: str = "GET",
+    post_data: Optional[dict] = None,
+    socks_host: str = "127.0.0.1",
+) -> tuple[Optional[ProbeResponse], float, Optional[Exception]]:
+    """
+    Асинхронный HTTP(S)-запрос через SOCKS5. Возвращает (ответ, время_ответа, ошибка) как make_request.
+    timeout: число или (connect, read); connect - до установления туннеля, read - на каждую следующую фазу.
+    """
+    return await AsyncProbeSession(socks_port, socks_host, keep_alive=False).request(url, timeout, method, post_data)
+
+
+class AsyncProbeSession:
+    """Асинхронный аналог ProbeSession (для одного цикла событий)."""
+
+    def __init__(self, socks_port: InboundAddress, socks_host: str = "127.0.0.1", keep_alive: bool = True):
+        self.socks_port = socks_port
+        self.socks_host = socks_host
+        self.keep_alive = keep_alive
+        self._idle: dict[tuple[str, str, int], list[tuple[asyncio.StreamReader, asyncio.StreamWriter]]] = {}
+
+    async def request(
+        self,
+        url: str,
+        timeout: float | tuple[float, float],
+        method: str = "GET",
+        post_data: Optional[dict] = None,
+    ) -> tuple[Optional[ProbeResponse], float, Optional[Exception]]:
+        """Запрос как probe_request_async; открытое соединение к тому же хосту используется повторно."""
+        start = time.perf_counter()
+        timings: dict[str, float] = {}
+        scheme = "http"
+        conn = None
+        reused = False
+        try:
+            scheme, host, port, target = _split_url(url)
+            connect_t, read_t = _split_timeout(timeout)
+            origin = (scheme, host, port)
+            idle = self._idle.get(origin) if self.keep_alive else None
+            conn = idle.pop() if idle else None
+            if conn is not None:
+                reused = True
+                try:
+                    response, reusable = await _exchange_async(
+                        *conn, method, host, port, scheme, target, post_data, True, read_t, start, timings
+                    )
+                except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError):
+                    if "first_byte" in timings:
+                        raise
+                    # Сервер закрыл простаивавшее соединение - повторяем по новому
+                    conn[1].close()
+                    conn = None
+                    reused = False
+                    start = time.perf_counter()
+            if conn is None:
+                conn = await _open_tunnel_async(
+                    self.socks_host, self.socks_port, scheme, host, port, connect_t, read_t, start, timings
+                )
+                response, reusable = await _exchange_async(
+                    *conn, method, host, port, scheme, target, post_data, self.keep_alive, read_t, start, timings
+                )
+            response.reused = reused
+            if reusable:
+                self._idle.setdefault(origin, []).append(conn)
+                conn = None
+            return (response, timings["total"], None)
+        except asyncio.TimeoutError:
+            phase = _failed_phase(scheme, timings, reused)
+            return (None, time.perf_counter() - start, ProbeTimeout(f"Таймаут запроса (фаза {phase})"))
+        except asyncio.IncompleteReadError:
+            phase = _failed_phase(scheme, timings, reused)
+            return (None, time.perf_counter() - start, ConnectionAbortedError(f"Соединение закрыто (фаза {phase})"))
+        except asyncio.LimitOverrunError:
+            return (None, time.perf_counter() - start, ProbeError("Слишком большие заголовки ответа"))
+        except (OSError, ssl.SSLError, ProbeError, ValueError) as e:
+            return (None, time.perf_counter() - start, e)
+        finally:
+            if conn is not None:
+                conn[1].close()
+
+    def close(self) -> None:
+        idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for _, writer in conns:
+                writer.close()
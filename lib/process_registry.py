@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модуль учёта и завершения процессов xray.
+Реестр запущенных процессов (pid -> процесс и его адреса inbound) общий для всех потоков
+проверки. Поток проверки не ждёт завершения xray: release() отправляет SIGTERM и передаёт
+процесс фоновому сборщику, который опрашивает все завершающиеся процессы разом, через
+_TERM_GRACE секунд добивает группу процесса SIGKILL и возвращает адреса в port_pool
+только после выхода xray (адрес не выдаётся, пока его ещё слушает старый процесс). Процесс,
+переживший SIGKILL (например, в состоянии D), остаётся у сборщика вместе со своими адресами.
+Процессы asyncio-движка завершаются так же, фоновой задачей в его цикле событий.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from typing import Iterable, Optional, Union
+
+from .port_pool import InboundAddress, return_ports
+from .spawn_server import SpawnedProcess
+
+logger = logging.getLogger(__name__)
+
+# Ожидание выхода после SIGTERM, затем SIGKILL группы; после SIGKILL ещё столько же на выход
+_TERM_GRACE = 2.0
+_KILL_GRACE = 1.0
+# Интервал опроса завершающихся процессов сборщиком
+_REAP_INTERVAL = 0.05
+_SIGKILL = getattr(signal, "SIGKILL", signal.SIGTERM)
+
+# Popen, SpawnedProcess (spawn_server) или процесс asyncio-движка
+XrayProcess = Union[subprocess.Popen, SpawnedProcess, asyncio.subprocess.Process]
+
+_lock = threading.RLock()
+# pid -> (процесс, адреса inbound, возвращаемые после его завершения)
+_registry: dict[int, tuple[XrayProcess, tuple[InboundAddress, ...]]] = {}
+# Процессы у сборщика (SIGTERM отправлен, ждём выхода)
+_dying: list["_Dying"] = []
+_reaper_wakeup = threading.Condition(_lock)
+_reaper: Optional[threading.Thread] = None
+# Фоновые задачи завершения процессов asyncio (ссылки, чтобы задачи не собрал GC)
+_async_tasks: set = set()
+
+
+def register(proc: XrayProcess, addresses: Iterable[InboundAddress] = ()) -> None:
+    """Учитывает запущенный xray; addresses вернутся в port_pool после его завершения через release()."""
+    with _lock:
+        _registry[proc.pid] = (proc, tuple(addresses))
+
+
+def unregister(proc: XrayProcess) -> None:
+    """Снимает процесс с учёта (его завершает и адреса возвращает вызывающий)."""
+    with _lock:
+        _registry.pop(proc.pid, None)
+
+
+def _signal_group(proc: XrayProcess, sig: int) -> None:
+    """Сигнал группе процесса xray (xray запускается в своей сессии), на Windows - kill."""
+    try:
+        if sys.platform == "win32":
+            proc.kill()
+        else:
+            os.killpg(proc.pid, sig)
+    except (OSError, ProcessLookupError):
+        try:
+            proc.send_signal(sig)
+        except (OSError, ProcessLookupError):
+            pass
+
+
+def _close_stderr(proc: XrayProcess) -> None:
+    """Закрывает перехваченный stderr без блокирующего чтения."""
+    if not isinstance(proc, asyncio.subprocess.Process) and proc.stderr is not None:
+        try:
+            proc.stderr.close()
+        except (OSError, ValueError):
+            pass
+
+
+def _terminate(proc: XrayProcess) -> None:
+    try:
+        proc.terminate()
+    except (OSError, ProcessLookupError):
+        pass
+
+
+class _Dying:
+    """Процесс у сборщика: когда добить SIGKILL и когда перестать ждать."""
+
+    def __init__(self, proc: Union[subprocess.Popen, SpawnedProcess], addresses: list[InboundAddress]):
+        now = time.monotonic()
+        self.proc = proc
+        self.addresses = addresses
+        self.kill_at = now + _TERM_GRACE
+        self.give_up_at = now + _TERM_GRACE + _KILL_GRACE
+        self.killed = False
+        self.stuck = False
+
+
+def release(proc: Optional[Union[subprocess.Popen, SpawnedProcess]], addresses: Iterable[InboundAddress] = (), drain_stderr: bool = True) -> None:
+    """
+    Завершает xray без ожидания: SIGTERM и передача фоновому сборщику; адреса вернутся в port_pool
+    после выхода процесса. proc=None (xray не запустился) - адреса возвращаются сразу.
+    """
+    global _reaper
+    addresses = list(addresses)
+    if proc is None:
+        return_ports(addresses)
+        return
+    unregister(proc)
+    if drain_stderr:
+        _close_stderr(proc)
+    if proc.poll() is not None:
+        return_ports(addresses)
+        return
+    _terminate(proc)
+    with _lock:
+        _dying.append(_Dying(proc, addresses))
+        if _reaper is None:
+            _reaper = threading.Thread(target=_reap_loop, name="xray-reaper", daemon=True)
+            _reaper.start()
+        _reaper_wakeup.notify()
+
+
+def _reap_loop() -> None:
+    """Фоновый сборщик: за проход опрашивает все завершающиеся процессы, зависшие добивает SIGKILL группы."""
+    while True:
+        with _lock:
+            while not _dying:
+                _reaper_wakeup.wait()
+            batch = list(_dying)
+        now = time.monotonic()
+        finished = []
+        for item in batch:
+            if item.proc.poll() is not None:
+                finished.append(item)
+            elif now >= item.give_up_at and not item.stuck:
+                # Адреса ещё может слушать живой процесс: они вернутся в пул только после его выхода
+                logger.warning(f"xray (pid {item.proc.pid}) не завершился после SIGKILL, адреса {item.addresses} не возвращаются в пул до его выхода")
+                item.stuck = True
+            elif now >= item.kill_at and not item.killed:
+                _signal_group(item.proc, _SIGKILL)
+                item.killed = True
+        if finished:
+            with _lock:
+                # Процессы, уже снятые terminate_all, вернули свои адреса там
+                finished = [item for item in finished if item in _dying]
+                _dying[:] = [item for item in _dying if item not in finished]
+            return_ports([address for item in finished for address in item.addresses])
+        time.sleep(_REAP_INTERVAL)
+
+
+async def _reap_async(proc: asyncio.subprocess.Process) -> None:
+    try:
+        try:
+            await asyncio.wait_for(proc.wait(), _TERM_GRACE)
+        except asyncio.TimeoutError:
+            _signal_group(proc, _SIGKILL)
+            try:
+                await asyncio.wait_for(proc.wait(), _KILL_GRACE)
+            except asyncio.TimeoutError:
+                logger.warning(f"xray (pid {proc.pid}) не завершился после SIGKILL, адреса не возвращаются в пул до его выхода")
+                await proc.wait()
+    except asyncio.CancelledError:
+        # Цикл событий закрывается - добиваем сразу; не вышедший процесс остаётся в реестре для terminate_all
+        _signal_group(proc, _SIGKILL)
+        raise
+    finally:
+        # Процесс, уже снятый terminate_all, вернул свои адреса там
+        entry = None
+        if proc.returncode is not None:
+            with _lock:
+                entry = _registry.pop(proc.pid, None)
+        if entry is not None:
+            return_ports(entry[1])
+
+
+def release_async(proc: Optional[asyncio.subprocess.Process], addresses: Iterable[InboundAddress] = ()) -> None:
+    """Аналог release для процессов asyncio: завершение идёт фоновой задачей текущего цикла событий."""
+    addresses = list(addresses)
+    if proc is None or proc.returncode is not None:
+        if proc is not None:
+            unregister(proc)
+        return_ports(addresses)
+        return
+    # Процесс остаётся в реестре до выхода - при прерывании его завершит terminate_all
+    register(proc, addresses)
+    _terminate(proc)
+    task = asyncio.get_running_loop().create_task(_reap_async(proc))
+    _async_tasks.add(task)
+    task.add_done_callback(_async_tasks.discard)
+
+
+def terminate_all() -> None:
+    """
+    Немедленно завершает все учтённые и завершающиеся процессы (SIGKILL группы) и возвращает их адреса.
+    Для прерывания и выхода: ничего не ждёт дольше _KILL_GRACE.
+    """
+    with _lock:
+        entries = list(_registry.values()) + [(item.proc, tuple(item.addresses)) for item in _dying]
+        _registry.clear()
+        _dying.clear()
+    for proc, _ in entries:
+        _signal_group(proc, _SIGKILL)
+    deadline = time.monotonic() + _KILL_GRACE
+    for proc, _ in entries:
+        if not isinstance(proc, asyncio.subprocess.Process):
+            try:
+                proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                pass
+    return_ports([address for _, addresses in entries for address in addresses])
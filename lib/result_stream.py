@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модуль потоковой записи результатов (STREAM_RESULTS).
+По мере проверки каждый ключ дописывается строкой JSON в <результат>.jsonl, а файл
+рабочих ключей и (top100) раз в STREAM_PUBLISH_INTERVAL секунд переписываются
+отсортированными по задержке. Файлы публикуются атомарно (запись во временный файл
+и os.replace), так что читатель никогда не видит наполовину записанный список.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from .config import STREAM_PUBLISH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Регулярка для удаления префикса задержки "[123ms] " перед публикацией
+_LATENCY_PREFIX_RE = re.compile(r"^\[\d+ms\]\s*", re.MULTILINE)
+
+# Метрики ключа, попадающие в JSONL
+_RECORD_METRICS = (
+    "successful_urls", "failed_urls", "total_requests", "successful_requests", "timeouts",
+    "cached", "prefiltered", "deadline_exceeded", "xray_rss_kb", "xray_cpu_ms", "xray_shared",
+)
+
+
+def strip_latency_prefix(text: str) -> str:
+    """Убирает префикс задержки [Nms] из начала строк перед записью в файл для публикации."""
+    return _LATENCY_PREFIX_RE.sub("", text)
+
+
+def top100_path(output_path: str) -> Path:
+    """Файл топ-100: исходное_имя + (top100) + то же расширение (без расширения, если у основного файла его нет)."""
+    base_path = Path(output_path)
+    return base_path.parent / f"{base_path.stem}(top100){base_path.suffix}"
+
+
+def jsonl_path(output_path: str) -> Path:
+    """Файл потоковых записей по ключам: исходное_имя.jsonl рядом с результатом."""
+    base_path = Path(output_path)
+    return base_path.parent / f"{base_path.stem}.jsonl"
+
+
+def atomic_write_text(path: str | Path, text: str) -> None:
+    """Записывает файл целиком: во временный файл в том же каталоге, затем os.replace."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.parent / f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def write_available(output_path: str, available_sorted: list[tuple[str, float]], top_n: int = 100) -> Optional[Path]:
+    """
+    Публикует отсортированные рабочие ключи и top_n лучших (без префикса задержки).
+    Возвращает путь к файлу топа или None, если ключей нет.
+    """
+    if not available_sorted:
+        return None
+    atomic_write_text(output_path, "\n".join(strip_latency_prefix(item[0]) for item in available_sorted))
+    path = top100_path(output_path)
+    atomic_write_text(path, "\n".join(strip_latency_prefix(item[0]) for item in available_sorted[:top_n]))
+    return path
+
+
+class ResultStream:
+    """
+    Потоковая запись результатов одного прогона.
+    record() вызывается по готовности каждого ключа; publish() - принудительная публикация
+    (в конце прогона или при прерывании).
+    """
+
+    def __init__(self, output_path: str, interval: float = STREAM_PUBLISH_INTERVAL):
+        self.output_path = output_path
+        self.interval = interval
+        self.available: list[tuple[str, float]] = []
+        self.published = 0
+        # RLock: publish() может вызываться из обработчика сигнала посреди record() в том же потоке
+        self._lock = threading.RLock()
+        self._last_publish = time.monotonic()
+        self._dirty = False
+        path = jsonl_path(output_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._jsonl = open(path, "w", encoding="utf-8")
+
+    def record(self, link: str, ok: bool, metrics: Optional[dict], entry: Optional[tuple[str, float]] = None) -> None:
+        """
+        Дописывает ключ в JSONL; entry - (отформатированная_строка, задержка_мс), если ключ попадает в рабочие.
+        Раз в interval секунд публикует накопленные рабочие ключи.
+        """
+        record = {
+            "key": link,
+            "available": ok,
+            "published": entry is not None,
+            "latency_ms": round(entry[1]) if entry is not None else None,
+            "checked_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        if entry is not None:
+            # Строка для публикации (с метаданными) - по ней --merge-shards собирает общий результат
+            record["line"] = strip_latency_prefix(entry[0])
+        if metrics:
+            record.update({name: metrics[name] for name in _RECORD_METRICS if name in metrics})
+            if metrics.get("geolocation") and "ip" in metrics["geolocation"]:
+                record["ip"] = metrics["geolocation"]["ip"]
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            if self._jsonl is None:
+                return
+            self._jsonl.write(line + "\n")
+            self._jsonl.flush()
+            if entry is not None:
+                self.available.append(entry)
+                self._dirty = True
+            due = self._dirty and time.monotonic() - self._last_publish >= self.interval
+        if due:
+            self.publish()
+
+    def publish(self) -> None:
+        """Переписывает файл рабочих ключей и (top100), если с прошлой публикации появились новые."""
+        with self._lock:
+            if not self._dirty:
+                return
+            available_sorted = sorted(self.available, key=lambda x: x[1])
+            self._dirty = False
+            self._last_publish = time.monotonic()
+            try:
+                write_available(self.output_path, available_sorted)
+                self.published = len(available_sorted)
+            except OSError as e:
+                logger.warning(f"Ошибка публикации промежуточных результатов: {e}")
+                return
+        logger.debug(f"Опубликовано рабочих ключей: {len(available_sorted)}")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.close()
+                self._jsonl = None
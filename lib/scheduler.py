@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модуль приоритетного порядка проверки (PRIORITY_SCHEDULING).
+Ключи проверяются в порядке убывания оценки вероятности пройти проверку, чтобы рабочие
+ключи находились в начале прогона и попадали в результат, даже если прогон оборван.
+История: прошлый файл результата (рабочие ключи, отсортированы по задержке), notworkers
+и кэш результатов. Для ключей без истории оценка - наивный Байес по признакам
+(протокол, транспорт, шифрование, порт, источник), обученный на ключах с историей.
+"""
+
+import logging
+import math
+import os
+from collections import defaultdict
+from typing import Optional
+
+from .cache import get_key_hash
+from .parsing import normalize_proxy_link, parse_proxy_url
+
+logger = logging.getLogger(__name__)
+
+# Оценки ключей с известной историей (выше любой оценки по признакам)
+_PREVIOUS_PASS_SCORE = 0.9  # + до 0.1 за место в прошлом результате (меньше задержка - выше)
+_CACHED_PASS_SCORE = 0.85
+_CACHED_FAIL_SCORE = 0.02
+_MAX_FEATURE_SCORE = 0.8
+# Ключ из notworkers: оценка по признакам умножается на этот коэффициент
+_NOTWORKER_FACTOR = 0.5
+# Сглаживание частоты по значению признака (редкие значения тянутся к общей доле)
+_SMOOTHING = 5.0
+# Признаки коррелированы (порт и шифрование и т.п.) - вклад каждого ослабляется
+_FEATURE_WEIGHT = 0.5
+
+
+def key_features(link: str, source: Optional[str] = None) -> list[tuple[str, str]]:
+    """Признаки ключа: протокол, транспорт, шифрование транспорта, порт и (если известен) источник."""
+    parsed = parse_proxy_url(link)
+    if parsed:
+        # У VMess "security" - шифр, транспортное шифрование в "tls"
+        security = parsed.get("tls", "") if parsed.get("protocol") == "vmess" else parsed.get("security", "")
+        features = [
+            ("protocol", str(parsed.get("protocol", ""))),
+            ("network", str(parsed.get("network", "tcp")).lower()),
+            ("security", str(security or "none").lower()),
+            ("port", str(parsed.get("port", ""))),
+        ]
+    else:
+        features = [("protocol", "?")]
+    if source:
+        features.append(("source", source))
+    return features
+
+
+def load_previous_results(path: str) -> dict[str, int]:
+    """{нормализованный ключ: место} из прошлого файла результата (ключи там отсортированы по задержке)."""
+    ranks: dict[str, int] = {}
+    if not path or not os.path.isfile(path):
+        return ranks
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if line.startswith("[") and "ms]" in line:
+                    line = line.split("]", 1)[1].strip()
+                link = normalize_proxy_link(line)
+                if "://" in link and link not in ranks:
+                    ranks[link] = len(ranks)
+    except (OSError, UnicodeDecodeError) as e:
+        logger.warning(f"Ошибка чтения прошлого результата {path}: {e}")
+    return ranks
+
+
+def _logit(p: float) -> float:
+    return math.log(p / (1.0 - p))
+
+
+class _FeatureModel:
+    """Наивный Байес по категориальным признакам с долей успеха по каждому значению признака."""
+
+    def __init__(self):
+        self.total = 0
+        self.passed = 0
+        self.counts: dict[tuple[str, str], list[int]] = defaultdict(lambda: [0, 0])  # значение -> [прошло, всего]
+
+    def add(self, features: list[tuple[str, str]], ok: bool) -> None:
+        self.total += 1
+        self.passed += int(ok)
+        for feature in features:
+            counts = self.counts[feature]
+            counts[0] += int(ok)
+            counts[1] += 1
+
+    def predict(self, features: list[tuple[str, str]]) -> float:
+        base = (self.passed + 1) / (self.total + 2)
+        score = _logit(base)
+        for feature in features:
+            passed, total = self.counts.get(feature, (0, 0))
+            rate = (passed + _SMOOTHING * base) / (total + _SMOOTHING)
+            score += _FEATURE_WEIGHT * (_logit(rate) - _logit(base))
+        return 1.0 / (1.0 + math.exp(-score))
+
+
+def prioritize(
+    links: list[str],
+    previous_output: str,
+    notworkers: set[str],
+    cache_entries: Optional[dict] = None,
+    sources: Optional[dict[str, str]] = None,
+) -> tuple[list[str], int]:
+    """
+    Упорядочивает ключи по убыванию оценки вероятности пройти проверку (при равной оценке - исходный порядок).
+    previous_output: прошлый файл результата; notworkers: нормализованные нерабочие ключи;
+    cache_entries: кэш результатов {хеш_ключа: {"result": ...}} (без учёта TTL);
+    sources: {нормализованный ключ: источник} (режим merge).
+    Возвращает (ключи_по_приоритету, число_ключей_с_историей).
+    """
+    sources = sources or {}
+    cache_entries = cache_entries or {}
+    previous = load_previous_results(previous_output)
+    cached = {link: cache_entries.get(get_key_hash(link), {}).get("result") for link in links}
+
+    model = _FeatureModel()
+    for link in previous:
+        model.add(key_features(link, sources.get(link)), True)
+    for link in notworkers:
+        if link not in previous:
+            model.add(key_features(link, sources.get(link)), False)
+    for link, result in cached.items():
+        if result is not None and normalize_proxy_link(link) not in previous:
+            model.add(key_features(link, sources.get(normalize_proxy_link(link))), bool(result))
+
+    scores: dict[str, float] = {}
+    known = 0
+    for link in links:
+        normalized = normalize_proxy_link(link)
+        if normalized in previous:
+            scores[link] = _PREVIOUS_PASS_SCORE + 0.1 * (1.0 - previous[normalized] / len(previous))
+        elif cached[link] is not None:
+            scores[link] = _CACHED_PASS_SCORE if cached[link] else _CACHED_FAIL_SCORE
+        else:
+            score = min(_MAX_FEATURE_SCORE, model.predict(key_features(link, sources.get(normalized))))
+            scores[link] = score * _NOTWORKER_FACTOR if normalized in notworkers else score
+            continue
+        known += 1
+
+    ordered = sorted(links, key=lambda link: -scores[link])
+    logger.debug(f"Приоритет: обучено на {model.total} ключах, с историей {known} из {len(links)}")
+    return (ordered, known)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модуль детерминированного деления списка ключей на шарды (--shard i/N).
+Ключ попадает в шард по стабильному хешу normalize_proxy_link, поэтому на любой машине
+и при любом порядке списка каждый ключ проверяется ровно одним шардом.
+Шард пишет результаты в файлы с суффиксом (shardI-N); шаг --merge-shards собирает
+их JSONL-записи (lib.result_stream) в общий отсортированный результат.
+"""
+
+import hashlib
+import json
+import logging
+import re
+from pathlib import Path
+
+from .parsing import normalize_proxy_link
+
+logger = logging.getLogger(__name__)
+
+
+def parse_shard(spec: str) -> tuple[int, int]:
+    """Разбирает "i/N" (1 <= i <= N) в (i, N). ValueError при неверном формате."""
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", spec or "")
+    if not match:
+        raise ValueError(f"Неверный шард {spec!r}: ожидается i/N, например 1/4")
+    index, count = int(match.group(1)), int(match.group(2))
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Неверный шард {spec!r}: нужно 1 <= i <= N")
+    return (index, count)
+
+
+def shard_of(link: str, count: int) -> int:
+    """Номер шарда ключа (1..count), не зависящий от процесса и порядка ключей."""
+    digest = hashlib.sha256(normalize_proxy_link(link).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count + 1
+
+
+def filter_shard(keys: list[tuple[str, str]], index: int, count: int) -> list[tuple[str, str]]:
+    """Ключи (ссылка, полная_строка), попадающие в шард index из count."""
+    return [item for item in keys if shard_of(item[0], count) == index]
+
+
+def shard_output_path(output_path: str, index: int, count: int) -> str:
+    """Файл результата шарда: исходное_имя(shardI-N) + то же расширение."""
+    base_path = Path(output_path)
+    return str(base_path.parent / f"{base_path.stem}(shard{index}-{count}){base_path.suffix}")
+
+
+def load_shard_results(output_path: str) -> tuple[list[tuple[str, float]], set[str], set[str], list[int], int]:
+    """
+    Читает JSONL всех найденных шардов результата output_path.
+    Возвращает (рабочие (строка, задержка_мс), нерабочие ключи для notworkers, рабочие ключи, найденные шарды, число шардов).
+    При нескольких наборах шардов (разное N) берётся набор с наибольшим числом файлов.
+    """
+    base_path = Path(output_path)
+    pattern = re.compile(re.escape(base_path.stem) + r"\(shard(\d+)-(\d+)\)\.jsonl")
+    sets: dict[int, dict[int, Path]] = {}
+    for path in base_path.parent.glob(f"{base_path.stem}(shard*-*).jsonl"):
+        match = pattern.fullmatch(path.name)
+        if match:
+            sets.setdefault(int(match.group(2)), {})[int(match.group(1))] = path
+    if not sets:
+        return ([], set(), set(), [], 0)
+    count, files = max(sets.items(), key=lambda item: len(item[1]))
+
+    available: list[tuple[str, float]] = []
+    failed: set[str] = set()
+    passed: set[str] = set()
+    for index in sorted(files):
+        path = files[index]
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Пропущена повреждённая строка в {path}")
+                    continue
+                key = record.get("key")
+                if not key:
+                    continue
+                # Как в одиночном прогоне: рабочий - попавший в результат (в пределах MAX_LATENCY_MS)
+                if record.get("published") and record.get("line"):
+                    passed.add(key)
+                    available.append((record["line"], float(record.get("latency_ms") or 0)))
+                elif not record.get("prefiltered"):
+                    failed.add(key)
+    return (available, failed - passed, passed, sorted(files), count)
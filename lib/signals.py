@@ -6,22 +6,19 @@
 
 import atexit
 import signal
-import subprocess
 import sys
-from typing import TYPE_CHECKING
+from typing import Callable
 
 from rich.console import Console
 
-if TYPE_CHECKING:
-    from .xray_manager import kill_xray_process
-
 console = Console()
 
 # Глобальные переменные для обработки сигналов
-active_processes: list[tuple[subprocess.Popen, int]] = []
 interrupted = False
 available_keys: list[str] = []
 output_path_global: str = ""
+# Вызываются при прерывании до выхода (например, публикация потоковых результатов)
+interrupt_hooks: list[Callable[[], None]] = []
 
 
 def signal_handler(signum, frame):
@@ -30,20 +27,22 @@ def signal_handler(signum, frame):
     interrupted = True
     console.print("\n\n[bold yellow][!][/bold yellow] Получен сигнал прерывания. Завершение работы...")
     cleanup_processes()
+    for hook in interrupt_hooks:
+        try:
+            hook()
+        except Exception as e:
+            import logging
+            logging.getLogger(__name__).error(f"Ошибка при завершении: {e}")
     save_partial_results()
     sys.exit(0)
 
 
 def cleanup_processes():
-    """Корректно завершает все активные процессы xray."""
+    """Завершает все процессы xray (запущенные и ещё не завершившиеся после проверки)."""
     # Импортируем здесь, чтобы избежать циклических зависимостей
-    from .xray_manager import kill_xray_process
-    from .port_pool import return_port
-    
-    for proc, port in active_processes:
-        kill_xray_process(proc)
-        return_port(port)
-    active_processes.clear()
+    from .process_registry import terminate_all
+
+    terminate_all()
 
 
 def save_partial_results():
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модуль spawn-сервера xray (XRAY_SPAWN_SERVER, только POSIX).
+fork/exec из процесса проверки со 120 потоками и большой кучей дорог (копирование таблиц
+страниц, блокировки fork, GIL), и дорожает по мере роста процесса. Spawn-сервер - маленький
+отдельный процесс, запускаемый в начале работы: он принимает запросы запуска по
+Unix-сокету (аргументы и дескрипторы stdin/stderr/memfd через SCM_RIGHTS), запускает xray
+через posix_spawn в новой сессии и возвращает pid; о завершении процессов сообщает по
+отдельному каналу. Если канал запросов закрылся (процесс проверки завершился, в том числе
+по SIGKILL), сервер завершает группы всех своих xray и выходит.
+Серверная часть использует только стандартную библиотеку: процесс сервера не импортирует
+модули проверки.
+"""
+
+import errno
+import fcntl
+import json
+import logging
+import os
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Номер дескриптора memfd с конфигом в xray (аргумент -config /proc/self/fd/N)
+MEMFD_TARGET_FD = 3
+# Сообщение о завершении xray: pid, код возврата (как Popen.returncode)
+_EXIT_EVENT = struct.Struct("<ii")
+_MAX_MESSAGE = 64 * 1024
+_MAX_FDS = 4
+# Дескрипторы сервера переносятся выше этого номера, чтобы не пересекаться с 0-3 xray
+_HIGH_FD = 10
+_PR_SET_PDEATHSIG = 1
+
+
+def parent_death_signal(parent: int, sig: int = signal.SIGTERM) -> None:
+    """
+    PR_SET_PDEATHSIG (Linux): текущий процесс получит sig при завершении родителя parent.
+    Сигнал приходит при завершении запустившего потока родителя - процесс должен быть запущен из главного потока.
+    """
+    if not sys.platform.startswith("linux"):
+        return
+    try:
+        import ctypes
+
+        ctypes.CDLL(None, use_errno=True).prctl(_PR_SET_PDEATHSIG, sig)
+    except (OSError, AttributeError):
+        return
+    # Родитель успел завершиться до prctl - сигнал уже не придёт
+    if os.getppid() != parent:
+        os.kill(os.getpid(), sig)
+
+
+def _high_fd(fd: int) -> int:
+    """Копия fd с номером не ниже _HIGH_FD (close-on-exec), исходный fd закрывается."""
+    high = fcntl.fcntl(fd, fcntl.F_DUPFD_CLOEXEC, _HIGH_FD)
+    os.close(fd)
+    return high
+
+
+def serve(request_fd: int, events_fd: int, parent: int = 0) -> None:
+    """
+    Цикл spawn-сервера: запросы запуска из request_fd, события завершения в events_fd.
+    parent - pid процесса проверки для PR_SET_PDEATHSIG (0 - без него, остаётся закрытие канала запросов).
+    """
+    # Ctrl+C обрабатывает процесс проверки; SIGTERM - завершить свои xray (finally) и выйти
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if parent:
+        # Один раз на сервер вместо preexec_fn на каждый xray: гибель процесса проверки - SIGTERM серверу
+        parent_death_signal(parent)
+    sock = socket.socket(fileno=_high_fd(request_fd))
+    events_fd = _high_fd(events_fd)
+    devnull = _high_fd(os.open(os.devnull, os.O_RDWR))
+    children: set[int] = set()
+    lock = threading.Lock()
+    spawned = threading.Event()
+
+    def reap() -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, 0)
+            except ChildProcessError:
+                spawned.wait()
+                spawned.clear()
+                continue
+            with lock:
+                children.discard(pid)
+            try:
+                os.write(events_fd, _EXIT_EVENT.pack(pid, os.waitstatus_to_exitcode(status)))
+            except OSError:
+                pass
+
+    threading.Thread(target=reap, daemon=True).start()
+    try:
+        while True:
+            try:
+                message, fds, _, _ = socket.recv_fds(sock, _MAX_MESSAGE, _MAX_FDS)
+            except OSError:
+                break
+            if not message:
+                break
+            fds = [_high_fd(fd) for fd in fds]
+            try:
+                request = json.loads(message)
+                argv = request["argv"]
+                actions = [(os.POSIX_SPAWN_DUP2, devnull, target) for target in (0, 1, 2)]
+                actions += [(os.POSIX_SPAWN_DUP2, fd, target) for fd, target in zip(fds, request["targets"])]
+                with lock:
+                    pid = os.posix_spawnp(argv[0], argv, os.environ, file_actions=actions, setsid=True)
+                    children.add(pid)
+                spawned.set()
+                reply = {"pid": pid}
+            except OSError as e:
+                reply = {"errno": e.errno or errno.EIO, "error": e.strerror or str(e)}
+            except (ValueError, KeyError, TypeError) as e:
+                reply = {"errno": errno.EINVAL, "error": str(e)}
+            finally:
+                for fd in fds:
+                    os.close(fd)
+            sock.send(json.dumps(reply).encode())
+    finally:
+        # Процесс проверки завершился или закрыл канал - xray не должны его пережить
+        with lock:
+            for pid in children:
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except OSError:
+                    pass
+
+
+class SpawnedProcess:
+    """xray, запущенный spawn-сервером: часть интерфейса subprocess.Popen, нужная xray_manager и process_registry."""
+
+    def __init__(self, args: list[str], pid: int, stdin, stderr):
+        self.args = args
+        self.pid = pid
+        self.stdin = stdin
+        self.stderr = stderr
+        self.returncode: Optional[int] = None
+        self._exited = threading.Event()
+
+    def _set_exited(self, returncode: int) -> None:
+        self.returncode = returncode
+        self._exited.set()
+
+    def poll(self) -> Optional[int]:
+        return self.returncode
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        if not self._exited.wait(timeout):
+            raise subprocess.TimeoutExpired(self.args, timeout)
+        return self.returncode
+
+    def send_signal(self, sig: int) -> None:
+        # После выхода pid мог достаться другому процессу
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def terminate(self) -> None:
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self) -> None:
+        self.send_signal(signal.SIGKILL)
+
+
+class SpawnClient:
+    """Клиент spawn-сервера в процессе проверки (свой сервер у каждого процесса)."""
+
+    def __init__(self, env: dict[str, str], pdeathsig: bool = False):
+        parent_sock, child_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        # PDEATHSIG срабатывает при завершении запустившего потока: из потока пула - только закрытие канала
+        parent = os.getpid() if pdeathsig and threading.current_thread() is threading.main_thread() else 0
+        events_r, events_w = os.pipe()
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code = f"import sys; sys.path.insert(0, {root!r}); from lib.spawn_server import serve; serve(*map(int, sys.argv[1:]))"
+        try:
+            self.server = subprocess.Popen(
+                [sys.executable, "-c", code, str(child_sock.fileno()), str(events_w), str(parent)],
+                pass_fds=(child_sock.fileno(), events_w),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                # Окружение сервера наследуют все xray (метка владельца и переменные Go профиля, см. xray_resources)
+                env=env,
+            )
+        except BaseException:
+            parent_sock.close()
+            os.close(events_r)
+            raise
+        finally:
+            child_sock.close()
+            os.close(events_w)
+        self._sock = parent_sock
+        self._events = events_r
+        self._lock = threading.Lock()
+        self._procs: dict[int, SpawnedProcess] = {}
+        # Завершения, пришедшие раньше ответа о запуске
+        self._early_exits: dict[int, int] = {}
+        self._procs_lock = threading.Lock()
+        self.alive = True
+        threading.Thread(target=self._read_events, name="spawn-server-events", daemon=True).start()
+
+    def _read_events(self) -> None:
+        buffer = b""
+        while True:
+            try:
+                chunk = os.read(self._events, _EXIT_EVENT.size * 64)
+            except OSError:
+                chunk = b""
+            if not chunk:
+                break
+            buffer += chunk
+            while len(buffer) >= _EXIT_EVENT.size:
+                pid, returncode = _EXIT_EVENT.unpack_from(buffer)
+                buffer = buffer[_EXIT_EVENT.size:]
+                with self._procs_lock:
+                    proc = self._procs.pop(pid, None)
+                    if proc is None:
+                        self._early_exits[pid] = returncode
+                if proc is not None:
+                    proc._set_exited(returncode)
+        # Сервер завершился: его xray он завершил сам (или их завершит sweep_orphans)
+        self.alive = False
+        with self._procs_lock:
+            procs = list(self._procs.values())
+            self._procs.clear()
+        for proc in procs:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+            proc._set_exited(-signal.SIGKILL)
+
+    def spawn(self, args: list[str], stdin_pipe: bool, stderr_pipe: bool, memfd: Optional[int]) -> SpawnedProcess:
+        """Запускает xray; stdin_pipe/stderr_pipe - как PIPE у Popen, memfd станет дескриптором MEMFD_TARGET_FD."""
+        send_fds: list[int] = []
+        targets: list[int] = []
+        close_after: list[int] = []
+        stdin = stderr = None
+        try:
+            if stdin_pipe:
+                read_end, write_end = os.pipe()
+                stdin = os.fdopen(write_end, "wb")
+                send_fds.append(read_end)
+                targets.append(0)
+                close_after.append(read_end)
+            if stderr_pipe:
+                read_end, write_end = os.pipe()
+                stderr = os.fdopen(read_end, "rb")
+                send_fds.append(write_end)
+                targets.append(2)
+                close_after.append(write_end)
+            if memfd is not None:
+                send_fds.append(memfd)
+                targets.append(MEMFD_TARGET_FD)
+            payload = json.dumps({"argv": args, "targets": targets}).encode()
+            with self._lock:
+                socket.send_fds(self._sock, [payload], send_fds)
+                reply = self._sock.recv(_MAX_MESSAGE)
+            if not reply:
+                raise ConnectionError("spawn-сервер закрыл соединение")
+            reply = json.loads(reply)
+            if "pid" not in reply:
+                raise OSError(reply.get("errno", errno.EIO), reply.get("error", "spawn-сервер не запустил процесс"))
+        except BaseException:
+            for stream in (stdin, stderr):
+                if stream is not None:
+                    stream.close()
+            raise
+        finally:
+            for fd in close_after:
+                os.close(fd)
+        proc = SpawnedProcess(args, reply["pid"], stdin, stderr)
+        with self._procs_lock:
+            returncode = self._early_exits.pop(proc.pid, None)
+            if returncode is None:
+                self._procs[proc.pid] = proc
+        if returncode is not None:
+            proc._set_exited(returncode)
+        return proc
+
+    def close(self) -> None:
+        """Закрывает канал: сервер завершает свои xray и выходит."""
+        self.alive = False
+        self._sock.close()
+        try:
+            self.server.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.server.kill()
+
+
+_client: Optional[SpawnClient] = None
+_client_pid = 0
+_client_failed = False
+_client_lock = threading.Lock()
+
+
+def spawn_client() -> Optional[SpawnClient]:
+    """
+    Spawn-сервер этого процесса (запускается при первом вызове). None - сервер выключен
+    (XRAY_SPAWN_SERVER=false), не поддерживается платформой или не запустился.
+    Вызывается рано, пока процесс проверки ещё мал: запуск самого сервера - обычный fork/exec.
+    """
+    global _client, _client_pid, _client_failed
+    # Настройки и метка владельца читаются только в процессе проверки: сервер их не импортирует
+    from .config import XRAY_PDEATHSIG, XRAY_SPAWN_SERVER
+    from .xray_resources import child_env
+
+    if not XRAY_SPAWN_SERVER or not hasattr(os, "posix_spawnp") or not hasattr(socket, "send_fds"):
+        return None
+    with _client_lock:
+        if _client_pid != os.getpid():
+            # Новый процесс (процесс-исполнитель) - свой сервер
+            _client, _client_pid, _client_failed = None, os.getpid(), False
+        if _client is not None and not _client.alive:
+            _client = None
+        if _client is None and not _client_failed:
+            try:
+                _client = SpawnClient(child_env(), pdeathsig=XRAY_PDEATHSIG)
+            except OSError as e:
+                logger.warning(f"spawn-сервер не запущен, xray запускается напрямую: {e}")
+                _client_failed = True
+        return _client
@@ -6,11 +6,8 @@ Speedtest одного прокси-ключа: задержка (RTT) и/или
 Используется отдельным скриптом speedtest_checker.py для уже проверенных конфигов.
 """
 
-import json
 import logging
-import os
 import socket
-import tempfile
 import time
 from typing import Optional
 
@@ -27,30 +24,20 @@ from .config import (
     SPEED_TEST_TIMEOUT,
     SPEED_TEST_URL,
     VERIFY_HTTPS_SSL,
-    XRAY_STARTUP_POLL_INTERVAL,
+    XRAY_DAEMON_MODE,
     XRAY_STARTUP_WAIT,
 )
 from .parsing import parse_proxy_url
-from .port_pool import return_port, take_port
-from .signals import active_processes
-from .utils import check_response_valid, make_request
-from .xray_manager import build_xray_config, kill_xray_process, run_xray
+from .port_pool import take_port, unix_inbounds
+from .process_registry import register, release
+from .utils import check_response_valid, is_timeout_error, make_socks_request, socks_proxies
+from .xray_daemon import get_daemon_pool
+from .xray_manager import run_xray, wait_for_xray_ready
+from .xray_templates import render_xray_config
 
 logger = logging.getLogger(__name__)
 
 
-def _wait_for_port(host: str, port: int, max_wait: float, poll_interval: float = 0.05) -> bool:
-    """Ждёт, пока порт станет доступен для подключения (xray поднял SOCKS)."""
-    deadline = time.perf_counter() + max_wait
-    while time.perf_counter() < deadline:
-        try:
-            with socket.create_connection((host, port), timeout=0.3):
-                return True
-        except (socket.error, socket.gaierror, OSError):
-            time.sleep(poll_interval)
-    return False
-
-
 # Hysteria: проверка доступности по TCP (как в checker)
 def _hysteria_latency(address: str, port: int, timeout: float) -> Optional[float]:
     try:
@@ -99,6 +86,96 @@ def _test_download_speed(
         return None
 
 
+def _measure_through_proxy(
+    proxy_line: str,
+    port: int,
+    timeout: float,
+    metric: str,
+    requests_count: int,
+    test_url: str,
+    mode: str,
+    download_timeout: int,
+    download_url_small: str,
+    download_url_medium: str,
+    metrics: Optional[dict] = None,
+) -> Optional[tuple[str, float]]:
+    """Замер задержки/скорости через уже поднятый локальный SOCKS-порт xray (таймауты считаются в metrics)."""
+    proxies = socks_proxies(port)
+    deadline = time.perf_counter() + timeout
+    response_times: list[float] = []
+    per_request_timeout = max(1.0, (timeout - 0.2) / max(1, requests_count))
+
+    last_resp_status = None
+    last_err = None
+    for _ in range(requests_count):
+        if time.perf_counter() >= deadline:
+            break
+        connect_t = min(5, max(1.0, per_request_timeout * 0.5))
+        read_t = min(15, max(3.0, per_request_timeout * 0.6))
+        resp, elapsed, err = make_socks_request(test_url, port, (connect_t, read_t))
+        if err:
+            last_err = err
+            if metrics is not None and is_timeout_error(err):
+                metrics["timeouts"] = metrics.get("timeouts", 0) + 1
+        if resp:
+            last_resp_status = resp.status_code
+        if resp and not err and check_response_valid(resp, 0, test_url):
+            response_times.append(elapsed * 1000.0)
+    if not response_times:
+        if SPEED_TEST_DEBUG:
+            if last_err:
+                logger.info("speed_test_key: HTTP request failed: %s", last_err)
+            elif last_resp_status is not None:
+                logger.info("speed_test_key: invalid response status=%s (expected 200/204)", last_resp_status)
+            else:
+                logger.info("speed_test_key: no valid HTTP response (timeout or invalid)")
+        return None
+    avg_latency_ms = sum(response_times) / len(response_times)
+
+    if mode == "quick" and download_url_small:
+        speed_mbps = _test_download_speed(proxies, download_url_small, min(10, download_timeout))
+        if speed_mbps is not None:
+            return (proxy_line, speed_mbps)
+        return None
+    if mode == "full" and download_url_medium:
+        speed_mbps = _test_download_speed(proxies, download_url_medium, download_timeout)
+        if speed_mbps is not None:
+            return (proxy_line, speed_mbps)
+        return None
+
+    if mode == "latency" or not (download_url_small or download_url_medium):
+        if metric == "throughput":
+            return (proxy_line, 100000.0 / avg_latency_ms if avg_latency_ms > 0 else 0)
+        return (proxy_line, avg_latency_ms)
+    return (proxy_line, avg_latency_ms)
+
+
+def _speed_test_via_daemon(pool, proxy_line: str, parsed: dict, *measure_args) -> Optional[tuple[str, float]]:
+    """Speedtest через слот долгоживущего xray (outbound подменяется через API)."""
+    lease = pool.lease()
+    if lease is None:
+        if SPEED_TEST_DEBUG:
+            logger.info("speed_test_key: no free daemon slot")
+        return None
+    daemon, slot = lease
+    try:
+        if not daemon.attach(slot, parsed):
+            if SPEED_TEST_DEBUG:
+                logger.info("speed_test_key: xray API rejected outbound")
+            return None
+        try:
+            return _measure_through_proxy(proxy_line, daemon.socks_ports[slot], *measure_args)
+        finally:
+            daemon.detach(slot)
+    except Exception as e:
+        logger.debug("speed_test_key %s", e)
+        if SPEED_TEST_DEBUG:
+            logger.info("speed_test_key: exception %s", e)
+        return None
+    finally:
+        pool.release(daemon, slot)
+
+
 def speed_test_key(
     proxy_line: str,
     timeout: float,
@@ -109,6 +186,7 @@ def speed_test_key(
     download_timeout: int = 30,
     download_url_small: str = "",
     download_url_medium: str = "",
+    metrics: Optional[dict] = None,
 ) -> Optional[tuple[str, float]]:
     """
     Speedtest одного ключа.
@@ -116,6 +194,7 @@ def speed_test_key(
     mode=quick: задержка + загрузка 250KB (score = speed_mbps, больше = лучше).
     mode=full: задержка + загрузка 1MB (score = speed_mbps, больше = лучше).
     Возвращает (строка_ключа, score) или None при ошибке.
+    metrics: если передан, в metrics["timeouts"] считаются запросы, завершившиеся таймаутом.
     """
     parsed = parse_proxy_url(proxy_line)
     if not parsed:
@@ -131,108 +210,39 @@ def speed_test_key(
             logger.info("speed_test_key: hysteria latency failed")
         return None
 
-    port = take_port()
+    # Слоты демонов на Unix-сокетах недоступны для requests - тогда отдельный xray на TCP-порту
+    if XRAY_DAEMON_MODE and not unix_inbounds():
+        pool = get_daemon_pool()
+        if pool is not None:
+            return _speed_test_via_daemon(
+                pool, proxy_line, parsed, timeout, metric, requests_count, test_url,
+                mode, download_timeout, download_url_small, download_url_medium, metrics,
+            )
+
+    port = take_port(tcp=True)
     if port is None:
         if SPEED_TEST_DEBUG:
             logger.info("speed_test_key: no free port")
         return None
 
     proc = None
-    config = build_xray_config(parsed, port)
-    fd, config_path = tempfile.mkstemp(suffix=".json", prefix="xray_st_")
     try:
-        with os.fdopen(fd, "w", encoding="utf-8") as f:
-            json.dump(config, f, ensure_ascii=False)
-    except Exception:
-        try:
-            os.close(fd)
-        except OSError:
-            pass
-        return_port(port)
-        return None
-
-    try:
-        proc = run_xray(config_path, stderr_pipe=False)
-        active_processes.append((proc, port))
-        waited = 0.0
-        while waited < XRAY_STARTUP_WAIT:
-            if proc.poll() is not None:
-                break
-            time.sleep(XRAY_STARTUP_POLL_INTERVAL)
-            waited += XRAY_STARTUP_POLL_INTERVAL
-        if proc.poll() is not None:
+        proc = run_xray(render_xray_config(parsed, port), stderr_pipe=False)
+        register(proc, [port])
+        ready, err = wait_for_xray_ready(proc, [port], timeout=XRAY_STARTUP_WAIT + min(2.5, timeout))
+        if not ready:
             if SPEED_TEST_DEBUG:
-                logger.info("speed_test_key: xray process exited early")
+                logger.info("speed_test_key: xray not ready: %s", err)
             return None
 
-        if not _wait_for_port("127.0.0.1", port, max_wait=min(2.5, timeout)):
-            if SPEED_TEST_DEBUG:
-                logger.info("speed_test_key: port wait timeout")
-            return None
-
-        proxies = {
-            "http": f"socks5h://127.0.0.1:{port}",
-            "https": f"socks5h://127.0.0.1:{port}",
-        }
-        deadline = time.perf_counter() + timeout
-        response_times: list[float] = []
-        per_request_timeout = max(1.0, (timeout - 0.2) / max(1, requests_count))
-
-        last_resp_status = None
-        last_err = None
-        for _ in range(requests_count):
-            if time.perf_counter() >= deadline:
-                break
-            connect_t = min(5, max(1.0, per_request_timeout * 0.5))
-            read_t = min(15, max(3.0, per_request_timeout * 0.6))
-            resp, elapsed, err = make_request(test_url, proxies, (connect_t, read_t))
-            if err:
-                last_err = err
-            if resp:
-                last_resp_status = resp.status_code
-            if resp and not err and check_response_valid(resp, 0, test_url):
-                response_times.append(elapsed * 1000.0)
-        if not response_times:
-            if SPEED_TEST_DEBUG:
-                if last_err:
-                    logger.info("speed_test_key: HTTP request failed: %s", last_err)
-                elif last_resp_status is not None:
-                    logger.info("speed_test_key: invalid response status=%s (expected 200/204)", last_resp_status)
-                else:
-                    logger.info("speed_test_key: no valid HTTP response (timeout or invalid)")
-            return None
-        avg_latency_ms = sum(response_times) / len(response_times)
-
-        if mode == "quick" and download_url_small:
-            speed_mbps = _test_download_speed(proxies, download_url_small, min(10, download_timeout))
-            if speed_mbps is not None:
-                return (proxy_line, speed_mbps)
-            return None
-        if mode == "full" and download_url_medium:
-            speed_mbps = _test_download_speed(proxies, download_url_medium, download_timeout)
-            if speed_mbps is not None:
-                return (proxy_line, speed_mbps)
-            return None
-
-        if mode == "latency" or not (download_url_small or download_url_medium):
-            if metric == "throughput":
-                return (proxy_line, 100000.0 / avg_latency_ms if avg_latency_ms > 0 else 0)
-            return (proxy_line, avg_latency_ms)
-        return (proxy_line, avg_latency_ms)
+        return _measure_through_proxy(
+            proxy_line, port, timeout, metric, requests_count, test_url,
+            mode, download_timeout, download_url_small, download_url_medium, metrics,
+        )
     except Exception as e:
         logger.debug("speed_test_key %s", e)
         if SPEED_TEST_DEBUG:
             logger.info("speed_test_key: exception %s", e)
         return None
     finally:
-        if proc is not None:
-            try:
-                active_processes.remove((proc, port))
-            except ValueError:
-                pass
-            kill_xray_process(proc, drain_stderr=False)
-        try:
-            os.unlink(config_path)
-        except FileNotFoundError:
-            pass
-        return_port(port)
+        release(proc, [port], drain_stderr=False)
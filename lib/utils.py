@@ -4,8 +4,10 @@
 Модуль утилит: HTTP запросы, валидация ответов, геолокация.
 """
 
+import threading
 import time
 from typing import Optional
+from urllib.parse import urlsplit
 
 import requests
 
@@ -15,12 +17,17 @@ from .config import (
     GEOLOCATION_SERVICE,
     MAX_RESPONSE_TIME,
     MIN_RESPONSE_SIZE,
+    PROBE_CLIENT,
+    PROBE_KEEP_ALIVE,
     VERIFY_HTTPS_SSL,
 )
+from .probe import ProbeSession, ProbeTimeout, probe_request
 
 
 def _is_connection_error(exc: BaseException) -> bool:
     """Проверяет, что ошибка связана с обрывом/отказом соединения (часто временная)."""
+    if isinstance(exc, ConnectionError):
+        return True
     s = str(exc).lower()
     if "connection aborted" in s or "connection reset" in s:
         return True
@@ -35,6 +42,15 @@ def _get_geolocation(proxies: dict, service_url: str) -> Optional[dict]:
     """Получает геолокацию через прокси. Возвращает словарь с информацией или None."""
     try:
         r = requests.get(service_url, proxies=proxies, timeout=CONNECT_TIMEOUT)
+        return geolocation_from_response(r)
+    except Exception:
+        pass
+    return None
+
+
+def geolocation_from_response(r) -> Optional[dict]:
+    """Разбирает ответ сервиса геолокации (requests.Response или ProbeResponse)."""
+    try:
         if r.status_code == 200:
             data = r.json()
             if "origin" in data:
@@ -61,19 +77,22 @@ def make_request(
     timeout: float | tuple[float, float],
     method: str = "GET",
     post_data: Optional[dict] = None,
+    session: Optional[requests.Session] = None,
 ) -> tuple[Optional[requests.Response], float, Optional[Exception]]:
     """Выполняет HTTP-запрос и возвращает (response, время_ответа, ошибка).
-    timeout: число (общий таймаут) или (connect_timeout, read_timeout)."""
+    timeout: число (общий таймаут) или (connect_timeout, read_timeout).
+    session: сессия requests с пулом соединений (по умолчанию - новое соединение на запрос)."""
     start_time = time.perf_counter()
     verify_ssl = VERIFY_HTTPS_SSL if url.lower().startswith("https://") else True
+    client = session if session is not None else requests
     try:
         if method == "POST" and post_data:
-            r = requests.post(
+            r = client.post(
                 url, proxies=proxies, timeout=timeout, json=post_data,
                 allow_redirects=False, verify=verify_ssl,
             )
         else:
-            r = requests.get(
+            r = client.get(
                 url, proxies=proxies, timeout=timeout,
                 allow_redirects=False, verify=verify_ssl,
             )
@@ -84,8 +103,83 @@ def make_request(
         return (None, elapsed, e)
 
 
+def socks_proxies(port: int) -> dict:
+    """Прокси для requests через локальный SOCKS-порт xray (DNS резолвит прокси)."""
+    return {
+        "http": f"socks5h://127.0.0.1:{port}",
+        "https": f"socks5h://127.0.0.1:{port}",
+    }
+
+
+class _RequestsSocksSession:
+    """
+    Keep-alive сессия requests через SOCKS-порт xray (аналог probe.ProbeSession для PROBE_CLIENT=requests).
+    requests.Session не потокобезопасна, а параллельные URL проверки идут в разных потоках - у каждого
+    потока своя сессия. requests не сообщает, взято ли соединение из пула: повторный запрос потока к тому
+    же хосту считается тёплым.
+    """
+
+    def __init__(self, port: int):
+        self.proxies = socks_proxies(port)
+        self._local = threading.local()
+        self._sessions: list[requests.Session] = []
+        self._lock = threading.Lock()
+
+    def _thread_session(self) -> tuple[requests.Session, set[tuple[str, str]]]:
+        """Сессия текущего потока и хосты, к которым она уже подключалась."""
+        state = getattr(self._local, "state", None)
+        if state is None:
+            state = self._local.state = (requests.Session(), set())
+            with self._lock:
+                self._sessions.append(state[0])
+        return state
+
+    def request(self, url: str, timeout: float | tuple[float, float], method: str = "GET", post_data: Optional[dict] = None):
+        session, origins = self._thread_session()
+        response, elapsed, error = make_request(url, self.proxies, timeout, method=method, post_data=post_data, session=session)
+        if response is not None:
+            origin = tuple(urlsplit(url)[:2])
+            response.reused = origin in origins
+            origins.add(origin)
+        return (response, elapsed, error)
+
+    def close(self) -> None:
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
+
+
+def socks_session(port: int):
+    """Keep-alive сессия запросов через SOCKS-порт xray клиентом PROBE_CLIENT или None (PROBE_KEEP_ALIVE выключен)."""
+    if not PROBE_KEEP_ALIVE:
+        return None
+    if PROBE_CLIENT == "requests":
+        return _RequestsSocksSession(port)
+    return ProbeSession(port)
+
+
+def make_socks_request(
+    url: str,
+    port: int,
+    timeout: float | tuple[float, float],
+    method: str = "GET",
+    post_data: Optional[dict] = None,
+    session=None,
+):
+    """
+    Запрос через локальный SOCKS-порт xray клиентом PROBE_CLIENT. Возвращает (response, время_ответа, ошибка).
+    session: сессия из socks_session() - соединения к тому же хосту переиспользуются.
+    """
+    if session is not None:
+        return session.request(url, timeout, method=method, post_data=post_data)
+    if PROBE_CLIENT == "requests":
+        return make_request(url, socks_proxies(port), timeout, method=method, post_data=post_data)
+    return probe_request(url, port, timeout, method=method, post_data=post_data)
+
+
 def check_response_valid(
-    response: requests.Response, min_size: int = 0, url: str = ""
+    response, min_size: int = 0, url: str = ""
 ) -> bool:
     """Проверяет валидность ответа: статус-код и размер.
     Для URL вида generate_204 (как в клиентах SagerNet и др.) требуется код 204."""
@@ -113,11 +207,41 @@ def get_geolocation(proxies: dict) -> Optional[dict]:
     return _get_geolocation(proxies, GEOLOCATION_SERVICE)
 
 
+def get_geolocation_via_socks(port: int, timeout: float = CONNECT_TIMEOUT) -> Optional[dict]:
+    """Геолокация через локальный SOCKS-порт xray (клиентом PROBE_CLIENT)."""
+    if not CHECK_GEOLOCATION:
+        return None
+    if PROBE_CLIENT == "requests":
+        return get_geolocation(socks_proxies(port))
+    response, _, _ = probe_request(GEOLOCATION_SERVICE, port, timeout)
+    return geolocation_from_response(response) if response is not None else None
+
+
 def check_geolocation_allowed(geolocation: Optional[dict], allowed_countries: list[str]) -> bool:
     """Проверяет, разрешена ли геолокация."""
     return _check_geolocation_allowed(geolocation, allowed_countries)
 
 
+def is_timeout_error(exc: Optional[BaseException]) -> bool:
+    """Проверяет, является ли ошибка таймаутом запроса (requests или встроенный клиент)."""
+    return isinstance(exc, (requests.Timeout, ProbeTimeout, TimeoutError))
+
+
 def is_connection_error(exc: BaseException) -> bool:
     """Проверяет, является ли ошибка ошибкой соединения."""
     return _is_connection_error(exc)
+
+
+def raise_nofile_limit(needed: int) -> None:
+    """Поднимает мягкий лимит открытых файлов (много одновременных сокетов и процессов xray)."""
+    try:
+        import resource
+    except ImportError:
+        return
+    try:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        if soft != resource.RLIM_INFINITY and soft < target:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    except (ValueError, OSError):
+        pass
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модуль общей очереди ключей для нескольких процессов проверки (--queue / WORK_QUEUE).
+Очередь - файл SQLite: первый процесс заполняет её ключами списка (после префильтров и
+приоритета), затем каждый процесс берёт пачки по QUEUE_BATCH_SIZE ключей в аренду и
+возвращает вердикты. Аренда продлевается фоновым потоком (heartbeat); аренда упавшего
+процесса истекает, и его ключи возвращаются в очередь. Быстрые процессы просто берут
+больше пачек. Итоговый результат публикует процесс, завершивший последний ключ.
+Процессы должны работать с одним файлом очереди (один хост или надёжная общая ФС).
+"""
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Optional
+
+from .config import QUEUE_BATCH_SIZE, QUEUE_LEASE_SECONDS, QUEUE_MAX_ATTEMPTS
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    fingerprint TEXT NOT NULL,
+    state TEXT NOT NULL,          -- filling | ready | published
+    owner TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS keys (
+    key TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    state TEXT NOT NULL,          -- pending | leased | done
+    owner TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    ok INTEGER,
+    line TEXT,                    -- строка для публикации (ключ в пределах MAX_LATENCY_MS)
+    latency_ms REAL,
+    metrics TEXT
+);
+CREATE INDEX IF NOT EXISTS keys_state ON keys (state, position);
+"""
+
+
+class QueueError(Exception):
+    """Очередь занята другим списком ключей или недоступна."""
+
+
+def worker_id() -> str:
+    """Идентификатор процесса-исполнителя: хост:pid."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """Очередь ключей одного входного списка (fingerprint - journal.list_fingerprint)."""
+
+    def __init__(
+        self,
+        path: str,
+        fingerprint: str,
+        lease_seconds: float = QUEUE_LEASE_SECONDS,
+        max_attempts: int = QUEUE_MAX_ATTEMPTS,
+    ):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.owner = worker_id()
+        self.lease_seconds = max(1.0, lease_seconds)
+        self.max_attempts = max(1, max_attempts)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Одно соединение на процесс: вызовы из потоков проверки и heartbeat сериализуются блокировкой
+        self._conn = sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._heartbeat: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        """Запись в очереди: BEGIN IMMEDIATE (один писатель на файл) ... COMMIT, при исключении ROLLBACK."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def attach(self) -> bool:
+        """
+        Подключается к очереди. True - этот процесс должен заполнить её (fill), False - очередь
+        этого списка уже заполняется или заполнена другим процессом.
+        QueueError, если в очереди незавершённый прогон другого списка.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT fingerprint, state, updated FROM meta WHERE id = 1").fetchone()
+            if row is not None:
+                fingerprint, state, updated = row
+                stalled = state == "filling" and now - updated > self.lease_seconds
+                if state == "published" or stalled:
+                    pass
+                elif fingerprint == self.fingerprint:
+                    return False
+                else:
+                    raise QueueError(f"Очередь {self.path} занята незавершённым прогоном другого списка")
+            conn.execute("DELETE FROM keys")
+            conn.execute("DELETE FROM meta")
+            conn.execute(
+                "INSERT INTO meta (id, fingerprint, state, owner, updated) VALUES (1, ?, 'filling', ?, ?)",
+                (self.fingerprint, self.owner, now),
+            )
+        # Пока идёт заполнение (префильтры), heartbeat показывает остальным, что процесс жив
+        self._start_heartbeat()
+        return True
+
+    def fill(self, links: Iterable[str]) -> int:
+        """Ставит ключи в очередь в заданном порядке (уже завершённые не трогает) и открывает её для аренды."""
+        with self._transaction() as conn:
+            start = conn.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM keys").fetchone()[0]
+            cursor = conn.executemany(
+                "INSERT OR IGNORE INTO keys (key, position, state) VALUES (?, ?, 'pending')",
+                ((link, start + i) for i, link in enumerate(links)),
+            )
+            conn.execute("UPDATE meta SET state = 'ready', updated = ? WHERE id = 1", (time.time(),))
+            return cursor.rowcount
+
+    def wait_ready(self, poll: float = 1.0) -> bool:
+        """
+        Ждёт, пока заполняющий процесс откроет очередь. True - заполнявший процесс перестал
+        отвечать и заполнение перехвачено: очередь должен заполнить этот процесс.
+        """
+        while True:
+            with self._lock:
+                row = self._conn.execute("SELECT state FROM meta WHERE id = 1").fetchone()
+            if row is None or row[0] != "filling":
+                return False
+            if self.attach():
+                return True
+            time.sleep(poll)
+
+    def lease(self, batch_size: int = QUEUE_BATCH_SIZE) -> list[str]:
+        """
+        Берёт в аренду до batch_size ключей (сначала возвращает в очередь ключи с истёкшей арендой).
+        Ключ, аренда которого истекла max_attempts раз (процессы падают на нём), считается нерабочим.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE keys SET state = 'done', ok = 0, owner = NULL, metrics = ? "
+                "WHERE state = 'leased' AND lease_until < ? AND attempts >= ?",
+                (json.dumps({"queue_abandoned": True}), now, self.max_attempts),
+            )
+            expired = conn.execute(
+                "UPDATE keys SET state = 'pending', owner = NULL WHERE state = 'leased' AND lease_until < ?", (now,)
+            ).rowcount
+            if expired:
+                logger.warning(f"Очередь: {expired} ключей с истёкшей арендой возвращены в очередь")
+            links = [row[0] for row in conn.execute(
+                "SELECT key FROM keys WHERE state = 'pending' ORDER BY position LIMIT ?", (max(1, batch_size),)
+            )]
+            conn.executemany(
+                "UPDATE keys SET state = 'leased', owner = ?, lease_until = ?, attempts = attempts + 1 WHERE key = ?",
+                ((self.owner, now + self.lease_seconds, link) for link in links),
+            )
+        if links:
+            self._start_heartbeat()
+        return links
+
+    def complete(self, link: str, ok: bool, metrics: Optional[dict], entry: Optional[tuple[str, float]] = None) -> None:
+        """Записывает вердикт ключа; entry - (строка для публикации, задержка_мс), если ключ попадает в рабочие."""
+        from .result_stream import strip_latency_prefix
+
+        line = strip_latency_prefix(entry[0]) if entry is not None else None
+        latency = entry[1] if entry is not None else None
+        with self._transaction() as conn:
+            # Ключ без строки в очереди (отсеян префильтром до заполнения) добавляется сразу завершённым
+            conn.execute(
+                "INSERT INTO keys (key, position, state, ok, line, latency_ms, metrics) "
+                "VALUES (?, (SELECT COALESCE(MAX(position), -1) + 1 FROM keys), 'done', ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET state = 'done', owner = NULL, ok = excluded.ok, "
+                "line = excluded.line, latency_ms = excluded.latency_ms, metrics = excluded.metrics",
+                (link, int(ok), line, latency, json.dumps(metrics, ensure_ascii=False, default=str) if metrics else None),
+            )
+
+    def heartbeat(self) -> None:
+        """Продлевает аренду всех ключей этого процесса (и заполнение очереди, если его ведёт этот процесс)."""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("UPDATE meta SET updated = ? WHERE id = 1 AND state = 'filling' AND owner = ?", (now, self.owner))
+            conn.execute(
+                "UPDATE keys SET lease_until = ? WHERE state = 'leased' AND owner = ?",
+                (now + self.lease_seconds, self.owner),
+            )
+
+    def _start_heartbeat(self) -> None:
+        if self._heartbeat is not None:
+            return
+
+        def run() -> None:
+            while not self._stopped.wait(self.lease_seconds / 3):
+                try:
+                    self.heartbeat()
+                except sqlite3.Error as e:
+                    logger.warning(f"Очередь: не удалось продлить аренду: {e}")
+
+        self._heartbeat = threading.Thread(target=run, name="queue-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def release(self) -> None:
+        """Возвращает в очередь незавершённые ключи этого процесса (при прерывании)."""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE keys SET state = 'pending', owner = NULL, attempts = MAX(0, attempts - 1) "
+                "WHERE state = 'leased' AND owner = ?",
+                (self.owner,),
+            )
+
+    def counts(self) -> dict[str, int]:
+        """Число ключей по состояниям: pending, leased, done."""
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM keys GROUP BY state").fetchall()
+        counts = {"pending": 0, "leased": 0, "done": 0}
+        counts.update(dict(rows))
+        return counts
+
+    def claim_publish(self) -> bool:
+        """True ровно для одного процесса, когда все ключи проверены: он публикует итоговый результат."""
+        with self._transaction() as conn:
+            if conn.execute("SELECT COUNT(*) FROM keys WHERE state != 'done'").fetchone()[0]:
+                return False
+            return conn.execute(
+                "UPDATE meta SET state = 'published', owner = ?, updated = ? WHERE id = 1 AND state = 'ready'",
+                (self.owner, time.time()),
+            ).rowcount == 1
+
+    def results(self) -> tuple[list[tuple[str, float]], set[str], set[str]]:
+        """Итог очереди: (рабочие (строка, задержка_мс), нерабочие ключи для notworkers, рабочие ключи)."""
+        available: list[tuple[str, float]] = []
+        failed: set[str] = set()
+        passed: set[str] = set()
+        with self._lock:
+            rows = self._conn.execute("SELECT key, line, latency_ms, metrics FROM keys WHERE state = 'done'").fetchall()
+        for key, line, latency, metrics in rows:
+            if line:
+                passed.add(key)
+                available.append((line, latency or 0.0))
+            elif not (metrics and json.loads(metrics).get("prefiltered")):
+                # Отсеянные без запуска xray (префильтр, группировка) в нерабочие не попадают
+                failed.add(key)
+        return (available, failed, passed)
+
+    def close(self) -> None:
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join(timeout=5)
+        with self._lock:
+            self._conn.close()
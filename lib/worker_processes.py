@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модуль многопроцессной проверки (WORKER_PROCESSES > 1).
+K процессов-исполнителей запускаются один раз на прогон. Родитель берёт ключи из источника
+(KeyFeed: ключи серверов по вердикту представителя, пачки общей очереди) по мере освобождения
+места и раздаёт через общую очередь заданий (быстрый процесс берёт больше ключей); у каждого
+процесса своя часть портов (port_pool.use_port_slice) и свой пул потоков (или asyncio-движок)
+на 1/K общей параллельности. Вердикты с метриками
+возвращаются родителю по каналу, форматирование, прогресс и запись результатов
+остаются в родительском процессе. Так проверка масштабируется по ядрам, а не упирается
+в GIL одного процесса.
+"""
+
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+from typing import Callable, Iterable, Optional
+
+from .cache import get_key_hash
+from .config import (
+    ASYNC_CONCURRENCY,
+    CHECK_ENGINE,
+    MAX_WORKERS,
+    WORKER_PROCESSES,
+)
+from .key_feed import KeyFeed
+from .process_registry import terminate_all
+
+logger = logging.getLogger(__name__)
+
+# Как часто родитель проверяет, живы ли процессы, пока ждёт результатов
+_POLL_INTERVAL = 1.0
+# Как часто родитель перепроверяет источник ключей, пока у исполнителей есть свободные места
+_FEED_POLL = 0.1
+
+
+def _terminate_worker(signum, frame) -> None:
+    """Обработчик SIGTERM процесса-исполнителя: без вывода и хуков родителя, только остановка xray."""
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    terminate_all()
+    os._exit(1)
+
+
+def _worker_main(index: int, processes: int, parent: int, tasks, results, xray_cmd: str, cache: Optional[dict]) -> None:
+    """Процесс-исполнитель: проверяет ключи из tasks до метки None, вердикты отправляет в results."""
+    from . import config as config_module
+    from .logger_config import setup_logging
+    from .orphans import die_with_parent
+    from .port_pool import use_port_slice
+    from .spawn_server import spawn_client
+    from .xray_daemon import shutdown_daemon_pool
+
+    setup_logging(debug=False)
+    # Ctrl+C получает и родитель - он остановит процессы; SIGTERM от родителя - завершить свои xray и выйти
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, _terminate_worker)
+    # Родитель убит без очистки (SIGKILL) - SIGTERM себе: обработчик завершит свои xray
+    die_with_parent(parent)
+    # Путь к xray мог быть найден или скачан родителем (ensure_xray)
+    config_module.XRAY_CMD = xray_cmd
+    use_port_slice(index, processes)
+    # Свой spawn-сервер - до запуска потоков проверки
+    spawn_client()
+
+    def on_result(link: str, ok: bool, metrics: Optional[dict]) -> None:
+        entry = cache.get(get_key_hash(link)) if cache is not None else None
+        results.put(("result", link, ok, metrics, entry))
+
+    def on_error(links: list[str], e: Exception) -> None:
+        results.put(("error", links, f"{type(e).__name__}: {e}"))
+
+    # Задания приходят по мере раздачи родителем; метка None - больше не будет
+    feed = KeyFeed()
+    feed.hold()
+
+    def receive() -> None:
+        for link in iter(tasks.get, None):
+            feed.put([link])
+        feed.release()
+
+    threading.Thread(target=receive, name="tasks", daemon=True).start()
+    try:
+        if CHECK_ENGINE == "async":
+            from .async_checker import run_checks_async
+            run_checks_async(feed, on_result, on_error, cache=cache, concurrency=-(-ASYNC_CONCURRENCY // processes))
+        else:
+            from .checker import check_key_e2e
+            from .concurrency import run_adaptive
+
+            def on_done(link: str, future) -> bool:
+                try:
+                    link_result, ok, metrics = future.result()
+                except Exception as e:
+                    on_error([link], e)
+                else:
+                    on_result(link_result, ok, metrics)
+                return False
+
+            run_adaptive(lambda link: check_key_e2e(link, debug=False, cache=cache), feed, on_done, workers=-(-MAX_WORKERS // processes))
+    finally:
+        shutdown_daemon_pool()
+        results.put(("done", index))
+
+
+def run_checks_multiprocess(
+    links: Iterable[str] | KeyFeed,
+    on_result: Callable[[str, bool, Optional[dict]], None],
+    on_error: Callable[[list[str], Exception], None],
+    cache: Optional[dict] = None,
+    processes: int = WORKER_PROCESSES,
+) -> None:
+    """
+    Проверяет ключи в processes процессах, запущенных один раз на весь источник links (список или KeyFeed).
+    В работе держится не больше ключей, чем общая параллельность исполнителей: остальные ждут в источнике,
+    и ключи, добавленные в него по ходу проверки, раздаются без перезапуска процессов.
+    on_result(ключ, доступен, метрики) и on_error(ключи, исключение) вызываются в родительском процессе
+    по мере готовности; кэш результатов пополняется вердиктами процессов.
+    """
+    from . import config as config_module
+
+    if isinstance(links, KeyFeed):
+        feed = links
+    else:
+        links = list(links)
+        if not links:
+            return
+        processes = min(processes, len(links))
+        feed = KeyFeed(links)
+    processes = max(1, processes)
+    # Раздаётся не больше, чем исполнители проверяют одновременно, плюс по заданию в запас на процесс
+    in_flight_limit = (ASYNC_CONCURRENCY if CHECK_ENGINE == "async" else MAX_WORKERS) + processes
+    # spawn: процессы не наследуют потоки и блокировки родителя (пулы префильтров, heartbeat очереди)
+    context = multiprocessing.get_context("spawn")
+    tasks = context.Queue()
+    results = context.Queue()
+
+    workers = [
+        context.Process(
+            target=_worker_main,
+            args=(index, processes, os.getpid(), tasks, results, config_module.XRAY_CMD, cache),
+            name=f"checker-{index}",
+            daemon=True,
+        )
+        for index in range(processes)
+    ]
+    for process in workers:
+        process.start()
+
+    # Розданные ключи без вердикта
+    in_flight: set[str] = set()
+    exhausted = False
+    finished = 0
+    try:
+        while finished < processes:
+            while not exhausted and len(in_flight) < in_flight_limit:
+                try:
+                    link = feed.get(timeout=0)
+                except queue.Empty:
+                    break
+                if link is None:
+                    exhausted = True
+                    for _ in range(processes):
+                        tasks.put(None)
+                    break
+                in_flight.add(link)
+                tasks.put(link)
+            try:
+                message = results.get(timeout=_POLL_INTERVAL if exhausted or len(in_flight) >= in_flight_limit else _FEED_POLL)
+            except queue.Empty:
+                if not any(process.is_alive() for process in workers):
+                    # Все процессы завершились, но не все сообщили об этом - упали
+                    break
+                continue
+            kind = message[0]
+            if kind == "result":
+                _, link, ok, metrics, entry = message
+                in_flight.discard(link)
+                if cache is not None and entry is not None:
+                    cache[get_key_hash(link)] = entry
+                on_result(link, ok, metrics)
+            elif kind == "error":
+                _, failed, text = message
+                in_flight.difference_update(failed)
+                on_error(failed, RuntimeError(text))
+            elif kind == "done":
+                finished += 1
+    except BaseException:
+        # Прерывание родителя: процессы останавливаются сразу (SIGTERM - их обработчик завершает свои xray)
+        for process in workers:
+            process.terminate()
+        raise
+    for process in workers:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+    crashed = [process.name for process in workers if process.exitcode not in (0, None)]
+    if crashed:
+        logger.error(f"Процессы проверки завершились с ошибкой: {', '.join(crashed)}")
+    # Ключи, взятые упавшим процессом, и ещё не розданные остались без вердикта
+    if finished < processes:
+        remaining = [*in_flight, *feed.drain()]
+        if remaining:
+            on_error(remaining, RuntimeError(f"нет вердикта для {len(remaining)} ключей: процесс проверки упал"))
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модуль пула долгоживущих процессов xray (режим XRAY_DAEMON_MODE).
+Каждый демон поднимает SOCKS inbound на каждый слот и API (HandlerService).
+Для проверки ключа слот арендуется, outbound ключа добавляется через API,
+после проверки - удаляется. Процесс xray при этом не перезапускается.
+Вызовы API (запуск "xray api") объединяются: подключения, пришедшие за _API_BATCH_WINDOW
+секунд, добавляются одним "ado", а отложенные удаления уходят одним "rmo" перед ним.
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Optional
+
+from .config import (
+    XRAY_DAEMON_COUNT,
+    XRAY_DAEMON_SLOTS,
+    XRAY_STARTUP_WAIT,
+)
+from .port_pool import InboundAddress, return_port, return_ports, take_port, take_ports
+from .process_registry import register, unregister
+from .xray_manager import (
+    build_outbound,
+    build_xray_base_config,
+    kill_xray_process,
+    run_xray,
+    wait_for_xray_ready,
+    xray_api_add_outbound,
+    xray_api_add_outbounds,
+    xray_api_remove_outbound,
+    xray_api_remove_outbounds,
+)
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждать свободный слот, прежде чем считать ключ непроверенным
+_LEASE_TIMEOUT = 60.0
+# Сколько первый ожидающий подключения собирает запросы других потоков в один вызов API
+_API_BATCH_WINDOW = 0.02
+
+
+class _AttachRequest:
+    """Подключение, ожидающее общего вызова API."""
+
+    def __init__(self, slot: int, outbound: dict):
+        self.slot = slot
+        self.outbound = outbound
+        self.ok = False
+        self.done = threading.Event()
+
+
+class XrayDaemon:
+    """Один долгоживущий процесс xray с набором слотов (SOCKS-порт + outbound proxy-i)."""
+
+    def __init__(self, socks_ports: list[InboundAddress], api_port: int):
+        self.socks_ports = socks_ports
+        self.api_port = api_port
+        self.proc = None
+        self._lock = threading.Lock()
+        # Очередь вызовов API: подключения ждут результата, удаления - нет
+        self._api_lock = threading.Lock()
+        self._attaches: list[_AttachRequest] = []
+        self._removals: list[int] = []
+        self._attached: set[int] = set()
+        self._flushing = False
+
+    def start(self) -> bool:
+        """Запускает xray и ждёт, пока API начнёт принимать соединения."""
+        with self._api_lock:
+            # У нового процесса outbound слотов нет
+            self._attached.clear()
+            self._removals.clear()
+        try:
+            self.proc = run_xray(build_xray_base_config(self.socks_ports, self.api_port), stderr_pipe=False)
+        except OSError as e:
+            logger.warning(f"xray-демон не запущен: {e}")
+            return False
+        # Порты демона возвращает пул (shutdown), в реестре - только процесс
+        register(self.proc)
+        ready, err = wait_for_xray_ready(self.proc, [self.api_port, *self.socks_ports], timeout=max(XRAY_STARTUP_WAIT, 5.0))
+        if not ready:
+            logger.warning(f"xray-демон не готов: {err}")
+        return ready
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def restart(self) -> bool:
+        """Перезапускает упавший демон (слоты и порты сохраняются)."""
+        with self._lock:
+            if self.alive():
+                return True
+            logger.warning(f"xray-демон на API-порту {self.api_port} завершился, перезапуск")
+            self.stop()
+            return self.start()
+
+    def attach(self, slot: int, parsed: dict) -> bool:
+        """Подключает ключ к слоту: добавляет outbound proxy-slot через API (вместе с подключениями других потоков)."""
+        request = _AttachRequest(slot, build_outbound(parsed, f"proxy-{slot}"))
+        with self._api_lock:
+            self._attaches.append(request)
+            leader = not self._flushing
+            self._flushing = True
+        if leader:
+            time.sleep(_API_BATCH_WINDOW)
+            self._flush_api()
+        request.done.wait()
+        return request.ok
+
+    def detach(self, slot: int) -> None:
+        """Отключает ключ от слота: удаление outbound proxy-slot уходит со следующим вызовом API."""
+        with self._api_lock:
+            if slot in self._attached:
+                self._attached.discard(slot)
+                self._removals.append(slot)
+
+    def _flush_api(self) -> None:
+        """Исполняет накопленные удаления и подключения, пока очередь не опустеет."""
+        while True:
+            with self._api_lock:
+                attaches, self._attaches = self._attaches, []
+                removals, self._removals = self._removals, []
+                if not attaches and not removals:
+                    self._flushing = False
+                    return
+            try:
+                self._apply(attaches, removals)
+            finally:
+                for request in attaches:
+                    request.done.set()
+
+    def _apply(self, attaches: list[_AttachRequest], removals: list[int]) -> None:
+        tags = [f"proxy-{slot}" for slot in removals]
+        if tags and not xray_api_remove_outbounds(self.api_port, tags) and len(tags) > 1:
+            # Один неудачный тег не должен оставить остальные outbound
+            for tag in tags:
+                xray_api_remove_outbound(self.api_port, tag)
+        if not attaches:
+            return
+        if xray_api_add_outbounds(self.api_port, [request.outbound for request in attaches]):
+            for request in attaches:
+                request.ok = True
+        else:
+            # Пакет мог добавиться частично, или остался outbound предыдущего ключа - по одному
+            for request in attaches:
+                request.ok = xray_api_add_outbound(self.api_port, request.outbound)
+                if not request.ok:
+                    xray_api_remove_outbound(self.api_port, f"proxy-{request.slot}")
+                    request.ok = xray_api_add_outbound(self.api_port, request.outbound)
+        with self._api_lock:
+            self._attached.update(request.slot for request in attaches if request.ok)
+
+    def stop(self) -> None:
+        if self.proc is not None:
+            # Синхронно: restart сразу поднимает xray на тех же портах
+            unregister(self.proc)
+            kill_xray_process(self.proc, drain_stderr=False)
+            self.proc = None
+
+
+class XrayDaemonPool:
+    """Пул демонов xray; выдаёт свободные слоты в аренду."""
+
+    def __init__(self, count: int = XRAY_DAEMON_COUNT, slots: int = XRAY_DAEMON_SLOTS):
+        self.count = count
+        self.slots = slots
+        self.daemons: list[XrayDaemon] = []
+        self._free: "queue.Queue[tuple[XrayDaemon, int]]" = queue.Queue()
+
+    def start(self) -> bool:
+        """Поднимает демоны. False, если не поднялся ни один."""
+        for _ in range(self.count):
+            socks_ports = take_ports(self.slots, wait=0)
+            api_port = take_port(tcp=True, wait=0)
+            if socks_ports is None or api_port is None:
+                if socks_ports:
+                    return_ports(socks_ports)
+                if api_port is not None:
+                    return_port(api_port)
+                logger.warning("Недостаточно свободных адресов inbound для xray-демонов")
+                break
+            daemon = XrayDaemon(socks_ports, api_port)
+            if not daemon.start():
+                daemon.stop()
+                return_ports(socks_ports)
+                return_port(api_port)
+                continue
+            self.daemons.append(daemon)
+            for slot in range(self.slots):
+                self._free.put((daemon, slot))
+        return bool(self.daemons)
+
+    def lease(self, timeout: float = _LEASE_TIMEOUT) -> Optional[tuple[XrayDaemon, int]]:
+        """Берёт свободный слот (демон, номер_слота) или None по таймауту."""
+        try:
+            daemon, slot = self._free.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if not daemon.alive() and not daemon.restart():
+            self._free.put((daemon, slot))
+            return None
+        return (daemon, slot)
+
+    def release(self, daemon: XrayDaemon, slot: int) -> None:
+        self._free.put((daemon, slot))
+
+    def shutdown(self) -> None:
+        for daemon in self.daemons:
+            daemon.stop()
+            return_ports(daemon.socks_ports)
+            return_port(daemon.api_port)
+        self.daemons.clear()
+
+
+_pool: Optional[XrayDaemonPool] = None
+_pool_failed = False
+_pool_lock = threading.Lock()
+
+
+def get_daemon_pool() -> Optional[XrayDaemonPool]:
+    """Возвращает общий пул демонов, при первом вызове поднимает его. None - демоны не запустились."""
+    global _pool, _pool_failed
+    with _pool_lock:
+        if _pool is None and not _pool_failed:
+            pool = XrayDaemonPool()
+            if pool.start():
+                _pool = pool
+            else:
+                pool.shutdown()
+                _pool_failed = True
+                logger.warning("xray-демоны не запустились, ключи проверяются отдельными процессами xray")
+        return _pool
+
+
+def shutdown_daemon_pool() -> None:
+    """Останавливает демоны (вызывается в конце работы)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
@@ -4,13 +4,16 @@
 Модуль управления xray: конфигурация, запуск, остановка, загрузка.
 """
 
+import asyncio
+import errno
 import json
 import os
 import platform
+import selectors
 import signal
+import socket
 import subprocess
 import sys
-import tempfile
 import time
 import zipfile
 
@@ -19,19 +22,23 @@ from rich.console import Console
 
 from . import config
 from .config import (
+    XRAY_CONFIG_DELIVERY,
     XRAY_DIR_NAME,
     XRAY_RELEASES_API,
     XRAY_STARTUP_POLL_INTERVAL,
     XRAY_STARTUP_WAIT,
 )
+from .port_pool import InboundAddress, connect_inbound, inbound_listen, open_inbound_connection
+from .spawn_server import MEMFD_TARGET_FD, spawn_client
+from .xray_resources import apply_limits, child_env, mark_started
 
 console = Console()
 
 
-def build_xray_config(parsed: dict, socks_port: int) -> dict:
+def build_outbound(parsed: dict, tag: str = "proxy") -> dict:
     """
-    Собирает конфиг xray: inbound SOCKS, outbound для различных протоколов.
-    Поддерживает: VLESS, VMess, Trojan, Shadowsocks.
+    Собирает outbound xray для ключа (VLESS, VMess, Trojan, Shadowsocks) с заданным тегом.
+    При неподдерживаемом протоколе - ValueError.
     """
     protocol = parsed.get("protocol", "vless")
     address = parsed.get("address", "")
@@ -89,7 +96,7 @@ def build_xray_config(parsed: dict, socks_port: int) -> dict:
     outbound = {
         "protocol": protocol,
         "streamSettings": stream,
-        "tag": "proxy",
+        "tag": tag,
     }
     
     if protocol == "vless":
@@ -144,19 +151,31 @@ def build_xray_config(parsed: dict, socks_port: int) -> dict:
     else:
         raise ValueError(f"Неподдерживаемый протокол: {protocol}")
     
+    return outbound
+
+
+def _socks_inbound(socks_port: InboundAddress, tag: str) -> dict:
+    """Локальный SOCKS inbound: порт на 127.0.0.1 или Unix-сокет (см. port_pool)."""
+    listen, port = inbound_listen(socks_port)
+    return {
+        "listen": listen,
+        "port": port,
+        "protocol": "socks",
+        "settings": {"udp": False},
+        "tag": tag,
+    }
+
+
+def build_xray_config(parsed: dict, socks_port: InboundAddress) -> dict:
+    """
+    Собирает конфиг xray: inbound SOCKS, outbound для различных протоколов.
+    Поддерживает: VLESS, VMess, Trojan, Shadowsocks.
+    """
     return {
         "log": {"loglevel": "error"},
-        "inbounds": [
-            {
-                "listen": "127.0.0.1",
-                "port": socks_port,
-                "protocol": "socks",
-                "settings": {"udp": False},
-                "tag": "in",
-            }
-        ],
+        "inbounds": [_socks_inbound(socks_port, "in")],
         "outbounds": [
-            outbound,
+            build_outbound(parsed, "proxy"),
             {"protocol": "freedom", "tag": "direct"},
         ],
         "routing": {
@@ -168,21 +187,258 @@ def build_xray_config(parsed: dict, socks_port: int) -> dict:
     }
 
 
-def run_xray(config_path: str, stderr_pipe: bool = False):
-    """Запуск xray. При stderr_pipe=True stderr возвращается в proc.stderr."""
+def build_xray_base_config(socks_ports: list[InboundAddress], api_port: int) -> dict:
+    """
+    Базовый конфиг долгоживущего xray: SOCKS inbound на каждый слот (in-i) с правилом
+    in-i -> proxy-i и API (HandlerService) на api_port. Outbound proxy-i добавляется
+    и удаляется во время работы через API; пока его нет, трафик слота уходит в blackhole.
+    """
+    inbounds = [_socks_inbound(socks_port, f"in-{i}") for i, socks_port in enumerate(socks_ports)]
+    inbounds.append({
+        "listen": "127.0.0.1",
+        "port": api_port,
+        "protocol": "dokodemo-door",
+        "settings": {"address": "127.0.0.1"},
+        "tag": "api",
+    })
+    rules = [{"type": "field", "inboundTag": ["api"], "outboundTag": "api"}]
+    rules.extend(
+        {"type": "field", "inboundTag": [f"in-{i}"], "outboundTag": f"proxy-{i}"}
+        for i in range(len(socks_ports))
+    )
+    return {
+        "log": {"loglevel": "error"},
+        "api": {"tag": "api", "services": ["HandlerService"]},
+        "inbounds": inbounds,
+        "outbounds": [
+            # Первый outbound - обработчик по умолчанию для слотов без ключа
+            {"protocol": "blackhole", "tag": "block"},
+            {"protocol": "freedom", "tag": "direct"},
+        ],
+        "routing": {
+            "domainStrategy": "IPIfNonMatch",
+            "rules": rules,
+        },
+    }
+
+
+def xray_api_add_outbound(api_port: int, outbound: dict, timeout: float = 5.0) -> bool:
+    """Добавляет outbound в работающий xray через API (xray api ado). True - успешно."""
+    return xray_api_add_outbounds(api_port, [outbound], timeout)
+
+
+def xray_api_add_outbounds(api_port: int, outbounds: list[dict], timeout: float = 5.0) -> bool:
+    """Добавляет несколько outbound одним вызовом xray api ado. True - добавлены все."""
+    payload = json.dumps({"outbounds": outbounds}, ensure_ascii=False).encode("utf-8")
+    return _run_xray_api(["ado", f"--server=127.0.0.1:{api_port}", "stdin:"], payload, timeout)
+
+
+def xray_api_remove_outbound(api_port: int, tag: str, timeout: float = 5.0) -> bool:
+    """Удаляет outbound с тегом tag из работающего xray через API (xray api rmo)."""
+    return xray_api_remove_outbounds(api_port, [tag], timeout)
+
+
+def xray_api_remove_outbounds(api_port: int, tags: list[str], timeout: float = 5.0) -> bool:
+    """Удаляет несколько outbound одним вызовом xray api rmo. True - удалены все."""
+    return _run_xray_api(["rmo", f"--server=127.0.0.1:{api_port}", *tags], None, timeout)
+
+
+def _run_xray_api(args: list[str], payload: bytes | None, timeout: float) -> bool:
+    """Выполняет команду xray api. True при коде возврата 0."""
+    try:
+        p = subprocess.run(
+            [config.XRAY_CMD, "api", *args],
+            input=payload,
+            capture_output=True,
+            timeout=timeout,
+            creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0,
+        )
+        return p.returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+def build_xray_batch_config(parsed_list: list[dict], socks_ports: list[InboundAddress]) -> dict:
+    """
+    Собирает один конфиг xray для пакета ключей: на каждый ключ свой SOCKS inbound (in-i)
+    и свой outbound (proxy-i), связанные правилом маршрутизации inboundTag -> outboundTag.
+    Ключ i проверяется через порт socks_ports[i].
+    """
+    if len(parsed_list) != len(socks_ports):
+        raise ValueError("Число ключей и портов в пакете не совпадает")
+    inbounds = []
+    outbounds = []
+    rules = []
+    for i, (parsed, socks_port) in enumerate(zip(parsed_list, socks_ports)):
+        inbounds.append(_socks_inbound(socks_port, f"in-{i}"))
+        outbounds.append(build_outbound(parsed, f"proxy-{i}"))
+        rules.append({"type": "field", "inboundTag": [f"in-{i}"], "outboundTag": f"proxy-{i}"})
+    outbounds.append({"protocol": "freedom", "tag": "direct"})
+    return {
+        "log": {"loglevel": "error"},
+        "inbounds": inbounds,
+        "outbounds": outbounds,
+        "routing": {
+            "domainStrategy": "IPIfNonMatch",
+            "rules": rules,
+        },
+    }
+
+
+def _config_bytes(config_data: dict | str) -> bytes:
+    """Конфиг xray в виде JSON-байтов: словарь или готовый JSON (lib.xray_templates)."""
+    if isinstance(config_data, str):
+        return config_data.encode("utf-8")
+    return json.dumps(config_data, ensure_ascii=False).encode("utf-8")
+
+
+def _config_memfd(data: bytes) -> int | None:
+    """Анонимный файл в памяти (memfd) с конфигом или None, если memfd недоступен (не Linux)."""
+    if XRAY_CONFIG_DELIVERY != "memfd" or not hasattr(os, "memfd_create"):
+        return None
+    fd = os.memfd_create("xray-config", os.MFD_CLOEXEC)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    except OSError:
+        os.close(fd)
+        raise
+    return fd
+
+
+def _xray_run_args(memfd: int | None) -> list[str]:
+    """Аргументы запуска: конфиг из /proc/self/fd/N (memfd) или из stdin."""
+    source = f"/proc/self/fd/{memfd}" if memfd is not None else "stdin:"
+    return [config.XRAY_CMD, "run", "-config", source]
+
+
+def _xray_popen_kwargs(stderr_pipe: bool, memfd: int | None) -> dict:
     kwargs = {
-        "stdout": subprocess.DEVNULL,
+        "stdin": subprocess.PIPE if memfd is None else subprocess.DEVNULL,
         "stderr": subprocess.PIPE if stderr_pipe else subprocess.DEVNULL,
+        # Метка владельца - для поиска осиротевших xray при следующем запуске (orphans.sweep_orphans),
+        # переменные Go профиля ресурсов (xray_resources)
+        "env": child_env(),
     }
+    if memfd is not None:
+        kwargs["pass_fds"] = (memfd,)
     if sys.platform == "win32":
         kwargs["creationflags"] = subprocess.CREATE_NO_WINDOW
     else:
         # Новая сессия - процесс и дочерние можно завершить группой
         kwargs["start_new_session"] = True
-    return subprocess.Popen(
-        [config.XRAY_CMD, "run", "-config", config_path],
-        **kwargs,
-    )
+    return kwargs
+
+
+def run_xray(config_data: dict | str, stderr_pipe: bool = False):
+    """
+    Запуск xray с конфигом без временного файла: JSON передаётся через stdin (-config stdin:)
+    или через memfd (XRAY_CONFIG_DELIVERY=memfd). При stderr_pipe=True stderr возвращается в proc.stderr.
+    Запуск идёт через spawn-сервер (XRAY_SPAWN_SERVER), если он доступен: его xray завершаются
+    вместе с процессом проверки. Без preexec_fn: Popen сохраняет быстрый запуск (vfork/posix_spawn),
+    а xray, запущенные напрямую, после SIGKILL процесса проверки завершает orphans.sweep_orphans.
+    """
+    data = _config_bytes(config_data)
+    memfd = _config_memfd(data)
+    try:
+        proc = None
+        client = spawn_client()
+        if client is not None:
+            try:
+                proc = client.spawn(
+                    _xray_run_args(MEMFD_TARGET_FD if memfd is not None else None),
+                    stdin_pipe=memfd is None, stderr_pipe=stderr_pipe, memfd=memfd,
+                )
+            except (ConnectionError, json.JSONDecodeError):
+                # Сервер завершился - этот xray запускается напрямую, следующий получит новый сервер
+                pass
+        if proc is None:
+            proc = subprocess.Popen(
+                _xray_run_args(memfd),
+                stdout=subprocess.DEVNULL,
+                **_xray_popen_kwargs(stderr_pipe, memfd),
+            )
+    finally:
+        if memfd is not None:
+            os.close(memfd)
+    apply_limits(proc.pid)
+    mark_started(proc)
+    if proc.stdin is not None:
+        try:
+            proc.stdin.write(data)
+            proc.stdin.close()
+        except OSError:
+            # xray завершился, не дочитав конфиг - ошибку покажет wait_for_xray_ready
+            pass
+    return proc
+
+
+def _port_accepts(host: str, port: InboundAddress, wait: float) -> bool:
+    """Неблокирующий connect к порту (или Unix-сокету); ждёт не дольше wait. True - соединение принято."""
+    if isinstance(port, str):
+        try:
+            connect_inbound(port, wait).close()
+            return True
+        except OSError:
+            return False
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.setblocking(False)
+        err = sock.connect_ex((host, port))
+        if err == 0:
+            return True
+        if err not in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY, getattr(errno, "WSAEWOULDBLOCK", -1)):
+            return False
+        # selectors (poll/epoll), а не select.select: номер дескриптора при сотнях xray бывает >= FD_SETSIZE
+        with selectors.DefaultSelector() as selector:
+            selector.register(sock, selectors.EVENT_WRITE)
+            if not selector.select(wait):
+                return False
+        return sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def _xray_exit_error(proc: subprocess.Popen) -> str:
+    """Текст ошибки завершившегося xray: stderr (если перехвачен) или код возврата."""
+    err = ""
+    if getattr(proc, "stderr", None) is not None:
+        try:
+            err = proc.stderr.read().decode("utf-8", errors="replace").strip()
+        except (OSError, ValueError):
+            pass
+    return err or f"xray завершился с кодом {proc.returncode}"
+
+
+def wait_for_xray_ready(
+    proc: subprocess.Popen,
+    ports: list[InboundAddress],
+    timeout: float | None = None,
+    host: str = "127.0.0.1",
+) -> tuple[bool, str]:
+    """
+    Ждёт готовности xray: возвращается сразу, как только все inbound-порты принимают соединения.
+    Не дольше timeout (по умолчанию XRAY_STARTUP_WAIT). Если процесс завершился раньше -
+    (False, текст ошибки из stderr или код возврата). Возвращает (готов, ошибка).
+    """
+    wait = XRAY_STARTUP_WAIT if timeout is None else timeout
+    deadline = time.perf_counter() + wait
+    pending = list(ports)
+    while True:
+        if proc.poll() is not None:
+            return (False, _xray_exit_error(proc))
+        while pending and _port_accepts(host, pending[0], XRAY_STARTUP_POLL_INTERVAL):
+            pending.pop(0)
+        if not pending:
+            return (True, "")
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return (False, f"порт {pending[0]} не открылся за {wait:.1f} с")
+        # Отказ в соединении приходит сразу - ждём до следующей попытки
+        time.sleep(min(XRAY_STARTUP_POLL_INTERVAL, remaining))
 
 
 def kill_xray_process(proc: subprocess.Popen, drain_stderr: bool = True) -> None:
@@ -223,6 +479,65 @@ def kill_xray_process(proc: subprocess.Popen, drain_stderr: bool = True) -> None
         pass
 
 
+async def run_xray_async(config_data: dict | str, stderr_pipe: bool = False) -> asyncio.subprocess.Process:
+    """Асинхронный запуск xray (для asyncio-движка проверки); конфиг передаётся как в run_xray."""
+    data = _config_bytes(config_data)
+    memfd = _config_memfd(data)
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *_xray_run_args(memfd),
+            stdout=asyncio.subprocess.DEVNULL,
+            **_xray_popen_kwargs(stderr_pipe, memfd),
+        )
+    finally:
+        if memfd is not None:
+            os.close(memfd)
+    apply_limits(proc.pid)
+    mark_started(proc)
+    if proc.stdin is not None:
+        try:
+            proc.stdin.write(data)
+            await proc.stdin.drain()
+            proc.stdin.close()
+        except (OSError, ConnectionResetError):
+            pass
+    return proc
+
+
+async def wait_for_xray_ready_async(
+    proc: asyncio.subprocess.Process,
+    ports: list[InboundAddress],
+    timeout: float | None = None,
+    host: str = "127.0.0.1",
+) -> tuple[bool, str]:
+    """Асинхронный аналог wait_for_xray_ready: (готов, ошибка)."""
+    wait = XRAY_STARTUP_WAIT if timeout is None else timeout
+    deadline = time.perf_counter() + wait
+    pending = list(ports)
+    while True:
+        if proc.returncode is not None:
+            err = ""
+            if proc.stderr is not None:
+                try:
+                    err = (await proc.stderr.read()).decode("utf-8", errors="replace").strip()
+                except (OSError, ValueError):
+                    pass
+            return (False, err or f"xray завершился с кодом {proc.returncode}")
+        while pending:
+            try:
+                _, writer = await asyncio.wait_for(open_inbound_connection(pending[0], host), XRAY_STARTUP_POLL_INTERVAL)
+            except (OSError, asyncio.TimeoutError):
+                break
+            writer.close()
+            pending.pop(0)
+        if not pending:
+            return (True, "")
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return (False, f"порт {pending[0]} не открылся за {wait:.1f} с")
+        await asyncio.sleep(min(XRAY_STARTUP_POLL_INTERVAL, remaining))
+
+
 def check_xray_available() -> bool:
     """Проверяет, что xray доступен (XRAY_CMD)."""
     try:
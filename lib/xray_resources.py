@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модуль профилей ресурсов и учёта ресурсов процессов xray.
+Рантайм Go по умолчанию запускает поток на каждое ядро и держит свою кучу, поэтому при
+сотне одновременных xray на маленькой машине растут конкуренция за CPU и суммарный RSS.
+- Профиль (XRAY_RESOURCE_PROFILE и отдельные настройки XRAY_GO*/XRAY_CPU_AFFINITY/XRAY_NICE/
+  XRAY_IONICE/XRAY_RLIMIT_*): GOMAXPROCS, GOGC и GOMEMLIMIT передаются в окружении xray;
+  привязка к CPU, nice, ionice и rlimits применяются к процессу по pid сразу после запуска
+  (apply_limits) - без preexec_fn, запуск через spawn-сервер не замедляется.
+- Учёт (XRAY_RESOURCE_ACCOUNTING): перед завершением xray из /proc/<pid> читаются пиковый
+  RSS (VmHWM) и процессорное время (utime + stime) - одного замера достаточно, оба значения
+  накопительные. record_usage записывает их в метрики ключа (xray_rss_kb, xray_cpu_ms).
+  Замер берётся только у работающего процесса с тем же временем старта, что и при запуске
+  (mark_started): pid вышедшего xray мог уже собрать reaper spawn-сервера и занять другой процесс.
+  Демоны XRAY_DAEMON_MODE общие для многих ключей и живут весь прогон - их ресурсы не учитываются.
+"""
+
+import errno
+import functools
+import itertools
+import logging
+import os
+import platform
+import sys
+import weakref
+from typing import Optional
+
+from .config import (
+    XRAY_CPU_AFFINITY,
+    XRAY_GOGC,
+    XRAY_GOMAXPROCS,
+    XRAY_GOMEMLIMIT,
+    XRAY_IONICE,
+    XRAY_NICE,
+    XRAY_RESOURCE_ACCOUNTING,
+    XRAY_RESOURCE_PROFILE,
+    XRAY_RLIMIT_AS_MB,
+    XRAY_RLIMIT_NOFILE,
+)
+from .orphans import process_start_time, xray_env
+
+logger = logging.getLogger(__name__)
+
+# Готовые профили: настройка -> значение (как в переменных окружения XRAY_*)
+_PROFILES: dict[str, dict[str, str]] = {
+    "none": {},
+    "lean": {"gomaxprocs": "1", "gogc": "50", "gomemlimit": "64MiB", "nice": "10", "ionice": "idle"},
+}
+
+# ioprio_set(2): номер системного вызова по архитектуре (в os его нет)
+_IOPRIO_SYSCALLS = {"x86_64": 251, "amd64": 251, "i386": 289, "i686": 289, "aarch64": 30, "arm64": 30, "riscv64": 30, "armv7l": 314, "ppc64le": 273}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_SHIFT = 13
+_IOPRIO_CLASSES = {"best-effort": 2, "idle": 3}
+
+
+def _setting(name: str, override: str) -> str:
+    """Значение настройки: явная переменная XRAY_* или значение профиля."""
+    if override:
+        return override
+    return _PROFILES.get(XRAY_RESOURCE_PROFILE, {}).get(name, "")
+
+
+def _parse_cpus(spec: str) -> list[set[int]]:
+    """Наборы CPU из "0-3,6;7": наборы через ";", в наборе номера и диапазоны через ","."""
+    sets = []
+    for group in spec.split(";"):
+        cpus: set[int] = set()
+        for part in filter(None, (item.strip() for item in group.split(","))):
+            first, _, last = part.partition("-")
+            cpus.update(range(int(first), int(last or first) + 1))
+        if cpus:
+            sets.append(cpus)
+    return sets
+
+
+def _parse_ionice(spec: str) -> Optional[int]:
+    """Значение ioprio для "idle" или "best-effort[:уровень]"; None - не задано."""
+    if not spec:
+        return None
+    name, _, level = spec.partition(":")
+    if name not in _IOPRIO_CLASSES:
+        raise ValueError(f"XRAY_IONICE: неизвестный класс {name!r} (idle, best-effort[:0-7])")
+    return (_IOPRIO_CLASSES[name] << _IOPRIO_CLASS_SHIFT) | (min(7, max(0, int(level))) if level else 4)
+
+
+_cpu_sets = _parse_cpus(_setting("affinity", XRAY_CPU_AFFINITY)) if hasattr(os, "sched_setaffinity") else []
+_cpu_cursor = itertools.count()
+_nice = int(_setting("nice", XRAY_NICE) or 0) if hasattr(os, "setpriority") else 0
+_ioprio = _parse_ionice(_setting("ionice", XRAY_IONICE))
+_ioprio_set = None
+if _ioprio is not None and sys.platform.startswith("linux") and platform.machine().lower() in _IOPRIO_SYSCALLS:
+    import ctypes
+
+    # ioprio_set(IOPRIO_WHO_PROCESS, pid, ioprio)
+    _ioprio_set = functools.partial(
+        ctypes.CDLL(None, use_errno=True).syscall, _IOPRIO_SYSCALLS[platform.machine().lower()], _IOPRIO_WHO_PROCESS
+    )
+_rlimits: list[tuple[int, int]] = []
+if sys.platform != "win32":
+    import resource
+
+    if XRAY_RLIMIT_NOFILE > 0:
+        _rlimits.append((resource.RLIMIT_NOFILE, XRAY_RLIMIT_NOFILE))
+    if XRAY_RLIMIT_AS_MB > 0:
+        _rlimits.append((resource.RLIMIT_AS, XRAY_RLIMIT_AS_MB * 1024 * 1024))
+    if not hasattr(resource, "prlimit"):
+        _rlimits.clear()
+# Предупреждения о недоступных ограничениях - по одному на настройку
+_warned: set[str] = set()
+
+
+def go_env() -> dict[str, str]:
+    """Переменные рантайма Go для xray по профилю."""
+    env = {}
+    gomaxprocs = _setting("gomaxprocs", XRAY_GOMAXPROCS)
+    if not gomaxprocs and _cpu_sets:
+        # Go берёт число потоков из маски CPU при старте, а маска ставится уже после запуска
+        gomaxprocs = str(min(len(cpus) for cpus in _cpu_sets))
+    for name, value in (("GOMAXPROCS", gomaxprocs), ("GOGC", _setting("gogc", XRAY_GOGC)), ("GOMEMLIMIT", _setting("gomemlimit", XRAY_GOMEMLIMIT))):
+        if value:
+            env[name] = value
+    return env
+
+
+_child_env: dict[int, dict[str, str]] = {}
+
+
+def child_env() -> dict[str, str]:
+    """Окружение запуска xray: метка владельца (orphans.xray_env) и переменные Go профиля."""
+    pid = os.getpid()
+    if pid not in _child_env:
+        _child_env[pid] = {**xray_env(), **go_env()}
+    return _child_env[pid]
+
+
+def _warn_once(name: str, error: OSError) -> None:
+    if name not in _warned:
+        _warned.add(name)
+        logger.warning(f"Ограничение xray {name} не применено: {error}")
+
+
+def apply_limits(pid: int) -> None:
+    """Привязка к CPU, nice, ionice и rlimits профиля для запущенного xray (процесс мог уже завершиться)."""
+    try:
+        if _cpu_sets:
+            os.sched_setaffinity(pid, _cpu_sets[next(_cpu_cursor) % len(_cpu_sets)])
+        if _nice:
+            os.setpriority(os.PRIO_PROCESS, pid, _nice)
+        if _ioprio_set is not None and _ioprio_set(pid, _ioprio) != 0:
+            error = ctypes.get_errno()
+            if error != errno.ESRCH:
+                _warn_once("ionice", OSError(error, os.strerror(error)))
+        for limit, value in _rlimits:
+            resource.prlimit(pid, limit, (value, value))
+    except ProcessLookupError:
+        pass
+    except OSError as e:
+        # Недостаточно прав (отрицательный nice, поднятие жёсткого лимита) - проверка идёт без ограничения
+        _warn_once(type(e).__name__, e)
+
+
+def limits_summary() -> str:
+    """Краткое описание профиля для таблицы настроек (пусто - без ограничений)."""
+    parts = [f"{name}={value}" for name, value in go_env().items()]
+    if _cpu_sets:
+        parts.append(f"CPU {XRAY_CPU_AFFINITY or _setting('affinity', '')}")
+    if _nice:
+        parts.append(f"nice {_nice}")
+    if _ioprio_set is not None:
+        parts.append(f"ionice {_setting('ionice', XRAY_IONICE)}")
+    if XRAY_RLIMIT_NOFILE > 0:
+        parts.append(f"NOFILE {XRAY_RLIMIT_NOFILE}")
+    if XRAY_RLIMIT_AS_MB > 0:
+        parts.append(f"AS {XRAY_RLIMIT_AS_MB} МБ")
+    return ", ".join(parts)
+
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+# Процесс xray -> время старта из /proc при запуске (записи исчезают вместе с объектами процессов)
+_start_times = weakref.WeakKeyDictionary()
+
+
+def mark_started(proc) -> None:
+    """Запоминает время старта запущенного xray для проверки pid в record_usage."""
+    if XRAY_RESOURCE_ACCOUNTING:
+        start = process_start_time(proc.pid)
+        if start is not None:
+            _start_times[proc] = start
+
+
+def usage(pid: int, start_time: Optional[str] = None) -> Optional[tuple[int, float]]:
+    """
+    (пиковый RSS в КБ, процессорное время в мс) процесса из /proc или None (нет /proc или процесса).
+    start_time: None, если pid принадлежит уже другому процессу (время старта не совпало).
+    """
+    try:
+        # status читается первым: совпавшее затем время старта в stat подтверждает и его
+        with open(f"/proc/{pid}/status", "rb") as f:
+            status = f.read()
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # Имя процесса в скобках может содержать пробелы - поля считаем после ")"
+    fields = stat[stat.rfind(b")") + 2:].split()
+    if start_time is not None and (len(fields) <= 19 or fields[19].decode() != start_time):
+        return None
+    cpu_ms = (int(fields[11]) + int(fields[12])) * 1000 / _CLOCK_TICKS
+    rss_kb = 0
+    for line in status.splitlines():
+        if line.startswith(b"VmHWM:"):
+            rss_kb = int(line.split()[1])
+            break
+    return (rss_kb, cpu_ms)
+
+
+def record_usage(proc, metrics_list: list[dict]) -> None:
+    """
+    Записывает ресурсы xray (до завершения процесса) в метрики проверенных им ключей.
+    Пакетный xray (несколько ключей): процессорное время делится поровну, RSS - общий пиковый.
+    """
+    if not XRAY_RESOURCE_ACCOUNTING or proc is None or not metrics_list:
+        return
+    start_time = _start_times.pop(proc, None)
+    if start_time is None or proc.poll() is not None:
+        return
+    sample = usage(proc.pid, start_time)
+    if sample is None:
+        return
+    rss_kb, cpu_ms = sample
+    for metrics in metrics_list:
+        if rss_kb:
+            metrics["xray_rss_kb"] = rss_kb
+        metrics["xray_cpu_ms"] = round(cpu_ms / len(metrics_list), 1)
+        if len(metrics_list) > 1:
+            metrics["xray_shared"] = len(metrics_list)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модуль предкомпилированных шаблонов конфигов xray.
+Структура outbound зависит только от "формы" ключа: протокол, транспорт, шифрование и
+наличие необязательных полей (flow, Host). Для каждой формы один раз собирается конфиг
+через build_outbound с метками вместо значений и сериализуется в JSON; дальше конфиг
+ключа - склейка готовых фрагментов JSON со значениями адреса, порта, id, SNI, ключей
+и адреса inbound (порт или Unix-сокет). Результат совпадает с json.dumps(build_xray_config(...)).
+"""
+
+import json
+import threading
+from json.encoder import encode_basestring
+
+from .port_pool import InboundAddress, inbound_listen
+from .xray_manager import _socks_inbound, build_outbound, build_xray_config
+
+# Поля ключа, подставляемые в шаблон: поле -> (значение по умолчанию, подставлять "значение or умолчание").
+# Должно соответствовать чтению полей в build_outbound.
+_SLOT_FIELDS: dict[str, tuple[object, bool]] = {
+    "address": ("", False),
+    "port": (443, False),
+    "uuid": ("", False),
+    "id": ("", False),
+    "alterId": (0, False),
+    "password": ("", False),
+    "method": ("aes-256-gcm", False),
+    "flow": ("", False),
+    "fingerprint": ("chrome", True),
+    "serverName": ("", True),
+    "publicKey": ("", True),
+    "shortId": ("", True),
+    "grpcServiceName": ("", True),
+    "wsPath": ("/", True),
+    "wsHost": ("", False),
+    "mode": ("auto", True),
+}
+# Поля, задающие форму (копируются в шаблон как есть)
+_SHAPE_FIELDS = ("protocol", "network", "security", "tls")
+
+# Метка слота в сериализованном шаблоне (значения ключа в шаблон не попадают - только метки)
+_MARK = "@@slot:{}@@"
+_MISSING = object()
+# Форма -> (фрагменты JSON и слоты вперемешку, используемые слоты)
+_templates: dict[tuple, tuple[list, tuple[str, ...]]] = {}
+_templates_lock = threading.Lock()
+# Слоты адреса inbound: listen и port (см. port_pool.inbound_listen)
+_INBOUND_SLOTS = ["inbound_listen", "inbound_port"]
+
+
+def _shape(parsed: dict) -> tuple:
+    """Форма ключа: поля структуры и признаки необязательных частей outbound."""
+    return tuple(parsed.get(name, _MISSING) for name in _SHAPE_FIELDS) + (bool(parsed.get("flow")), bool(parsed.get("wsHost")))
+
+
+def _marked(parsed: dict, shape: tuple) -> dict:
+    """Ключ той же формы с метками вместо значений."""
+    marked = {name: parsed[name] for name in _SHAPE_FIELDS if name in parsed}
+    marked.update({name: _MARK.format(name) for name in _SLOT_FIELDS})
+    if not shape[-2]:
+        marked.pop("flow")
+    if not shape[-1]:
+        marked.pop("wsHost")
+    return marked
+
+
+def _compile(text: str, slots: list[str]) -> tuple[list, tuple[str, ...]]:
+    """Разбивает JSON с метками на [фрагмент, (слот,), фрагмент, ...] и список встретившихся слотов."""
+    parts: list = [text]
+    for slot in slots:
+        marker = json.dumps(_MARK.format(slot), ensure_ascii=False)
+        compiled = []
+        for part in parts:
+            if not isinstance(part, str):
+                compiled.append(part)
+                continue
+            pieces = part.split(marker)
+            for i, piece in enumerate(pieces):
+                if i:
+                    compiled.append((slot,))
+                compiled.append(piece)
+        parts = compiled
+    used = tuple(slot for slot in slots if (slot,) in parts)
+    return (parts, used)
+
+
+def _template(parsed: dict) -> tuple[list, tuple[str, ...]]:
+    """Шаблон полного конфига (один ключ) для формы ключа; собирается при первом обращении."""
+    shape = _shape(parsed)
+    template = _templates.get(shape)
+    if template is not None:
+        return template
+    config = build_xray_config(_marked(parsed, shape), 0)
+    _marked_inbound(config["inbounds"][0])
+    template = _compile(json.dumps(config, ensure_ascii=False), [*_SLOT_FIELDS, *_INBOUND_SLOTS])
+    with _templates_lock:
+        _templates.setdefault(shape, template)
+    return template
+
+
+def _marked_inbound(inbound: dict) -> dict:
+    """Inbound с метками вместо listen и port."""
+    inbound.update(listen=_MARK.format("inbound_listen"), port=_MARK.format("inbound_port"))
+    return inbound
+
+
+def _inbound_values(socks_port: InboundAddress) -> dict[str, str]:
+    """JSON-значения слотов адреса inbound."""
+    listen, port = inbound_listen(socks_port)
+    return {"inbound_listen": encode_basestring(listen), "inbound_port": str(int(port))}
+
+
+def _json_value(value) -> str:
+    """json.dumps(value, ensure_ascii=False) с быстрым путём для строк и чисел."""
+    if type(value) is str:
+        return encode_basestring(value)
+    if type(value) is int:
+        return str(value)
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _render(template: tuple[list, tuple[str, ...]], parsed: dict, extra: dict[str, str]) -> str:
+    """Заполняет шаблон: значения полей ключа (только используемых формой) и готовые JSON-значения extra."""
+    parts, used = template
+    values = dict(extra)
+    for name in used:
+        if name in values:
+            continue
+        default, use_or = _SLOT_FIELDS[name]
+        values[name] = _json_value((parsed.get(name) or default) if use_or else parsed.get(name, default))
+    return "".join(part if type(part) is str else values[part[0]] for part in parts)
+
+
+def render_xray_config(parsed: dict, socks_port: InboundAddress) -> str:
+    """JSON конфига xray для ключа (как json.dumps(build_xray_config(parsed, socks_port)))."""
+    return _render(_template(parsed), parsed, _inbound_values(socks_port))
+
+
+def _outbound_template(parsed: dict) -> tuple[list, tuple[str, ...]]:
+    """Шаблон одного outbound (тег - слот "tag") для пакетных конфигов."""
+    shape = ("outbound",) + _shape(parsed)
+    template = _templates.get(shape)
+    if template is not None:
+        return template
+    outbound = build_outbound(_marked(parsed, shape[1:]), _MARK.format("tag"))
+    template = _compile(json.dumps(outbound, ensure_ascii=False), [*_SLOT_FIELDS, "tag"])
+    with _templates_lock:
+        _templates.setdefault(shape, template)
+    return template
+
+
+_INBOUND_TEMPLATE = _compile(
+    json.dumps(_marked_inbound(_socks_inbound(0, _MARK.format("tag"))), ensure_ascii=False), [*_INBOUND_SLOTS, "tag"]
+)
+
+
+def render_xray_batch_config(parsed_list: list[dict], socks_ports: list[InboundAddress]) -> str:
+    """JSON пакетного конфига (как json.dumps(build_xray_batch_config(parsed_list, socks_ports)))."""
+    if len(parsed_list) != len(socks_ports):
+        raise ValueError("Число ключей и портов в пакете не совпадает")
+    inbounds = []
+    outbounds = []
+    rules = []
+    for i, (parsed, socks_port) in enumerate(zip(parsed_list, socks_ports)):
+        inbounds.append(_render(_INBOUND_TEMPLATE, parsed, {**_inbound_values(socks_port), "tag": f'"in-{i}"'}))
+        outbounds.append(_render(_outbound_template(parsed), parsed, {"tag": f'"proxy-{i}"'}))
+        rules.append(f'{{"type": "field", "inboundTag": ["in-{i}"], "outboundTag": "proxy-{i}"}}')
+    outbounds.append('{"protocol": "freedom", "tag": "direct"}')
+    return (
+        '{"log": {"loglevel": "error"}, "inbounds": [' + ", ".join(inbounds)
+        + '], "outbounds": [' + ", ".join(outbounds)
+        + '], "routing": {"domainStrategy": "IPIfNonMatch", "rules": [' + ", ".join(rules) + "]}}"
+    )
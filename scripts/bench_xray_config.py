@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Микробенчмарк генерации конфигов xray: build_xray_config + json.dumps против
+предкомпилированных шаблонов (lib.xray_templates). Перед замером проверяет, что
+шаблоны дают тот же JSON, что и сборщик.
+
+Запуск из корня репозитория:
+    python scripts/bench_xray_config.py [число_ключей] [файл_со_ссылками]
+"""
+
+import base64
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.parsing import parse_proxy_lines, parse_proxy_url  # noqa: E402
+from lib.xray_manager import build_xray_batch_config, build_xray_config  # noqa: E402
+from lib.xray_templates import render_xray_batch_config, render_xray_config  # noqa: E402
+
+_VMESS = base64.b64encode(json.dumps({
+    "v": "2", "ps": "vm", "add": "vm.example.com", "port": "443", "id": "b831381d-6324-4d53-ad4f-8cda48b30811",
+    "aid": "0", "net": "ws", "type": "none", "host": "cdn.example.com", "path": "/ray", "tls": "tls", "sni": "vm.example.com",
+}).encode()).decode()
+
+SAMPLE_LINKS = [
+    "vless://c19e580c-1ba9-4846-afdb-ac2847b18177@1.2.3.4:443?security=reality&sni=a.com&pbk=Zm9vYmFy&sid=ab12&fp=chrome&type=tcp&flow=xtls-rprx-vision#r",
+    "vless://ae45b713-5a0d-4080-8b75-a0f7311fcf8d@host.example.com:8443?security=tls&sni=host.example.com&type=ws&host=cdn.example.com&path=%2Fws#ws",
+    "vless://5fb94673-d2d2-4a16-b0a1-ac5c937be18b@5.6.7.8:443?security=tls&sni=g.example.com&type=grpc&serviceName=grpc#grpc",
+    "vless://d8d39845-623e-43c9-b965-f17d9f11dd6c@9.9.9.9:80?security=none&type=xhttp&mode=packet-up#xhttp",
+    "vmess://" + _VMESS,
+    "trojan://secret@tr.example.com:443?security=tls&sni=tr.example.com#t",
+    "ss://" + base64.b64encode(b"aes-256-gcm:password").decode() + "@10.0.0.1:8388#ss",
+]
+
+
+def _load_parsed(path: str | None) -> list[dict]:
+    if path:
+        with open(path, encoding="utf-8") as f:
+            links = [link for link, _ in parse_proxy_lines(f.read())]
+    else:
+        links = SAMPLE_LINKS
+    parsed = [p for p in (parse_proxy_url(link) for link in links) if p and p.get("protocol") in ("vless", "vmess", "trojan", "shadowsocks")]
+    if not parsed:
+        sys.exit("Нет ключей для замера")
+    return parsed
+
+
+def _check(parsed_list: list[dict]) -> None:
+    for i, parsed in enumerate(parsed_list):
+        expected = json.dumps(build_xray_config(parsed, 20000 + i), ensure_ascii=False)
+        actual = render_xray_config(parsed, 20000 + i)
+        if actual != expected:
+            sys.exit(f"Расхождение для {parsed.get('protocol')}:\n{expected}\n{actual}")
+        # Inbound на Unix-сокете (INBOUND_ALLOCATOR=unix)
+        if render_xray_config(parsed, "@sock-1") != json.dumps(build_xray_config(parsed, "@sock-1"), ensure_ascii=False):
+            sys.exit(f"Расхождение для {parsed.get('protocol')} с Unix-сокетом")
+    for ports in (list(range(30000, 30000 + len(parsed_list))), [f"/tmp/s{i}.sock" for i in range(len(parsed_list))]):
+        if json.loads(render_xray_batch_config(parsed_list, ports)) != build_xray_batch_config(parsed_list, ports):
+            sys.exit("Расхождение пакетного конфига")
+
+
+def _bench(name: str, fn, items: list[dict]) -> float:
+    start = time.perf_counter()
+    for i, parsed in enumerate(items):
+        fn(parsed, 20000 + i % 1000)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<32} {elapsed * 1000:8.1f} мс  {elapsed / len(items) * 1e6:6.2f} мкс/ключ")
+    return elapsed
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    parsed_list = _load_parsed(sys.argv[2] if len(sys.argv) > 2 else None)
+    _check(parsed_list)
+    print(f"JSON совпадает для {len(parsed_list)} ключей ({len({p.get('protocol') for p in parsed_list})} протоколов)")
+
+    items = [parsed_list[i % len(parsed_list)] for i in range(count)]
+    builder = _bench("build_xray_config + json.dumps", lambda p, port: json.dumps(build_xray_config(p, port), ensure_ascii=False), items)
+    template = _bench("render_xray_config (шаблоны)", render_xray_config, items)
+    print(f"Ускорение: {builder / template:.1f}x на {count} ключах")
+
+    batch = [items[i:i + 20] for i in range(0, len(items), 20)]
+    start = time.perf_counter()
+    for chunk in batch:
+        json.dumps(build_xray_batch_config(chunk, list(range(30000, 30000 + len(chunk)))), ensure_ascii=False)
+    builder = time.perf_counter() - start
+    start = time.perf_counter()
+    for chunk in batch:
+        render_xray_batch_config(chunk, list(range(30000, 30000 + len(chunk))))
+    template = time.perf_counter() - start
+    print(f"Пакеты по 20: сборщик {builder * 1000:.1f} мс, шаблоны {template * 1000:.1f} мс ({builder / template:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,11 +14,14 @@ import sys
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Optional
 
 from rich.console import Console
 from rich.progress import BarColumn, Progress, SpinnerColumn, TextColumn, TimeElapsedColumn
 
+from lib.concurrency import AdaptiveLimiter, run_adaptive
 from lib.config import (
+    ADAPTIVE_CONCURRENCY,
     MAX_WORKERS,
     MIN_SPEED_THRESHOLD_MBPS,
     SPEED_TEST_DEBUG,
@@ -36,6 +39,7 @@ from lib.config import (
     SPEED_TEST_WORKERS,
 )
 from lib.speedtest import speed_test_key
+from lib.xray_daemon import shutdown_daemon_pool
 from lib.xray_manager import ensure_xray
 
 console = Console()
@@ -104,9 +108,12 @@ def main() -> None:
     Path(out_dir).mkdir(parents=True, exist_ok=True)
 
     workers = min(SPEED_TEST_WORKERS, MAX_WORKERS)
+    # Адаптивная параллельность: workers - стартовое значение
+    limiter = AdaptiveLimiter(workers) if ADAPTIVE_CONCURRENCY else None
     console.print(
         f"[cyan]Speedtest:[/cyan] {len(lines)} ключей, режим={SPEED_TEST_MODE}, метрика={SPEED_TEST_METRIC}, "
         f"таймаут={SPEED_TEST_TIMEOUT}с, воркеров={workers}"
+        + (" (адаптивно)" if limiter is not None else "")
     )
     time_start = time.perf_counter()
 
@@ -121,30 +128,43 @@ def main() -> None:
         console=console,
     ) as progress:
         task = progress.add_task("[cyan]Speedtest...[/cyan]", total=len(lines))
-        with ThreadPoolExecutor(max_workers=workers) as executor:
-            futures = {
-                executor.submit(
-                    speed_test_key,
-                    line,
-                    SPEED_TEST_TIMEOUT,
-                    SPEED_TEST_METRIC,
-                    SPEED_TEST_REQUESTS,
-                    SPEED_TEST_URL,
-                    mode=SPEED_TEST_MODE,
-                    download_timeout=SPEED_TEST_DOWNLOAD_TIMEOUT,
-                    download_url_small=SPEED_TEST_DOWNLOAD_URL_SMALL,
-                    download_url_medium=SPEED_TEST_DOWNLOAD_URL_MEDIUM,
-                ): line
-                for line in lines
-            }
-            for future in as_completed(futures):
-                progress.advance(task)
-                try:
-                    pair = future.result()
-                    if pair is not None:
-                        results.append(pair)
-                except Exception:
-                    pass
+        def run_one(line: str) -> tuple[Optional[tuple[str, float]], dict]:
+            metrics: dict = {}
+            return speed_test_key(
+                line,
+                SPEED_TEST_TIMEOUT,
+                SPEED_TEST_METRIC,
+                SPEED_TEST_REQUESTS,
+                SPEED_TEST_URL,
+                mode=SPEED_TEST_MODE,
+                download_timeout=SPEED_TEST_DOWNLOAD_TIMEOUT,
+                download_url_small=SPEED_TEST_DOWNLOAD_URL_SMALL,
+                download_url_medium=SPEED_TEST_DOWNLOAD_URL_MEDIUM,
+                metrics=metrics,
+            ), metrics
+
+        def on_done(line: str, future) -> bool:
+            """Учитывает результат; True - ключ не прошёл из-за таймаутов (сигнал для AdaptiveLimiter)."""
+            progress.advance(task)
+            try:
+                pair, metrics = future.result()
+            except Exception:
+                return False
+            if pair is not None:
+                results.append(pair)
+                return False
+            return bool(metrics.get("timeouts"))
+
+        if limiter is not None:
+            run_adaptive(run_one, lines, on_done, limiter)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(run_one, line): line for line in lines}
+                for future in as_completed(futures):
+                    on_done(futures[future], future)
+    shutdown_daemon_pool()
+    if limiter is not None:
+        console.print(f"[cyan]Адаптивная параллельность:[/cyan] {limiter.summary()}")
 
     elapsed = time.perf_counter() - time_start
     if not results:
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Общие настройки тестов: корень репозитория в sys.path (пакет lib) и заглушка SOCKS5-порта xray."""
+
+import socket
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+class SocksStub:
+    """
+    SOCKS5-сервер вместо inbound xray: после CONNECT отвечает на HTTP-запросы "204 No Content"
+    (keep-alive, пока клиент не попросит Connection: close).
+    mode: "ok"; "auth" - метод без аутентификации не принят; "error" - ответ на CONNECT с кодом code;
+    "truncated" - ответ обрывается; "silent" - на CONNECT не отвечает.
+    """
+
+    def __init__(self, mode: str = "ok", code: int = 5):
+        self.mode = mode
+        self.code = code
+        self.connections = 0
+        self.requests: list[bytes] = []
+        self._clients: list[socket.socket] = []
+        self._lock = threading.Lock()
+        self._server = socket.socket()
+        self._server.bind(("127.0.0.1", 0))
+        self._server.listen()
+        self.port = self._server.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            with self._lock:
+                self.connections += 1
+                self._clients.append(conn)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn: socket.socket) -> None:
+        stream = conn.makefile("rb")
+        try:
+            stream.read(3)
+            if self.mode == "auth":
+                conn.sendall(b"\x05\xff")
+                return
+            conn.sendall(b"\x05\x00")
+            head = stream.read(4)
+            if len(head) < 4:
+                return
+            atyp = head[3]
+            stream.read({1: 4, 4: 16}.get(atyp) or stream.read(1)[0])
+            stream.read(2)
+            if self.mode == "silent":
+                stream.read(1)
+                return
+            if self.mode == "truncated":
+                conn.sendall(b"\x05\x00")
+                return
+            reply = 0 if self.mode == "ok" else self.code
+            conn.sendall(bytes([5, reply, 0, 1]) + bytes(6))
+            if reply:
+                return
+            while True:
+                request = b""
+                while not request.endswith(b"\r\n\r\n"):
+                    line = stream.readline()
+                    if not line:
+                        return
+                    request += line
+                with self._lock:
+                    self.requests.append(request)
+                conn.sendall(b"HTTP/1.1 204 No Content\r\n\r\n")
+                if b"connection: close" in request.lower():
+                    return
+        except OSError:
+            pass
+        finally:
+            stream.close()
+            conn.close()
+
+    def drop_idle(self) -> None:
+        """Закрывает все соединения (как сервер, закрывший простаивающие keep-alive)."""
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for conn in clients:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        self._server.close()
+        self.drop_idle()
+
+
+@pytest.fixture
+def socks_stub():
+    """Фабрика заглушек SOCKS5 (SocksStub); все закрываются после теста."""
+    stubs = []
+
+    def make(mode: str = "ok", code: int = 5) -> SocksStub:
+        stub = SocksStub(mode, code)
+        stubs.append(stub)
+        return stub
+
+    yield make
+    for stub in stubs:
+        stub.close()
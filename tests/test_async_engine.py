@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""asyncio-движок: блокирующие источник и обработчики вне цикла событий, откат на потоки."""
+
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from lib import async_checker
+from lib.async_checker import run_checks_async
+from lib.key_feed import KeyFeed
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _SlowFeed(KeyFeed):
+    """Источник, который блокирует при выдаче ключа (как пополнение из очереди SQLite)."""
+
+    def __init__(self, links):
+        super().__init__(links)
+        self.threads = set()
+
+    def get(self, timeout=None):
+        self.threads.add(threading.current_thread().name)
+        time.sleep(0.02)
+        return super().get(timeout)
+
+
+def test_blocking_calls_off_event_loop(monkeypatch):
+    monkeypatch.setattr(async_checker, "capacity", lambda: 100)
+    ticks = []
+
+    async def fake_check(link, cache=None):
+        # Пока ключи "проверяются", цикл событий должен успевать отсчитывать паузы
+        for _ in range(5):
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+        if link == "bad":
+            raise ValueError("сбой")
+        return (link, True, {})
+
+    monkeypatch.setattr(async_checker, "check_key_e2e_async", fake_check)
+    links = [f"k{i}" for i in range(10)] + ["bad"]
+    feed = _SlowFeed(links)
+    results, errors, result_threads = [], [], set()
+
+    def on_result(link, ok, metrics):
+        result_threads.add(threading.current_thread().name)
+        # Журнал с fsync, запись потока результатов
+        time.sleep(0.05)
+        results.append(link)
+
+    def on_error(failed, e):
+        result_threads.add(threading.current_thread().name)
+        errors.append((failed, str(e)))
+
+    loop_thread = threading.current_thread().name
+    run_checks_async(feed, on_result, on_error, concurrency=20)
+    assert sorted(results) == sorted(links[:-1])
+    assert errors == [(["bad"], "сбой")]
+    assert loop_thread not in feed.threads and loop_thread not in result_threads
+    # on_result вызывается последовательно, в одном потоке
+    assert len(result_threads) == 1
+    # Цикл событий не останавливался на 0.05 с обработки каждого результата
+    gaps = [b - a for a, b in zip(ticks, ticks[1:])]
+    assert max(gaps) < 0.045
+
+
+def _engine(**env):
+    code = "from lib import config; print(config.CHECK_ENGINE, config.ASYNC_ENGINE_FALLBACK)"
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=_ROOT, capture_output=True, text=True, check=True,
+        env={**os.environ, "CHECK_ENGINE": "async", "XRAY_DAEMON_MODE": "false", "XRAY_BATCH_SIZE": "1", **env},
+    )
+    return result.stdout.split()[-2:]
+
+
+def test_async_engine_falls_back_to_threads():
+    assert _engine() == ["async", "False"]
+    assert _engine(XRAY_DAEMON_MODE="true") == ["threads", "True"]
+    assert _engine(XRAY_BATCH_SIZE="5") == ["threads", "True"]
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Пакетный режим: несколько ключей через один xray, откат на проверку по одному."""
+
+import json
+
+import pytest
+
+from lib import checker
+from lib.checker import check_keys_batch
+
+_KEYS = [
+    f"vless://c19e580c-1ba9-4846-afdb-ac2847b1817{i}@10.0.0.{i}:443?security=none&type=tcp#k{i}"
+    for i in range(3)
+]
+
+
+class _Proc:
+    pid = 2 ** 22 + 12345
+    stderr = None
+
+    def poll(self):
+        return None
+
+
+@pytest.fixture
+def batch(monkeypatch):
+    """Запуски xray, проверки через порты и проверки по одному без настоящего xray."""
+    calls = {"configs": [], "released": [], "probed": {}, "single": []}
+    ports = [30001, 30002, 30003]
+    monkeypatch.setattr(checker, "take_ports", lambda count: ports[:count])
+
+    def run_xray(config, stderr_pipe=False):
+        calls["configs"].append(json.loads(config))
+        return _Proc()
+
+    def check_through_proxy(line, port, metrics, should_debug_flag, cache, deadline):
+        calls["probed"][line] = port
+        return (line, not line.endswith("#k1"), metrics)
+
+    def check_key_e2e(line, debug=False, cache=None):
+        calls["single"].append(line)
+        return (line, True, {})
+
+    monkeypatch.setattr(checker, "run_xray", run_xray)
+    monkeypatch.setattr(checker, "register", lambda proc, addresses: None)
+    monkeypatch.setattr(checker, "release", lambda proc, addresses: calls["released"].append(list(addresses)))
+    monkeypatch.setattr(checker, "wait_for_xray_ready", lambda proc, ports, timeout: (calls.get("ready", True), ""))
+    monkeypatch.setattr(checker, "_check_through_proxy", check_through_proxy)
+    monkeypatch.setattr(checker, "check_key_e2e", check_key_e2e)
+    return calls
+
+
+def test_one_xray_for_the_batch(batch):
+    results = check_keys_batch(_KEYS)
+    assert [(line, ok) for line, ok, _ in results] == [(_KEYS[0], True), (_KEYS[1], False), (_KEYS[2], True)]
+    # Один xray: ключ i - через свой inbound и свой outbound
+    assert len(batch["configs"]) == 1
+    config = batch["configs"][0]
+    assert [inbound["port"] for inbound in config["inbounds"]] == [30001, 30002, 30003]
+    assert [o["settings"]["vnext"][0]["address"] for o in config["outbounds"][:3]] == ["10.0.0.0", "10.0.0.1", "10.0.0.2"]
+    assert batch["probed"] == {_KEYS[0]: 30001, _KEYS[1]: 30002, _KEYS[2]: 30003}
+    assert batch["released"] == [[30001, 30002, 30003]] and batch["single"] == []
+
+
+def test_not_ready_falls_back_to_single_checks(batch):
+    batch["ready"] = False
+    results = check_keys_batch(_KEYS)
+    assert [ok for _, ok, _ in results] == [True, True, True]
+    assert batch["single"] == _KEYS and batch["probed"] == {}
+    # Порты пакета возвращены до проверки по одному
+    assert batch["released"] == [[30001, 30002, 30003]]
+
+
+def test_unparsable_keys_and_single_key(batch):
+    results = check_keys_batch(["not a key", _KEYS[0]])
+    # Неразобранный ключ - сразу нерабочий, один оставшийся проверяется без пакета
+    assert [(line, ok) for line, ok, _ in results] == [("not a key", False), (_KEYS[0], True)]
+    assert batch["configs"] == [] and batch["single"] == [_KEYS[0]]
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""AdaptiveLimiter (AIMD) и run_adaptive."""
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from lib import concurrency
+from lib.concurrency import AdaptiveLimiter, run_adaptive
+from lib.key_feed import KeyFeed
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемое время окна и ресурсы без давления (CPU задаётся clock.cpu)."""
+    clock = SimpleNamespace(now=0.0, cpu=0.1)
+    monkeypatch.setattr(concurrency, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    monkeypatch.setattr(AdaptiveLimiter, "_cpu_busy", lambda self: clock.cpu)
+    monkeypatch.setattr(concurrency, "_fd_usage", lambda: None)
+    monkeypatch.setattr(concurrency, "_memory_available", lambda: None)
+    return clock
+
+
+def _window(limiter: AdaptiveLimiter, clock, completed: int, timeouts: int = 0) -> None:
+    """Окно длиной interval: completed задач, из них timeouts - таймаутом (последняя закрывает окно)."""
+    for i in range(completed - 1):
+        limiter.record(i < timeouts)
+    clock.now += limiter.interval
+    limiter.record(completed - 1 < timeouts)
+
+
+def test_bounds(clock):
+    limiter = AdaptiveLimiter(500, minimum=4, maximum=100, interval=1)
+    assert (limiter.limit, limiter.minimum, limiter.maximum, limiter.step) == (100, 4, 100, 10)
+    assert AdaptiveLimiter(1, minimum=4, maximum=100).limit == 4
+
+
+def test_grows_only_on_throughput_gain(clock):
+    limiter = AdaptiveLimiter(20, minimum=2, maximum=100, interval=1)
+    # Первое окно - рост
+    _window(limiter, clock, 50)
+    assert limiter.limit == 22
+    # Плато (+2%) - лимит не растёт
+    _window(limiter, clock, 51)
+    assert limiter.limit == 22
+    # Рост пропускной способности на 5% и больше - рост лимита
+    _window(limiter, clock, 54)
+    assert limiter.limit == 24
+    assert limiter.decisions == ["параллельность 20 -> 22: пропускная способность 50.0/с",
+                                 "параллельность 22 -> 24: пропускная способность 54.0/с"]
+
+
+def test_decreases_under_cpu_pressure(clock):
+    limiter = AdaptiveLimiter(20, minimum=10, maximum=100, interval=1)
+    clock.cpu = 0.99
+    _window(limiter, clock, 50)
+    assert limiter.limit == 14
+    _window(limiter, clock, 50)
+    assert limiter.limit == 10
+    assert "CPU загружен на 99%" in limiter.decisions[0]
+    assert (limiter.lowest, limiter.highest) == (10, 20)
+
+
+def test_timeout_spike_against_baseline(clock, monkeypatch):
+    monkeypatch.setattr(concurrency, "ADAPTIVE_TIMEOUT_SPIKE", 0.2)
+    limiter = AdaptiveLimiter(20, minimum=2, maximum=100, interval=1)
+    # Обычная доля таймаутов (мёртвые ключи) - не давление
+    _window(limiter, clock, 50, timeouts=10)
+    _window(limiter, clock, 50, timeouts=10)
+    assert limiter.limit == 22
+    # Всплеск таймаутов относительно обычной доли - сокращение
+    _window(limiter, clock, 50, timeouts=30)
+    assert limiter.limit == 15
+    assert "всплеск таймаутов" in limiter.decisions[-1]
+
+
+def test_run_adaptive_respects_workers_and_batches():
+    running = 0
+    peak = 0
+    lock = threading.Lock()
+    done = []
+
+    def work(item):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        threading.Event().wait(0.01)
+        with lock:
+            running -= 1
+        return item
+
+    def on_done(item, future):
+        done.append(future.result())
+        return False
+
+    run_adaptive(work, [f"k{i}" for i in range(20)], on_done, workers=3)
+    assert sorted(done) == sorted(f"k{i}" for i in range(20))
+    assert 1 <= peak <= 3
+
+    done.clear()
+    run_adaptive(work, [f"k{i}" for i in range(5)], on_done, workers=2, batch=2)
+    assert sorted(done) == [["k0", "k1"], ["k2", "k3"], ["k4"]]
+
+
+def test_run_adaptive_feed_and_limiter(clock):
+    feed = KeyFeed(["a", "b"])
+    feed.hold()
+    limiter = AdaptiveLimiter(2, minimum=1, maximum=4, interval=3600)
+    recorded = []
+    limiter.record = recorded.append
+
+    def on_done(item, future):
+        # Ключ, появившийся по результату задачи, попадает в тот же пул
+        if item == "a":
+            feed.put(["c"])
+            feed.release()
+        return item == "b"
+
+    seen = []
+    run_adaptive(lambda item: seen.append(item), feed, on_done, limiter)
+    assert sorted(seen) == ["a", "b", "c"]
+    assert sorted(recorded) == [False, False, True]
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Передача конфига xray без временных файлов: stdin и memfd, напрямую и через spawn-сервер."""
+
+import json
+import os
+import socket
+import sys
+
+import pytest
+
+from lib import config, xray_manager
+from lib.spawn_server import SpawnClient
+from lib.xray_manager import run_xray
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="поддельный xray - скрипт POSIX")
+
+# Поддельный xray: сохраняет аргументы и прочитанный конфиг ("-config stdin:" или путь)
+_FAKE_XRAY = '''#!{python}
+import json, sys
+source = sys.argv[3]
+data = sys.stdin.buffer.read() if source == "stdin:" else open(source, "rb").read()
+with open({out!r}, "w", encoding="utf-8") as f:
+    json.dump({{"argv": sys.argv[1:], "config": data.decode("utf-8")}}, f)
+'''
+
+# Больше буфера pipe (64 КБ): запись в stdin не должна зависать; не ASCII - конфиг передаётся в UTF-8
+_CONFIG = {"log": {"loglevel": "error"}, "remarks": "ключ", "padding": "x" * 200_000}
+
+
+@pytest.fixture(params=["stdin", "memfd"])
+def delivery(request, monkeypatch):
+    if request.param == "memfd" and not hasattr(os, "memfd_create"):
+        pytest.skip("нужен memfd")
+    monkeypatch.setattr(xray_manager, "XRAY_CONFIG_DELIVERY", request.param)
+    return request.param
+
+
+@pytest.fixture(params=["direct", "spawn-server"])
+def launcher(request, monkeypatch):
+    client = None
+    if request.param == "spawn-server":
+        if not hasattr(os, "posix_spawnp") or not hasattr(socket, "send_fds"):
+            pytest.skip("spawn-сервер только для POSIX")
+        client = SpawnClient(dict(os.environ))
+    monkeypatch.setattr(xray_manager, "spawn_client", lambda: client)
+    yield request.param
+    if client is not None:
+        client.close()
+
+
+@pytest.fixture
+def fake_xray(tmp_path, monkeypatch):
+    out = tmp_path / "received.json"
+    script = tmp_path / "xray"
+    script.write_text(_FAKE_XRAY.format(python=sys.executable, out=str(out)))
+    script.chmod(0o755)
+    monkeypatch.setattr(config, "XRAY_CMD", str(script))
+    return out
+
+
+def test_config_reaches_xray(fake_xray, delivery, launcher):
+    proc = run_xray(_CONFIG)
+    assert proc.wait(timeout=10) == 0
+    received = json.loads(fake_xray.read_text(encoding="utf-8"))
+    assert json.loads(received["config"]) == _CONFIG
+    source = received["argv"][2]
+    if delivery == "stdin":
+        assert received["argv"] == ["run", "-config", "stdin:"]
+    else:
+        # Конфиг читается из анонимного файла в памяти, а не из файла на диске
+        assert source.startswith("/proc/self/fd/")
+
+
+def test_prerendered_json(fake_xray, delivery, launcher):
+    # Готовый JSON шаблонов (xray_templates) передаётся как есть
+    text = json.dumps(_CONFIG, ensure_ascii=False)
+    proc = run_xray(text)
+    assert proc.wait(timeout=10) == 0
+    assert json.loads(fake_xray.read_text(encoding="utf-8"))["config"] == text
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Deadline: бюджет времени на проверку ключа (KEY_DEADLINE)."""
+
+from types import SimpleNamespace
+
+import pytest
+
+from lib import checker, deadline
+from lib.deadline import Deadline
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr(deadline, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+@pytest.mark.parametrize("budget", [None, 0, -1])
+def test_unlimited(clock, budget):
+    limit = Deadline(budget)
+    clock.now += 1e6
+    assert limit.remaining() == float("inf")
+    assert not limit.expired()
+    assert limit.clamp((5, 10)) == (5, 10)
+    assert limit.sleep_time(3) == 3
+
+
+def test_budget(clock):
+    limit = Deadline(10)
+    clock.now += 4
+    assert limit.remaining() == 6
+    assert limit.clamp(8) == 6
+    assert limit.clamp((5, 10)) == (5, 6)
+    assert limit.sleep_time(2) == 2
+    clock.now += 5.9
+    # Остатка не хватает даже на короткий запрос
+    assert limit.expired()
+    clock.now += 1
+    assert limit.remaining() == 0
+    assert limit.sleep_time(2) == 0
+
+
+def test_hysteria_timeout_clamped(clock, monkeypatch):
+    monkeypatch.setattr(checker, "USE_ADAPTIVE_TIMEOUT", False)
+    monkeypatch.setattr(checker, "CONNECT_TIMEOUT", 5)
+    assert checker._hysteria_timeout(None) == 5.0
+    assert checker._hysteria_timeout(Deadline(None)) == 5.0
+    limit = Deadline(10)
+    clock.now += 8
+    assert checker._hysteria_timeout(limit) == 2
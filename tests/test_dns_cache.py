@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""dns_cache: разрешение имён, NXDOMAIN, файл кэша и подстановка IP в outbound xray."""
+
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from lib import dns_cache
+from lib.dns_cache import cached_address, is_nxdomain, pinned_address, resolve_hosts
+from lib.xray_manager import build_outbound
+
+
+@pytest.fixture
+def resolver(tmp_path, monkeypatch):
+    """Подменный getaddrinfo: host -> IP, отсутствующие имена - NXDOMAIN."""
+    cache_file = tmp_path / "dns.json"
+    monkeypatch.setattr(dns_cache, "_entries", {})
+    monkeypatch.setattr(dns_cache, "DNS_CACHE_FILE", str(cache_file))
+    monkeypatch.setattr(dns_cache, "DNS_CONCURRENCY", 4)
+    monkeypatch.setattr(dns_cache, "DNS_TIMEOUT", 2.0)
+    records = {}
+    calls = []
+    delay = {"value": 0.0}
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        calls.append(host)
+        time.sleep(delay["value"])
+        if host not in records:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (records[host], 0))]
+
+    monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+    return {"records": records, "calls": calls, "delay": delay, "file": cache_file}
+
+
+def test_resolve_and_nxdomain(resolver):
+    resolver["records"]["a.example.com"] = "10.0.0.1"
+    resolve_hosts(["a.example.com", "missing.example.com", "1.2.3.4", "a.example.com"])
+    # IP-адреса не разрешаются, повторы - один раз
+    assert sorted(resolver["calls"]) == ["a.example.com", "missing.example.com"]
+    assert cached_address("a.example.com") == "10.0.0.1"
+    assert cached_address("missing.example.com") == "missing.example.com"
+    assert is_nxdomain("missing.example.com") and not is_nxdomain("a.example.com")
+    # Второй прогон берёт всё из кэша
+    resolve_hosts(["a.example.com", "missing.example.com"])
+    assert len(resolver["calls"]) == 2
+
+
+def test_cache_file_written_atomically_and_reloaded(resolver, monkeypatch):
+    resolver["records"]["a.example.com"] = "10.0.0.1"
+    resolve_hosts(["a.example.com"])
+    data = json.loads(resolver["file"].read_text(encoding="utf-8"))
+    assert data["a.example.com"]["ips"] == ["10.0.0.1"]
+    # Временных файлов рядом не осталось
+    assert [p.name for p in resolver["file"].parent.iterdir()] == ["dns.json"]
+
+    # Новый прогон: запись берётся с диска без обращения к резолверу
+    monkeypatch.setattr(dns_cache, "_entries", {})
+    resolve_hosts(["a.example.com"])
+    assert resolver["calls"] == ["a.example.com"]
+    assert cached_address("a.example.com") == "10.0.0.1"
+
+
+def test_expired_entries_resolved_again(resolver, monkeypatch):
+    resolver["records"]["a.example.com"] = "10.0.0.1"
+    monkeypatch.setattr(dns_cache, "_entries", {"a.example.com": {"ips": ["10.9.9.9"], "timestamp": time.time() - 10}})
+    monkeypatch.setattr(dns_cache, "DNS_CACHE_TTL", 5)
+    resolve_hosts(["a.example.com"])
+    assert cached_address("a.example.com") == "10.0.0.1"
+
+
+def test_queue_time_not_counted_in_timeout(resolver, monkeypatch):
+    # 8 имён по 0.2 с при 2 потоках: последние ждут в очереди дольше DNS_TIMEOUT, но успевают
+    monkeypatch.setattr(dns_cache, "DNS_CONCURRENCY", 2)
+    monkeypatch.setattr(dns_cache, "DNS_TIMEOUT", 0.5)
+    resolver["delay"]["value"] = 0.2
+    hosts = [f"h{i}.example.com" for i in range(8)]
+    for i, host in enumerate(hosts):
+        resolver["records"][host] = f"10.0.0.{i}"
+    resolve_hosts(hosts)
+    assert [cached_address(host) for host in hosts] == [f"10.0.0.{i}" for i in range(8)]
+
+
+def test_concurrency_bounded(resolver, monkeypatch):
+    monkeypatch.setattr(dns_cache, "DNS_CONCURRENCY", 3)
+    active = {"now": 0, "max": 0}
+    lock = threading.Lock()
+    real = socket.getaddrinfo
+
+    def counting(host, port, *args, **kwargs):
+        with lock:
+            active["now"] += 1
+            active["max"] = max(active["max"], active["now"])
+        try:
+            time.sleep(0.05)
+            return real(host, port, *args, **kwargs)
+        finally:
+            with lock:
+                active["now"] -= 1
+
+    monkeypatch.setattr(socket, "getaddrinfo", counting)
+    resolve_hosts([f"h{i}.example.com" for i in range(10)])
+    assert active["max"] <= 3
+
+
+def test_pinned_address_keeps_sni_and_host(monkeypatch):
+    monkeypatch.setattr(dns_cache, "_entries", {"srv.example.com": {"ips": ["10.0.0.7"], "timestamp": time.time()}})
+    parsed = {"protocol": "vless", "address": "srv.example.com", "port": 443, "uuid": "u", "security": "tls", "serverName": "", "network": "ws", "wsHost": ""}
+    pinned = pinned_address(parsed)
+    assert pinned["address"] == "10.0.0.7"
+    outbound = build_outbound(pinned)
+    assert outbound["settings"]["vnext"][0]["address"] == "10.0.0.7"
+    assert outbound["streamSettings"]["tlsSettings"]["serverName"] == "srv.example.com"
+    assert outbound["streamSettings"]["wsSettings"]["headers"]["Host"] == "srv.example.com"
+    # Исходный ключ не меняется; заданные SNI и Host не перезаписываются
+    assert parsed["address"] == "srv.example.com"
+    explicit = pinned_address(dict(parsed, serverName="sni.example.com", wsHost="cdn.example.com"))
+    assert (explicit["serverName"], explicit["wsHost"]) == ("sni.example.com", "cdn.example.com")
+
+
+def test_pinned_address_vmess_tls(monkeypatch):
+    monkeypatch.setattr(dns_cache, "_entries", {"vm.example.com": {"ips": ["10.0.0.8"], "timestamp": time.time()}})
+    pinned = pinned_address({"protocol": "vmess", "address": "vm.example.com", "security": "auto", "tls": "tls", "serverName": "", "network": "tcp"})
+    assert (pinned["address"], pinned["serverName"]) == ("10.0.0.8", "vm.example.com")
+
+
+@pytest.mark.parametrize("parsed", [
+    {"protocol": "vless", "address": "srv.example.com", "security": "tls", "network": "grpc"},
+    {"protocol": "vless", "address": "srv.example.com", "security": "none", "network": "xhttp"},
+    {"protocol": "hysteria2", "address": "srv.example.com", "network": "tcp"},
+    {"protocol": "vless", "address": "other.example.com", "security": "tls", "network": "tcp"},
+    {"protocol": "vless", "address": "1.2.3.4", "security": "none", "network": "tcp"},
+])
+def test_pinned_address_unchanged(parsed, monkeypatch):
+    monkeypatch.setattr(dns_cache, "_entries", {"srv.example.com": {"ips": ["10.0.0.7"], "timestamp": time.time()}})
+    assert pinned_address(parsed) is parsed
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""grouping: группы ключей по серверу, split_siblings и потоковый SiblingDispatcher."""
+
+import queue
+
+import pytest
+
+from lib import grouping
+from lib.grouping import SiblingDispatcher, group_by_endpoint, split_siblings
+from lib.key_feed import KeyFeed
+
+_UUID = "c19e580c-1ba9-4846-afdb-ac2847b18177"
+
+
+def _key(host: str, name: str, port: int = 443, network: str = "tcp") -> str:
+    return f"vless://{_UUID}@{host}:{port}?security=tls&sni=a.com&type={network}#{name}"
+
+
+_ALIVE = [_key("10.0.0.1", f"a{i}") for i in range(3)]
+_DEAD = [_key("10.0.0.2", f"d{i}") for i in range(3)]
+_UDP = [_key("10.0.0.3", f"u{i}", network="kcp") for i in range(2)]
+
+
+@pytest.fixture
+def probes(monkeypatch):
+    """Заглушка TCP-проверки: жив только 10.0.0.1; список проверенных наборов адресов."""
+    calls = []
+
+    def probe(endpoints):
+        calls.append(list(endpoints))
+        return {endpoint: endpoint[0] == "10.0.0.1" for endpoint in endpoints}
+
+    monkeypatch.setattr(grouping, "probe_tcp_endpoints", probe)
+    return calls
+
+
+def test_group_by_endpoint():
+    other_port = _key("10.0.0.1", "p", port=8443)
+    representatives, siblings = group_by_endpoint([_ALIVE[0], _DEAD[0], _ALIVE[1], "garbage", other_port, _ALIVE[2], "garbage"])
+    # Неразобранные ключи - сами себе представители; другой порт - другая группа
+    assert representatives == [_ALIVE[0], _DEAD[0], "garbage", other_port, "garbage"]
+    assert siblings == {_ALIVE[0]: _ALIVE[1:]}
+
+
+def test_split_siblings(probes):
+    _, siblings = group_by_endpoint(_ALIVE + _DEAD + _UDP)
+    to_check, dead = split_siblings({_ALIVE[0]: False, _DEAD[0]: False, _UDP[0]: False}, siblings)
+    # Сервер жив или UDP-транспорт (не проверяется по TCP) - ключи проверяются как обычно
+    assert sorted(to_check) == sorted(_ALIVE[1:] + _UDP[1:])
+    assert sorted(dead) == sorted(_DEAD[1:])
+    assert all(metrics["prefiltered"] for metrics in dead.values())
+    assert probes == [[("10.0.0.1", 443), ("10.0.0.2", 443)]]
+
+
+def test_split_siblings_passed_representative_skips_probe(probes):
+    _, siblings = group_by_endpoint(_DEAD)
+    assert split_siblings({_DEAD[0]: True}, siblings) == (_DEAD[1:], {})
+    assert probes == [[]]
+
+
+def _take_all(feed: KeyFeed) -> list[str]:
+    links = []
+    while True:
+        try:
+            link = feed.get(timeout=0)
+        except queue.Empty:
+            return links
+        if link is None:
+            return links
+        links.append(link)
+
+
+def test_dispatcher_releases_siblings_by_verdict(probes):
+    feed = KeyFeed()
+    dead = {}
+    dispatcher = SiblingDispatcher(feed, dead.update)
+    dispatcher.add(_ALIVE + _DEAD + ["garbage"])
+    assert _take_all(feed) == [_ALIVE[0], _DEAD[0], "garbage"]
+
+    # Прошёл - ключи группы сразу в начало источника, без TCP-проверки
+    feed.put(["later"])
+    dispatcher.verdict(_ALIVE[0], True)
+    assert _take_all(feed) == _ALIVE[1:] + ["later"]
+    # Вердикт не представителя ничего не меняет
+    dispatcher.verdict(_ALIVE[1], False)
+
+    # Не прошёл, сервер мёртв - ключи группы в on_dead, источник исчерпан после фоновой проверки
+    dispatcher.verdict(_DEAD[0], False)
+    assert feed.get(timeout=5) is None
+    dispatcher.close()
+    assert sorted(dead) == sorted(_DEAD[1:])
+    assert probes == [[("10.0.0.2", 443)]]
+
+
+def test_dispatcher_failed_representative_of_alive_server(probes):
+    feed = KeyFeed()
+    dispatcher = SiblingDispatcher(feed, lambda dead: pytest.fail("сервер жив"))
+    dispatcher.add(_ALIVE)
+    assert feed.get(timeout=0) == _ALIVE[0]
+    dispatcher.verdict(_ALIVE[0], False)
+    assert feed.get_many(10, timeout=5) == _ALIVE[1:]
+    assert feed.get(timeout=0) is None
+    dispatcher.close()
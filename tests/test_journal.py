@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""CheckpointJournal: отпечаток списка и продолжение прогона после обрыва."""
+
+import json
+
+from lib.journal import CheckpointJournal, list_fingerprint
+
+_LINKS = ["vless://a", "vless://b", "vless://c"]
+
+
+def test_fingerprint_ignores_order_and_duplicates():
+    assert list_fingerprint(_LINKS) == list_fingerprint(reversed(_LINKS + ["vless://a"]))
+    assert list_fingerprint(_LINKS) != list_fingerprint(_LINKS[:2])
+
+
+def test_resume_same_list(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = CheckpointJournal(list_fingerprint(_LINKS), path=path, flush_every=100, flush_interval=3600)
+    assert journal.load() == {}
+    journal.add("vless://a", True, {"response_times": [0.2]})
+    journal.add("vless://b", False, None)
+    # Обрыв без close(): на диске только то, что сброшено
+    journal.flush()
+    journal._file.write('{"key": "vless://c", "ok"')
+    journal._file.flush()
+
+    resumed = CheckpointJournal(list_fingerprint(list(reversed(_LINKS))), path=path)
+    # Недописанная последняя строка пропускается
+    assert resumed.load() == {"vless://a": (True, {"response_times": [0.2]}), "vless://b": (False, None)}
+    resumed.add("vless://c", True, None)
+    resumed.close()
+    assert CheckpointJournal(list_fingerprint(_LINKS), path=path).load()["vless://c"] == (True, None)
+
+
+def test_other_list_starts_new_journal(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = CheckpointJournal(list_fingerprint(_LINKS), path=str(path), flush_every=1)
+    journal.load()
+    journal.add("vless://a", True, None)
+    journal.close()
+
+    other = CheckpointJournal(list_fingerprint(_LINKS[:2]), path=str(path))
+    assert other.load() == {}
+    other.close()
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 1 and json.loads(lines[0])["fingerprint"] == list_fingerprint(_LINKS[:2])
+
+
+def test_flush_batches_and_completed_close(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = CheckpointJournal("fp", path=str(path), flush_every=2, flush_interval=3600)
+    journal.load()
+    journal.add("vless://a", True, None)
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 1
+    journal.add("vless://b", True, None)
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 3
+    journal.close(completed=True)
+    assert not path.exists()
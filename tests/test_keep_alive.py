@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Keep-alive сессии запросов через SOCKS-порт xray: ProbeSession и сессии requests по потокам."""
+
+import threading
+
+from lib.probe import ProbeSession
+from lib.utils import _RequestsSocksSession
+
+
+def test_probe_session_reuses_connection(socks_stub):
+    stub = socks_stub()
+    session = ProbeSession(stub.port)
+    try:
+        results = [session.request("http://example.com/generate_204", 5) for _ in range(3)]
+        assert [response.status_code for response, _, _ in results] == [204] * 3
+        assert [response.reused for response, _, _ in results] == [False, True, True]
+        assert stub.connections == 1
+        # Другой хост - своё соединение
+        response, _, _ = session.request("http://other.example.com/", 5)
+        assert not response.reused and stub.connections == 2
+    finally:
+        session.close()
+
+
+def test_probe_session_without_keep_alive(socks_stub):
+    stub = socks_stub()
+    session = ProbeSession(stub.port, keep_alive=False)
+    for _ in range(2):
+        response, _, error = session.request("http://example.com/", 5)
+        assert error is None and not response.reused
+    assert stub.connections == 2
+    assert all(b"Connection: close" in request for request in stub.requests)
+
+
+def test_probe_session_reopens_dropped_connection(socks_stub):
+    stub = socks_stub()
+    session = ProbeSession(stub.port)
+    try:
+        session.request("http://example.com/", 5)
+        # Сервер закрыл простаивающее соединение - запрос повторяется по новому
+        stub.drop_idle()
+        response, _, error = session.request("http://example.com/", 5)
+        assert error is None and response.status_code == 204 and not response.reused
+        assert stub.connections == 2
+    finally:
+        session.close()
+
+
+def test_requests_session_per_thread(socks_stub):
+    stub = socks_stub()
+    session = _RequestsSocksSession(stub.port)
+    flags: dict[str, list[bool]] = {}
+
+    def run(name: str) -> None:
+        for _ in range(2):
+            response, _, error = session.request("http://example.com/generate_204", 5)
+            assert error is None
+            flags.setdefault(name, []).append(response.reused)
+
+    threads = [threading.Thread(target=run, args=(f"t{i}",)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # У каждого потока своя requests.Session: своё соединение, повторный запрос потока - тёплый
+    assert flags == {f"t{i}": [False, True] for i in range(3)}
+    assert len(session._sessions) == 3
+    assert stub.connections == 3
+    session.close()
+    assert session._sessions == []
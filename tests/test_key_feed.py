@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""KeyFeed: порядок ключей, hold/release и пополнение из общей очереди."""
+
+import queue
+import threading
+
+import pytest
+
+from lib.key_feed import KeyFeed
+
+
+def test_put_front_and_get_many():
+    feed = KeyFeed(["a", "b"])
+    feed.put(["c"])
+    feed.put(["x", "y"], front=True)
+    assert feed.pending() == 5
+    assert feed.get_many(3) == ["x", "y", "a"]
+    assert feed.get_many(10) == ["b", "c"]
+    assert feed.get() is None
+
+
+def test_hold_keeps_feed_open():
+    feed = KeyFeed()
+    feed.hold()
+    with pytest.raises(queue.Empty):
+        feed.get(timeout=0.01)
+
+    def later():
+        feed.put(["late"])
+        feed.release()
+
+    timer = threading.Timer(0.05, later)
+    timer.start()
+    assert feed.get(timeout=5) == "late"
+    assert feed.get(timeout=0) is None
+    timer.join()
+
+
+def test_drain():
+    feed = KeyFeed(["a", "b"])
+    assert feed.drain() == ["a", "b"]
+    assert feed.get(timeout=0) is None
+
+
+def test_refill_until_exhausted():
+    batches = [["a", "b"], False, ["c"]]
+    calls = []
+
+    def refill():
+        calls.append(1)
+        if not batches:
+            return None
+        batch = batches.pop(0)
+        if batch is False:
+            # Ключей пока нет (аренды других процессов) - повторить через refill_interval
+            return False
+        feed.put(batch)
+        return True
+
+    feed = KeyFeed(refill=refill, refill_interval=0.01)
+    assert feed.get_many(5) == ["a", "b"]
+    assert feed.get(timeout=5) == "c"
+    assert feed.get() is None
+    assert len(calls) == 4
+    # Исчерпанный источник больше не пополняется
+    assert feed.get(timeout=0) is None
+    assert len(calls) == 4
+
+
+def test_refill_not_due_raises_empty():
+    feed = KeyFeed(refill=lambda: False, refill_interval=60)
+    with pytest.raises(queue.Empty):
+        feed.get(timeout=0)
+    with pytest.raises(queue.Empty):
+        feed.get(timeout=0.01)
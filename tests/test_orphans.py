@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""orphans: метка владельца xray и поиск осиротевших процессов по /proc."""
+
+import os
+import signal
+
+import pytest
+
+from lib import orphans
+from lib.orphans import XRAY_OWNER_ENV, owner_token, process_start_time, sweep_orphans
+
+
+def _stat(pid: int, start: int) -> bytes:
+    # Имя с пробелом и скобкой; время старта - поле 22
+    fields = ["S", "1"] + ["0"] * 17 + [str(start)] + ["0"] * 20
+    return f"{pid} (xr ay) {' '.join(fields)}".encode()
+
+
+@pytest.fixture
+def fake_proc(tmp_path, monkeypatch):
+    """
+    Поддельный /proc: add(pid, start, owner) - процесс со временем старта и меткой владельца в окружении.
+    Завершённые sweep_orphans процессы (группы) - в killed.
+    """
+    root = tmp_path / "proc"
+    root.mkdir()
+    killed = []
+
+    def add(pid: int, start: int, owner: str | None = None) -> None:
+        (root / str(pid)).mkdir()
+        (root / str(pid) / "stat").write_bytes(_stat(pid, start))
+        environ = [b"PATH=/usr/bin"]
+        if owner is not None:
+            environ.append(f"{XRAY_OWNER_ENV}={owner}".encode())
+        (root / str(pid) / "environ").write_bytes(b"\0".join(environ) + b"\0")
+
+    real_open = open
+    real_listdir = os.listdir
+
+    def fake_open(path, *args, **kwargs):
+        if str(path).startswith("/proc/"):
+            path = root / str(path)[len("/proc/"):]
+        return real_open(path, *args, **kwargs)
+
+    monkeypatch.setattr("builtins.open", fake_open)
+    monkeypatch.setattr(os, "listdir", lambda path: real_listdir(root) if path == "/proc" else real_listdir(path))
+    monkeypatch.setattr(os, "killpg", lambda pid, sig: killed.append((pid, sig)))
+    add.killed = killed
+    return add
+
+
+def test_start_time_and_token(fake_proc):
+    fake_proc(500, 12345)
+    assert process_start_time(500) == "12345"
+    assert owner_token(500) == "500:12345"
+    assert process_start_time(501) is None
+    assert owner_token(501) == "501:"
+
+
+def test_owner_alive(fake_proc):
+    fake_proc(500, 12345)
+    assert orphans._owner_alive("500:12345")
+    # Тот же pid, но другой процесс (время старта не совпало) - владельца нет
+    assert not orphans._owner_alive("500:999")
+    assert not orphans._owner_alive("501:12345")
+    # Метка без времени старта (не Linux у владельца) - проверяется только pid
+    assert orphans._owner_alive("500:")
+    # Непонятная метка - процесс не трогаем
+    assert orphans._owner_alive("garbage")
+
+
+def test_sweep_kills_only_orphans(fake_proc, monkeypatch):
+    monkeypatch.setattr(os, "getpid", lambda: 100)
+    monkeypatch.setattr(os, "getppid", lambda: 1)
+    fake_proc(100, 10, owner="1:1")    # сам процесс проверки
+    fake_proc(200, 20)                 # владелец, живой прогон
+    fake_proc(201, 21, owner="200:20")  # xray живого прогона
+    fake_proc(202, 22, owner="300:30")  # владелец завершился
+    fake_proc(203, 23, owner="200:19")  # pid владельца занят другим процессом
+    fake_proc(204, 24)                 # не xray проверки
+    assert sweep_orphans() == 2
+    assert sorted(fake_proc.killed) == [(202, signal.SIGKILL), (203, signal.SIGKILL)]
+
+
+def test_sweep_nothing_to_do(fake_proc):
+    fake_proc(200, 20)
+    assert sweep_orphans() == 0 and fake_proc.killed == []
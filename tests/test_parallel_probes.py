@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""Параллельные URL проверки: ранняя остановка прохода и прерывание идущих запросов."""
+
+import socket
+import threading
+import time
+
+import pytest
+
+from lib import checker
+from lib.probe import ProbeSession
+
+_URLS = [("http://a/", "http"), ("https://b/", "https"), ("https://c/", "https")]
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    def apply(strict=False, require_all=False, minimum=1, https=False):
+        monkeypatch.setattr(checker, "STRICT_MODE", strict)
+        monkeypatch.setattr(checker, "STRICT_MODE_REQUIRE_ALL", require_all)
+        monkeypatch.setattr(checker, "MIN_SUCCESSFUL_URLS", minimum)
+        monkeypatch.setattr(checker, "REQUIRE_HTTPS", https)
+
+    return apply
+
+
+def test_pass_impossible_require_all(settings):
+    settings(strict=True, require_all=True)
+    assert not checker._pass_impossible(_URLS, {0: {"ok": True}})
+    # Строгий режим "все URL": первый неуспешный URL решает проход
+    assert checker._pass_impossible(_URLS, {2: {"ok": False}})
+
+
+def test_pass_impossible_min_successful(settings):
+    settings(minimum=2)
+    assert not checker._pass_impossible(_URLS, {0: {"ok": False}})
+    assert checker._pass_impossible(_URLS, {0: {"ok": False}, 1: {"ok": False}})
+
+
+def test_pass_impossible_require_https(settings):
+    settings(https=True)
+    assert not checker._pass_impossible(_URLS, {1: {"ok": False}})
+    assert checker._pass_impossible(_URLS, {1: {"ok": False}, 2: {"ok": False}})
+
+
+@pytest.fixture
+def silent_server():
+    """TCP-сервер, который принимает соединения и ничего не отвечает (зависший SOCKS)."""
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    accepted = []
+    stop = threading.Event()
+
+    def serve():
+        server.settimeout(0.1)
+        while not stop.is_set():
+            try:
+                accepted.append(server.accept()[0])
+            except OSError:
+                pass
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield server.getsockname()[1]
+    stop.set()
+    thread.join()
+    server.close()
+    for sock in accepted:
+        sock.close()
+
+
+def test_abort_active_interrupts_blocked_request(silent_server):
+    session = ProbeSession(silent_server, keep_alive=False)
+    result = {}
+
+    def run():
+        result["value"] = session.request("http://example.com/", (5, 10))
+
+    thread = threading.Thread(target=run)
+    start = time.monotonic()
+    thread.start()
+    time.sleep(0.3)
+    session.abort_active()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert time.monotonic() - start < 3
+    response, _, error = result["value"]
+    assert response is None and error is not None
+    session.close()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""port_pool: динамические порты, карантин и проверка bind вне блокировки пула."""
+
+import socket
+
+import pytest
+
+from lib import port_pool
+from lib.port_pool import _DynamicPorts
+
+
+@pytest.fixture
+def listening():
+    """Порт, который слушает "другой процесс"."""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen()
+    yield sock.getsockname()[1]
+    sock.close()
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    def make(start: int, end: int, quarantine: float = 0.0) -> _DynamicPorts:
+        allocator = _DynamicPorts(start, end, quarantine)
+        monkeypatch.setattr(port_pool, "_tcp", allocator)
+        monkeypatch.setattr(port_pool, "_unix", None)
+        return allocator
+
+    return make
+
+
+def test_take_round_robin_and_quarantine():
+    ports = _DynamicPorts(40000, 40004, quarantine=60)
+    assert ports.take(2) == [40000, 40001]
+    assert ports.take(3) is None
+    ports.give_back([40000])
+    # На карантине порт не выдаётся, пока диапазон не пройден
+    assert ports.take(2) == [40002, 40003]
+    assert ports.take(1) is None
+    ports.cancel([40003])
+    assert ports.take(1) == [40003]
+
+
+def test_busy_port_set_aside_outside_lock(pool, listening, monkeypatch):
+    allocator = pool(listening, listening + 2)
+    checked = []
+    real_free = port_pool._port_free
+
+    def port_free(port):
+        # bind проверяется без блокировки пула: остальные потоки в это время берут и возвращают адреса
+        assert not port_pool._port_lock.locked()
+        checked.append(port)
+        return real_free(port)
+
+    monkeypatch.setattr(port_pool, "_port_free", port_free)
+    address = port_pool.take_port(tcp=True, wait=1)
+    assert address == listening + 1
+    assert checked == [listening, listening + 1]
+    assert listening in allocator._quarantined
+    port_pool.return_port(address)
+
+
+def test_take_ports_all_or_nothing(pool, listening):
+    pool(listening, listening + 2)
+    # Один из двух портов слушает другой процесс - пары нет
+    assert port_pool.take_ports(2, tcp=True, wait=0.2) is None
+    assert port_pool.take_ports(3, tcp=True, wait=5) is None
+
+
+def test_port_in_time_wait_is_free():
+    # Прошлый xray закрыл соединение первым: его порт в TIME_WAIT, но новый xray его слушать может.
+    # Слушающий сокет - как у xray (Go ставит SO_REUSEADDR)
+    server = socket.socket()
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    port = server.getsockname()[1]
+    client = socket.create_connection(("127.0.0.1", port))
+    conn, _ = server.accept()
+    conn.close()
+    client.recv(1)
+    client.close()
+    server.close()
+    assert port_pool._port_free(port)
+
+
+def test_listening_port_is_busy(listening):
+    assert not port_pool._port_free(listening)
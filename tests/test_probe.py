@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""probe: SOCKS5-рукопожатие, ошибки прокси, таймауты и фазы холодного/тёплого запроса."""
+
+import asyncio
+import socket
+import time
+
+import pytest
+
+from lib.checker import _record_response
+from lib.probe import AsyncProbeSession, ProbeError, ProbeSession, ProbeTimeout
+
+
+def _sync_request(port, url, timeout):
+    return ProbeSession(port, keep_alive=False).request(url, timeout)
+
+
+def _async_request(port, url, timeout):
+    return asyncio.run(AsyncProbeSession(port, keep_alive=False).request(url, timeout))
+
+
+@pytest.fixture(params=["sync", "async"])
+def request_via(request):
+    """Запрос встроенным клиентом: блокирующим и asyncio."""
+    return _sync_request if request.param == "sync" else _async_request
+
+
+def test_success(socks_stub, request_via):
+    stub = socks_stub()
+    response, elapsed, error = request_via(stub.port, "http://example.com:8080/generate_204?x=1", 5)
+    assert error is None
+    assert response.status_code == 204 and response.content == b"" and not response.reused
+    # Все фазы холодного запроса по порядку
+    timings = response.timings
+    assert list(timings) == ["connect", "socks", "first_byte", "total"]
+    assert timings["connect"] <= timings["socks"] <= timings["first_byte"] <= timings["total"] == elapsed
+    assert stub.requests[0].startswith(b"GET /generate_204?x=1 HTTP/1.1\r\nHost: example.com:8080\r\n")
+
+
+@pytest.mark.parametrize("code, message", [(5, "connection refused"), (2, "connection not allowed"), (42, "ошибка 42")])
+def test_connect_reply_error(socks_stub, request_via, code, message):
+    stub = socks_stub("error", code)
+    response, _, error = request_via(stub.port, "http://example.com/", 5)
+    assert response is None
+    assert isinstance(error, ProbeError) and message in str(error)
+
+
+def test_method_rejected(socks_stub, request_via):
+    stub = socks_stub("auth")
+    response, _, error = request_via(stub.port, "http://example.com/", 5)
+    assert response is None
+    assert isinstance(error, ProbeError) and "аутентификации" in str(error)
+
+
+def test_truncated_reply(socks_stub, request_via):
+    stub = socks_stub("truncated")
+    response, _, error = request_via(stub.port, "http://example.com/", 5)
+    assert response is None
+    assert isinstance(error, ConnectionAbortedError) and "фаза socks" in str(error)
+
+
+def test_timeout(socks_stub, request_via):
+    stub = socks_stub("silent")
+    start = time.monotonic()
+    response, elapsed, error = request_via(stub.port, "http://example.com/", (0.3, 0.3))
+    assert response is None
+    assert isinstance(error, ProbeTimeout) and "фаза socks" in str(error)
+    assert 0.25 <= elapsed < 2 and time.monotonic() - start < 2
+
+
+def test_connection_refused(request_via):
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    response, _, error = request_via(port, "http://example.com/", 1)
+    assert response is None and isinstance(error, OSError)
+
+
+def test_cold_warm_split(socks_stub):
+    stub = socks_stub()
+    session = ProbeSession(stub.port)
+    metrics = {}
+    try:
+        for _ in range(3):
+            response, elapsed, error = session.request("http://example.com/", 5)
+            assert error is None
+            _record_response(metrics, response, elapsed)
+    finally:
+        session.close()
+    # Первый запрос платит за SOCKS-рукопожатие, повторные идут по открытому туннелю
+    assert len(metrics["cold_response_times"]) == 1 and len(metrics["warm_response_times"]) == 2
+    cold, warm = metrics["phase_timings"][0], metrics["phase_timings"][1]
+    assert "socks" in cold and "socks" not in warm and "connect" not in warm
+    assert stub.connections == 1
+
+
+def test_cold_warm_split_async(socks_stub):
+    stub = socks_stub()
+
+    async def run():
+        session = AsyncProbeSession(stub.port)
+        try:
+            return [await session.request("http://example.com/", 5) for _ in range(2)]
+        finally:
+            session.close()
+
+    (first, _, _), (second, _, _) = asyncio.run(run())
+    assert (first.reused, second.reused) == (False, True)
+    assert "socks" in first.timings and list(second.timings) == ["first_byte", "total"]
+    assert stub.connections == 1
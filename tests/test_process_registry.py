@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""process_registry: фоновый сборщик завершает xray и возвращает адреса только после его выхода."""
+
+import subprocess
+import sys
+import time
+
+import pytest
+
+from lib import process_registry
+from lib.process_registry import release, terminate_all
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="нужны группы процессов POSIX")
+
+
+@pytest.fixture
+def returned(monkeypatch):
+    """Адреса, возвращённые в port_pool, и короткие интервалы сборщика."""
+    monkeypatch.setattr(process_registry, "_TERM_GRACE", 0.3)
+    monkeypatch.setattr(process_registry, "_KILL_GRACE", 0.3)
+    ports = []
+    monkeypatch.setattr(process_registry, "return_ports", lambda addresses: ports.extend(addresses))
+    yield ports
+    terminate_all()
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def _spawn(code):
+    return subprocess.Popen([sys.executable, "-c", code], start_new_session=True)
+
+
+def test_release_returns_ports_after_exit(returned):
+    proc = _spawn("import time; time.sleep(30)")
+    release(proc, [20001, 20002])
+    assert _wait_for(lambda: returned == [20001, 20002])
+    assert proc.poll() is not None
+
+
+def test_release_kills_process_ignoring_sigterm(returned):
+    proc = _spawn("import signal, sys, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); print(flush=True); time.sleep(30)")
+    time.sleep(0.2)
+    release(proc, [20003])
+    # До SIGKILL адрес не возвращается
+    time.sleep(0.15)
+    assert returned == [] and proc.poll() is None
+    assert _wait_for(lambda: returned == [20003])
+    assert proc.returncode == -9
+
+
+def test_release_of_finished_process(returned):
+    proc = _spawn("pass")
+    proc.wait()
+    release(proc, [20004])
+    assert returned == [20004]
+    release(None, [20005])
+    assert returned == [20004, 20005]
+
+
+class _Unkillable:
+    """Процесс, который не выходит даже после SIGKILL (состояние D)."""
+
+    pid = 2 ** 22 + 12345
+    stderr = None
+
+    def __init__(self):
+        self.returncode = None
+        self.signals = []
+
+    def poll(self):
+        return self.returncode
+
+    def terminate(self):
+        self.signals.append("TERM")
+
+    def send_signal(self, sig):
+        self.signals.append(sig)
+
+    def kill(self):
+        self.signals.append("KILL")
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+
+def test_stuck_process_keeps_its_ports(returned, caplog):
+    proc = _Unkillable()
+    release(proc, [20006])
+    assert _wait_for(lambda: "не завершился после SIGKILL" in caplog.text)
+    assert process_registry._SIGKILL in proc.signals
+    time.sleep(0.2)
+    assert returned == []
+    # Процесс наконец вышел - адрес возвращается
+    proc.returncode = -9
+    assert _wait_for(lambda: returned == [20006])
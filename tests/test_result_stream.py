@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""result_stream: атомарная публикация рабочих ключей и JSONL-записи по ключам."""
+
+import json
+import os
+
+import pytest
+
+from lib import result_stream
+from lib.result_stream import ResultStream, atomic_write_text, jsonl_path, top100_path
+
+
+def test_atomic_write_replaces_whole_file(tmp_path):
+    path = tmp_path / "sub" / "available.txt"
+    atomic_write_text(path, "old")
+    atomic_write_text(path, "new\nlist")
+    assert path.read_text(encoding="utf-8") == "new\nlist"
+    # Временные файлы не остаются
+    assert os.listdir(path.parent) == ["available.txt"]
+
+
+def test_atomic_write_failure_keeps_previous_file(tmp_path, monkeypatch):
+    path = tmp_path / "available.txt"
+    atomic_write_text(path, "published")
+
+    def fail(src, dst):
+        raise OSError("диск заполнен")
+
+    monkeypatch.setattr(result_stream.os, "replace", fail)
+    with pytest.raises(OSError):
+        atomic_write_text(path, "half")
+    assert path.read_text(encoding="utf-8") == "published"
+    assert os.listdir(tmp_path) == ["available.txt"]
+
+
+def test_paths():
+    assert str(top100_path("out/available.txt")) == os.path.join("out", "available(top100).txt")
+    assert str(jsonl_path("out/available")) == os.path.join("out", "available.jsonl")
+
+
+def test_stream_records_and_publishes_sorted(tmp_path):
+    output = str(tmp_path / "available")
+    stream = ResultStream(output, interval=3600)
+    stream.record("vless://slow", True, {"timeouts": 0}, ("[300ms] vless://slow#S", 300.0))
+    stream.record("vless://dead", False, {"timeouts": 2, "prefiltered": True, "response_times": [1.0]})
+    # Интервал не прошёл - списки ещё не опубликованы
+    assert not os.path.exists(output)
+
+    stream.record("vless://fast", True, None, ("[50ms] vless://fast#F", 50.0))
+    stream.publish()
+    assert open(output, encoding="utf-8").read() == "vless://fast#F\nvless://slow#S"
+    assert top100_path(output).read_text(encoding="utf-8") == "vless://fast#F\nvless://slow#S"
+    assert stream.published == 2
+    stream.close()
+
+    records = [json.loads(line) for line in jsonl_path(output).read_text(encoding="utf-8").splitlines()]
+    assert [record["key"] for record in records] == ["vless://slow", "vless://dead", "vless://fast"]
+    assert records[0]["published"] and records[0]["line"] == "vless://slow#S" and records[0]["latency_ms"] == 300
+    # В JSONL - только отобранные метрики
+    assert (records[1]["published"], records[1]["timeouts"], records[1]["prefiltered"]) == (False, 2, True)
+    assert "response_times" not in records[1] and "line" not in records[1]
+
+
+def test_stream_publishes_by_interval(tmp_path):
+    output = str(tmp_path / "available")
+    stream = ResultStream(output, interval=0)
+    stream.record("vless://a", True, None, ("[10ms] vless://a#A", 10.0))
+    assert open(output, encoding="utf-8").read() == "vless://a#A"
+    stream.close()
+    # После close записи игнорируются
+    stream.record("vless://b", False, None)
+    assert len(jsonl_path(output).read_text(encoding="utf-8").splitlines()) == 1
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""scheduler.prioritize: порядок проверки по истории и по признакам ключей."""
+
+from lib.cache import get_key_hash
+from lib.scheduler import key_features, load_previous_results, prioritize
+
+_UUID = "c19e580c-1ba9-4846-afdb-ac2847b18177"
+
+
+def _reality(host: int) -> str:
+    return f"vless://{_UUID}@10.0.0.{host}:443?security=reality&sni=a.com&pbk=xx&type=tcp"
+
+
+def _plain(host: int) -> str:
+    return f"vless://{_UUID}@10.0.1.{host}:8080?security=none&type=ws"
+
+
+def test_key_features():
+    assert key_features(_reality(1), "src") == [
+        ("protocol", "vless"), ("network", "tcp"), ("security", "reality"), ("port", "443"), ("source", "src"),
+    ]
+    assert key_features("garbage") == [("protocol", "?")]
+
+
+def test_load_previous_results(tmp_path):
+    path = tmp_path / "available"
+    path.write_text(f"# заголовок\n[120ms] {_reality(2)}#fast\n\n{_reality(1)}#slow\n{_reality(2)}#dup\n", encoding="utf-8")
+    assert load_previous_results(str(path)) == {_reality(2): 0, _reality(1): 1}
+    assert load_previous_results(str(tmp_path / "missing")) == {}
+
+
+def test_history_first_then_cache(tmp_path):
+    previous = tmp_path / "available"
+    previous.write_text(f"{_reality(2)}\n{_reality(1)}\n", encoding="utf-8")
+    cached_ok, cached_fail, unknown = _plain(1), _plain(2), _plain(3)
+    links = [cached_fail, unknown, f"{_reality(1)}#имя", cached_ok, _reality(2)]
+    cache = {get_key_hash(cached_ok): {"result": True}, get_key_hash(cached_fail): {"result": False}}
+
+    ordered, known = prioritize(links, str(previous), set(), cache_entries=cache)
+    # Прошлый результат - по месту в нём, затем прошедшие по кэшу, затем по признакам, последними - не прошедшие по кэшу
+    assert ordered == [_reality(2), f"{_reality(1)}#имя", cached_ok, unknown, cached_fail]
+    assert known == 4
+
+
+def test_features_learned_from_history(tmp_path):
+    previous = tmp_path / "available"
+    previous.write_text("".join(f"{_reality(host)}\n" for host in range(10)), encoding="utf-8")
+    notworkers = {_plain(host) for host in range(10)}
+    links = [_plain(100), _reality(100)]
+
+    ordered, known = prioritize(links, str(previous), notworkers)
+    # Ключ с признаками рабочих ключей идёт раньше ключа с признаками нерабочих
+    assert ordered == [_reality(100), _plain(100)]
+    assert known == 0
+
+
+def test_notworker_demoted_and_ties_keep_order(tmp_path):
+    links = [_reality(1), _reality(2), _reality(3)]
+    assert prioritize(links, str(tmp_path / "missing"), set()) == (links, 0)
+    ordered, _ = prioritize(links, str(tmp_path / "missing"), {_reality(1)})
+    assert ordered == [_reality(2), _reality(3), _reality(1)]
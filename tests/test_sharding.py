@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""sharding: разбор --shard, стабильное распределение ключей и сборка результатов шардов."""
+
+import hashlib
+import json
+
+import pytest
+
+from lib.sharding import filter_shard, load_shard_results, parse_shard, shard_of, shard_output_path
+
+_KEYS = [f"vless://id{i}@10.0.{i // 250}.{i % 250}:443?security=tls#k{i}" for i in range(400)]
+
+
+@pytest.mark.parametrize("spec, expected", [("1/4", (1, 4)), (" 4 / 4 ", (4, 4)), ("1/1", (1, 1))])
+def test_parse_shard(spec, expected):
+    assert parse_shard(spec) == expected
+
+
+@pytest.mark.parametrize("spec", ["", "0/4", "5/4", "1/0", "1-4", "a/b", "1/4/2", None])
+def test_parse_shard_invalid(spec):
+    with pytest.raises(ValueError):
+        parse_shard(spec)
+
+
+def test_shard_of_is_stable_hash_of_normalized_link():
+    link = _KEYS[7]
+    digest = hashlib.sha256(link.split("#", 1)[0].encode("utf-8")).digest()
+    assert shard_of(link, 5) == int.from_bytes(digest[:8], "big") % 5 + 1
+    # Комментарий (#...) и пробелы вокруг ключа на шард не влияют
+    assert shard_of(f"  {link.split('#')[0]}#другое имя  ", 5) == shard_of(link, 5)
+
+
+def test_every_key_in_exactly_one_shard():
+    items = [(link, link) for link in _KEYS]
+    shards = [filter_shard(items, index, 4) for index in range(1, 5)]
+    assert sorted(item for shard in shards for item in shard) == sorted(items)
+    # Распределение не вырождено и не зависит от порядка списка
+    assert all(shard for shard in shards)
+    assert filter_shard(list(reversed(items)), 2, 4) == list(reversed(shards[1]))
+
+
+def test_shard_output_path():
+    assert shard_output_path("out/available", 2, 4) == "out/available(shard2-4)"
+    assert shard_output_path("out/available.txt", 1, 3) == "out/available(shard1-3).txt"
+
+
+def _write_shard(tmp_path, index, count, records):
+    path = tmp_path / f"available(shard{index}-{count}).jsonl"
+    path.write_text("".join(json.dumps(record) + "\n" for record in records) + "{broken\n", encoding="utf-8")
+
+
+def test_load_shard_results(tmp_path):
+    _write_shard(tmp_path, 1, 2, [
+        {"key": "vless://a", "published": True, "line": "vless://a#A", "latency_ms": 120},
+        {"key": "vless://b", "published": False},
+        # Отсеян префильтром: в notworkers не попадает
+        {"key": "vless://c", "published": False, "prefiltered": True},
+    ])
+    _write_shard(tmp_path, 2, 2, [
+        {"key": "vless://d", "published": True, "line": "vless://d#D", "latency_ms": 80},
+        # Повторная проверка ключа, уже рабочего в другом шарде
+        {"key": "vless://a", "published": False},
+    ])
+    # Устаревший набор с другим N и меньшим числом файлов - не берётся
+    _write_shard(tmp_path, 1, 3, [{"key": "vless://z", "published": False}])
+
+    available, failed, passed, found, count = load_shard_results(str(tmp_path / "available"))
+    assert (found, count) == ([1, 2], 2)
+    assert sorted(available) == [("vless://a#A", 120.0), ("vless://d#D", 80.0)]
+    assert passed == {"vless://a", "vless://d"}
+    assert failed == {"vless://b"}
+
+
+def test_load_shard_results_without_shards(tmp_path):
+    assert load_shard_results(str(tmp_path / "available")) == ([], set(), set(), [], 0)
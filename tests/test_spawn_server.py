@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""spawn_server: запуск процессов через сервер, коды выхода, pipe/memfd и завершение вместе с каналом."""
+
+import os
+import shutil
+import signal
+import socket
+import time
+
+import pytest
+
+from lib.spawn_server import MEMFD_TARGET_FD, SpawnClient
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(os, "posix_spawnp") or not hasattr(socket, "send_fds"), reason="spawn-сервер только для POSIX"
+)
+
+
+@pytest.fixture
+def client():
+    client = SpawnClient(dict(os.environ))
+    yield client
+    client.close()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def test_round_trip_exit_codes(client):
+    proc = client.spawn([shutil.which("true")], stdin_pipe=False, stderr_pipe=False, memfd=None)
+    assert proc.pid > 0
+    assert proc.wait(timeout=5) == 0 and proc.poll() == 0
+    proc = client.spawn(["sh", "-c", "exit 3"], stdin_pipe=False, stderr_pipe=False, memfd=None)
+    assert proc.wait(timeout=5) == 3
+
+
+def test_missing_binary(client):
+    with pytest.raises(OSError):
+        client.spawn(["/nonexistent/xray", "run"], stdin_pipe=False, stderr_pipe=False, memfd=None)
+    # Сервер после ошибки продолжает работать
+    proc = client.spawn(["true"], stdin_pipe=False, stderr_pipe=False, memfd=None)
+    assert proc.wait(timeout=5) == 0
+
+
+def test_stdin_and_stderr_pipes(client):
+    proc = client.spawn(["sh", "-c", "cat >&2"], stdin_pipe=True, stderr_pipe=True, memfd=None)
+    proc.stdin.write(b"config")
+    proc.stdin.close()
+    assert proc.stderr.read() == b"config"
+    proc.stderr.close()
+    assert proc.wait(timeout=5) == 0
+
+
+@pytest.mark.skipif(not hasattr(os, "memfd_create"), reason="нужен memfd")
+def test_memfd_passed_as_target_fd(client):
+    fd = os.memfd_create("test-config", os.MFD_CLOEXEC)
+    os.write(fd, b"from memfd")
+    try:
+        proc = client.spawn(
+            ["sh", "-c", f"cat /proc/self/fd/{MEMFD_TARGET_FD} >&2"], stdin_pipe=False, stderr_pipe=True, memfd=fd
+        )
+    finally:
+        os.close(fd)
+    assert proc.stderr.read() == b"from memfd"
+    proc.stderr.close()
+    assert proc.wait(timeout=5) == 0
+
+
+def test_terminate_in_own_session(client):
+    proc = client.spawn(["sleep", "30"], stdin_pipe=False, stderr_pipe=False, memfd=None)
+    # posix_spawn с новой сессией: группа процесса = его pid
+    assert os.getpgid(proc.pid) == proc.pid
+    proc.terminate()
+    assert proc.wait(timeout=5) == -signal.SIGTERM
+
+
+def test_close_kills_children():
+    client = SpawnClient(dict(os.environ))
+    proc = client.spawn(["sleep", "30"], stdin_pipe=False, stderr_pipe=False, memfd=None)
+    client.close()
+    # Канал закрыт: сервер завершает группы своих процессов и выходит
+    assert client.server.returncode is not None
+    deadline = time.monotonic() + 5
+    while _alive(proc.pid) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert not _alive(proc.pid)
+    assert proc.wait(timeout=5) is not None
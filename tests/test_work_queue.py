@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""WorkQueue: аренда пачек, возврат истёкших аренд и единственный публикующий процесс."""
+
+import pytest
+
+from lib.work_queue import QueueError, WorkQueue
+
+_LINKS = [f"vless://k{i}" for i in range(5)]
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    queues = []
+
+    def make(owner: str, fingerprint: str = "list-a", **kwargs) -> WorkQueue:
+        queue = WorkQueue(str(tmp_path / "queue.db"), fingerprint, **kwargs)
+        # Несколько процессов-исполнителей в одном тесте различаются только владельцем
+        queue.owner = owner
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.close()
+
+
+def _expire_leases(queue: WorkQueue) -> None:
+    with queue._transaction() as conn:
+        conn.execute("UPDATE keys SET lease_until = 0 WHERE state = 'leased'")
+
+
+def test_attach_fill_and_lease(make_queue):
+    first, second = make_queue("a"), make_queue("b")
+    assert first.attach() is True
+    # Очередь этого списка уже заполняет другой процесс
+    assert second.attach() is False
+    assert first.fill(_LINKS) == 5
+
+    assert first.lease(2) == _LINKS[:2]
+    assert second.lease(2) == _LINKS[2:4]
+    assert first.lease(10) == _LINKS[4:]
+    assert second.lease(10) == []
+    assert first.counts() == {"pending": 0, "leased": 5, "done": 0}
+
+
+def test_attach_other_list_is_rejected(make_queue):
+    first = make_queue("a")
+    first.attach()
+    first.fill(_LINKS)
+    with pytest.raises(QueueError):
+        make_queue("b", fingerprint="list-b").attach()
+
+
+def test_expired_lease_returns_to_queue(make_queue):
+    crashed, alive = make_queue("crashed"), make_queue("alive")
+    crashed.attach()
+    crashed.fill(_LINKS[:2])
+    assert crashed.lease(2) == _LINKS[:2]
+    # Аренда продлевается только владельцу
+    alive.heartbeat()
+    _expire_leases(crashed)
+    assert alive.lease(10) == _LINKS[:2]
+    assert alive.counts() == {"pending": 0, "leased": 2, "done": 0}
+
+
+def test_key_abandoned_after_max_attempts(make_queue):
+    queue = make_queue("a", max_attempts=2)
+    queue.attach()
+    queue.fill(_LINKS[:1])
+    for _ in range(2):
+        assert queue.lease(1) == _LINKS[:1]
+        _expire_leases(queue)
+    # Две аренды ключа истекли - он завершён как нерабочий
+    assert queue.lease(1) == []
+    assert queue.counts()["done"] == 1
+    assert queue.results() == ([], {_LINKS[0]}, set())
+
+
+def test_release_returns_own_keys(make_queue):
+    queue = make_queue("a")
+    queue.attach()
+    queue.fill(_LINKS[:3])
+    queue.lease(3)
+    queue.release()
+    assert queue.counts() == {"pending": 3, "leased": 0, "done": 0}
+
+
+def test_claim_publish_once_and_results(make_queue):
+    first, second = make_queue("a"), make_queue("b")
+    first.attach()
+    first.fill(_LINKS[:3])
+    first.lease(2)
+    second.lease(1)
+    first.complete(_LINKS[0], True, {"response_times": [0.1]}, ("[100ms] vless://k0#ok", 100.0))
+    first.complete(_LINKS[1], False, {"timeouts": 1})
+    assert first.claim_publish() is False
+
+    second.complete(_LINKS[2], False, {"prefiltered": True})
+    # Ключ, отсеянный префильтром до заполнения очереди, добавляется сразу завершённым
+    second.complete("vless://extra", False, {"prefiltered": True})
+    assert second.claim_publish() is True
+    assert first.claim_publish() is False
+
+    available, failed, passed = first.results()
+    assert available == [("vless://k0#ok", 100.0)]
+    assert passed == {_LINKS[0]}
+    # Отсеянные префильтром в notworkers не попадают
+    assert failed == {_LINKS[1]}
+
+
+def test_published_queue_is_reused_for_next_run(make_queue):
+    first = make_queue("a")
+    first.attach()
+    first.fill(_LINKS[:1])
+    first.lease(1)
+    first.complete(_LINKS[0], False, None)
+    assert first.claim_publish() is True
+    # Прогон опубликован: следующий процесс (и другой список) заполняет очередь заново
+    other = make_queue("b", fingerprint="list-b")
+    assert other.attach() is True
+    assert other.counts() == {"pending": 0, "leased": 0, "done": 0}
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""XrayDaemon.attach/detach: объединение вызовов xray api (заглушка вместо xray)."""
+
+import json
+import os
+import stat
+import sys
+import threading
+
+import pytest
+
+from lib import config
+from lib.parsing import parse_proxy_url
+from lib.xray_daemon import XrayDaemon
+
+_KEY = "vless://c19e580c-1ba9-4846-afdb-ac2847b18177@10.0.0.1:443?security=reality&sni=a.com&pbk=xx&type=tcp#k0"
+
+# Заглушка "xray api ado|rmo": outbound хранятся в state.json, каждый вызов пишется в calls.log.
+# Как настоящий xray: ado с уже существующим тегом и rmo отсутствующего тега завершаются ошибкой.
+_STUB = '''#!{python}
+import json, os, sys
+base = os.path.dirname(os.path.abspath(__file__))
+state_path = os.path.join(base, "state.json")
+state = json.load(open(state_path)) if os.path.exists(state_path) else []
+command = sys.argv[2]
+with open(os.path.join(base, "calls.log"), "a") as log:
+    log.write(json.dumps(sys.argv[2:]) + "\\n")
+if command == "ado":
+    tags = [o["tag"] for o in json.load(sys.stdin)["outbounds"]]
+    for tag in tags:
+        if tag in state:
+            json.dump(state, open(state_path, "w"))
+            sys.exit(1)
+        state.append(tag)
+elif command == "rmo":
+    for tag in sys.argv[4:]:
+        if tag not in state:
+            json.dump(state, open(state_path, "w"))
+            sys.exit(1)
+        state.remove(tag)
+json.dump(state, open(state_path, "w"))
+'''
+
+
+@pytest.fixture
+def stub_api(tmp_path, monkeypatch):
+    script = tmp_path / "xray"
+    script.write_text(_STUB.format(python=sys.executable))
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(config, "XRAY_CMD", str(script))
+
+    class Stub:
+        def calls(self):
+            path = tmp_path / "calls.log"
+            return [json.loads(line) for line in path.read_text().splitlines()] if path.exists() else []
+
+        def state(self):
+            path = tmp_path / "state.json"
+            return sorted(json.loads(path.read_text())) if path.exists() else []
+
+        def set_state(self, tags):
+            (tmp_path / "state.json").write_text(json.dumps(tags))
+
+    return Stub()
+
+
+@pytest.mark.skipif(os.name != "posix", reason="заглушка - исполняемый скрипт")
+def test_concurrent_attaches_share_one_api_call(stub_api):
+    daemon = XrayDaemon(socks_ports=[], api_port=1)
+    parsed = parse_proxy_url(_KEY)
+    results = {}
+    barrier = threading.Barrier(8)
+
+    def attach(slot):
+        barrier.wait()
+        results[slot] = daemon.attach(slot, parsed)
+
+    threads = [threading.Thread(target=attach, args=(slot,)) for slot in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(results.values()) and len(results) == 8
+    assert stub_api.state() == sorted(f"proxy-{slot}" for slot in range(8))
+    # Восемь подключений - заметно меньше восьми запусков xray api
+    assert len(stub_api.calls()) < 8
+
+
+@pytest.mark.skipif(os.name != "posix", reason="заглушка - исполняемый скрипт")
+def test_detach_is_deferred_and_batched(stub_api):
+    daemon = XrayDaemon(socks_ports=[], api_port=1)
+    parsed = parse_proxy_url(_KEY)
+    for slot in range(3):
+        assert daemon.attach(slot, parsed)
+    calls = len(stub_api.calls())
+
+    for slot in range(3):
+        daemon.detach(slot)
+    # Удаление не запускает xray api само по себе
+    assert len(stub_api.calls()) == calls
+
+    assert daemon.attach(0, parsed)
+    new_calls = stub_api.calls()[calls:]
+    assert new_calls[0][0] == "rmo" and sorted(new_calls[0][2:]) == ["proxy-0", "proxy-1", "proxy-2"]
+    assert [call[0] for call in new_calls] == ["rmo", "ado"]
+    assert stub_api.state() == ["proxy-0"]
+
+
+@pytest.mark.skipif(os.name != "posix", reason="заглушка - исполняемый скрипт")
+def test_attach_replaces_stale_outbound(stub_api):
+    stub_api.set_state(["proxy-3"])
+    daemon = XrayDaemon(socks_ports=[], api_port=1)
+    assert daemon.attach(3, parse_proxy_url(_KEY))
+    assert stub_api.state() == ["proxy-3"]
+    assert [call[0] for call in stub_api.calls()] == ["ado", "ado", "rmo", "ado"]
+
+
+@pytest.mark.skipif(os.name != "posix", reason="заглушка - исполняемый скрипт")
+def test_detach_of_failed_attach_is_skipped(stub_api, monkeypatch):
+    monkeypatch.setattr(config, "XRAY_CMD", "/nonexistent/xray")
+    daemon = XrayDaemon(socks_ports=[], api_port=1)
+    assert not daemon.attach(5, parse_proxy_url(_KEY))
+    daemon.detach(5)
+    assert daemon._removals == []
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Готовность xray: _port_accepts и wait_for_xray_ready без фиксированной паузы."""
+
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from lib import xray_manager
+from lib.xray_manager import _port_accepts, wait_for_xray_ready
+
+
+@pytest.fixture
+def listener():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen()
+    yield sock.getsockname()[1]
+    sock.close()
+
+
+@pytest.fixture
+def closed_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class _Proc:
+    """Процесс xray для wait_for_xray_ready: работает, пока returncode не задан."""
+
+    def __init__(self, returncode=None):
+        self.returncode = returncode
+        self.stderr = None
+
+    def poll(self):
+        return self.returncode
+
+
+def test_port_accepts(listener, closed_port):
+    assert _port_accepts("127.0.0.1", listener, 1)
+    # Отказ в соединении - сразу, без ожидания wait
+    start = time.monotonic()
+    assert not _port_accepts("127.0.0.1", closed_port, 5)
+    assert time.monotonic() - start < 1
+
+
+def test_port_accepts_unix_socket(tmp_path):
+    path = str(tmp_path / "in.sock")
+    assert not _port_accepts("127.0.0.1", path, 0.1)
+    server = socket.socket(socket.AF_UNIX)
+    server.bind(path)
+    server.listen()
+    try:
+        assert _port_accepts("127.0.0.1", path, 1)
+    finally:
+        server.close()
+
+
+def test_port_accepts_high_descriptor(listener):
+    # Дескрипторы >= 1024 (сотни xray и поднятый RLIMIT_NOFILE): select.select их не принимает
+    resource = pytest.importorskip("resource")
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < 1100:
+        if hard != resource.RLIM_INFINITY and hard < 1100:
+            pytest.skip("RLIMIT_NOFILE меньше 1100")
+        resource.setrlimit(resource.RLIMIT_NOFILE, (1100, hard))
+    fds = []
+    try:
+        while not fds or fds[-1] < 1030:
+            fds.append(os.open(os.devnull, os.O_RDONLY))
+        assert _port_accepts("127.0.0.1", listener, 1)
+    finally:
+        for fd in fds:
+            os.close(fd)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+
+def test_ready_as_soon_as_ports_accept(closed_port, monkeypatch):
+    monkeypatch.setattr(xray_manager, "XRAY_STARTUP_POLL_INTERVAL", 0.02)
+    server = socket.socket()
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+    def open_later():
+        server.bind(("127.0.0.1", closed_port))
+        server.listen()
+
+    timer = threading.Timer(0.2, open_later)
+    timer.start()
+    try:
+        start = time.monotonic()
+        assert wait_for_xray_ready(_Proc(), [closed_port], timeout=5) == (True, "")
+        assert time.monotonic() - start < 2
+    finally:
+        timer.join()
+        server.close()
+
+
+def test_not_ready(closed_port, monkeypatch):
+    monkeypatch.setattr(xray_manager, "XRAY_STARTUP_POLL_INTERVAL", 0.02)
+    ok, error = wait_for_xray_ready(_Proc(), [closed_port], timeout=0.2)
+    assert not ok and str(closed_port) in error
+    # xray завершился до открытия порта - ошибка сразу, с кодом возврата
+    assert wait_for_xray_ready(_Proc(returncode=23), [closed_port], timeout=5) == (False, "xray завершился с кодом 23")
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""xray_resources: разбор настроек профиля и учёт ресурсов процесса по /proc."""
+
+import os
+import sys
+
+import pytest
+
+from lib import xray_resources
+from lib.xray_resources import _parse_cpus, _parse_ionice, mark_started, record_usage, usage
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ("", []),
+    ("0", [{0}]),
+    ("0-3,6", [{0, 1, 2, 3, 6}]),
+    ("0-1; 2-3 ;", [{0, 1}, {2, 3}]),
+    (" 4 , 5-5 ", [{4, 5}]),
+])
+def test_parse_cpus(spec, expected):
+    assert _parse_cpus(spec) == expected
+
+
+def test_parse_cpus_invalid():
+    with pytest.raises(ValueError):
+        _parse_cpus("a-b")
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ("", None),
+    ("idle", (3 << 13) | 4),
+    ("best-effort", (2 << 13) | 4),
+    ("best-effort:0", 2 << 13),
+    ("best-effort:9", (2 << 13) | 7),
+])
+def test_parse_ionice(spec, expected):
+    assert _parse_ionice(spec) == expected
+
+
+def test_parse_ionice_unknown_class():
+    with pytest.raises(ValueError, match="XRAY_IONICE"):
+        _parse_ionice("realtime")
+
+
+def _fake_proc(tmp_path, monkeypatch, stat: bytes, status: bytes):
+    (tmp_path / "stat").write_bytes(stat)
+    (tmp_path / "status").write_bytes(status)
+    real_open = open
+
+    def fake_open(path, *args, **kwargs):
+        if str(path).startswith("/proc/42/"):
+            path = tmp_path / os.path.basename(path)
+        return real_open(path, *args, **kwargs)
+
+    monkeypatch.setattr("builtins.open", fake_open)
+    monkeypatch.setattr(xray_resources, "_CLOCK_TICKS", 100)
+
+
+def test_usage_parses_proc(tmp_path, monkeypatch):
+    # Имя процесса с пробелами и скобками; utime=150, stime=50 тиков (поля 14 и 15)
+    fields = " ".join(["S", "1"] + ["0"] * 9 + ["150", "50"] + ["0"] * 30)
+    _fake_proc(tmp_path, monkeypatch, f"42 (xray (run) x) {fields}".encode(), b"Name:\txray\nVmHWM:\t  20480 kB\nVmRSS:\t 1024 kB\n")
+    assert usage(42) == (20480, 2000.0)
+
+
+def test_usage_missing_process():
+    assert usage(2 ** 22 + 12345) is None
+
+
+class _Proc:
+    def __init__(self, pid=42, returncode=None):
+        self.pid = pid
+        self.returncode = returncode
+
+    def poll(self):
+        return self.returncode
+
+
+@pytest.fixture
+def accounting(monkeypatch):
+    monkeypatch.setattr(xray_resources, "XRAY_RESOURCE_ACCOUNTING", True)
+    monkeypatch.setattr(xray_resources, "process_start_time", lambda pid: "777")
+    samples = []
+
+    def fake_usage(pid, start_time=None):
+        samples.append((pid, start_time))
+        return (2048, 90.0)
+
+    monkeypatch.setattr(xray_resources, "usage", fake_usage)
+    return samples
+
+
+def test_record_usage(accounting, monkeypatch):
+    proc = _Proc()
+    single = [{}]
+    mark_started(proc)
+    record_usage(proc, single)
+    assert single == [{"xray_rss_kb": 2048, "xray_cpu_ms": 90.0}]
+    # Замер - по pid с временем старта, запомненным при запуске
+    assert accounting == [(42, "777")]
+    # Пакетный xray: CPU делится поровну, RSS общий
+    batch = [{}, {}, {}]
+    mark_started(proc)
+    record_usage(proc, batch)
+    assert batch == [{"xray_rss_kb": 2048, "xray_cpu_ms": 30.0, "xray_shared": 3}] * 3
+
+    monkeypatch.setattr(xray_resources, "XRAY_RESOURCE_ACCOUNTING", False)
+    off = [{}]
+    mark_started(proc)
+    record_usage(proc, off)
+    assert off == [{}]
+
+
+def test_record_usage_skips_exited_process(accounting):
+    # Вышедший xray: его pid мог уже собрать reaper spawn-сервера - /proc не читается
+    proc = _Proc()
+    mark_started(proc)
+    proc.returncode = 0
+    metrics = [{}]
+    record_usage(proc, metrics)
+    # Без времени старта (процесс не отмечен при запуске) - тоже без замера
+    record_usage(_Proc(), metrics)
+    assert metrics == [{}] and accounting == []
+
+
+def test_usage_rejects_reused_pid(tmp_path, monkeypatch):
+    # Поле 22 (время старта) = 5000, а xray запускался с другим
+    fields = " ".join(["S", "1"] + ["0"] * 9 + ["150", "50"] + ["0"] * 6 + ["5000"] + ["0"] * 23)
+    _fake_proc(tmp_path, monkeypatch, f"42 (xray) {fields}".encode(), b"VmHWM:\t  20480 kB\n")
+    assert usage(42, "5000") == (20480, 2000.0)
+    assert usage(42, "4999") is None
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="нужен /proc")
+def test_usage_of_current_process():
+    rss_kb, cpu_ms = usage(os.getpid())
+    assert rss_kb > 0 and cpu_ms > 0
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""xray_templates: шаблоны дают тот же JSON, что и сборщик build_xray_config."""
+
+import base64
+import json
+
+import pytest
+
+from lib.parsing import parse_proxy_url
+from lib.xray_manager import build_xray_batch_config, build_xray_config
+from lib.xray_templates import render_xray_batch_config, render_xray_config
+
+_VMESS = base64.b64encode(json.dumps({
+    "v": "2", "ps": "vm", "add": "vm.example.com", "port": "443", "id": "b831381d-6324-4d53-ad4f-8cda48b30811",
+    "aid": "0", "net": "ws", "type": "none", "host": "cdn.example.com", "path": "/ray", "tls": "tls", "sni": "vm.example.com",
+}).encode()).decode()
+
+_LINKS = [
+    "vless://c19e580c-1ba9-4846-afdb-ac2847b18177@1.2.3.4:443?security=reality&sni=a.com&pbk=Zm9vYmFy&sid=ab12&fp=chrome&type=tcp&flow=xtls-rprx-vision#r",
+    "vless://ae45b713-5a0d-4080-8b75-a0f7311fcf8d@host.example.com:8443?security=tls&sni=host.example.com&type=ws&host=cdn.example.com&path=%2Fws#ws",
+    "vless://5fb94673-d2d2-4a16-b0a1-ac5c937be18b@5.6.7.8:443?security=tls&sni=g.example.com&type=grpc&serviceName=grpc#grpc",
+    "vless://d8d39845-623e-43c9-b965-f17d9f11dd6c@9.9.9.9:80?security=none&type=xhttp&mode=packet-up#xhttp",
+    # Значения, которые нужно экранировать в JSON (кавычки, обратная косая черта, не ASCII)
+    "vless://d8d39845-623e-43c9-b965-f17d9f11dd6c@9.9.9.9:443?security=tls&sni=%D0%BF%D1%80%22q%5C.example&type=ws#esc",
+    "vmess://" + _VMESS,
+    "trojan://secret@tr.example.com:443?security=tls&sni=tr.example.com#t",
+    "ss://" + base64.b64encode(b"aes-256-gcm:password").decode() + "@10.0.0.1:8388#ss",
+]
+_PARSED = [parse_proxy_url(link) for link in _LINKS]
+
+
+def test_links_parsed():
+    assert all(_PARSED)
+
+
+@pytest.mark.parametrize("parsed", _PARSED, ids=[link.split("://")[0] + str(i) for i, link in enumerate(_LINKS)])
+@pytest.mark.parametrize("inbound", [20000, "@sock-1", "/tmp/s.sock"])
+def test_render_matches_builder(parsed, inbound):
+    expected = json.dumps(build_xray_config(parsed, inbound), ensure_ascii=False)
+    assert render_xray_config(parsed, inbound) == expected
+    # Повторный вызов - из кэша шаблонов, с другим адресом inbound
+    other = 20001 if isinstance(inbound, int) else inbound + "2"
+    assert render_xray_config(parsed, other) == json.dumps(build_xray_config(parsed, other), ensure_ascii=False)
+
+
+@pytest.mark.parametrize("ports", [list(range(30000, 30000 + len(_PARSED))), [f"/tmp/s{i}.sock" for i in range(len(_PARSED))]])
+def test_batch_matches_builder(ports):
+    assert json.loads(render_xray_batch_config(_PARSED, ports)) == build_xray_batch_config(_PARSED, ports)
@@ -10,11 +10,10 @@
 
 import json
 import os
-import re
 import statistics
 import sys
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 from typing import Optional
@@ -30,11 +29,17 @@ from rich.progress import (
     TimeRemainingColumn,
 )
 
+from lib.async_checker import run_checks_async
 from lib.cache import load_cache, save_cache
-from lib.checker import check_key_e2e
+from lib.checker import check_key_e2e, check_keys_batch
+from lib.concurrency import AdaptiveLimiter, run_adaptive
 from lib.config import (
+    ADAPTIVE_CONCURRENCY,
+    CHECK_ENGINE,
     DEBUG_FIRST_FAIL,
     DEFAULT_LIST_URL,
+    DNS_PRECACHE,
+    ENDPOINT_GROUPING,
     ENABLE_CACHE,
     EXPORT_FORMAT,
     LINKS_FILE,
@@ -45,12 +50,36 @@ from lib.config import (
     METRICS_FILE,
     MODE,
     NOTWORKERS_FILE,
+    JOURNAL_FILE,
+    ORPHAN_SWEEP,
+    PRIORITY_SCHEDULING,
+    RESUME,
+    SHARD,
+    SORT_BY_WARM_LATENCY,
+    STREAM_RESULTS,
+    TCP_PREFILTER,
+    WORK_QUEUE,
+    WORKER_PROCESSES,
+    XRAY_BATCH_SIZE,
+    XRAY_DAEMON_MODE,
 )
 from lib.config_display import print_current_config
 from lib.export import export_to_csv, export_to_html, export_to_json
+from lib.grouping import SiblingDispatcher
+from lib.journal import CheckpointJournal, list_fingerprint
+from lib.key_feed import KeyFeed
 from lib.metrics import calculate_performance_metrics, print_statistics_table
+from lib.orphans import sweep_orphans
 from lib.parsing import decode_subscription_content, get_output_path, load_keys_from_file, load_merged_keys, load_notworkers, normalize_proxy_link, parse_proxy_lines, parse_proxy_url, save_notworkers
-from lib.signals import available_keys, interrupted, output_path_global
+from lib.prefilter import dns_prefilter, tcp_prefilter
+from lib.result_stream import ResultStream, atomic_write_text, strip_latency_prefix, top100_path, write_available
+from lib.scheduler import prioritize
+from lib.sharding import filter_shard, load_shard_results, parse_shard, shard_output_path
+from lib.signals import available_keys, interrupt_hooks, output_path_global
+from lib.spawn_server import spawn_client
+from lib.work_queue import QueueError, WorkQueue
+from lib.worker_processes import run_checks_multiprocess
+from lib.xray_daemon import shutdown_daemon_pool
 from lib.xray_manager import build_xray_config, ensure_xray
 
 console = Console()
@@ -63,9 +92,33 @@ def main():
     from lib.logger_config import setup_logging
     setup_logging(debug=False)
     
-    args = [a for a in sys.argv[1:] if a.startswith("-")]
-    urls_arg = [a for a in sys.argv[1:] if not a.startswith("-")]
+    shard_spec, argv = _extract_option(sys.argv[1:], "--shard")
+    queue_path, argv = _extract_option(argv, "--queue")
+    queue_path = queue_path or WORK_QUEUE
+    args = [a for a in argv if a.startswith("-")]
+    urls_arg = [a for a in argv if not a.startswith("-")]
     print_config = "--print-config" in args or "-p" in args
+    shard: Optional[tuple[int, int]] = None
+    if shard_spec or SHARD:
+        try:
+            shard = parse_shard(shard_spec or SHARD)
+        except ValueError as e:
+            console.print(f"[bold red]Ошибка:[/bold red] {e}")
+            sys.exit(1)
+    if shard is not None and queue_path:
+        console.print("[bold red]Ошибка:[/bold red] --shard и --queue несовместимы: очередь сама делит ключи между процессами")
+        sys.exit(1)
+
+    # Сборка результатов шардов: список ключей не загружается, нужен только путь результата
+    if "--merge-shards" in args:
+        if MODE == "notworkers":
+            list_url = "notworkers"
+        elif MODE == "merge":
+            list_url = "merged"
+        else:
+            list_url = urls_arg[0] if urls_arg else DEFAULT_LIST_URL
+        merge_shard_results(get_output_path(list_url))
+        return
 
     def load_list(url_or_path: str) -> str:
         """Загружает список по URL или читает из локального файла."""
@@ -77,6 +130,7 @@ def main():
             return f.read()
 
     # Определяем источник ключей и загружаем список в зависимости от режима
+    sources: dict[str, str] = {}  # ключ -> список, откуда он взят (режим merge)
     if MODE == "notworkers":
         list_url = "notworkers"
         keys = load_keys_from_file(NOTWORKERS_FILE)
@@ -92,7 +146,7 @@ def main():
             console.print(f"[bold red]Ошибка:[/bold red] файл со ссылками не найден: {links_path}")
             sys.exit(1)
         try:
-            _, keys = load_merged_keys(links_path)
+            _, keys = load_merged_keys(links_path, sources)
         except (requests.RequestException, OSError) as e:
             console.print(f"[bold red]Ошибка загрузки списков:[/bold red] {e}")
             sys.exit(1)
@@ -119,6 +173,13 @@ def main():
 
     output_path = get_output_path(list_url)
 
+    # Шард: только ключи с хешем в шарде, свои файлы результата (их соберёт --merge-shards)
+    if shard is not None:
+        before = len(keys)
+        keys = filter_shard(keys, *shard)
+        output_path = shard_output_path(output_path, *shard)
+        console.print(f"[cyan]Шард {shard[0]}/{shard[1]}:[/cyan] {len(keys)} из {before} ключей")
+
     if print_config:
         if not keys:
             console.print("[red]Нет ключей в списке.[/red]")
@@ -141,6 +202,11 @@ def main():
         console.print("Установите Xray-core вручную и добавьте в PATH или задайте XRAY_PATH.")
         sys.exit(1)
     console.print("[green]✓[/green] xray готов.\n")
+    if ORPHAN_SWEEP:
+        # xray прошлых запусков, убитых без очистки (SIGKILL, отменённый CI), держат порты и CPU
+        sweep_orphans()
+    # Spawn-сервер запускается, пока процесс мал и без потоков проверки (XRAY_SPAWN_SERVER)
+    spawn_client()
 
     if MODE == "notworkers":
         console.print(f"[cyan]Проверка ключей из {NOTWORKERS_FILE}.[/cyan]")
@@ -166,18 +232,26 @@ def main():
     # Загрузка кэша
     cache = load_cache() if ENABLE_CACHE else None
 
+    def overall_latency_ms(metrics: Optional[dict]) -> float:
+        """Средняя задержка по всем запросам ключа (холодным и тёплым), мс - по ней применяется MAX_LATENCY_MS."""
+        times = metrics.get("response_times") if metrics else None
+        return sum(times) / len(times) * 1000 if times else 0.0
+
     def format_key_with_metadata(link: str, metrics: Optional[dict]) -> tuple[str, float]:
         """
         Форматирует ключ с метаданными для сохранения.
         Возвращает (отформатированная_строка, задержка_в_мс).
-        Задержка используется для сортировки (0 если нет данных).
+        Задержка используется для сортировки (0 если нет данных); MAX_LATENCY_MS сверяется с overall_latency_ms.
         """
         full_line = link_to_full.get(link, link)
         
-        # Вычисляем среднюю задержку в мс
+        # Вычисляем среднюю задержку в мс (по тёплым запросам, если были: без рукопожатий это реальный RTT)
         avg_latency_ms = 0.0
-        if metrics and metrics.get("response_times"):
-            avg_time_sec = sum(metrics["response_times"]) / len(metrics["response_times"])
+        latency_times = metrics.get("response_times") if metrics else None
+        if metrics and SORT_BY_WARM_LATENCY and metrics.get("warm_response_times"):
+            latency_times = metrics["warm_response_times"]
+        if latency_times:
+            avg_time_sec = sum(latency_times) / len(latency_times)
             avg_latency_ms = avg_time_sec * 1000  # Конвертируем в миллисекунды
         
         # Если метаданные не нужны или нет метрик, возвращаем простую строку с префиксом задержки
@@ -198,6 +272,19 @@ def main():
             max_ms = max_time * 1000
             metadata_lines.append(f"# Задержка: мин={min_ms:.0f}мс, макс={max_ms:.0f}мс, среднее={avg_ms:.0f}мс")
         
+        if metrics.get("cold_response_times") and metrics.get("warm_response_times"):
+            cold_ms = metrics["cold_response_times"][0] * 1000
+            warm = metrics["warm_response_times"]
+            warm_ms = sum(warm) / len(warm) * 1000
+            metadata_lines.append(f"# Соединение: холодный запрос={cold_ms:.0f}мс, тёплые={warm_ms:.0f}мс ({len(warm)})")
+        
+        if metrics.get("phase_timings"):
+            phases = metrics["phase_timings"]
+            first_byte_ms = sum(t["first_byte"] for t in phases) / len(phases) * 1000
+            tls = [t["tls"] - t["socks"] for t in phases if "tls" in t]
+            tls_str = f"TLS={sum(tls) / len(tls) * 1000:.0f}мс, " if tls else ""
+            metadata_lines.append(f"# Фазы: {tls_str}первый байт={first_byte_ms:.0f}мс")
+        
         if metrics.get("geolocation"):
             geo = metrics["geolocation"]
             if "ip" in geo:
@@ -214,26 +301,128 @@ def main():
         return (formatted, avg_latency_ms)
 
     output_path_global = output_path
+
+    # Общая очередь: первый процесс заполняет её (префильтры, приоритет), остальные сразу берут пачки ключей
+    queue = None
+    filling = False
+    if queue_path:
+        queue = WorkQueue(queue_path, list_fingerprint(links_only))
+        try:
+            filling = queue.attach()
+            if not filling:
+                console.print(f"[cyan]Очередь:[/cyan] подключение к {queue_path}")
+                filling = queue.wait_ready()
+        except QueueError as e:
+            console.print(f"[bold red]Ошибка:[/bold red] {e}")
+            sys.exit(1)
+        interrupt_hooks.append(queue.release)
+    joined = queue is not None and not filling
+
+    # Потоковая запись: JSONL по каждому ключу и периодическая публикация рабочих ключей
+    # (для шарда обязательна: по JSONL шардов собирается общий результат; в очереди результат публикует она)
+    stream = ResultStream(output_path) if (STREAM_RESULTS or shard is not None) and queue is None else None
+    # Журнал для продолжения прогона с того же списка после обрыва (у каждого шарда свой; очередь сама хранит вердикты)
+    journal = None
+    if RESUME and queue is None:
+        journal_path = JOURNAL_FILE if shard is None else f"{JOURNAL_FILE}.shard{shard[0]}-{shard[1]}"
+        journal = CheckpointJournal(list_fingerprint(links_only), journal_path)
+    if cache is not None:
+        interrupt_hooks.append(lambda: save_cache(cache))
+    if journal is not None:
+        interrupt_hooks.append(journal.flush)
+    if stream is not None:
+        interrupt_hooks.append(stream.publish)
+
+    def persist(link: str, ok: bool, metrics: Optional[dict], entry: Optional[tuple[str, float]] = None) -> None:
+        """Записывает результат ключа в поток результатов, журнал и общую очередь."""
+        if stream is not None:
+            stream.record(link, ok, metrics, entry)
+        if journal is not None:
+            journal.add(link, ok, metrics)
+        if queue is not None:
+            queue.complete(link, ok, metrics, entry)
+
+    def record_dead(dead_metrics: dict[str, dict]) -> None:
+        """Учитывает ключи, отсеянные без запуска xray."""
+        all_metrics.update(dead_metrics)
+        for link, metrics in dead_metrics.items():
+            persist(link, False, metrics)
+
+    if journal is not None:
+        resumed = journal.load()
+        if resumed:
+            for link in links_only:
+                if link not in resumed:
+                    continue
+                ok, metrics = resumed[link]
+                all_metrics[link] = metrics or {}
+                entry = None
+                if ok:
+                    formatted, latency = format_key_with_metadata(link, metrics)
+                    if overall_latency_ms(metrics) <= MAX_LATENCY_MS:
+                        entry = (formatted, latency)
+                        available.append(entry)
+                        available_keys.append(link)
+                if stream is not None:
+                    stream.record(link, ok, metrics, entry)
+            links_only = [link for link in links_only if link not in resumed]
+            console.print(f"[cyan]Продолжение прогона:[/cyan] {len(resumed)} ключей уже проверено (из {journal_path}), осталось {len(links_only)}")
+
+    # DNS-префильтр: имена серверов разрешаются заранее и один раз, ключи с NXDOMAIN не доходят до xray
+    if DNS_PRECACHE and not joined:
+        links_only, dead_metrics = dns_prefilter(links_only)
+        record_dead(dead_metrics)
+        if dead_metrics:
+            console.print(f"[cyan]DNS:[/cyan] домен не существует у {len(dead_metrics)} ключей (остаётся {len(links_only)})")
+
+    # TCP-префильтр: ключи, чей сервер не принимает TCP, не доходят до запуска xray
+    if TCP_PREFILTER and links_only and not joined:
+        links_only, dead_metrics = tcp_prefilter(links_only)
+        record_dead(dead_metrics)
+        if dead_metrics:
+            console.print(f"[cyan]TCP-префильтр:[/cyan] недоступно {len(dead_metrics)} ключей (остаётся {len(links_only)})")
+    if not links_only and queue is None:
+        elapsed = time.perf_counter() - time_start
+        save_results_and_exit(available, all_metrics, output_path, elapsed, total, cache, stream, journal, shard is not None)
+        return
+
+    # Приоритетный порядок: вероятно рабочие ключи - в начало очереди
+    if PRIORITY_SCHEDULING and len(links_only) > 1 and not joined:
+        links_only, known = prioritize(
+            links_only,
+            output_path,
+            load_notworkers(NOTWORKERS_FILE),
+            load_cache(ttl=None) if ENABLE_CACHE else None,
+            sources,
+        )
+        console.print(f"[cyan]Приоритет:[/cyan] ключей с историей {known}, остальные упорядочены по признакам")
     
+    if filling:
+        added = queue.fill(links_only)
+        console.print(f"[cyan]Очередь:[/cyan] {added} ключей поставлено в {queue_path}")
+
     # Первый ключ проверяем с выводом отладки при неудаче
-    if DEBUG_FIRST_FAIL and links_only:
+    if DEBUG_FIRST_FAIL and links_only and queue is None:
         link0 = links_only[0]
         _, ok0, metrics0 = check_key_e2e(link0, debug=True, cache=cache)
         all_metrics[link0] = metrics0
+        entry0 = None
         if ok0:
             formatted, latency = format_key_with_metadata(link0, metrics0)
-            if latency <= MAX_LATENCY_MS:
-                available.append((formatted, latency))
+            if overall_latency_ms(metrics0) <= MAX_LATENCY_MS:
+                entry0 = (formatted, latency)
+                available.append(entry0)
                 available_keys.append(link0)
                 console.print(f"[green]✓[/green] [1/{total}] OK ({int(latency)}мс)")
             else:
-                console.print(f"[yellow]✗[/yellow] [1/{total}] OK, но задержка {int(latency)}мс > {MAX_LATENCY_MS}мс (пропуск)")
+                console.print(f"[yellow]✗[/yellow] [1/{total}] OK, но задержка {int(overall_latency_ms(metrics0))}мс > {MAX_LATENCY_MS}мс (пропуск)")
         else:
             console.print(f"[red]✗[/red] [1/{total}] fail (см. логи выше)")
+        persist(link0, ok0, metrics0, entry0)
         links_only = links_only[1:]
         if not links_only:
             elapsed = time.perf_counter() - time_start
-            save_results_and_exit(available, all_metrics, output_path, elapsed, total, cache)
+            save_results_and_exit(available, all_metrics, output_path, elapsed, total, cache, stream, journal, shard is not None)
             return
         done = 1
     else:
@@ -255,56 +444,164 @@ def main():
             f"[cyan]Проверка ключей...[/cyan] [OK: 0, FAIL: 0]",
             total=len(links_only)
         )
-        
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            futures = {executor.submit(check_key_e2e, link, debug=False, cache=cache): link for link in links_only}
-            for future in as_completed(futures):
-                if interrupted:
-                    break
+
+        # Результаты приходят из потоков движка и фоновой перепроверки серверов (группировка)
+        results_lock = threading.RLock()
+        # Ключей, арендованных этим процессом в общей очереди
+        leased = 0
+
+        def lease_more() -> Optional[bool]:
+            """Пополнение источника пачкой из общей очереди (когда ключи в нём кончились)."""
+            nonlocal leased
+            batch = queue.lease()
+            if batch:
+                leased += len(batch)
+                progress.update(task, total=leased + queue.counts()["pending"])
+                submit(batch)
+                return True
+            # Аренды держат другие процессы (или ещё проверяются свои) - ждём: при падении ключи вернутся
+            return False if queue.counts()["leased"] else None
+
+        def handle_result(link: str, ok: bool, metrics: Optional[dict]) -> None:
+            """Учитывает результат проверки одного ключа и обновляет прогресс-бар."""
+            nonlocal done
+            with results_lock:
                 done += 1
-                try:
-                    link, ok, metrics = future.result()
-                    all_metrics[link] = metrics
-                    if ok:
-                        formatted, latency = format_key_with_metadata(link, metrics)
-                        if latency <= MAX_LATENCY_MS:
-                            available.append((formatted, latency))
-                            available_keys.append(link)
-                    
-                    # Обновляем прогресс-бар одной строкой
-                    ok_count = len(available)
-                    fail_count = done - ok_count
-                    avg_time_str = ""
-                    if ok and LOG_RESPONSE_TIME and metrics.get("response_times"):
-                        avg_time = sum(metrics["response_times"]) / len(metrics["response_times"])
-                        avg_time_str = f", avg: {avg_time:.2f}с"
-                    
-                    progress.update(
-                        task,
-                        advance=1,
-                        description=f"[cyan]Проверка ключей...[/cyan] [OK: {ok_count}, FAIL: {fail_count}{avg_time_str}]"
-                    )
-                except Exception as e:
-                    from lib.logger_config import logger
-                    logger.error(f"Ошибка проверки ключа: {e}")
-                    fail_count = done - len(available)
-                    progress.update(
-                        task,
-                        advance=1,
-                        description=f"[cyan]Проверка ключей...[/cyan] [OK: {len(available)}, FAIL: {fail_count}, ERROR: 1]"
-                    )
+                all_metrics[link] = metrics
+                entry = None
+                if ok:
+                    formatted, latency = format_key_with_metadata(link, metrics)
+                    if overall_latency_ms(metrics) <= MAX_LATENCY_MS:
+                        entry = (formatted, latency)
+                        available.append(entry)
+                        available_keys.append(link)
+                persist(link, ok, metrics, entry)
 
-    elapsed = time.perf_counter() - time_start
-    save_results_and_exit(available, all_metrics, output_path, elapsed, total, cache)
+                # Обновляем прогресс-бар одной строкой
+                ok_count = len(available)
+                fail_count = done - ok_count
+                avg_time_str = ""
+                if ok and LOG_RESPONSE_TIME and metrics.get("response_times"):
+                    avg_time = sum(metrics["response_times"]) / len(metrics["response_times"])
+                    avg_time_str = f", avg: {avg_time:.2f}с"
+
+                progress.update(
+                    task,
+                    advance=1,
+                    description=f"[cyan]Проверка ключей...[/cyan] [OK: {ok_count}, FAIL: {fail_count}{avg_time_str}]"
+                )
+            if dispatcher is not None:
+                dispatcher.verdict(link, ok)
+
+        def handle_dead(dead_metrics: dict[str, dict]) -> None:
+            """Ключи мёртвых серверов (по итогам группировки) - нерабочие без запуска xray."""
+            for link, metrics in dead_metrics.items():
+                handle_result(link, False, metrics)
 
+        def handle_error(links: list[str], e: Exception) -> None:
+            """Учитывает ключи, проверка которых завершилась исключением."""
+            nonlocal done
+            from lib.logger_config import logger
+            logger.error(f"Ошибка проверки ключа: {e}")
+            with results_lock:
+                done += len(links)
+                fail_count = done - len(available)
+                progress.update(
+                    task,
+                    advance=len(links),
+                    description=f"[cyan]Проверка ключей...[/cyan] [OK: {len(available)}, FAIL: {fail_count}, ERROR: 1]"
+                )
+            if dispatcher is not None:
+                for link in links:
+                    dispatcher.verdict(link, False)
 
-# Регулярка для удаления префикса задержки "[123ms] " перед публикацией
-_LATENCY_PREFIX_RE = re.compile(r"^\[\d+ms\]\s*", re.MULTILINE)
+        def on_check_done(link: str, future) -> bool:
+            """Результат проверки для пула потоков; True - ключ не прошёл из-за таймаутов."""
+            try:
+                link, ok, metrics = future.result()
+            except Exception as e:
+                handle_error([link], e)
+                return False
+            handle_result(link, ok, metrics)
+            return not ok and bool(metrics and metrics.get("timeouts"))
 
+        def on_batch_done(batch: list[str], future) -> bool:
+            """Результаты пакетной проверки (один xray на пакет)."""
+            try:
+                results = future.result()
+            except Exception as e:
+                handle_error(batch, e)
+                return False
+            for link, ok, metrics in results:
+                handle_result(link, ok, metrics)
+            return False
 
-def _strip_latency_prefix(text: str) -> str:
-    """Убирает префикс задержки [Nms] из начала строк перед записью в файл для публикации."""
-    return _LATENCY_PREFIX_RE.sub("", text)
+        # Единый источник ключей на весь прогон: движок не перезапускается между фазами группировки и пачками очереди
+        feed = KeyFeed(refill=lease_more, refill_interval=min(1.0, queue.lease_seconds / 3)) if queue is not None else KeyFeed()
+        dispatcher = None
+        if ENDPOINT_GROUPING:
+            # Сначала по одному ключу на сервер; остальные - по вердикту представителя, ключи мёртвых серверов - без запуска xray
+            dispatcher = SiblingDispatcher(feed, handle_dead)
+
+        def submit(links: list[str]) -> None:
+            if dispatcher is not None:
+                dispatcher.add(links)
+            else:
+                feed.put(links)
+
+        batch_mode = XRAY_BATCH_SIZE > 1 and not XRAY_DAEMON_MODE
+        # Адаптивная параллельность: только для пула потоков по одному ключу в одном процессе
+        limiter = None
+        if ADAPTIVE_CONCURRENCY and CHECK_ENGINE != "async" and not batch_mode and WORKER_PROCESSES <= 1:
+            limiter = AdaptiveLimiter(MAX_WORKERS)
+
+        if queue is None:
+            submit(links_only)
+        try:
+            # Один движок на весь прогон: ключи берутся из источника по мере освобождения места
+            if WORKER_PROCESSES > 1 and not batch_mode:
+                # Несколько процессов со своими пулами и портами; результаты обрабатываются здесь
+                run_checks_multiprocess(feed, handle_result, handle_error, cache=cache)
+            elif CHECK_ENGINE == "async":
+                # asyncio-движок: до ASYNC_CONCURRENCY ключей одновременно без пула потоков
+                run_checks_async(feed, handle_result, handle_error, cache=cache)
+            elif batch_mode:
+                # Пакетный режим: один xray на XRAY_BATCH_SIZE ключей, запросов в полёте по-прежнему ~MAX_WORKERS
+                run_adaptive(
+                    lambda batch: check_keys_batch(batch, debug=False, cache=cache), feed, on_batch_done,
+                    workers=max(1, MAX_WORKERS // XRAY_BATCH_SIZE), batch=XRAY_BATCH_SIZE,
+                )
+            else:
+                run_adaptive(lambda link: check_key_e2e(link, debug=False, cache=cache), feed, on_check_done, limiter, workers=MAX_WORKERS)
+        finally:
+            if dispatcher is not None:
+                dispatcher.close()
+
+    shutdown_daemon_pool()
+    if limiter is not None:
+        console.print(f"[cyan]Адаптивная параллельность:[/cyan] {limiter.summary()}")
+    elapsed = time.perf_counter() - time_start
+    if queue is not None:
+        # Итог процесса - только его ключи; общий результат публикует процесс, завершивший очередь
+        save_results_and_exit(available, all_metrics, output_path, elapsed, total, cache, partial=True, publish=False)
+        finish_queue(queue, output_path)
+        return
+    save_results_and_exit(available, all_metrics, output_path, elapsed, total, cache, stream, journal, shard is not None)
+
+
+def _extract_option(argv: list[str], name: str) -> tuple[Optional[str], list[str]]:
+    """Извлекает "name ЗНАЧЕНИЕ" или "name=ЗНАЧЕНИЕ" из аргументов. Возвращает (значение или None, остальные аргументы)."""
+    value = None
+    rest: list[str] = []
+    args = iter(argv)
+    for arg in args:
+        if arg == name:
+            value = next(args, "")
+        elif arg.startswith(name + "="):
+            value = arg.split("=", 1)[1]
+        else:
+            rest.append(arg)
+    return (value, rest)
 
 
 def _create_top100_file(output_path: str, available_sorted: list[tuple[str, float]]) -> Optional[str]:
@@ -319,30 +616,85 @@ def _create_top100_file(output_path: str, available_sorted: list[tuple[str, floa
     # Берем первые 100 элементов
     top100 = available_sorted[:100]
     
-    # Формируем имя файла: исходное_имя + (top100) + то же расширение (без расширения, если у основного файла его нет)
-    base_path = Path(output_path)
-    base_name = base_path.stem  # Имя без расширения
-    base_ext = base_path.suffix  # Расширение как у основного файла (пусто - без расширения)
-    top100_name = f"{base_name}(top100){base_ext}"
-    top100_path = base_path.parent / top100_name
-    
-    # Сохраняем top100 без префикса задержки (для публикации)
-    top100_lines = [_strip_latency_prefix(item[0]) for item in top100]
-    top100_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(top100_path, "w", encoding="utf-8") as f:
-        f.write("\n".join(top100_lines))
+    # Сохраняем top100 без префикса задержки (для публикации), атомарно
+    path = top100_path(output_path)
+    atomic_write_text(path, "\n".join(strip_latency_prefix(item[0]) for item in top100))
     
     console.print(f"[cyan]Top100:[/cyan] {len(top100)} ключей с минимальной задержкой (от {top100[0][1]:.0f}мс до {top100[-1][1]:.0f}мс)")
-    return str(top100_path)
+    return str(path)
+
+
+def _update_notworkers(failed_links: set[str], available_links: set[str]) -> None:
+    """Добавляет нерабочие ключи в NOTWORKERS_FILE и удаляет из него ожившие."""
+    available_normalized = {normalize_proxy_link(link) for link in available_links if normalize_proxy_link(link)}
+    if failed_links or available_normalized:
+        existing = load_notworkers(NOTWORKERS_FILE)
+        failed_normalized = {normalize_proxy_link(link) for link in failed_links if normalize_proxy_link(link)}
+        merged = (existing | failed_normalized) - available_normalized
+        added = len(failed_normalized - existing)
+        removed = len(existing & available_normalized)
+        save_notworkers(NOTWORKERS_FILE, merged)
+        parts = []
+        if added:
+            parts.append(f"добавлено {added}")
+        if removed:
+            parts.append(f"удалено {removed} (оживших)")
+        if parts:
+            console.print(f"[cyan]Notworkers:[/cyan] {', '.join(parts)}, всего в файле: {len(merged)}")
+        else:
+            console.print(f"[cyan]Notworkers:[/cyan] без изменений, всего в файле: {len(merged)}")
+
+
+def _publish_combined(output_path: str, available: list[tuple[str, float]], failed_links: set[str], available_links: set[str], origin: str) -> None:
+    """Публикует общий результат нескольких процессов (шардов или очереди) и обновляет notworkers."""
+    available_sorted = sorted(available, key=lambda x: x[1])
+    if available_sorted:
+        write_available(output_path, available_sorted)
+        console.print(f"[green]✓[/green] Результаты {origin} сохранены в: [bold]{output_path}[/bold] ({len(available_sorted)} ключей, отсортированы по задержке)")
+        console.print(f"[green]✓[/green] Top100 сохранен в: [bold]{top100_path(output_path)}[/bold]")
+    else:
+        console.print("[yellow]Нет доступных ключей для сохранения.[/yellow]")
+    _update_notworkers(failed_links, available_links)
+
+
+def merge_shard_results(output_path: str) -> None:
+    """--merge-shards: собирает результаты шардов в общий отсортированный файл, (top100) и notworkers."""
+    available, failed_links, available_links, found, count = load_shard_results(output_path)
+    if not count:
+        console.print(f"[bold red]Ошибка:[/bold red] не найдено результатов шардов для {output_path}")
+        sys.exit(1)
+    missing = sorted(set(range(1, count + 1)) - set(found))
+    if missing:
+        console.print(f"[yellow]Нет результатов шардов {', '.join(map(str, missing))} из {count}[/yellow] - итог неполный")
+    _publish_combined(output_path, available, failed_links, available_links, f"{len(found)} шардов")
+
+
+def finish_queue(queue: WorkQueue, output_path: str) -> None:
+    """Публикует общий результат очереди, если этот процесс завершил её последним."""
+    try:
+        if queue.claim_publish():
+            available, failed_links, available_links = queue.results()
+            _publish_combined(output_path, available, failed_links, available_links, f"очереди ({len(available) + len(failed_links)} ключей)")
+        else:
+            console.print("[cyan]Очередь:[/cyan] ключи ещё проверяются другими процессами - результат опубликует последний из них")
+    finally:
+        queue.close()
 
 
-def save_results_and_exit(available: list[tuple[str, float]], all_metrics: dict, output_path: str, elapsed: float, total: int, cache: Optional[dict] = None):
+def save_results_and_exit(available: list[tuple[str, float]], all_metrics: dict, output_path: str, elapsed: float, total: int, cache: Optional[dict] = None, stream: Optional[ResultStream] = None, journal: Optional[CheckpointJournal] = None, partial: bool = False, publish: bool = True):
     """
     Сохраняет результаты и выводит статистику.
     available: список кортежей (отформатированная_строка, задержка_в_мс)
+    stream: потоковая запись прогона (закрывается; итоговые файлы пишутся здесь)
+    journal: журнал прогона (удаляется после сохранения результатов - прогон завершён)
+    partial: проверена часть списка - шард или процесс общей очереди (notworkers обновляет шаг сборки результата)
+    publish: записывать файл результата и (top100); процесс очереди не пишет их - результат публикует очередь
     """
     from lib.logger_config import logger
     
+    if stream is not None:
+        stream.close()
+    
     # Сохранение кэша
     if cache is not None and ENABLE_CACHE:
         save_cache(cache)
@@ -351,18 +703,16 @@ def save_results_and_exit(available: list[tuple[str, float]], all_metrics: dict,
     available_sorted = sorted(available, key=lambda x: x[1])
     
     # Сохранение результатов в текстовый файл (отсортированные, без префикса задержки для публикации)
-    if available_sorted:
-        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-        available_lines = [_strip_latency_prefix(item[0]) for item in available_sorted]
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write("\n".join(available_lines))
+    if publish and available_sorted:
+        available_lines = [strip_latency_prefix(item[0]) for item in available_sorted]
+        atomic_write_text(output_path, "\n".join(available_lines))
         console.print(f"\n[green]✓[/green] Результаты сохранены в: [bold]{output_path}[/bold] (отсортированы по задержке)")
         
         # Создание top100 файла
         top100_path = _create_top100_file(output_path, available_sorted)
         if top100_path:
             console.print(f"[green]✓[/green] Top100 сохранен в: [bold]{top100_path}[/bold]")
-    else:
+    elif publish:
         console.print("\n[yellow]Нет доступных ключей для сохранения.[/yellow]")
     
     # Расчет метрик производительности
@@ -396,24 +746,11 @@ def save_results_and_exit(available: list[tuple[str, float]], all_metrics: dict,
         })
 
     # Обновление файла неактивных ключей: добавить нерабочие, удалить ожившие (проверенные в этом прогоне и прошедшие)
-    failed_links = set(all_metrics.keys()) - available_links
-    available_normalized = {normalize_proxy_link(link) for link in available_links if normalize_proxy_link(link)}
-    if failed_links or available_normalized:
-        existing = load_notworkers(NOTWORKERS_FILE)
-        failed_normalized = {normalize_proxy_link(link) for link in failed_links if normalize_proxy_link(link)}
-        merged = (existing | failed_normalized) - available_normalized
-        added = len(failed_normalized - existing)
-        removed = len(existing & available_normalized)
-        save_notworkers(NOTWORKERS_FILE, merged)
-        parts = []
-        if added:
-            parts.append(f"добавлено {added}")
-        if removed:
-            parts.append(f"удалено {removed} (оживших)")
-        if parts:
-            console.print(f"[cyan]Notworkers:[/cyan] {', '.join(parts)}, всего в файле: {len(merged)}")
-        else:
-            console.print(f"[cyan]Notworkers:[/cyan] без изменений, всего в файле: {len(merged)}")
+    # Шард и процесс очереди notworkers не трогают - это делает шаг сборки по результатам всех процессов
+    if not partial:
+        # Отсеянные префильтром и группировкой (без запуска xray) в notworkers не заносятся
+        failed_links = {link for link, metrics in all_metrics.items() if not metrics.get("prefiltered")}
+        _update_notworkers(failed_links - available_links, available_links)
     
     perf_metrics = calculate_performance_metrics(results_for_metrics, all_metrics, elapsed)
     print_statistics_table(perf_metrics)
@@ -442,6 +779,10 @@ def save_results_and_exit(available: list[tuple[str, float]], all_metrics: dict,
         except Exception as e:
             logger.error(f"Ошибка сохранения метрик: {e}")
 
+    # Прогон завершён и сохранён - продолжать нечего
+    if journal is not None:
+        journal.close(completed=True)
+
 
 if __name__ == "__main__":
     main()